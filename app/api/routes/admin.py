@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from datetime import datetime, timezone, timedelta
 try:
     from zoneinfo import ZoneInfo
 except Exception:
     ZoneInfo = None
-from typing import List
+from typing import List, Optional
 
-from app.core.database import SessionLocal, PostprocessJob
+from app.core.config import settings
+from app.core.database import SessionLocal, PostprocessJob, PreferenceJob, get_engine, sqlite_health_report
+from app.core import migrations as schema_migrations
+from app.services import queue_metrics
+from app.services.backfills import backfill_progress, set_backfill_state
+from sqlalchemy import func
 from fastapi.templating import Jinja2Templates
 
 router = APIRouter()
@@ -35,10 +40,21 @@ def to_jst(dt, fmt: str = "%Y-%m-%d %H:%M"):
 templates.env.filters["to_jst"] = to_jst
 
 
-def _get_jobs(limit: int = 100, status: str = None) -> List[PostprocessJob]:
+def _window_hours(hours: Optional[int]) -> int:
+    return max(int(settings.admin_jobs_window_hours if hours is None else hours), 1)
+
+
+def _get_jobs(limit: int = 100, status: str = None, hours: Optional[int] = None) -> List[PostprocessJob]:
+    """直近 `hours` 時間に作成されたジョブを新しい順に返す（created_at / (status, created_at) インデックスを使う）"""
+    limit = max(min(int(limit or 100), 1000), 1)
+    since = datetime.utcnow() - timedelta(hours=_window_hours(hours))
     db = SessionLocal()
     try:
-        q = db.query(PostprocessJob).order_by(PostprocessJob.created_at.desc())
+        q = (
+            db.query(PostprocessJob)
+            .filter(PostprocessJob.created_at >= since)
+            .order_by(PostprocessJob.created_at.desc())
+        )
         if status:
             # allow comma-separated list
             allowed = {s.strip() for s in status.split(',') if s.strip()}
@@ -51,8 +67,8 @@ def _get_jobs(limit: int = 100, status: str = None) -> List[PostprocessJob]:
 
 
 @router.get("/admin/postprocess_jobs", response_class=HTMLResponse)
-def admin_postprocess_jobs(request: Request, limit: int = 100, status: str = None):
-    jobs = _get_jobs(limit=limit, status=status)
+def admin_postprocess_jobs(request: Request, limit: int = 100, status: str = None, hours: Optional[int] = None):
+    jobs = _get_jobs(limit=limit, status=status, hours=hours)
     now = datetime.utcnow()
     def seconds_remaining(job):
         if job.next_attempt_at is None:
@@ -77,13 +93,13 @@ def admin_postprocess_jobs(request: Request, limit: int = 100, status: str = Non
 
     return templates.TemplateResponse(
         "admin_postprocess.html",
-        {"request": request, "jobs": jobs_ctx, "status": status or "all", "limit": limit},
+        {"request": request, "jobs": jobs_ctx, "status": status or "all", "limit": limit, "hours": _window_hours(hours)},
     )
 
 
 @router.get("/api/admin/postprocess_jobs")
-def admin_postprocess_jobs_json(limit: int = 100, status: str = None):
-    jobs = _get_jobs(limit=limit, status=status)
+def admin_postprocess_jobs_json(limit: int = 100, status: str = None, hours: Optional[int] = None):
+    jobs = _get_jobs(limit=limit, status=status, hours=hours)
     now = datetime.utcnow()
     out = []
     for job in jobs:
@@ -121,4 +137,67 @@ def admin_postprocess_jobs_json(limit: int = 100, status: str = None):
             "created_at": job.created_at.isoformat() if job.created_at else None,
             "created_at_jst": _fmt_jst(job.created_at),
         })
-    return {"jobs": out}
+    return {"jobs": out, "window_hours": _window_hours(hours)}
+
+
+@router.get("/api/admin/queue_metrics")
+def admin_queue_metrics():
+    """キューごとの状態別件数・期限切れリース数と、このプロセスのカウンタを返す"""
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        queues = {}
+        for model in (PostprocessJob, PreferenceJob):
+            by_status = dict(db.query(model.status, func.count(model.id)).group_by(model.status).all())
+            expired = (
+                db.query(func.count(model.id))
+                .filter(model.status == "in_progress", model.lease_expires_at < now)
+                .scalar()
+            )
+            reclaimed = (
+                db.query(func.count(model.id))
+                .filter(model.last_error.like("lease expired%"))
+                .scalar()
+            )
+            queues[model.__tablename__] = {
+                "by_status": by_status,
+                "expired_leases": expired or 0,
+                "reclaimed_jobs": reclaimed or 0,
+            }
+    finally:
+        db.close()
+    return {"queues": queues, "process_counters": queue_metrics.snapshot()}
+
+
+@router.get("/api/admin/db_health")
+def admin_db_health():
+    """接続に実際に適用されている SQLite の PRAGMA（WAL・busy_timeout など）を返す"""
+    return sqlite_health_report(get_engine())
+
+
+def _migration_status() -> dict:
+    engine = get_engine()
+    return {"schema": schema_migrations.status(engine), "backfills": backfill_progress(engine)}
+
+
+@router.get("/admin/migrations", response_class=HTMLResponse)
+def admin_migrations(request: Request):
+    """スキーマのバージョンとバックフィルの進捗"""
+    return templates.TemplateResponse("admin_migrations.html", {"request": request, **_migration_status()})
+
+
+@router.get("/api/admin/migrations")
+def admin_migrations_json():
+    return _migration_status()
+
+
+@router.post("/api/admin/backfills/{name}/{action}")
+def admin_backfill_action(name: str, action: str):
+    """バックフィルの一時停止（pause）・再開（resume）・最初からやり直し（restart）"""
+    if action not in ("pause", "resume", "restart"):
+        raise HTTPException(status_code=400, detail="action must be pause, resume or restart")
+    try:
+        set_backfill_state(get_engine(), name, action)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Backfill not found")
+    return {"backfills": backfill_progress(get_engine())}
@@ -137,8 +137,12 @@ async def create_source(request: Request, db=Depends(get_db)):
     if url_val:
         if not _is_valid_url(url_val):
             raise HTTPException(status_code=400, detail="invalid url")
-    db.execute(
-        text("INSERT INTO sources (name,type,config,enabled,cron_schedule) VALUES (:name,:type,:config,:enabled,:cron)"),
+    # RETURNING は SQLite（3.35+）と PostgreSQL の両方で使える
+    scalar = db.execute(
+        text(
+            "INSERT INTO sources (name,type,config,enabled,cron_schedule) "
+            "VALUES (:name,:type,:config,:enabled,:cron) RETURNING id"
+        ),
         {
             "name": name,
             "type": type_,
@@ -146,19 +150,12 @@ async def create_source(request: Request, db=Depends(get_db)):
             "enabled": int(enabled),
             "cron": cron,
         },
-    )
+    ).scalar()
     db.commit()
 
     # Reload scheduler to immediately reflect the new source
     _reload_scheduler_if_available()
 
-    # Get last insert id (SQLite compatible)
-    try:
-        last_id = db.execute(text("SELECT last_insert_rowid()"))
-        scalar = last_id.scalar()
-    except Exception:
-        scalar = None
-
     # If HTML requested, return updated list fragment
     if request.query_params.get("html") == "1" or request.headers.get("accept", "").find("text/html") != -1:
         return await list_sources(request, db)
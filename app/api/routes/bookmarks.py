@@ -10,14 +10,36 @@ from sqlalchemy.orm import Session, joinedload
 
 import app.core.database as app_db
 from app.core.database import Bookmark, Document, create_tables, get_db
+from app.core.pagination import InvalidCursor, fetch_page
 from app.core.user_utils import GUEST_USER_ID
+from app.services.bookmark_service import invalidate_bookmark_count
 from app.services.personalization_queue import schedule_profile_update
+from app.services.preference_profile import PreferenceProfileService
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 templates = Jinja2Templates(directory="app/templates")
 
 
+def _apply_bookmark_event(db: Session, bookmark: Bookmark, *, removed: bool = False) -> None:
+    """ブックマークの追加・削除を嗜好プロファイルに即時反映する（失敗してもAPIは継続）"""
+    invalidate_bookmark_count(bookmark.user_id)
+    try:
+        PreferenceProfileService().apply_bookmark_event(
+            db,
+            user_id=bookmark.user_id,
+            document_id=bookmark.document_id,
+            bookmarked_at=bookmark.created_at,
+            bookmark_id=bookmark.id,
+            removed=removed,
+            # 削除済みの行は読み直せないので、加算時に記録した内容をここで渡す
+            contribution=bookmark.profile_contribution if removed else None,
+        )
+    except Exception:
+        db.rollback()
+        logger.exception("bookmarks: failed to apply bookmark event to preference profile")
+
+
 class BookmarkCreate(BaseModel):
     document_id: str
     note: Optional[str] = None
@@ -124,6 +146,7 @@ async def create_bookmark(
         db.commit()
         db.refresh(bm)
 
+        _apply_bookmark_event(db, bm)
         job_id = schedule_profile_update(db, user_id=bm.user_id, document_id=bm.document_id)
         if job_id:
             logger.debug("bookmarks.create: scheduled preference job %s for document %s", job_id, bm.document_id)
@@ -162,6 +185,7 @@ async def create_bookmark(
             new_db.commit()
             new_db.refresh(bm)
 
+            _apply_bookmark_event(new_db, bm)
             job_id = schedule_profile_update(new_db, user_id=bm.user_id, document_id=bm.document_id)
             if job_id:
                 logger.debug("bookmarks.create: scheduled preference job %s for document %s (fallback)", job_id, bm.document_id)
@@ -201,6 +225,7 @@ async def delete_bookmark(bookmark_id: str, db: Session = Depends(get_db)):
             bookmark_document_id = bm.document_id
             new_db.delete(bm)
             new_db.commit()
+            _apply_bookmark_event(new_db, bm, removed=True)
             job_id = schedule_profile_update(new_db, user_id=bookmark_user_id, document_id=bookmark_document_id)
             if job_id:
                 logger.debug("bookmarks.delete: scheduled preference job %s for document %s (fallback)", job_id, bookmark_document_id)
@@ -220,6 +245,7 @@ async def delete_bookmark(bookmark_id: str, db: Session = Depends(get_db)):
 
     db.delete(bm)
     db.commit()
+    _apply_bookmark_event(db, bm, removed=True)
 
     job_id = schedule_profile_update(db, user_id=bookmark_user_id, document_id=bookmark_document_id)
     if job_id:
@@ -229,11 +255,26 @@ async def delete_bookmark(bookmark_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("")
-async def list_bookmarks(limit: int = Query(50, le=200), offset: int = Query(0), db: Session = Depends(get_db)):
-    """ユーザー（匿名含む）のブックマーク一覧。現状 user_id="guest" のものを返す。"""
+async def list_bookmarks(
+    limit: int = Query(50, le=200),
+    offset: int = Query(0),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """ユーザー（匿名含む）のブックマーク一覧。現状 user_id="guest" のものを返す。
+
+    cursor には前ページの next_cursor を渡す（(created_at, id) のキーセット）。
+    offset は旧クライアント向けに残している。
+    """
+    next_cursor = None
     try:
-        q = db.query(Bookmark).filter(Bookmark.user_id == GUEST_USER_ID).order_by(Bookmark.created_at.desc()).offset(offset).limit(limit)
-        items = q.all()
+        q = db.query(Bookmark).options(joinedload(Bookmark.document)).filter(Bookmark.user_id == GUEST_USER_ID)
+        if offset and not cursor:
+            items = q.order_by(Bookmark.created_at.desc(), Bookmark.id.desc()).offset(offset).limit(limit).all()
+        else:
+            items, next_cursor = fetch_page(q, Bookmark.created_at, Bookmark.id, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except OperationalError:
         try:
             create_tables()
@@ -261,7 +302,7 @@ async def list_bookmarks(limit: int = Query(50, le=200), offset: int = Query(0),
                     } if b.document else None
                 })
 
-            return {"bookmarks": result, "total": len(result), "limit": limit, "offset": offset}
+            return {"bookmarks": result, "total": len(result), "limit": limit, "offset": offset, "next_cursor": None}
         finally:
             if new_db:
                 try:
@@ -283,7 +324,7 @@ async def list_bookmarks(limit: int = Query(50, le=200), offset: int = Query(0),
             } if b.document else None
         })
 
-    return {"bookmarks": result, "total": len(result), "limit": limit, "offset": offset}
+    return {"bookmarks": result, "total": len(result), "limit": limit, "offset": offset, "next_cursor": next_cursor}
 
 
 @router.delete("")
@@ -316,6 +357,7 @@ async def delete_bookmark_by_document(
             bookmark_document_id = bm.document_id
             new_db.delete(bm)
             new_db.commit()
+            _apply_bookmark_event(new_db, bm, removed=True)
             job_id = schedule_profile_update(new_db, user_id=bookmark_user_id, document_id=bookmark_document_id)
             if job_id:
                 logger.debug("bookmarks.delete_by_document: scheduled preference job %s for document %s (fallback)", job_id, bookmark_document_id)
@@ -335,6 +377,7 @@ async def delete_bookmark_by_document(
 
     db.delete(bm)
     db.commit()
+    _apply_bookmark_event(db, bm, removed=True)
     job_id = schedule_profile_update(db, user_id=bookmark_user_id, document_id=bookmark_document_id)
     if job_id:
         logger.debug("bookmarks.delete_by_document: scheduled preference job %s for document %s", job_id, bookmark_document_id)
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 from math import ceil
+from urllib.parse import urlencode
 
 from app.core.database import get_db
+from app.core.pagination import InvalidCursor
 from app.core.user_utils import normalize_user_id
-from app.services.bookmark_service import get_user_bookmarked_documents
+from app.services.bookmark_service import (
+    count_user_bookmarks,
+    get_user_bookmarked_documents,
+    get_user_bookmarked_page,
+)
 from fastapi.templating import Jinja2Templates
 from markdown_it import MarkdownIt
 from datetime import timezone, timedelta
@@ -52,20 +58,34 @@ async def bookmarks_only_page(
     request: Request,
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
     # Resolve current user. Authentication middleware should populate request.state.user;
     # for tests/local tooling allow header override.
     uid = _resolve_user_id(request)
 
-    # Fetch bookmarks. When page is out of range but bookmarks exist, snap to last page.
-    documents, total = get_user_bookmarked_documents(db, user_id=uid, page=page, per_page=per_page)
-
-    if page > 1 and not documents and total > 0:
-        last_page = max(1, ceil(total / per_page))
-        if last_page != page:
-            documents, total = get_user_bookmarked_documents(db, user_id=uid, page=last_page, per_page=per_page)
-            page = last_page
+    next_url = None
+    if cursor or page <= 1:
+        # Keyset pagination: the first page and every infinite-scroll page read
+        # per_page + 1 rows from the (user_id, created_at, id) index, no OFFSET.
+        try:
+            documents, next_cursor = get_user_bookmarked_page(db, uid, cursor=cursor, limit=per_page)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if next_cursor:
+            next_url = "/bookmarks?" + urlencode({"per_page": per_page, "cursor": next_cursor})
+        total = None
+        page = 1
+    else:
+        # Legacy ?page= links. When page is out of range but bookmarks exist, snap to last page.
+        documents, total = get_user_bookmarked_documents(db, user_id=uid, page=page, per_page=per_page)
+
+        if page > 1 and not documents and total > 0:
+            last_page = max(1, ceil(total / per_page))
+            if last_page != page:
+                documents, total = get_user_bookmarked_documents(db, user_id=uid, page=last_page, per_page=per_page)
+                page = last_page
 
     # Add personalized data to documents (for consistency with documents page)
     # Bookmarks page doesn't use personalized sorting, but we set attributes to None
@@ -78,17 +98,33 @@ async def bookmarks_only_page(
         d.personalized_computed_at = None
         d.personalized_cold_start = None
 
+    context = {
+        "request": request,
+        "documents": documents,
+        "cursor": cursor,
+        "next_url": next_url,
+        "container_target": "#bookmarks-container",
+    }
+    if cursor and request.headers.get("HX-Request") == "true":
+        # Infinite-scroll request: only the next cards and sentinel.
+        return templates.TemplateResponse("partials/document_cards_page.html", context)
+
+    if total is None:
+        # A single page is its own exact total; otherwise the total is display-only,
+        # so a briefly cached COUNT is fine.
+        total = len(documents) if not (cursor or next_url) else count_user_bookmarks(db, uid)
+
     last_page = max(1, ceil(total / per_page)) if total else 1
     has_previous = page > 1
-    has_next = (page * per_page) < total
-    start_index = (page - 1) * per_page + 1 if total else 0
-    end_index = start_index + len(documents) - 1 if documents else 0
+    has_next = (page * per_page) < total and not cursor
+    # Cursor pages don't know their absolute position, so the range line is hidden.
+    start_index = (page - 1) * per_page + 1 if total and not cursor else 0
+    end_index = start_index + len(documents) - 1 if documents and start_index else 0
 
     return templates.TemplateResponse(
         "bookmarks_only.html",
         {
-            "request": request,
-            "documents": documents,
+            **context,
             "page": page,
             "per_page": per_page,
             "total": total,
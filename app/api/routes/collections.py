@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 
-from app.core.database import get_db, Collection, CollectionItem, Document
+from app.core.database import get_db, Collection, CollectionItem, Document, defer_document_bodies
 
 router = APIRouter()
 
@@ -13,16 +14,27 @@ async def list_collections(
 ):
     """コレクション一覧取得"""
     
-    collections = db.query(Collection).order_by(Collection.created_at.desc()).all()
+    # アイテム数は items を読み込まず COUNT サブクエリで取得する
+    item_counts = (
+        db.query(CollectionItem.collection_id, func.count(CollectionItem.id).label("item_count"))
+        .group_by(CollectionItem.collection_id)
+        .subquery()
+    )
+    rows = (
+        db.query(Collection, func.coalesce(item_counts.c.item_count, 0))
+        .outerjoin(item_counts, item_counts.c.collection_id == Collection.id)
+        .order_by(Collection.created_at.desc())
+        .all()
+    )
     
     result = []
-    for collection in collections:
+    for collection, item_count in rows:
         result.append({
             "id": collection.id,
             "name": collection.name,
             "description": collection.description,
             "created_at": collection.created_at.isoformat(),
-            "item_count": len(collection.items)
+            "item_count": item_count
         })
     
     return {"collections": result}
@@ -60,7 +72,14 @@ async def get_collection(
 ):
     """コレクション詳細取得"""
     
-    collection = db.query(Collection).filter(Collection.id == collection_id).first()
+    # アイテムと記事（本文以外）を1クエリで読み込む
+    document_load = joinedload(Collection.items).joinedload(CollectionItem.document)
+    collection = (
+        db.query(Collection)
+        .options(document_load.options(*defer_document_bodies()))
+        .filter(Collection.id == collection_id)
+        .first()
+    )
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
     
@@ -2,19 +2,22 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import and_, case, or_
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm import Session, aliased, selectinload
 from typing import Optional, List, Dict
 from html import escape
 from markdown_it import MarkdownIt
 from datetime import timezone, timedelta
 
-from app.core.database import get_db, Document, Classification, PersonalizedScore, Bookmark
+from app.core.database import get_db, Document, PersonalizedScore, Bookmark, defer_document_bodies
+from app.core.pagination import InvalidCursor, fetch_page
 from app.core.timezone import JST, jst_isoformat, to_utc_naive
 from app.core.user_utils import normalize_user_id
+from app.services.bookmark_service import mark_bookmarked
+from app.services.document_search import document_text_match
 from app.services.llm_client import LLMClient
 from app.services.personalized_feedback import PersonalizedFeedbackService
 from app.services.personalized_repository import PersonalizedScoreRepository
-from app.services.similarity import calculate_document_similarity
+from app.services.similarity import calculate_document_similarity, nearest_documents
 
 router = APIRouter()
 
@@ -179,20 +182,22 @@ async def list_documents(
     to_date: Optional[str] = Query(None, alias="to", description="終了日 (YYYY-MM-DD)"),
     sort: Optional[str] = Query("recent", description="ソート順 (recent|personalized)"),
     limit: int = Query(50, le=100, description="取得件数"),
-    offset: int = Query(0, description="オフセット"),
+    offset: int = Query(0, description="オフセット（旧方式。cursor を推奨）"),
+    cursor: Optional[str] = Query(None, description="前ページの next_cursor"),
     db: Session = Depends(get_db)
 ):
     """ドキュメント一覧取得"""
     
-    query = db.query(Document)
+    # 本文は読み込まず、保存済みのプレビューだけを返す。分類は行ごとに遅延ロードせずまとめて読む
+    query = db.query(Document).options(*defer_document_bodies(), selectinload(Document.classifications))
     
     # 検索クエリ
     if q:
-        query = query.filter(Document.content_text.contains(q))
+        query = query.filter(document_text_match(db, q))
     
-    # カテゴリフィルタ
+    # カテゴリフィルタ（最新の分類を非正規化した documents.primary_category の索引で引く）
     if category:
-        query = query.join(Classification).filter(Classification.primary_category == category)
+        query = query.filter(Document.primary_category == category)
     
     # ドメインフィルタ
     if domain:
@@ -234,6 +239,7 @@ async def list_documents(
     use_personalized = sort_mode == "personalized"
 
     score_map = {}
+    next_cursor = None
     if use_personalized:
         # おすすめ記事は直近2日間に登録された記事を対象とする
         from datetime import datetime, timedelta
@@ -242,8 +248,15 @@ async def list_documents(
         # パーソナライズドソート時はuser_idを取得してブックマーク除外などを適用
         user_id = _resolve_user_id(request)
         documents, score_map = _fetch_personalized_documents(query, user_id, offset, limit, db)
+    elif offset and not cursor:
+        # 旧クライアント向けの OFFSET ページング
+        documents = query.order_by(Document.created_at.desc(), Document.id.desc()).offset(offset).limit(limit).all()
     else:
-        documents = query.order_by(Document.created_at.desc()).offset(offset).limit(limit).all()
+        # (created_at, id) のキーセットで次ページを引く。OFFSET と違い深いページでも読む行数は limit+1 件
+        try:
+            documents, next_cursor = fetch_page(query, Document.created_at, Document.id, cursor, limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
     # 結果整形
     result = []
@@ -258,7 +271,7 @@ async def list_documents(
             "published_at": doc.published_at.isoformat() if doc.published_at else None,
             "created_at": jst_isoformat(doc.created_at),
             "lang": doc.lang,
-            "content_preview": doc.content_text[:200] + "..." if len(doc.content_text) > 200 else doc.content_text
+            "content_preview": doc.preview_text(200),
         }
         
         # 分類情報
@@ -292,7 +305,8 @@ async def list_documents(
         "documents": result,
         "total": len(result),
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
     }
 
 
@@ -493,14 +507,14 @@ async def get_similar_documents(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # 埋め込みベースの類似度計算実装
-    # 同じカテゴリの他のドキュメントを取得して類似度を計算
-    
-    similar_docs = []
-    if document.classifications:
-        category = document.classifications[0].primary_category
-        similar_query = db.query(Document).join(Classification).filter(
-            Classification.primary_category == category,
+    # PostgreSQL + pgvector では埋め込みの近傍検索で全件から引く
+    similar_docs = nearest_documents(db, document_id, limit) or []
+
+    # それ以外は同じカテゴリの他のドキュメントを取得して類似度を計算
+    if not similar_docs and document.primary_category:
+        category = document.primary_category
+        similar_query = db.query(Document).options(*defer_document_bodies()).filter(
+            Document.primary_category == category,
             Document.id != document_id
         ).limit(limit * 2)  # 類似度計算後にソートするため、多めに取得
         
@@ -573,11 +587,8 @@ async def get_document_modal(
             status_code=404
         )
 
-    # ブックマーク状態を付与（既存のロジックを再利用）
-    try:
-        document.bookmarked = bool(document.bookmarks and len(document.bookmarks) > 0)
-    except Exception:
-        document.bookmarked = False
+    # ブックマーク状態を付与（ブックマーク一覧全体は読み込まない）
+    mark_bookmarked(db, [document])
 
     return templates.TemplateResponse(
         "partials/modal_content.html",
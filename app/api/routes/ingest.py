@@ -1,13 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Dict, Optional, List
+from contextlib import asynccontextmanager
 import json
 import tempfile
 import os
+import hashlib
+import aiofiles
 import logging
 
 from app.core.database import get_db, Document, Classification, Embedding
 from app.services.extractor import content_extractor
+from app.services.pdf_pipeline import extract_pdf, extract_pdf_preview
+from app.services.postprocess_queue import enqueue_job_for_document
 from app.services.llm_client import llm_client
 from app.core.config import settings
 from datetime import datetime
@@ -100,6 +106,97 @@ async def ingest_url(
     }
 
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+PDF_UPLOAD_DIR = "assets/pdfs/uploads"
+
+
+async def _stream_upload_to_disk(file: UploadFile, dest_dir: str, max_bytes: int):
+    """アップロードをチャンク単位でディスクへ書き出し、同時に SHA-256 を計算する。
+
+    上限を超えた時点で書き込みを中止し 413 を返す。戻り値は (一時ファイルパス, ハッシュ)。
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes} bytes)")
+
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf.part", dir=dest_dir)
+    os.close(fd)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes} bytes)")
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+
+# 同じ内容（SHA-256）の取り込みをプロセス内で直列化するロック。待っている側は先行リクエストの
+# 結果（登録済みの文書）を受け取り、抽出をやり直さない。使用中のハッシュの分だけ保持する
+_pdf_hash_locks: Dict[str, asyncio.Lock] = {}
+_pdf_hash_waiters: Dict[str, int] = {}
+
+
+@asynccontextmanager
+async def _pdf_hash_lock(file_hash: str):
+    lock = _pdf_hash_locks.setdefault(file_hash, asyncio.Lock())
+    _pdf_hash_waiters[file_hash] = _pdf_hash_waiters.get(file_hash, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _pdf_hash_waiters[file_hash] -= 1
+        if not _pdf_hash_waiters[file_hash]:
+            del _pdf_hash_waiters[file_hash]
+            del _pdf_hash_locks[file_hash]
+
+
+def _claim_pdf_path(tmp_path: str, final_path: str) -> bool:
+    """一時ファイルを最終パスへ排他的に置く（O_EXCL と同じく既存なら失敗するハードリンク）。
+
+    このリクエストがファイルを作ったら True、同じ内容のファイルが既にあれば False。
+    一時ファイルはどちらの場合も消す。
+    """
+    try:
+        os.link(tmp_path, final_path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.unlink(tmp_path)
+
+
+def _discard_pdf(db: Session, pdf_file_path: str, rel_path: str, created_file: bool) -> None:
+    """失敗時に、このリクエストが作り、どの文書からも参照されていないPDFだけを削除する"""
+    if not created_file or not os.path.exists(pdf_file_path):
+        return
+    try:
+        if db.query(Document.id).filter(Document.pdf_path == rel_path).first() is not None:
+            return
+    except Exception:
+        logger.exception("ingest_pdf: could not check references of %s; keeping the file", rel_path)
+        return
+    os.unlink(pdf_file_path)
+
+
+def _pdf_exists_response(document: Document) -> dict:
+    return {
+        "message": "PDF already exists",
+        "document_id": document.id,
+        "title": document.title,
+        "extraction_status": document.extraction_status or "full",
+    }
+
+
 @router.post("/pdf")
 async def ingest_pdf(
     file: UploadFile = File(...),
@@ -110,41 +207,75 @@ async def ingest_pdf(
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="PDF file required")
     
-    # 一時ファイルに保存
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
+    # チャンク単位でディスクに保存（メモリには全体を載せない）
+    upload_dir = os.path.join("data", PDF_UPLOAD_DIR)
+    tmp_file_path, file_hash = await _stream_upload_to_disk(file, upload_dir, settings.max_file_size)
     
-    try:
-        # PDF抽出
-        content_data = await content_extractor.extract_from_pdf(tmp_file_path, file.filename)
-        if not content_data:
-            raise HTTPException(status_code=400, detail="Failed to extract PDF content")
-        
-        # ドキュメント保存
-        document = Document(**content_data)
-        # 手動取り込みであることを明示的に記録
+    rel_path = f"{PDF_UPLOAD_DIR}/{file_hash}.pdf"
+    pdf_file_path = os.path.join("data", rel_path)
+    preview = settings.pdf_extraction_mode == "preview"
+    # 同じ内容を同時に取り込むリクエストはここで先行リクエストの終了を待つ。
+    # 最終パスのファイルを作る・消すのはロックを持つリクエストだけなので、使用中のファイルは消えない
+    async with _pdf_hash_lock(file_hash):
+        # 同一内容のPDFが取り込み済み（先行リクエストが登録した場合を含む）なら抽出をスキップ
+        existing = db.query(Document).filter(Document.pdf_path == rel_path).first()
+        if existing:
+            os.unlink(tmp_file_path)
+            return _pdf_exists_response(existing)
+
+        # 内容アドレス（SHA-256）のパスを原子的に確保する。別プロセスが同じ内容を同時に取り込んだ場合は
+        # 既存ファイルをそのまま使い、どちらが登録するかは documents.pdf_path の一意インデックスで決まる
+        created_file = _claim_pdf_path(tmp_file_path, pdf_file_path)
+
         try:
-            document.source = "manual"
-        except Exception:
-            logger.debug("Document model has no 'source' attribute; skipping manual source tag")
-        db.add(document)
-        db.commit()
-        db.refresh(document)
-        
+            # PDF抽出（preview モードでは先頭ページのみ。全文はポストプロセスで抽出）
+            if preview:
+                content_data = await extract_pdf_preview(pdf_file_path, file.filename)
+            else:
+                content_data = await extract_pdf(pdf_file_path, file.filename)
+            if not content_data:
+                raise HTTPException(status_code=400, detail="Failed to extract PDF content")
+
+            # ドキュメント保存
+            document = Document(**content_data)
+            document.pdf_path = rel_path
+            # 手動取り込みであることを明示的に記録
+            try:
+                document.source = "manual"
+            except Exception:
+                logger.debug("Document model has no 'source' attribute; skipping manual source tag")
+            if preview:
+                document.extraction_status = "preview"
+            db.add(document)
+            db.commit()
+            db.refresh(document)
+        except IntegrityError:
+            # 別プロセスで同じ内容を取り込んだリクエストが先に登録した
+            db.rollback()
+            existing = db.query(Document).filter(Document.pdf_path == rel_path).first()
+            if existing is None:
+                _discard_pdf(db, pdf_file_path, rel_path, created_file)
+                raise
+            return _pdf_exists_response(existing)
+        except BaseException:
+            # 取り込みに失敗したPDFは残さない（このリクエストが作ったファイルだけ）
+            db.rollback()
+            _discard_pdf(db, pdf_file_path, rel_path, created_file)
+            raise
+    
+    if preview:
+        # 全文抽出はポストプロセスジョブに委ねる
+        enqueue_job_for_document(db, document.id)
+    else:
         # 非同期でバックグラウンド処理
         await _process_document_async(document.id, content_data, db)
-        
-        return {
-            "message": "PDF ingested successfully",
-            "document_id": document.id,
-            "title": document.title
-        }
-        
-    finally:
-        # 一時ファイル削除
-        os.unlink(tmp_file_path)
+    
+    return {
+        "message": "PDF ingested successfully",
+        "document_id": document.id,
+        "title": document.title,
+        "extraction_status": document.extraction_status or "full",
+    }
 
 
 @router.post("/rss")
@@ -1,38 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Dict, Any
+from sqlalchemy.orm import Session, selectinload
+from typing import Dict, Any, Optional
 
-from app.core.database import get_db, Document, Classification, Collection
+from app.core.database import get_db, Document, defer_document_bodies
+from app.services.document_facets import category_counts, tag_counts
+from app.services.document_search import document_text_match
+from app.services.stats_counters import dashboard_stats
 
 router = APIRouter()
 
 
 @router.get("/stats")
 async def get_stats(db: Session = Depends(get_db)) -> Dict[str, Any]:
-    """統計情報を取得"""
-    
-    # ドキュメント数
-    total_docs = db.query(func.count(Document.id)).scalar() or 0
-    
-    # 今日追加されたドキュメント数
-    from datetime import datetime, timezone
-    today = datetime.now(timezone.utc).date()
-    today_docs = db.query(func.count(Document.id)).filter(
-        func.date(Document.created_at) == today
-    ).scalar() or 0
-    
-    # カテゴリ数（分類済みのもの）
-    total_categories = db.query(func.count(func.distinct(Classification.primary_category))).scalar() or 0
-    
-    # コレクション数
-    total_collections = db.query(func.count(Collection.id)).scalar() or 0
-    
+    """統計情報を取得（ドキュメント数・今日の登録数・カテゴリ数・コレクション数）
+
+    全件 COUNT はせず、挿入・削除で増減する stats_counters を1クエリで読む。
+    """
+    return dashboard_stats(db)
+
+
+@router.get("/facets")
+async def get_facets(
+    category: Optional[str] = Query(None, description="タグを絞り込むカテゴリ"),
+    tag_limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
+    """カテゴリ別件数とタグクラウド用のタグ件数"""
     return {
-        "total_documents": total_docs,
-        "today_documents": today_docs,
-        "total_categories": total_categories,
-        "total_collections": total_collections
+        "categories": category_counts(db),
+        "tags": tag_counts(db, limit=tag_limit, category=category),
     }
 
 
@@ -47,10 +43,8 @@ async def search_content(
     if not q or len(q.strip()) < 2:
         return {"results": [], "total": 0}
     
-    # 簡単な全文検索
-    query = db.query(Document).filter(
-        Document.content_text.contains(q.strip())
-    )
+    # 本文検索（PostgreSQL では tsvector と pg_trgm の索引を使う）
+    query = db.query(Document).options(*defer_document_bodies()).filter(document_text_match(db, q))
     
     documents = query.limit(limit).all()
     
@@ -62,7 +56,7 @@ async def search_content(
             "url": doc.url,
             "domain": doc.domain,
             "created_at": doc.created_at.isoformat(),
-            "content_preview": doc.content_text[:150] + "..." if len(doc.content_text) > 150 else doc.content_text
+            "content_preview": doc.preview_text(150)
         })
     
     return {
@@ -82,10 +76,16 @@ async def export_content(
     """コンテンツエクスポート"""
     
     query = db.query(Document)
+    if format == "csv":
+        # CSV はプレビューのみ出力するため本文を読み込まない
+        query = query.options(*defer_document_bodies())
+    elif format == "jsonl":
+        # JSONL は分類情報も出力するため1クエリでまとめて読む
+        query = query.options(selectinload(Document.classifications))
     
     # カテゴリフィルタ
     if category:
-        query = query.join(Classification).filter(Classification.primary_category == category)
+        query = query.filter(Document.primary_category == category)
     
     documents = query.limit(limit).all()
     
@@ -117,7 +117,7 @@ async def export_content(
                 doc.url or "",
                 doc.domain or "",
                 doc.created_at.isoformat(),
-                doc.content_text[:200].replace('\n', ' ') if doc.content_text else ""
+                doc.preview_text(200).replace('\n', ' ')
             ])
         
         return {"content": output.getvalue(), "filename": "scrap-board-export.csv"}
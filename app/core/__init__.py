@@ -5,6 +5,9 @@ from .database import (
 	SessionLocal,
 	engine,
 	get_db,
+	get_engine,
+	get_sessionmaker,
+	invalidate_engine_cache,
 	create_tables,
 	Document,
 	Classification,
@@ -25,6 +28,9 @@ __all__ = [
 	"SessionLocal",
 	"engine",
 	"get_db",
+	"get_engine",
+	"get_sessionmaker",
+	"invalidate_engine_cache",
 	"create_tables",
 	"Document",
 	"Classification",
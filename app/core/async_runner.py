@@ -0,0 +1,170 @@
+"""同期コード（ワーカースレッド等）から非同期処理を実行するための共有イベントループ。
+
+専用スレッドで1つの長寿命イベントループを動かし、`submit(coro)` で
+`concurrent.futures.Future` を返す。呼び出しごとに `asyncio.run()` で
+ループを作り直さないため、ループに紐づく HTTP クライアントの接続プールを
+呼び出し間で再利用できる（`get_loop_http_client` を参照）。
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CoroOrFactory = Union[Awaitable[Any], Callable[[], Awaitable[Any]]]
+
+
+class BackgroundLoopRunner:
+    """専用スレッドで長寿命のイベントループを保持するランナー"""
+
+    def __init__(self, name: str = "async-runner"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._ensure_started()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None and self._thread is not None and self._thread.is_alive():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._thread is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=_run, name=self.name, daemon=True)
+                thread.start()
+                started.wait()
+                self._loop = loop
+                self._thread = thread
+                logger.debug("Started background event loop thread %s", self.name)
+        return self._loop
+
+    def in_runner_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> Future:
+        """コルーチンを共有ループに投入し、Future を返す"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run_sync(self, coro_or_factory: CoroOrFactory, timeout: Optional[float] = None) -> Any:
+        """コルーチン（またはコルーチンを返す callable）を共有ループで実行し、結果を待つ。
+
+        共有ループのスレッド自身から呼ぶとデッドロックするため RuntimeError とする。
+        """
+        if self.in_runner_thread():
+            raise RuntimeError("run_sync() cannot be called from the background loop thread; await the coroutine instead")
+        coro = coro_or_factory() if callable(coro_or_factory) and not asyncio.iscoroutine(coro_or_factory) else coro_or_factory
+        if not asyncio.iscoroutine(coro) and not isinstance(coro, asyncio.Future):
+            raise TypeError("Expected coroutine or callable returning coroutine")
+        return self.submit(coro).result(timeout)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """ループ上のHTTPクライアントを閉じてからループを停止する"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None or thread is None or not thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(close_loop_http_clients(), loop).result(timeout)
+        except Exception:
+            logger.debug("Failed to close HTTP clients on background loop", exc_info=True)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+
+
+_runner = BackgroundLoopRunner()
+
+
+def get_runner() -> BackgroundLoopRunner:
+    return _runner
+
+
+def submit(coro: Awaitable[Any]) -> Future:
+    """共有ループにコルーチンを投入する（`get_runner().submit` の短縮形）"""
+    return _runner.submit(coro)
+
+
+def run_sync(coro_or_factory: CoroOrFactory, timeout: Optional[float] = None) -> Any:
+    """共有ループでコルーチンを実行して結果を返す（`get_runner().run_sync` の短縮形）"""
+    return _runner.run_sync(coro_or_factory, timeout)
+
+
+def shutdown_runner() -> None:
+    _runner.stop()
+
+
+# --- ループ単位で共有する HTTP クライアント ---------------------------------
+
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+_loop_clients_lock = threading.Lock()
+
+
+def get_loop_http_client(name: str, **client_kwargs: Any) -> httpx.AsyncClient:
+    """実行中のイベントループに紐づく `httpx.AsyncClient` を名前ごとに1つ返す。
+
+    `httpx.AsyncClient` は生成したループでしか使えないため、ループ単位でキャッシュする。
+    閉じられたループのエントリは次回呼び出し時に破棄する。
+    """
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        for stale in [lp for lp in list(_loop_clients.keys()) if lp.is_closed()]:
+            _loop_clients.pop(stale, None)
+        clients = _loop_clients.setdefault(loop, {})
+        client = clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(**client_kwargs)
+            clients[name] = client
+    return client
+
+
+_loop_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def get_loop_semaphore(name: str, limit: int) -> asyncio.Semaphore:
+    """実行中のイベントループに紐づく同時実行数制限用セマフォを名前ごとに1つ返す"""
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        semaphores = _loop_semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(name)
+        if semaphore is None:
+            semaphore = semaphores[name] = asyncio.Semaphore(max(int(limit), 1))
+    return semaphore
+
+
+async def close_loop_http_clients() -> None:
+    """実行中のループに紐づく HTTP クライアントをすべて閉じる"""
+    loop = asyncio.get_running_loop()
+    with _loop_clients_lock:
+        clients = _loop_clients.pop(loop, {})
+    for client in clients.values():
+        await client.aclose()
+
+
+__all__ = [
+    "BackgroundLoopRunner",
+    "get_runner",
+    "submit",
+    "run_sync",
+    "shutdown_runner",
+    "get_loop_http_client",
+    "get_loop_semaphore",
+    "close_loop_http_clients",
+]
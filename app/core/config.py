@@ -8,6 +8,22 @@ class Settings(BaseSettings):
     
     # データベース設定
     db_url: str = "sqlite:///./data/scraps.db"
+    # SQLite 接続ごとに適用する PRAGMA（Web と各ワーカーが同じファイルを共有するため）
+    sqlite_journal_mode: str = "WAL"  # WAL: 読み取りが書き込みにブロックされない（空文字で変更しない）
+    sqlite_synchronous: str = "NORMAL"  # WAL では NORMAL でもコミット済みデータは失われない
+    sqlite_busy_timeout_ms: int = 5000  # ロック中に待つ時間（"database is locked" を避ける）
+    sqlite_mmap_size: int = 268_435_456  # メモリマップ I/O の上限（バイト、0 で無効）
+    sqlite_cache_size_kib: int = 65_536  # 接続ごとのページキャッシュ（KiB）
+    sqlite_temp_store: str = "MEMORY"  # 一時テーブル・ソートの置き場所（DEFAULT / FILE / MEMORY）
+    # PostgreSQL（DB_URL=postgresql+psycopg://… のとき）の接続プールと検索・ベクトル設定
+    db_pool_size: int = 5  # プロセスごとに保持する接続数
+    db_max_overflow: int = 10  # 混雑時に一時的に追加できる接続数
+    postgres_fts_config: str = "simple"  # tsvector 検索のテキスト検索設定（空文字で LIKE 検索）
+    pgvector_enabled: bool = False  # embeddings に pgvector 列を持たせて類似検索に使う
+    pgvector_dimensions: int = 1536  # 埋め込みの次元数（これと異なる長さのベクトルは pgvector 列に入れない）
+    # 本文（content_md）の圧縮保存: zstd（zstandard が必要、無ければ zlib）/ zlib / none
+    content_compression: str = "zlib"
+    content_compression_level: Optional[int] = None  # 未指定なら各コーデックの既定（zstd=3, zlib=6）
     
     # LLM API設定
     chat_api_base: str = "http://localhost:1234/v1"
@@ -18,6 +34,7 @@ class Settings(BaseSettings):
     # API設定
     timeout_sec: int = 30
     max_retries: int = 3
+    llm_max_concurrency: int = 4  # 1つのイベントループから同時に投げる LLM リクエスト数の上限
     
     # アプリケーション設定
     app_title: str = "Scrap-Board"
@@ -31,6 +48,45 @@ class Settings(BaseSettings):
     upload_dir: str = "./data/uploads"
     assets_dir: str = "./data/assets"
     max_file_size: int = 50_000_000  # 50MB
+    thumbnail_negative_ttl_hours: int = 24  # favicon が無いドメインを再試行するまでの時間
+
+    # 一覧表示設定
+    bookmark_count_cache_seconds: int = 60  # ブックマーク件数のキャッシュ秒数（0 で無効）
+    stats_reconcile_interval_minutes: int = 60  # stats_counters を実テーブルから数え直す間隔（0 で無効）
+
+    # データ移行（バックフィル）設定
+    backfill_enabled: bool = True  # 起動中のアプリでバックフィルを少しずつ進める
+    backfill_interval_seconds: int = 60  # バックフィルを進める間隔
+    backfill_time_budget_seconds: float = 20.0  # 1回あたりに使う時間の上限
+    backfill_batch_size: int = 500  # 1トランザクションで処理する行数
+    backfill_throttle_seconds: float = 0.2  # バッチ間の待ち時間（他の書き込みに DB を譲る）
+
+    # PDF抽出設定（Docling パイプラインオプション）
+    pdf_ocr_enabled: bool = False
+    pdf_table_structure: bool = True
+    pdf_warmup_on_start: bool = False
+    pdf_extraction_mode: str = "full"  # full | preview
+    pdf_preview_pages: int = 3
+    pdf_extract_workers: int = 2
+    pdf_pages_per_chunk: int = 8
+
+    # ジョブキュー設定
+    job_lease_seconds: int = 600  # ワーカーがジョブを保持できる時間（リース期限）
+    job_reclaim_interval_seconds: int = 60  # 期限切れリースを回収する間隔
+    queue_idle_min_wait_seconds: float = 0.5  # キューが空のときの最初の待機時間
+    queue_idle_max_wait_seconds: float = 30.0  # アイドル時バックオフの上限
+    queue_signal_probe_interval: float = 0.2  # SQLite data_version を確認する間隔
+    job_retention_days: float = 7  # 完了（done）ジョブを保持する日数（0 以下で削除しない）
+    failed_job_retention_days: float = 30  # 失敗（failed）ジョブを保持する日数（0 以下で削除しない）
+    job_retention_batch_size: int = 500  # 1トランザクションで削除するジョブ数
+    db_vacuum_min_free_ratio: float = 0.2  # 空きページがこの割合以上なら SQLite を VACUUM（0 で無効）
+    admin_jobs_window_hours: int = 24  # 管理画面のジョブ一覧で表示する直近の時間幅
+    postprocess_worker_concurrency: int = 1  # 1ワーカーが並行処理する文書数（2以上で非同期モード）
+    worker_throughput_log_seconds: int = 60  # スループット（docs/min）をログ出力する間隔
+    preference_job_debounce_seconds: int = 30  # 同一ユーザーの再計算ジョブをまとめる待機時間
+    preference_job_max_delay_seconds: int = 300  # まとめられたジョブを最初の登録から遅らせる上限
+    preference_profile_half_life_days: float = 0.0  # ブックマークの重みが半減する日数（0 は減衰なし）
+    personalization_rescore_threshold: float = 0.05  # 前回の全件スコアリング時からのプロファイル変化量がこれ以上なら全件再スコア
 
     # 要約設定
     summary_mode: str = "sync"  # sync | async
@@ -47,7 +103,8 @@ class Settings(BaseSettings):
 # グローバル設定インスタンス
 settings = Settings()
 
-# ディレクトリ作成
-os.makedirs(os.path.dirname(settings.db_url.replace("sqlite:///", "")), exist_ok=True)
+# ディレクトリ作成（SQLite のときだけ DB ファイルの置き場所を作る）
+if settings.db_url.startswith("sqlite:///"):
+    os.makedirs(os.path.dirname(settings.db_url.replace("sqlite:///", "")) or ".", exist_ok=True)
 os.makedirs(settings.upload_dir, exist_ok=True)
 os.makedirs(settings.assets_dir, exist_ok=True)
\ No newline at end of file
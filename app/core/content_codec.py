@@ -0,0 +1,92 @@
+"""本文（content_md）の圧縮保存用コーデック。
+
+圧縮済みの値は先頭のマジックバイトで形式を判別する（zstd フレームは
+``28 b5 2f fd``、zlib ストリームは ``0x78`` で始まる）。そのため設定で
+コーデックを切り替えても既存の行はそのまま読める。zstd は任意依存
+（``zstandard``）で、入っていない環境では zlib で圧縮する。
+"""
+import logging
+import zlib
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+try:
+    import zstandard as _zstd
+    ZSTD_AVAILABLE = True
+except ImportError:
+    _zstd = None
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_CODECS = ("zstd", "zlib", "none")
+# これより短い本文は圧縮してもヘッダ分で得をしないため平文のまま保存する
+MIN_COMPRESS_BYTES = 256
+
+_warned_zstd_missing = False
+
+
+def active_codec() -> str:
+    """設定から実際に使うコーデック名を返す（zstd が使えなければ zlib）"""
+    global _warned_zstd_missing
+    codec = (settings.content_compression or "none").strip().lower()
+    if codec not in _CODECS:
+        logger.warning("Unknown content_compression %r; storing bodies uncompressed", codec)
+        return "none"
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        if not _warned_zstd_missing:
+            logger.warning("content_compression=zstd but zstandard is not installed; falling back to zlib")
+            _warned_zstd_missing = True
+        return "zlib"
+    return codec
+
+
+def compress_body(text: Optional[str], codec: Optional[str] = None) -> Optional[bytes]:
+    """本文を圧縮する。圧縮しない場合（none / 短い本文 / 縮まない本文）は None を返す"""
+    if not text:
+        return None
+    codec = codec or active_codec()
+    if codec == "none":
+        return None
+    raw = text.encode("utf-8")
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return None
+    level = settings.content_compression_level
+    if codec == "zstd":
+        blob = _zstd.ZstdCompressor(level=3 if level is None else level).compress(raw)
+    else:
+        blob = zlib.compress(raw, 6 if level is None else level)
+    return blob if len(blob) < len(raw) else None
+
+
+def decompress_body(blob: bytes) -> str:
+    """compress_body の出力を文字列に戻す"""
+    blob = bytes(blob)
+    if blob.startswith(_ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("document body is zstd-compressed but zstandard is not installed")
+        return _zstd.ZstdDecompressor().decompress(blob).decode("utf-8")
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def encode_content_md(content_md: Optional[str]) -> Tuple[Optional[str], Optional[bytes]]:
+    """documents への生 SQL 書き込み用に (content_md 列の値, content_md_z 列の値) を返す。
+
+    圧縮した場合 content_md 列は NOT NULL 制約を満たすため空文字にする。
+    """
+    blob = compress_body(content_md)
+    if blob is None:
+        return content_md, None
+    return "", blob
+
+
+__all__ = [
+    "ZSTD_AVAILABLE",
+    "MIN_COMPRESS_BYTES",
+    "active_codec",
+    "compress_body",
+    "decompress_body",
+    "encode_content_md",
+]
@@ -10,110 +10,244 @@ from sqlalchemy import (
     ForeignKey,
     JSON,
     Index,
+    LargeBinary,
     UniqueConstraint,
     CheckConstraint,
 )
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
-from sqlalchemy.sql import func
-from typing import Generator
+from sqlalchemy.orm import sessionmaker, Session, relationship, defer, object_session
+from sqlalchemy.sql import func, literal_column, select, text
+from typing import Dict, Generator, Optional
+import logging
+import re
+import threading
 import uuid
 
 from app.core.config import settings
+from app.core.content_codec import decompress_body, encode_content_md
 import os
 
+
+logger = logging.getLogger(__name__)
+
+
+# --- SQLite 接続プロファイル -------------------------------------------------
+# Web アプリと2つのワーカーコンテナが同じ data/scraps.db を共有するため、
+# プールが新しい接続を作るたびに WAL・busy_timeout・キャッシュ等の PRAGMA を適用する。
+
+_SQLITE_CHOICES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+
+
+def sqlite_pragma_profile() -> Dict[str, object]:
+    """設定から接続ごとに適用する PRAGMA を組み立てる（不正な値は除外）"""
+    profile: Dict[str, object] = {}
+    for name, value in (
+        ("journal_mode", settings.sqlite_journal_mode),
+        ("synchronous", settings.sqlite_synchronous),
+        ("temp_store", settings.sqlite_temp_store),
+    ):
+        value = (value or "").strip().upper()
+        if not value:
+            continue
+        if value not in _SQLITE_CHOICES[name]:
+            logger.warning("database: ignoring invalid SQLite %s=%r", name, value)
+            continue
+        profile[name] = value
+    profile["busy_timeout"] = max(int(settings.sqlite_busy_timeout_ms), 0)
+    profile["mmap_size"] = max(int(settings.sqlite_mmap_size), 0)
+    # 負の値は KiB 指定（ページサイズに依存しない）
+    profile["cache_size"] = -max(int(settings.sqlite_cache_size_kib), 0) if settings.sqlite_cache_size_kib else None
+    return {key: value for key, value in profile.items() if value is not None}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout を最初に設定し、journal_mode 切り替え時のロック待ちにも効かせる
+        for name, value in sorted(sqlite_pragma_profile().items(), key=lambda item: item[0] != "busy_timeout"):
+            try:
+                cursor.execute(f"PRAGMA {name}={value}")
+            except Exception:
+                logger.warning("database: failed to apply PRAGMA %s=%s", name, value, exc_info=True)
+    finally:
+        cursor.close()
+
+
+def sqlite_health_report(bind: Engine) -> Dict[str, object]:
+    """実際に有効になっている接続設定を返す（PostgreSQL はサーバー版・プール・検索／pgvector の状態）"""
+    report: Dict[str, object] = {"dialect": bind.dialect.name}
+    if bind.dialect.name == "postgresql":
+        return _postgres_health_report(bind, report)
+    if bind.dialect.name != "sqlite":
+        return report
+    with bind.connect() as conn:
+        for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size", "temp_store", "page_size"):
+            try:
+                report[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            except Exception:
+                report[name] = None
+        report["sqlite_version"] = conn.exec_driver_sql("SELECT sqlite_version()").scalar()
+    report["database"] = bind.url.database
+    for name, labels in (("synchronous", ("OFF", "NORMAL", "FULL", "EXTRA")), ("temp_store", ("DEFAULT", "FILE", "MEMORY"))):
+        value = report.get(name)
+        if isinstance(value, int) and 0 <= value < len(labels):
+            report[name] = labels[value]
+    # 設定どおりに反映されていない PRAGMA（ネットワークFS で WAL にできない等）
+    mismatches = {}
+    for name, expected in sqlite_pragma_profile().items():
+        actual = report.get(name)
+        if isinstance(expected, str) and isinstance(actual, str):
+            matched = actual.upper() == expected
+        else:
+            matched = actual == expected
+        if not matched:
+            mismatches[name] = {"expected": expected, "actual": actual}
+    report["mismatches"] = mismatches
+    return report
+
+
+def _postgres_health_report(bind: Engine, report: Dict[str, object]) -> Dict[str, object]:
+    with bind.connect() as conn:
+        report["server_version"] = conn.exec_driver_sql("SHOW server_version").scalar()
+        report["pgvector"] = conn.exec_driver_sql(
+            "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+        ).scalar()
+        indexes = {
+            row[0]
+            for row in conn.exec_driver_sql(
+                "SELECT indexname FROM pg_indexes WHERE tablename IN ('documents', 'embeddings')"
+            )
+        }
+    report["database"] = bind.url.database
+    report["pool_size"] = bind.pool.size() if hasattr(bind.pool, "size") else None
+    config = postgres_fts_config()
+    report["fts_config"] = config
+    report["fts_index"] = bool(config) and _pg_fts_index_name(config) in indexes
+    report["pgvector_index"] = _PG_VECTOR_INDEX in indexes
+    # SQLite と同じく「設定どおりになっていないもの」を返す
+    mismatches = {}
+    if config and not report["fts_index"]:
+        mismatches["fts_index"] = {"expected": _pg_fts_index_name(config), "actual": None}
+    if settings.pgvector_enabled and not report["pgvector_index"]:
+        mismatches["pgvector_index"] = {"expected": _PG_VECTOR_INDEX, "actual": report["pgvector"]}
+    report["mismatches"] = mismatches
+    return report
+
+
+# --- URL ごとのエンジンレジストリ ---------------------------------------------
+# エンジン（＝コネクションプール）はプロセス内で DB URL ごとに1つだけ作り、
+# ワーカーやサービスはすべて get_engine / get_sessionmaker 経由で共有する。
+# テストが実行時に DB_URL を切り替えた場合は別 URL として新しいエンジンが作られる。
+# 同じ URL のまま DB を作り直す場合は invalidate_engine_cache() で明示的に破棄する。
+
+_engines: Dict[str, Engine] = {}
+_sessionmakers: Dict[str, sessionmaker] = {}
+_registry_lock = threading.Lock()
+
+
+def current_db_url() -> str:
+    """現在の DB URL（環境変数 DB_URL を優先）"""
+    return os.environ.get("DB_URL") or settings.db_url
+
+
+def get_engine(db_url: Optional[str] = None) -> Engine:
+    """DB URL に対応する共有エンジンを返す（初回のみ作成）"""
+    db_url = db_url or current_db_url()
+    engine_ = _engines.get(db_url)
+    if engine_ is not None:
+        return engine_
+    with _registry_lock:
+        engine_ = _engines.get(db_url)
+        if engine_ is None:
+            if db_url.startswith("sqlite"):
+                options = {"connect_args": {"check_same_thread": False}}
+            else:
+                # 複数ノードから使うサーバー DB では、切れた接続をチェックアウト時に検出して張り直す
+                options = {
+                    "pool_pre_ping": True,
+                    "pool_size": max(int(settings.db_pool_size), 1),
+                    "max_overflow": max(int(settings.db_max_overflow), 0),
+                }
+            engine_ = create_engine(db_url, **options)
+            if engine_.dialect.name == "sqlite":
+                event.listen(engine_, "connect", _apply_sqlite_pragmas)
+            _engines[db_url] = engine_
+        return engine_
+
+
+def get_sessionmaker(db_url: Optional[str] = None) -> sessionmaker:
+    """DB URL に対応する共有エンジンに束縛されたセッションファクトリを返す"""
+    db_url = db_url or current_db_url()
+    bound = get_engine(db_url)
+    factory = _sessionmakers.get(db_url)
+    if factory is None or factory.kw.get("bind") is not bound:
+        with _registry_lock:
+            factory = _sessionmakers.get(db_url)
+            if factory is None or factory.kw.get("bind") is not bound:
+                factory = sessionmaker(autocommit=False, autoflush=False, bind=bound)
+                _sessionmakers[db_url] = factory
+    return factory
+
+
+def invalidate_engine_cache(db_url: Optional[str] = None) -> None:
+    """キャッシュ済みエンジンを破棄する（db_url 省略時はすべて）"""
+    with _registry_lock:
+        urls = [db_url] if db_url else list(_engines)
+        for url in urls:
+            engine_ = _engines.pop(url, None)
+            _sessionmakers.pop(url, None)
+            if engine_ is not None:
+                engine_.dispose()
+
+
 # データベースエンジン
-engine = create_engine(
-    settings.db_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.db_url else {}
-)
+engine = get_engine(settings.db_url)
 
 # セッションメーカー
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = get_sessionmaker(settings.db_url)
 
 # ベースクラス
 Base = declarative_base()
 
-# Keep track of engines we've ensured tables for (avoid repeated create_all calls)
-def get_db() -> Generator[Session, None, None]:
-    """データベースセッションを取得"""
-    # Ensure we operate on the sessionmaker/engine that tests may have set up.
-    # If SessionLocal already has a bound engine, use that. Otherwise create
-    # an engine from the active DB URL (env override preferred) and bind
-    # a new SessionLocal to it.
-    global SessionLocal, engine
-    bound_engine = getattr(SessionLocal, "bind", None)
-    # If there's no bound engine, or the bound engine uses a different
-    # DB URL than the one in the environment, recreate the engine so
-    # tests that set `DB_URL` at runtime are respected.
-    db_url = os.environ.get("DB_URL") or settings.db_url
-    current_engine_url = None
-    try:
-        if bound_engine is not None and hasattr(bound_engine, 'url'):
-            current_engine_url = str(bound_engine.url)
-    except Exception:
-        current_engine_url = None
+# --- リクエストごとのセッション ---------------------------------------------
+# スキーマの確認・作成は起動時（lifespan の create_tables）とマイグレーションで
+# 1回だけ行い、get_db はセッションを作って返すだけにする。
+# テストが実行時に DB_URL を差し替える場合は enable_test_db_hook() を呼ぶと、
+# リクエストごとに現在の URL のエンジンを引き、初めての URL ではテーブルを作成する。
 
-    if bound_engine is None or (db_url and current_engine_url and db_url != current_engine_url) or (bound_engine is not None and current_engine_url is None):
-        # prefer env var so pytest_configure/test fixtures can control DB
-        db_url = os.environ.get("DB_URL") or settings.db_url
-        try:
-            from sqlalchemy import create_engine as _create_engine
+_test_db_hook_enabled = False
+_schema_ready_urls = set()
 
-            new_engine = _create_engine(
-                db_url,
-                connect_args={"check_same_thread": False} if "sqlite" in db_url else {},
-            )
-            engine = new_engine
-            SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=new_engine)
-            bound_engine = new_engine
-        except Exception:
-            # fall back to existing module-level engine if creation fails
-            bound_engine = globals().get("engine")
 
-    # Ensure tables exist on the bound engine before creating sessions.
-    try:
-        if bound_engine is not None:
-            # If the bound engine does not have the core tables (e.g. documents),
-            # recreate an engine bound to the current DB URL so tests that
-            # swap DBs at runtime are respected.
-            try:
-                # Quick check for documents table presence (SQLite specific path)
-                conn = bound_engine.connect()
-                try:
-                    res = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='documents'")
-                    has_documents = bool(res.fetchall())
-                except Exception:
-                    # If the inspection query fails (non-sqlite dialect), fall back
-                    has_documents = True
-                finally:
-                    conn.close()
-            except Exception:
-                has_documents = False
-
-            if not has_documents:
-                # Recreate engine from env DB URL so it points to the DB with tables
-                try:
-                    db_url = os.environ.get("DB_URL") or settings.db_url
-                    from sqlalchemy import create_engine as _create_engine
-
-                    new_engine = _create_engine(db_url, connect_args={"check_same_thread": False} if "sqlite" in db_url else {})
-                    engine = new_engine
-                    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=new_engine)
-                    bound_engine = new_engine
-                except Exception:
-                    pass
-
-            # Ensure tables exist on the (new) bound engine before creating sessions.
-            try:
-                Base.metadata.create_all(bind=bound_engine)
-            except Exception:
-                pass
-    except Exception:
-        # best-effort only
-        pass
+def enable_test_db_hook(enabled: bool = True) -> None:
+    """テスト用: get_db が DB_URL の実行時変更に追従するようにする（tests/conftest.py から有効化）"""
+    global _test_db_hook_enabled
+    _test_db_hook_enabled = enabled
+    _schema_ready_urls.clear()
+
 
-    db = SessionLocal()
+def _test_sessionmaker() -> sessionmaker:
+    global SessionLocal, engine
+    db_url = current_db_url()
+    factory = get_sessionmaker(db_url)
+    if db_url not in _schema_ready_urls or factory is not SessionLocal:
+        Base.metadata.create_all(bind=factory.kw["bind"])
+        _schema_ready_urls.add(db_url)
+        SessionLocal = factory
+        engine = factory.kw["bind"]
+    return factory
+
+
+def get_db() -> Generator[Session, None, None]:
+    """データベースセッションを取得（FastAPI 依存関係）"""
+    factory = _test_sessionmaker() if _test_db_hook_enabled else SessionLocal
+    db = factory()
     try:
         yield db
     finally:
@@ -122,6 +256,15 @@ def get_db() -> Generator[Session, None, None]:
 
 # データベースモデル定義
 
+# 一覧で表示するプレビューの最大文字数。1文字余分に保存して「続きがあるか」を判定できるようにする
+CONTENT_PREVIEW_CHARS = 300
+
+
+def build_content_preview(content_text: Optional[str]) -> str:
+    """content_text から一覧表示用のプレビューを作る"""
+    return (content_text or "")[: CONTENT_PREVIEW_CHARS + 1]
+
+
 class Document(Base):
     """ドキュメントテーブル"""
     __tablename__ = "documents"
@@ -134,8 +277,16 @@ class Document(Base):
     published_at = Column(DateTime, nullable=True)
     fetched_at = Column(DateTime, default=func.now())
     lang = Column(String, nullable=True)
-    content_md = Column(Text, nullable=False)
+    # Markdown 本文は圧縮して content_md_z に保存する（Document.content_md プロパティ経由で読み書きする）。
+    # 圧縮しなかった本文（短い本文・圧縮無効・旧データ）は従来どおり content_md 列に平文で入る
+    _content_md = Column("content_md", Text, nullable=False)
+    content_md_z = Column(LargeBinary, nullable=True)
+    # content_text は LIKE 検索の対象なので平文のまま保存する
     content_text = Column(Text, nullable=False)
+    # 一覧表示用の本文プレビュー（content_text の先頭 CONTENT_PREVIEW_CHARS+1 文字。content_text 設定時に自動更新）
+    content_preview = Column(Text, nullable=True)
+    # 最新の分類のカテゴリ（一覧の絞り込みを classifications との JOIN なしで索引検索するための非正規化列）
+    primary_category = Column(String, nullable=True, index=True)
     short_summary = Column(Text, nullable=True)
     medium_summary = Column(Text, nullable=True)
     summary_generated_at = Column(DateTime, nullable=True)
@@ -144,13 +295,52 @@ class Document(Base):
     original_url = Column(String, nullable=True)
     thumbnail_url = Column(String, nullable=True)
     pdf_path = Column(String, nullable=True)
+    extraction_status = Column(String, nullable=True)  # preview | full (NULL = 通常の抽出)
     fetched_at = Column(DateTime, nullable=True)
     hash = Column(String, nullable=False, index=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
-    # リレーション
-    classifications = relationship("Classification", back_populates="document", cascade="all, delete-orphan")
+    @property
+    def content_md(self) -> Optional[str]:
+        """Markdown 本文（圧縮済みなら初回アクセス時に展開し、同じ blob の間はキャッシュする）"""
+        blob = self.content_md_z
+        if blob is None:
+            return self._content_md
+        cached = self.__dict__.get("_content_md_cache")
+        if cached is not None and cached[0] is blob:
+            return cached[1]
+        value = decompress_body(blob)
+        self.__dict__["_content_md_cache"] = (blob, value)
+        return value
+
+    @content_md.setter
+    def content_md(self, value: Optional[str]) -> None:
+        plain, blob = encode_content_md(value)
+        self._content_md = plain
+        self.content_md_z = blob
+        self.__dict__.pop("_content_md_cache", None)
+
+    def preview_text(self, limit: int = CONTENT_PREVIEW_CHARS) -> str:
+        """一覧用プレビュー（limit 文字を超える場合は "..." を付ける）。
+
+        content_preview が未設定の古い行だけ本文を読み込む。
+        """
+        limit = min(limit, CONTENT_PREVIEW_CHARS)
+        preview = self.content_preview
+        if preview is None:
+            preview = build_content_preview(self.content_text)
+        return preview[:limit] + "..." if len(preview) > limit else preview
+
+    # リレーション（classifications[0] が最新の分類になるよう作成日時の降順で読む）
+    classifications = relationship(
+        "Classification",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="(Classification.created_at.desc(), Classification.id)",
+    )
+    # 最新の分類のタグ（document_tags）
+    tag_rows = relationship("DocumentTag", back_populates="document", cascade="all, delete-orphan")
     embeddings = relationship("Embedding", back_populates="document", cascade="all, delete-orphan")
     collection_items = relationship("CollectionItem", back_populates="document", cascade="all, delete-orphan")
     feedbacks = relationship("Feedback", back_populates="document", cascade="all, delete-orphan")
@@ -172,13 +362,30 @@ class Document(Base):
         passive_deletes=True,
     )
 
+    __table_args__ = (
+        # 一覧のキーセットページング（created_at DESC, id DESC）用
+        Index("idx_documents_created_id", "created_at", "id"),
+        # PDFは内容アドレス（SHA-256）で保存するため、同じ内容の同時取り込みはここで1件に絞る
+        Index("ux_documents_pdf_path", "pdf_path", unique=True),
+    )
+
+
+@event.listens_for(Document.content_text, "set")
+def _sync_content_preview(target, value, oldvalue, initiator):
+    target.content_preview = build_content_preview(value)
+
+
+def defer_document_bodies():
+    """一覧表示用のローダーオプション: 本文（content_md / content_md_z / content_text）を読み込まない"""
+    return (defer(Document._content_md), defer(Document.content_md_z), defer(Document.content_text))
+
 
 class Classification(Base):
     """分類テーブル"""
     __tablename__ = "classifications"
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    document_id = Column(String, ForeignKey("documents.id"), nullable=False)
+    document_id = Column(String, ForeignKey("documents.id"), nullable=False, index=True)
     primary_category = Column(String, nullable=False)
     topics = Column(JSON, nullable=True)  # JSONB for topics list
     tags = Column(JSON, nullable=True)    # JSONB for tags list  
@@ -190,6 +397,87 @@ class Classification(Base):
     document = relationship("Document", back_populates="classifications")
 
 
+class DocumentTag(Base):
+    """ドキュメントのタグ（最新の分類の tags を1行1タグに正規化したもの）。
+
+    タグでの絞り込みやタグクラウドを JSON 文字列の LIKE ではなく索引で引くために使う。
+    Classification の書き込み時に下のイベントで更新される。
+    """
+    __tablename__ = "document_tags"
+
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String, primary_key=True)
+
+    document = relationship("Document", back_populates="tag_rows")
+
+    __table_args__ = (
+        Index("idx_document_tags_tag", "tag", "document_id"),
+    )
+
+
+def normalize_tags(tags) -> list:
+    """空白を除いて重複を取り除いたタグ一覧（順序は保持）"""
+    if not tags or isinstance(tags, (str, bytes)):
+        return []
+    result = []
+    for tag in tags:
+        if isinstance(tag, str) and tag.strip() and tag.strip() not in result:
+            result.append(tag.strip())
+    return result
+
+
+def _write_classification_facets(connection, document_id, primary_category, tags) -> None:
+    """documents.primary_category と document_tags を指定した分類の内容で置き換える"""
+    previous = connection.execute(
+        Document.__table__.select().with_only_columns(Document.__table__.c.primary_category).where(Document.__table__.c.id == document_id)
+    ).scalar()
+    if previous != primary_category:
+        deltas = {}
+        if previous is not None:
+            deltas[stats_category_key(previous)] = -1
+        if primary_category is not None:
+            deltas[stats_category_key(primary_category)] = 1
+        bump_stats_counters(connection, deltas)
+    connection.execute(
+        Document.__table__.update().where(Document.__table__.c.id == document_id).values(primary_category=primary_category)
+    )
+    connection.execute(DocumentTag.__table__.delete().where(DocumentTag.__table__.c.document_id == document_id))
+    rows = [{"document_id": document_id, "tag": tag} for tag in normalize_tags(tags)]
+    if rows:
+        connection.execute(DocumentTag.__table__.insert(), rows)
+
+
+# 分類を書き込んだ経路（postprocess / ingest / テスト）に関係なく、最後に書かれた分類を最新として
+# 同じフラッシュ内で primary_category / document_tags に反映する
+@event.listens_for(Classification, "after_insert")
+@event.listens_for(Classification, "after_update")
+def _sync_classification_facets(mapper, connection, target):
+    _write_classification_facets(connection, target.document_id, target.primary_category, target.tags)
+
+
+@event.listens_for(Classification, "after_delete")
+def _resync_classification_facets(mapper, connection, target):
+    session = object_session(target)
+    if session is not None and any(
+        isinstance(obj, Document) and obj.id == target.document_id for obj in session.deleted
+    ):
+        # ドキュメントごと削除される場合は document_tags もカスケードで消える
+        return
+    table = Classification.__table__
+    latest = connection.execute(
+        table.select()
+        .where(table.c.document_id == target.document_id)
+        .order_by(table.c.created_at.desc(), table.c.id)
+        .limit(1)
+    ).first()
+    _write_classification_facets(
+        connection,
+        target.document_id,
+        latest.primary_category if latest is not None else None,
+        latest.tags if latest is not None else None,
+    )
+
+
 class Embedding(Base):
     """埋め込みテーブル"""
     __tablename__ = "embeddings"
@@ -248,6 +536,176 @@ class Feedback(Base):
     document = relationship("Document", back_populates="feedbacks")
 
 
+class StatsCounter(Base):
+    """ダッシュボード用の集計カウンタ（key ごとの件数）
+
+    documents / collections の挿入・削除時に ORM イベントで増減し、定期的に
+    reconcile_stats_counters で実テーブルから数え直す。キー:
+    documents / collections / documents:YYYY-MM-DD（UTC の登録日）/ category:<カテゴリ名>
+    """
+    __tablename__ = "stats_counters"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class SchemaMigration(Base):
+    """適用済みの migrations/NNN_*.sql（app.core.migrations が記録する）"""
+    __tablename__ = "schema_migrations"
+
+    version = Column(String, primary_key=True)  # ファイル名の数字部分（"017" など）
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=func.now())
+
+
+class BackfillJob(Base):
+    """データ移行（バックフィル）の進捗。app.services.backfills がバッチごとに更新する
+
+    status: pending | running | paused | done | failed
+    cursor は最後に処理したキーで、中断しても次回はその続きから再開する。
+    """
+    __tablename__ = "backfill_jobs"
+
+    name = Column(String, primary_key=True)
+    status = Column(String, nullable=False, default="pending")
+    cursor = Column(String, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)
+    batches = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+STATS_DOCUMENTS = "documents"
+STATS_COLLECTIONS = "collections"
+STATS_CATEGORY_PREFIX = "category:"
+
+_STATS_UPSERT_SQL = text(
+    """
+    INSERT INTO stats_counters (key, value, updated_at) VALUES (:key, :delta, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET value = stats_counters.value + excluded.value, updated_at = excluded.updated_at
+    """
+)
+
+
+def stats_day_key(day) -> str:
+    """その日（UTC）に登録されたドキュメント数のキー。day は date / datetime / 'YYYY-MM-DD…' 文字列"""
+    if hasattr(day, "isoformat"):
+        day = day.isoformat()
+    return f"{STATS_DOCUMENTS}:{str(day)[:10]}"
+
+
+def stats_category_key(category: str) -> str:
+    return f"{STATS_CATEGORY_PREFIX}{category}"
+
+
+def bump_stats_counters(connection, deltas: Dict[str, int]) -> None:
+    """カウンタを差分だけ増減する（行が無ければ作る）。書き込みと同じトランザクションで呼ぶ"""
+    rows = [{"key": key, "delta": delta} for key, delta in deltas.items() if delta]
+    if rows:
+        connection.execute(_STATS_UPSERT_SQL, rows)
+
+
+def _document_day(connection, document_id) -> Optional[str]:
+    table = Document.__table__
+    return connection.execute(
+        table.select().with_only_columns(func.date(table.c.created_at)).where(table.c.id == document_id)
+    ).scalar()
+
+
+@event.listens_for(Document, "after_insert")
+def _count_inserted_document(mapper, connection, target):
+    created_at = target.__dict__.get("created_at")
+    # 既定値 func.now() の場合は DB 側で決まった値を読む
+    day = created_at if hasattr(created_at, "isoformat") else _document_day(connection, target.id)
+    deltas = {STATS_DOCUMENTS: 1}
+    if day is not None:
+        deltas[stats_day_key(day)] = 1
+    category = target.__dict__.get("primary_category")
+    if category is not None:
+        deltas[stats_category_key(category)] = 1
+    bump_stats_counters(connection, deltas)
+
+
+@event.listens_for(Document, "before_delete")
+def _count_deleted_document(mapper, connection, target):
+    # primary_category は分類イベントが Core で書き換えるため、ORM の値ではなく行を読む
+    table = Document.__table__
+    row = connection.execute(
+        table.select()
+        .with_only_columns(func.date(table.c.created_at), table.c.primary_category)
+        .where(table.c.id == target.id)
+    ).first()
+    if row is None:
+        return
+    deltas = {STATS_DOCUMENTS: -1}
+    if row[0] is not None:
+        deltas[stats_day_key(row[0])] = -1
+    if row[1] is not None:
+        deltas[stats_category_key(row[1])] = -1
+    bump_stats_counters(connection, deltas)
+
+
+@event.listens_for(Collection, "after_insert")
+def _count_inserted_collection(mapper, connection, target):
+    bump_stats_counters(connection, {STATS_COLLECTIONS: 1})
+
+
+@event.listens_for(Collection, "after_delete")
+def _count_deleted_collection(mapper, connection, target):
+    bump_stats_counters(connection, {STATS_COLLECTIONS: -1})
+
+
+def reconcile_stats_counters(connection) -> Dict[str, tuple]:
+    """実テーブルから数え直して stats_counters を置き換え、ずれていたキーを {key: (旧値, 新値)} で返す。
+
+    ORM を通らない書き込み（生 SQL の一括削除・手作業の修正）で生じたずれを直す。
+    先に stats_counters を書き換えて書き込みロックを取ってから数えるので、
+    数えている間に他プロセスの挿入が割り込んでずれることはない。
+    """
+    counters = StatsCounter.__table__
+    documents = Document.__table__
+    previous = {key: value for key, value in connection.execute(counters.select().with_only_columns(counters.c.key, counters.c.value))}
+    connection.execute(counters.delete())
+
+    actual: Dict[str, int] = {
+        STATS_DOCUMENTS: connection.execute(select(func.count()).select_from(documents)).scalar() or 0,
+        STATS_COLLECTIONS: connection.execute(select(func.count()).select_from(Collection.__table__)).scalar() or 0,
+    }
+    day = func.date(documents.c.created_at)
+    for value, count in connection.execute(
+        documents.select().with_only_columns(day, func.count()).where(documents.c.created_at.isnot(None)).group_by(day)
+    ):
+        actual[stats_day_key(value)] = count
+    for category, count in connection.execute(
+        documents.select()
+        .with_only_columns(documents.c.primary_category, func.count())
+        .where(documents.c.primary_category.isnot(None))
+        .group_by(documents.c.primary_category)
+    ):
+        actual[stats_category_key(category)] = count
+
+    connection.execute(counters.insert(), [{"key": key, "value": value} for key, value in actual.items()])
+    return {
+        key: (previous.get(key, 0), actual.get(key, 0))
+        for key in set(previous) | set(actual)
+        if previous.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def _status_index(name: str, status: str, *columns: str) -> Index:
+    """status で絞り込んだ部分インデックス（SQLite / PostgreSQL）。
+
+    キューの行はほとんどが done なので、リースや回収のクエリが見る
+    pending / in_progress の行だけを索引に載せる。
+    """
+    where = text(f"status = '{status}'")
+    return Index(name, *columns, sqlite_where=where, postgresql_where=where)
+
+
 class PostprocessJob(Base):
     """ポストプロセス用ジョブテーブル
 
@@ -258,6 +716,9 @@ class PostprocessJob(Base):
     - max_attempts: 最大試行回数
     - last_error: 直近のエラーメッセージ
     - next_attempt_at: 次回試行予定時刻
+    - lease_owner / lease_expires_at: ジョブを取得したワーカーとリース期限
+    - stage: extract|summary|embedding|classification（NULL は全工程を1ジョブで実行する旧形式）
+    - payload: ステージへのオプション（JSON。例: {"force": true} で要約を作り直す）
     """
     __tablename__ = "postprocess_jobs"
 
@@ -268,30 +729,210 @@ class PostprocessJob(Base):
     max_attempts = Column(Integer, nullable=False, default=5)
     last_error = Column(Text, nullable=True)
     next_attempt_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    stage = Column(String, nullable=True)
+    payload = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        Index("idx_postprocess_jobs_status_created", "status", "created_at"),
+        Index("idx_postprocess_jobs_created", "created_at"),
+        # lease_next_job: status='pending' ORDER BY created_at, id
+        _status_index("idx_postprocess_jobs_pending_created", "pending", "created_at", "id"),
+        # seconds_until_next_job: MIN(next_attempt_at) WHERE status='pending'
+        _status_index("idx_postprocess_jobs_pending_next_attempt", "pending", "next_attempt_at"),
+        # reclaim_expired_leases
+        _status_index("idx_postprocess_jobs_in_progress_lease", "in_progress", "lease_expires_at"),
+        # 保持期間を過ぎた完了ジョブの削除
+        _status_index("idx_postprocess_jobs_done_updated", "done", "updated_at"),
+    )
+
+
+# 最新の分類から documents.primary_category と document_tags を一括で埋める（SQLite。マイグレーション 017 と同じ SQL。
+# 稼働中の DB では app.services.backfills の document_facets がバッチで同じことを行う）
+CLASSIFICATION_BACKFILL_SQL = (
+    """
+    UPDATE documents SET primary_category = (
+        SELECT c.primary_category FROM classifications c
+        WHERE c.document_id = documents.id
+        ORDER BY c.created_at DESC, c.id LIMIT 1
+    )
+    WHERE primary_category IS NULL
+    """,
+    """
+    INSERT OR IGNORE INTO document_tags (document_id, tag)
+    SELECT c.document_id, trim(j.value)
+    FROM classifications c,
+         json_each(CASE WHEN json_valid(c.tags) AND json_type(c.tags) = 'array' THEN c.tags ELSE '[]' END) j
+    WHERE c.id = (
+        SELECT c2.id FROM classifications c2
+        WHERE c2.document_id = c.document_id
+        ORDER BY c2.created_at DESC, c2.id LIMIT 1
+    )
+      AND j.type = 'text' AND trim(j.value) != ''
+    """,
+)
+
+
+def _ensure_job_indexes(bind) -> None:
+    """既存 DB の索引付きテーブルに不足しているインデックスを作成する（create_all は既存テーブルを触らないため）"""
+    for table in (
+        PostprocessJob.__table__,
+        PreferenceJob.__table__,
+        Document.__table__,
+        Classification.__table__,
+        Bookmark.__table__,
+    ):
+        for index in table.indexes:
+            try:
+                index.create(bind=bind, checkfirst=True)
+            except Exception:
+                # 旧スキーマで列が無い場合などはスキップ（マイグレーション適用後に作成される）
+                pass
+
+
+# --- PostgreSQL: 全文検索（tsvector）と pgvector ------------------------------------
+# SQLite では使わない（検索は LIKE、類似度は JSON のベクトルを Python で計算する）。
+# どちらも設定値に依存する式・次元を含むため SQL ファイルではなく起動時に作成する。
+
+_PG_VECTOR_INDEX = "idx_embeddings_vec_pg"
+_REGCONFIG_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+
+
+def postgres_fts_config() -> Optional[str]:
+    """tsvector 検索に使うテキスト検索設定名（未設定・不正な値なら None で LIKE のみ）"""
+    name = (settings.postgres_fts_config or "").strip()
+    if not name:
+        return None
+    if not _REGCONFIG_NAME.match(name):
+        logger.warning("database: ignoring invalid POSTGRES_FTS_CONFIG=%r", name)
+        return None
+    return name
+
+
+def document_tsvector(config: str):
+    """documents.content_text の tsvector 式。
+
+    下の式インデックスと同じ形（定数の regconfig・coalesce の空文字）にしておかないと
+    プランナがインデックスを使わないため、バインド変数にせずリテラルで埋め込む。
+    """
+    return func.to_tsvector(
+        literal_column(f"'{config}'::regconfig"),
+        func.coalesce(Document.__table__.c.content_text, literal_column("''")),
+    )
+
+
+def document_tsquery(config: str, query: str):
+    """利用者の入力を websearch 形式（"語句"・OR・-除外）で tsquery にする"""
+    return func.websearch_to_tsquery(literal_column(f"'{config}'::regconfig"), query)
+
+
+def _pg_fts_index_name(config: str) -> str:
+    # 設定を変えたら別の式になるので、索引名にも設定名を含めて作り直させる
+    return f"idx_documents_content_fts_{config.replace('.', '_').lower()}"
+
+
+def _postgres_fts_ddl(config: str) -> str:
+    return (
+        f"CREATE INDEX IF NOT EXISTS {_pg_fts_index_name(config)} ON documents "
+        f"USING gin (to_tsvector('{config}'::regconfig, coalesce(content_text, '')))"
+    )
+
+
+def pgvector_active(bind) -> bool:
+    """類似検索に pgvector 列を使うか（PostgreSQL かつ PGVECTOR_ENABLED のとき）"""
+    return bool(settings.pgvector_enabled) and bind.dialect.name == "postgresql"
+
+
+def _pgvector_ddl(dimensions: int):
+    # embeddings.vec（JSON 文字列）は全 DB 共通のまま残し、vector 列はトリガーで追従させる。
+    # 次元が合わない・壊れたベクトルは NULL にして、埋め込みの保存自体は失敗させない
+    return (
+        "CREATE EXTENSION IF NOT EXISTS vector",
+        f"ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS vec_pg vector({dimensions})",
+        f"""
+        CREATE OR REPLACE FUNCTION embeddings_sync_vec_pg() RETURNS trigger AS $$
+        BEGIN
+            BEGIN
+                IF json_typeof(NEW.vec::json) = 'array' AND json_array_length(NEW.vec::json) = {dimensions} THEN
+                    NEW.vec_pg := NEW.vec::vector;
+                ELSE
+                    NEW.vec_pg := NULL;
+                END IF;
+            EXCEPTION WHEN others THEN
+                NEW.vec_pg := NULL;
+            END;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_embeddings_vec_pg ON embeddings",
+        "CREATE TRIGGER trg_embeddings_vec_pg BEFORE INSERT OR UPDATE OF vec ON embeddings "
+        "FOR EACH ROW EXECUTE FUNCTION embeddings_sync_vec_pg()",
+        f"CREATE INDEX IF NOT EXISTS {_PG_VECTOR_INDEX} ON embeddings USING hnsw (vec_pg vector_cosine_ops)",
+    )
+
+
+def ensure_postgres_features(bind) -> None:
+    """PostgreSQL のときだけ全文検索の式インデックスと pgvector 列・トリガー・HNSW 索引を作る"""
+    if bind.dialect.name != "postgresql":
+        return
+    config = postgres_fts_config()
+    if config:
+        try:
+            with bind.begin() as connection:
+                connection.exec_driver_sql(_postgres_fts_ddl(config))
+        except Exception:
+            logger.exception("database: failed to create the full-text search index")
+    if settings.pgvector_enabled:
+        try:
+            with bind.begin() as connection:
+                for statement in _pgvector_ddl(int(settings.pgvector_dimensions)):
+                    connection.exec_driver_sql(statement)
+        except Exception:
+            # vector 拡張が入っていないサーバーでは従来どおり Python 側で類似度を計算する
+            logger.exception("database: pgvector setup failed; similarity falls back to Python")
+
+
+def _seed_stats_counters(bind) -> None:
+    """stats_counters が空（新規作成・導入直後の既存 DB）なら実テーブルから数えて埋める"""
+    try:
+        with bind.begin() as connection:
+            if connection.execute(text("SELECT 1 FROM stats_counters LIMIT 1")).first() is None:
+                reconcile_stats_counters(connection)
+    except Exception:
+        logger.exception("stats_counters: initial reconciliation failed")
+
 
 def create_tables():
     """データベーステーブルを作成"""
-    # Create missing tables/columns for development/testing environments.
+    # Create missing tables for development/testing environments; columns and
+    # indexes added to existing tables come from the versioned migrations.
     # Use the DB URL from the environment (if set) so pytest-configured DBs
     # are respected even if `settings` was initialized earlier.
-    try:
-        db_url = os.environ.get("DB_URL") or settings.db_url
-        from sqlalchemy import create_engine as _create_engine
+    from app.core import migrations
 
-        create_engine_kwargs = {"connect_args": {"check_same_thread": False}} if "sqlite" in db_url else {}
-        local_engine = _create_engine(db_url, **create_engine_kwargs)
+    try:
+        db_url = current_db_url()
+        local_engine = get_engine(db_url)
         Base.metadata.create_all(bind=local_engine)
+        migrations.apply_pending(local_engine)
+        _ensure_job_indexes(local_engine)
+        ensure_postgres_features(local_engine)
+        _seed_stats_counters(local_engine)
         # Rebind module-level engine and SessionLocal so code using
         # `SessionLocal()` picks up the test DB when tests set `DB_URL`.
         try:
             globals()["engine"] = local_engine
-            globals()["SessionLocal"] = sessionmaker(autocommit=False, autoflush=False, bind=local_engine)
+            globals()["SessionLocal"] = get_sessionmaker(db_url)
         except Exception:
             # if rebind fails, continue — the tables at least exist on local_engine
             pass
+    except migrations.MigrationError:
+        # 失敗したマイグレーションはロールバック済み。スキーマが古いまま起動しないよう呼び出し側へ伝える
+        raise
     except Exception:
         # best-effort fallback to module-level engine
         try:
@@ -299,43 +940,6 @@ def create_tables():
         except Exception:
             pass
 
-    # If using SQLite, ensure new summary columns exist on prebuilt DB files.
-    # Some test databases are committed to the repo and may lack the new columns.
-    try:
-        from urllib.parse import urlparse
-        import sqlite3
-        from app.core.config import settings
-
-        if settings.db_url.startswith("sqlite"):
-            # Extract path from sqlite URL like sqlite:///./test.db
-            db_path = settings.db_url.replace("sqlite:///", "")
-            if db_path and os.path.exists(db_path):
-                conn = sqlite3.connect(db_path)
-                cur = conn.cursor()
-                cur.execute("PRAGMA table_info(documents);")
-                existing_cols = {r[1] for r in cur.fetchall()} if cur else set()
-
-                needed = [
-                    ("short_summary", "TEXT"),
-                    ("medium_summary", "TEXT"),
-                    ("summary_generated_at", "TEXT"),
-                    ("summary_model", "TEXT"),
-                    ("source", "TEXT"),
-                    ("original_url", "TEXT"),
-                    ("thumbnail_url", "TEXT"),
-                    ("pdf_path", "TEXT"),
-                    ("fetched_at", "TEXT"),
-                ]
-
-                for col, coltype in needed:
-                    if col not in existing_cols:
-                        cur.execute(f"ALTER TABLE documents ADD COLUMN {col} {coltype};")
-                conn.commit()
-                conn.close()
-    except Exception:
-        # Best-effort only — don't fail application start if migration step cannot run.
-        pass
-
 
 # Bookmark model
 class Bookmark(Base):
@@ -347,10 +951,17 @@ class Bookmark(Base):
     document_id = Column(String, ForeignKey("documents.id"), nullable=False, index=True)
     note = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
+    # 嗜好プロファイルへ実際に加算した内容（JSON）。削除時はこれだけを減算する
+    profile_contribution = Column(Text, nullable=True)
 
     # リレーション
     document = relationship("Document", back_populates="bookmarks")
 
+    __table_args__ = (
+        # ユーザーごとのブックマーク一覧のキーセットページング用
+        Index("idx_bookmarks_user_created_id", "user_id", "created_at", "id"),
+    )
+
 
 class PreferenceProfile(Base):
     """ユーザー嗜好プロファイル"""
@@ -365,6 +976,15 @@ class PreferenceProfile(Base):
     domain_weights = Column(Text, nullable=True)
     last_bookmark_id = Column(String, nullable=True)
     status = Column(String, nullable=False, default="ready", index=True)
+    # インクリメンタル更新用の状態（前方減衰で重み付けした累積値。weights 列はここから導出）
+    embedding_sum = Column(Text, nullable=True)  # JSON: 重み付き埋め込みベクトルの総和
+    embedding_weight = Column(Float, nullable=True)  # embedding_sum に含まれる重みの総和
+    category_counts = Column(Text, nullable=True)  # JSON: カテゴリごとの重み付き件数
+    domain_counts = Column(Text, nullable=True)  # JSON: ドメインごとの重み付き件数
+    decay_reference_at = Column(DateTime, nullable=True)  # 減衰重みの基準時刻
+    # 最後に全件スコアリングしたときのプロファイル（変化量の判定に使う）
+    scored_snapshot = Column(Text, nullable=True)  # JSON: embedding / category_weights / domain_weights / cold_start
+    scored_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, nullable=False, default=func.now())
     updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
 
@@ -380,6 +1000,7 @@ class PreferenceProfile(Base):
             user_id,
             unique=True,
             sqlite_where=user_id.isnot(None),
+            postgresql_where=user_id.isnot(None),
         ),
         Index("idx_preference_profiles_updated_at", "updated_at"),
     )
@@ -443,6 +1064,8 @@ class PreferenceJob(Base):
     max_attempts = Column(Integer, nullable=False, default=3)
     last_error = Column(Text, nullable=True)
     next_attempt_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
     scheduled_at = Column(DateTime, nullable=True, default=func.now())
     created_at = Column(DateTime, nullable=True, default=func.now())
     updated_at = Column(DateTime, nullable=True, default=func.now(), onupdate=func.now())
@@ -454,6 +1077,19 @@ class PreferenceJob(Base):
         Index("idx_preference_jobs_status", "status"),
         Index("idx_preference_jobs_next_attempt", "next_attempt_at"),
         Index("idx_preference_jobs_job_type", "job_type"),
+        Index("idx_preference_jobs_status_next_attempt", "status", "next_attempt_at"),
+        # lease_next_job: status='pending' ORDER BY next_attempt_at, scheduled_at, created_at
+        _status_index(
+            "idx_preference_jobs_pending_order",
+            "pending",
+            "next_attempt_at",
+            "scheduled_at",
+            "created_at",
+        ),
+        # 同一ユーザー・種別の pending ジョブへのまとめ込み
+        _status_index("idx_preference_jobs_pending_user_type", "pending", "user_id", "job_type"),
+        _status_index("idx_preference_jobs_in_progress_lease", "in_progress", "lease_expires_at"),
+        _status_index("idx_preference_jobs_done_updated", "done", "updated_at"),
     )
 
 
@@ -486,4 +1122,20 @@ class PreferenceFeedback(Base):
             "feedback_type",
             name="idx_preference_feedbacks_unique_submission",
         ),
-    )
\ No newline at end of file
+    )
+
+class ThumbnailCache(Base):
+    """サムネイル（favicon / og:image）取得結果のキャッシュ
+
+    - cache_key: "domain:<netloc>" または "url:<記事URL>"
+    - thumbnail_path: 'assets/thumbnails/thumb_<sha256>.png'（NULL は取得失敗のネガティブキャッシュ）
+    - expires_at: ネガティブキャッシュの有効期限
+    """
+
+    __tablename__ = "thumbnail_cache"
+
+    cache_key = Column(String, primary_key=True)
+    source_url = Column(String, nullable=True)
+    thumbnail_path = Column(String, nullable=True)
+    fetched_at = Column(DateTime, nullable=False, default=func.now())
+    expires_at = Column(DateTime, nullable=True)
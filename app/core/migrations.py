@@ -0,0 +1,179 @@
+"""Versioned runner for ``migrations/NNN_*.sql``.
+
+Each file's numeric prefix is its version. Applied versions are recorded in
+``schema_migrations`` so a file runs once per database, in version order, and
+``pending()`` tells what is left. A file is applied statement by statement
+inside one transaction (on SQLite an explicit ``BEGIN``, because pysqlite
+would autocommit DDL that precedes the first DML statement); the "already exists" / "duplicate column" errors that
+the old name-ordered script ignored are still tolerated per statement, because
+databases built by ``create_all`` already have most of the schema that the
+older files create.
+
+The files in ``migrations/`` are SQLite SQL. On PostgreSQL the schema comes
+from the models (``create_all`` / ``create_tables``) and the runner applies
+``migrations/postgresql/NNN_*.sql`` instead, recorded in the same table; see
+``migrations_dir``.
+
+Data backfills are not done here: long-running row updates go through
+``app.services.backfills`` so they can run in small batches while the app is
+serving.
+"""
+import logging
+import re
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from app.core.database import SchemaMigration
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+# SQLite 以外の dialect は migrations/<dialect>/ の SQL を使う
+DIALECT_DIRS = {"postgresql": MIGRATIONS_DIR / "postgresql"}
+
+_FILENAME = re.compile(r"^(\d+)_(.+)\.sql$")
+_TOLERATED_ERRORS = ("duplicate column", "already exists", "duplicate name")
+# 古いファイルの BEGIN TRANSACTION; / COMMIT; は無視し、トランザクションはランナーが張る
+_TRANSACTION_CONTROL = re.compile(r"^(BEGIN|COMMIT|END|ROLLBACK)(\s+TRANSACTION)?\s*;?$", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class MigrationFile:
+    version: str
+    name: str
+    path: Path
+
+
+class MigrationError(RuntimeError):
+    """マイグレーションの文が想定外のエラーで失敗した（そのファイルはロールバック済み）"""
+
+
+def migrations_dir(engine: Engine) -> Path:
+    """エンジンの dialect に対応するマイグレーションのディレクトリ"""
+    return DIALECT_DIRS.get(engine.dialect.name, MIGRATIONS_DIR)
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[MigrationFile]:
+    """ディレクトリ内の NNN_*.sql をバージョン順に返す"""
+    found = []
+    for path in Path(directory).glob("*.sql"):
+        match = _FILENAME.match(path.name)
+        if match:
+            found.append(MigrationFile(version=match.group(1), name=match.group(2), path=path))
+    found.sort(key=lambda m: (int(m.version), m.name))
+    return found
+
+
+def split_statements(sql: str) -> Iterator[str]:
+    """SQL スクリプトを文ごとに分ける（トリガー本体など ; を含む文も sqlite3.complete_statement で判定）"""
+    buffer = ""
+    for line in sql.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statement = _strip_comments(buffer)
+            if statement:
+                yield statement
+            buffer = ""
+    statement = _strip_comments(buffer)
+    if statement:
+        yield statement
+
+
+def _strip_comments(statement: str) -> str:
+    lines = [line for line in statement.splitlines() if not line.strip().startswith("--")]
+    return "\n".join(lines).strip()
+
+
+def applied_versions(engine: Engine) -> List[str]:
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    table = SchemaMigration.__table__
+    with engine.connect() as connection:
+        return [row[0] for row in connection.execute(table.select().with_only_columns(table.c.version))]
+
+
+def pending(engine: Engine, directory: Optional[Path] = None) -> List[MigrationFile]:
+    """まだ適用していないマイグレーション（バージョン順）"""
+    applied = set(applied_versions(engine))
+    return [m for m in discover(directory or migrations_dir(engine)) if m.version not in applied]
+
+
+def apply_migration(engine: Engine, migration: MigrationFile) -> None:
+    """1ファイルを1トランザクションで適用し、schema_migrations に記録する"""
+    sql = migration.path.read_text(encoding="utf-8")
+    with engine.begin() as connection:
+        # pysqlite は DML の前にしか BEGIN を発行せず、先頭の DDL は即時コミットされてしまう。
+        # 明示的に BEGIN してファイル全体を1トランザクションにする
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql("BEGIN")
+        # PostgreSQL はエラーでトランザクション全体が中断されるため、文ごとの SAVEPOINT で許容するエラーを巻き戻す
+        use_savepoints = connection.dialect.name != "sqlite"
+        for statement in split_statements(sql):
+            if _TRANSACTION_CONTROL.match(statement):
+                continue
+            savepoint = connection.begin_nested() if use_savepoints else None
+            try:
+                connection.exec_driver_sql(statement)
+                if savepoint is not None:
+                    savepoint.commit()
+            except DBAPIError as exc:
+                if savepoint is not None:
+                    savepoint.rollback()
+                message = str(exc.orig).lower()
+                if any(marker in message for marker in _TOLERATED_ERRORS):
+                    logger.info("migration %s: %s -- skipped", migration.version, exc.orig)
+                    continue
+                raise MigrationError(f"{migration.path.name}: {exc.orig}") from exc
+        connection.execute(SchemaMigration.__table__.insert().values(version=migration.version, name=migration.name))
+    logger.info("migration %s_%s applied", migration.version, migration.name)
+
+
+def apply_pending(engine: Engine, directory: Optional[Path] = None, target: Optional[str] = None) -> List[str]:
+    """未適用のマイグレーションを順に適用し、適用したバージョンを返す（target 指定時はそのバージョンまで）"""
+    applied = []
+    for migration in pending(engine, directory):
+        if target is not None and int(migration.version) > int(target):
+            break
+        apply_migration(engine, migration)
+        applied.append(migration.version)
+    return applied
+
+
+def status(engine: Engine, directory: Optional[Path] = None) -> dict:
+    """管理画面用: 適用済み・未適用のバージョン一覧"""
+    table = SchemaMigration.__table__
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    with engine.connect() as connection:
+        rows = connection.execute(table.select().order_by(table.c.version)).all()
+    applied = {row.version for row in rows}
+    return {
+        "applied": [
+            {"version": row.version, "name": row.name, "applied_at": row.applied_at.isoformat() if row.applied_at else None}
+            for row in rows
+        ],
+        "pending": [
+            {"version": m.version, "name": m.name}
+            for m in discover(directory or migrations_dir(engine))
+            if m.version not in applied
+        ],
+    }
+
+
+__all__ = [
+    "MIGRATIONS_DIR",
+    "DIALECT_DIRS",
+    "MigrationFile",
+    "MigrationError",
+    "migrations_dir",
+    "discover",
+    "split_statements",
+    "applied_versions",
+    "pending",
+    "apply_migration",
+    "apply_pending",
+    "status",
+]
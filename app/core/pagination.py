@@ -0,0 +1,93 @@
+"""Keyset (cursor) pagination on ``(created_at, id)``.
+
+Lists are ordered ``created_at DESC, id DESC`` and the next page starts
+strictly after the last row of the previous one, so every page is a range
+scan on a ``(…, created_at, id)`` index instead of an ``OFFSET`` that reads
+and discards all earlier rows.
+
+Cursors are opaque URL-safe tokens. On SQLite the raw stored ``created_at``
+text is carried in the cursor and compared as text: rows written by
+``func.now()`` (``YYYY-MM-DD HH:MM:SS``) and by Python datetimes
+(``… HH:MM:SS.ffffff``) use different formats, so a re-formatted datetime
+would not compare equal to the row it came from.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import String, literal, tuple_, type_coerce
+
+
+class InvalidCursor(ValueError):
+    """カーソルトークンが壊れている・別の一覧のもの"""
+
+
+def keyset_sort_value(created_col):
+    """カーソルに入れる created_at を取り出すための列（SQLite では保存されている文字列のまま）"""
+    return type_coerce(created_col, String).label("_keyset_created_at")
+
+
+def encode_cursor(created_at: Any, row_id: Any) -> str:
+    if isinstance(created_at, datetime):
+        payload = {"d": created_at.isoformat(), "id": row_id}
+    else:
+        payload = {"r": created_at, "id": row_id}
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Any, Any]:
+    """(created_at, id) を返す。created_at は SQLite の生文字列または datetime"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        row_id = payload["id"]
+        if "r" in payload:
+            return str(payload["r"]), row_id
+        return datetime.fromisoformat(payload["d"]), row_id
+    except Exception as exc:
+        raise InvalidCursor(f"invalid cursor: {token!r}") from exc
+
+
+def after_cursor(query, created_col, id_col, cursor: Optional[str]):
+    """created_at DESC, id DESC の並びで cursor より後ろの行に絞り込んで並べる"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if isinstance(created_at, str):
+            bound = literal(created_at, String)
+        else:
+            bound = literal(created_at, created_col.type)
+        query = query.filter(tuple_(created_col, id_col) < tuple_(bound, literal(row_id, id_col.type)))
+    return query.order_by(created_col.desc(), id_col.desc())
+
+
+def fetch_page(query, created_col, id_col, cursor: Optional[str], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """1ページ分の行と次ページのカーソル（最後のページなら None）を返す。
+
+    query の先頭エンティティの後ろに keyset_sort_value 列を追加して取得し、
+    戻り値の行からはその列を取り除く。
+    """
+    rows = (
+        after_cursor(query.add_columns(keyset_sort_value(created_col)), created_col, id_col, cursor)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        # SQLite 以外のドライバは type_coerce しても datetime を返すので、その場合は ISO 形式で持つ
+        last = rows[-1]
+        next_cursor = encode_cursor(last[-1], getattr(last[0], id_col.key))
+    items = [row[0] if len(row) == 2 else tuple(row[:-1]) for row in rows]
+    return items, next_cursor
+
+
+__all__ = [
+    "InvalidCursor",
+    "encode_cursor",
+    "decode_cursor",
+    "after_cursor",
+    "fetch_page",
+]
@@ -2,18 +2,26 @@ from fastapi import FastAPI, Request, Form, File, UploadFile, Depends, HTTPExcep
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session, selectinload
 import os
 import logging
+from urllib.parse import urlencode
 import asyncio
+import threading
 from contextlib import asynccontextmanager
 from markdown_it import MarkdownIt
 
 from app.core.config import settings
-from app.core.database import get_db, create_tables
+from app.core.database import get_db, create_tables, get_engine, sqlite_health_report
+from app.core.pagination import InvalidCursor, fetch_page
 from app.core.timezone import format_jst
 from app.services.scheduler import start_scheduler, stop_scheduler
+from app.services.extractor import warm_up_pdf_converter
+from app.services.bookmark_service import mark_bookmarked
+from app.services.document_search import document_text_match
+from app.services.pdf_pipeline import shutdown_pdf_pool
+from app.core.async_runner import shutdown_runner
 from app.api.routes import documents, ingest, collections, utils, admin_sources, bookmarks, bookmarks_only, preferences
 from app.api.routes import admin as admin_routes
 
@@ -37,6 +45,19 @@ async def lifespan(app: FastAPI):
     except Exception:
         logger.exception("create_tables() failed during startup")
 
+    # 実際に有効になっている接続設定（SQLite の PRAGMA / PostgreSQL の索引・拡張）を起動時に記録する
+    try:
+        report = sqlite_health_report(get_engine())
+        logger.info("Database connection profile: %s", {k: v for k, v in report.items() if k != "mismatches"})
+        if report.get("mismatches"):
+            logger.warning("Database settings not applied as configured: %s", report["mismatches"])
+    except Exception:
+        logger.exception("Failed to build database health report")
+
+    # Docling のモデル読み込みは重いため、起動をブロックしないようバックグラウンドで事前ロードする
+    if settings.pdf_warmup_on_start:
+        threading.Thread(target=warm_up_pdf_converter, name="docling-warmup", daemon=True).start()
+
     # Start scheduler only when not running under pytest collection/execution
     # If running under pytest, scheduler start is best-effort and may be skipped
     try:
@@ -61,6 +82,8 @@ async def lifespan(app: FastAPI):
         logger.info("Scheduler stopped")
     except Exception:
         logger.exception("Failed to stop scheduler")
+    shutdown_pdf_pool()
+    shutdown_runner()
 
 
 # FastAPIアプリケーション
@@ -114,25 +137,26 @@ app.include_router(admin_routes.router)
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request, db: Session = Depends(get_db)):
     """ホームページ"""
-    from app.core.database import Document
-    from datetime import datetime, timedelta
-    
-    # 最近のドキュメント（最新5件）を取得
-    recent_documents = db.query(Document).order_by(Document.created_at.desc()).limit(5).all()
+    from app.core.database import Document, defer_document_bodies
+    from app.services.stats_counters import home_stats
     
-    # 統計情報の取得
-    total_documents = db.query(Document).count()
+    # 最近のドキュメント（最新5件）を取得（本文は読まずプレビューのみ）
+    recent_documents = (
+        db.query(Document)
+        .options(*defer_document_bodies())
+        .order_by(Document.created_at.desc())
+        .limit(5)
+        .all()
+    )
     
-    # 今日追加されたドキュメント数
-    today = datetime.now().date()
-    today_start = datetime.combine(today, datetime.min.time())
-    today_documents = db.query(Document).filter(Document.created_at >= today_start).count()
+    # 統計情報（総数・今日の登録数）は stats_counters から主キーで読む
+    stats = home_stats(db)
     
     return templates.TemplateResponse("index.html", {
         "request": request,
         "recent_documents": recent_documents,
-        "total_documents": total_documents,
-        "today_documents": today_documents
+        "total_documents": stats["total_documents"],
+        "today_documents": stats["today_documents"]
     })
 
 
@@ -144,42 +168,41 @@ async def documents_page(
     tag: str = "",
     domain: str = "",
     sort: str = "recent",
+    cursor: str = "",
     db: Session = Depends(get_db)
 ):
-    """ドキュメント一覧ページ"""
+    """ドキュメント一覧ページ
+
+    新着順は (created_at, id) のキーセットで50件ずつ表示し、末尾のセンチネルが
+    cursor 付きで続きを要求する（HTMX からの cursor 付き要求にはカード部分だけを返す）。
+    """
     # 基本的なクエリ(後で改善)
-    from app.core.database import Document, Classification
+    from app.core.database import Document, defer_document_bodies
+    from app.services.document_facets import tagged_document_ids
     from app.api.routes.documents import _resolve_user_id, _fetch_personalized_documents
     
-    query = db.query(Document)
+    # カードにはプレビューしか表示しないため本文（content_md / content_text）は読み込まない。
+    # 分類はカードごとの遅延ロードを避けて1クエリでまとめて読む
+    query = db.query(Document).options(*defer_document_bodies(), selectinload(Document.classifications))
     
     if q:
-        query = query.filter(Document.content_text.contains(q))
+        query = query.filter(document_text_match(db, q))
 
     if domain:
         query = query.filter(Document.domain == domain)
 
-    # タグによるフィルタ（SQLite の JSON 配列を考慮して json_extract + LIKE を利用）
-    if tag:
-        # Join classifications and filter where the tags JSON array contains the given tag string.
-        # This uses a best-effort SQLite json_extract + LIKE check which matches '"tag"' inside the JSON array text.
-        # SQLite may store JSON with non-ASCII characters escaped (e.g. "\\u81ea\\u52d5\\u5316").
-        # Comparing the raw column text with LIKE is more robust for matching either
-        # the UTF-8 characters or their escaped \uXXXX representations.
-        raw_like = f'%"{tag}"%'
-        def to_escaped(s: str) -> str:
-            return s.encode('unicode_escape').decode('ascii')
-        escaped_tag = to_escaped(tag)
-        escaped_like = f'%"{escaped_tag}"%'
-
-        query = query.join(Classification).filter(
-            text("(classifications.tags LIKE :raw_like OR classifications.tags LIKE :escaped_like)")
-        ).params(raw_like=raw_like, escaped_like=escaped_like)
+    # カテゴリ・タグによるフィルタ（最新の分類を非正規化した primary_category / document_tags の索引で引く）
+    if category:
+        query = query.filter(Document.primary_category == category)
+
+    if tag.strip():
+        query = query.filter(Document.id.in_(tagged_document_ids(tag)))
     
     # Respect the `sort` parameter: use personalized ranking only when requested.
     # This keeps the default behavior as "recent" (created_at desc).
     sort_mode = (sort or "recent").lower()
     score_map = {}
+    next_url = None
     if sort_mode == "personalized":
         # おすすめ記事は直近2日間に登録された記事を対象とする
         from datetime import datetime, timedelta
@@ -190,20 +213,23 @@ async def documents_page(
         documents, score_map = _fetch_personalized_documents(query, user_id, 0, 50, db)
     else:
         # recent (default) - order by created_at descending
-        documents = query.order_by(Document.created_at.desc()).limit(50).all()
+        try:
+            documents, next_cursor = fetch_page(query, Document.created_at, Document.id, cursor or None, 50)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if next_cursor:
+            params = {key: value for key, value in (("q", q), ("category", category), ("tag", tag), ("domain", domain)) if value}
+            params.update(sort=sort_mode, cursor=next_cursor)
+            next_url = "/documents?" + urlencode(params)
     
     # Attach a transient `bookmarked` attribute to each Document instance so
     # templates can easily check bookmark state (document.bookmarked).
+    # The bookmark state of the whole page is resolved with a single query.
+    mark_bookmarked(db, documents)
+
     # Also attach personalized data if available
     display_rank = 1
     for d in documents:
-        try:
-            d.bookmarked = bool(d.bookmarks and len(d.bookmarks) > 0)
-        except Exception:
-            # Best-effort only: if relationship not loaded or access fails,
-            # default to False.
-            d.bookmarked = False
-        
         # Attach personalized data to document object
         score_dto = score_map.get(d.id)
         if score_dto is not None:
@@ -229,15 +255,20 @@ async def documents_page(
             d.personalized_computed_at = None
             d.personalized_cold_start = None
 
-    return templates.TemplateResponse("documents.html", {
+    context = {
         "request": request,
         "documents": documents,
         "q": q,
         "category": category,
         "tag": tag,
         "domain": domain,
-        "sort": sort
-    })
+        "sort": sort,
+        "cursor": cursor,
+        "next_url": next_url,
+    }
+    if cursor and request.headers.get("HX-Request") == "true":
+        return templates.TemplateResponse("partials/document_cards_page.html", context)
+    return templates.TemplateResponse("documents.html", context)
 
 
 @app.get("/documents/{document_id}", response_class=HTMLResponse)
@@ -253,10 +284,7 @@ async def document_detail(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     # Expose transient bookmarked attribute for templates
-    try:
-        document.bookmarked = bool(document.bookmarks and len(document.bookmarks) > 0)
-    except Exception:
-        document.bookmarked = False
+    mark_bookmarked(db, [document])
 
     return templates.TemplateResponse("document_detail.html", {
         "request": request,
@@ -0,0 +1,358 @@
+"""Resumable, batched data backfills that run while the app is serving.
+
+A backfill walks ``documents`` in primary-key order, a small batch per
+transaction, and records its cursor and row count in ``backfill_jobs`` in the
+same transaction as the batch. Each batch holds the write lock only briefly,
+the runner sleeps ``backfill_throttle_seconds`` between batches, and an
+interrupted run (restart, deploy, time budget) continues after the last
+committed batch. The scheduler calls ``run_pending_backfills`` periodically
+with a time budget; progress is shown on ``/admin/migrations``.
+
+Registered backfills fill the columns that earlier schema changes added
+without data: ``content_preview``, compressed ``content_md_z``, the
+denormalized ``primary_category`` / ``document_tags`` and, on PostgreSQL with
+``PGVECTOR_ENABLED``, the ``embeddings.vec_pg`` vector column.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.core.content_codec import active_codec, encode_content_md
+from app.core.database import (
+    BackfillJob,
+    Classification,
+    _write_classification_facets,
+    build_content_preview,
+    current_db_url,
+)
+
+logger = logging.getLogger(__name__)
+
+# step は (次のカーソル, 処理件数) を返し、対象が残っていなければカーソル None で終了を表す
+StepFn = Callable[[Connection, Optional[str], int], Tuple[Optional[str], int]]
+RemainingFn = Callable[[Connection, Optional[str]], int]
+
+
+@dataclass(frozen=True)
+class Backfill:
+    name: str
+    description: str
+    step: StepFn
+    remaining: RemainingFn
+    enabled: Callable[[], bool] = lambda: True
+
+
+def _select_ids(connection: Connection, sql: str, cursor: Optional[str], limit: int) -> List[tuple]:
+    return connection.execute(text(sql), {"after": cursor or "", "limit": limit}).all()
+
+
+def _count(connection: Connection, sql: str, cursor: Optional[str]) -> int:
+    return connection.execute(text(sql), {"after": cursor or ""}).scalar() or 0
+
+
+# --- content_preview ---------------------------------------------------------
+
+_PREVIEW_WHERE = "FROM documents WHERE id > :after AND content_preview IS NULL"
+
+
+def _preview_step(connection: Connection, cursor: Optional[str], limit: int):
+    rows = _select_ids(connection, f"SELECT id, content_text {_PREVIEW_WHERE} ORDER BY id LIMIT :limit", cursor, limit)
+    if not rows:
+        return None, 0
+    connection.execute(
+        text("UPDATE documents SET content_preview = :preview WHERE id = :id"),
+        [{"id": row[0], "preview": build_content_preview(row[1])} for row in rows],
+    )
+    return rows[-1][0], len(rows)
+
+
+# --- content_md の圧縮 ---------------------------------------------------------
+
+_COMPRESS_WHERE = "FROM documents WHERE id > :after AND content_md_z IS NULL"
+
+
+def _compress_step(connection: Connection, cursor: Optional[str], limit: int):
+    rows = _select_ids(connection, f"SELECT id, content_md {_COMPRESS_WHERE} ORDER BY id LIMIT :limit", cursor, limit)
+    if not rows:
+        return None, 0
+    updates = []
+    for doc_id, content_md in rows:
+        plain, blob = encode_content_md(content_md)
+        if blob is not None:
+            updates.append({"id": doc_id, "plain": plain, "blob": blob})
+    if updates:
+        connection.execute(text("UPDATE documents SET content_md = :plain, content_md_z = :blob WHERE id = :id"), updates)
+    # 圧縮しても縮まない短い本文も走査済みとして数える
+    return rows[-1][0], len(rows)
+
+
+# --- primary_category / document_tags ------------------------------------------
+
+_FACETS_WHERE = (
+    "FROM documents d WHERE d.id > :after AND d.primary_category IS NULL "
+    "AND EXISTS (SELECT 1 FROM classifications c WHERE c.document_id = d.id)"
+)
+
+
+def _facets_step(connection: Connection, cursor: Optional[str], limit: int):
+    rows = _select_ids(connection, f"SELECT d.id {_FACETS_WHERE} ORDER BY d.id LIMIT :limit", cursor, limit)
+    if not rows:
+        return None, 0
+    table = Classification.__table__
+    for (doc_id,) in rows:
+        latest = connection.execute(
+            table.select()
+            .where(table.c.document_id == doc_id)
+            .order_by(table.c.created_at.desc(), table.c.id)
+            .limit(1)
+        ).first()
+        if latest is not None:
+            # ORM イベントと同じ経路で書くので stats_counters のカテゴリ件数も揃う
+            _write_classification_facets(connection, doc_id, latest.primary_category, latest.tags)
+    return rows[-1][0], len(rows)
+
+
+# --- embeddings.vec_pg（pgvector） ------------------------------------------------
+
+_VECTOR_WHERE = "FROM embeddings WHERE id > :after AND vec_pg IS NULL"
+
+
+def _vector_step(connection: Connection, cursor: Optional[str], limit: int):
+    rows = _select_ids(connection, f"SELECT id {_VECTOR_WHERE} ORDER BY id LIMIT :limit", cursor, limit)
+    if not rows:
+        return None, 0
+    # vec を書き直すと BEFORE UPDATE トリガーが vec_pg を埋める（次元が合わない行は NULL のまま）
+    connection.execute(text("UPDATE embeddings SET vec = vec WHERE id = :id"), [{"id": row[0]} for row in rows])
+    return rows[-1][0], len(rows)
+
+
+def _pgvector_backfill_enabled() -> bool:
+    return bool(settings.pgvector_enabled) and current_db_url().startswith("postgresql")
+
+
+BACKFILLS: Dict[str, Backfill] = {
+    backfill.name: backfill
+    for backfill in (
+        Backfill(
+            name="content_preview",
+            description="一覧用の content_preview を content_text から作成",
+            step=_preview_step,
+            remaining=lambda conn, cursor: _count(conn, f"SELECT COUNT(*) {_PREVIEW_WHERE}", cursor),
+        ),
+        Backfill(
+            name="compress_content_md",
+            description="content_md を content_md_z に圧縮して保存",
+            step=_compress_step,
+            remaining=lambda conn, cursor: _count(conn, f"SELECT COUNT(*) {_COMPRESS_WHERE}", cursor),
+            enabled=lambda: active_codec() != "none",
+        ),
+        Backfill(
+            name="document_facets",
+            description="最新の分類から primary_category / document_tags を作成",
+            step=_facets_step,
+            remaining=lambda conn, cursor: _count(conn, f"SELECT COUNT(*) {_FACETS_WHERE}", cursor),
+        ),
+        Backfill(
+            name="embedding_vectors",
+            description="既存の埋め込みを pgvector 列（vec_pg）にコピー",
+            step=_vector_step,
+            remaining=lambda conn, cursor: _count(conn, f"SELECT COUNT(*) {_VECTOR_WHERE}", cursor),
+            enabled=_pgvector_backfill_enabled,
+        ),
+    )
+}
+
+
+def _job_table():
+    return BackfillJob.__table__
+
+
+def ensure_backfill_jobs(engine: Engine) -> None:
+    """登録済みのバックフィルに対応する backfill_jobs 行を作る（既存の行はそのまま）"""
+    table = _job_table()
+    table.create(bind=engine, checkfirst=True)
+    with engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(table.select().with_only_columns(table.c.name))}
+        rows = [{"name": name, "status": "pending", "processed": 0, "batches": 0} for name in BACKFILLS if name not in existing]
+        if rows:
+            connection.execute(table.insert(), rows)
+
+
+def _update_job(connection: Connection, name: str, **values) -> None:
+    table = _job_table()
+    values.setdefault("updated_at", datetime.utcnow())
+    connection.execute(table.update().where(table.c.name == name).values(**values))
+
+
+def _load_job(connection: Connection, name: str):
+    table = _job_table()
+    return connection.execute(table.select().where(table.c.name == name)).first()
+
+
+def run_backfill(
+    engine: Engine,
+    name: str,
+    *,
+    batch_size: Optional[int] = None,
+    throttle_seconds: Optional[float] = None,
+    time_budget: Optional[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> str:
+    """1つのバックフィルを進め、終了時の status を返す。
+
+    time_budget 秒を使い切ったら pending に戻して返す（次回はカーソルの続きから）。
+    paused / done のジョブは何もしない。
+    """
+    backfill = BACKFILLS[name]
+    batch_size = max(int(batch_size or settings.backfill_batch_size), 1)
+    throttle = settings.backfill_throttle_seconds if throttle_seconds is None else throttle_seconds
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+
+    ensure_backfill_jobs(engine)
+    try:
+        with engine.begin() as connection:
+            job = _load_job(connection, name)
+            if job.status in ("paused", "done"):
+                return job.status
+            if not backfill.enabled():
+                _update_job(connection, name, status="done", finished_at=datetime.utcnow(), last_error=None)
+                return "done"
+            remaining = backfill.remaining(connection, job.cursor)
+    except Exception as exc:
+        with engine.begin() as connection:
+            _update_job(connection, name, status="failed", last_error=str(exc))
+        logger.exception("backfill %s: failed to count remaining rows", name)
+        return "failed"
+    with engine.begin() as connection:
+        _update_job(
+            connection,
+            name,
+            status="running",
+            started_at=job.started_at or datetime.utcnow(),
+            total=job.processed + remaining,
+            last_error=None,
+        )
+    cursor, processed, batches = job.cursor, job.processed, job.batches
+
+    while True:
+        try:
+            with engine.begin() as connection:
+                # 管理画面からの一時停止はバッチの合間に反映する
+                if _load_job(connection, name).status == "paused":
+                    return "paused"
+                next_cursor, count = backfill.step(connection, cursor, batch_size)
+                if next_cursor is None:
+                    _update_job(connection, name, status="done", finished_at=datetime.utcnow())
+                    logger.info("backfill %s: done (%d rows)", name, processed)
+                    return "done"
+                cursor, processed, batches = next_cursor, processed + count, batches + 1
+                _update_job(connection, name, cursor=cursor, processed=processed, batches=batches)
+        except Exception as exc:
+            with engine.begin() as connection:
+                _update_job(connection, name, status="failed", last_error=str(exc))
+            logger.exception("backfill %s: batch failed at cursor %r", name, cursor)
+            return "failed"
+
+        if deadline is not None and time.monotonic() >= deadline:
+            with engine.begin() as connection:
+                _update_job(connection, name, status="pending")
+            return "pending"
+        if throttle > 0:
+            sleep(throttle)
+
+
+def run_pending_backfills(engine: Engine, time_budget: Optional[float] = None) -> Dict[str, str]:
+    """pending / running（前回中断）のバックフィルを登録順に時間の許す限り進める"""
+    ensure_backfill_jobs(engine)
+    table = _job_table()
+    with engine.connect() as connection:
+        statuses = dict(connection.execute(table.select().with_only_columns(table.c.name, table.c.status)).all())
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    results = {}
+    for name in BACKFILLS:
+        if statuses.get(name) not in ("pending", "running"):
+            continue
+        budget = None if deadline is None else deadline - time.monotonic()
+        if budget is not None and budget <= 0:
+            break
+        results[name] = run_backfill(engine, name, time_budget=budget)
+    return results
+
+
+def set_backfill_state(engine: Engine, name: str, action: str) -> None:
+    """管理画面の操作: pause / resume / restart（カーソルを消して最初からやり直す）"""
+    if name not in BACKFILLS:
+        raise KeyError(name)
+    ensure_backfill_jobs(engine)
+    with engine.begin() as connection:
+        if action == "pause":
+            _update_job(connection, name, status="paused")
+        elif action == "resume":
+            _update_job(connection, name, status="pending", last_error=None)
+        elif action == "restart":
+            _update_job(
+                connection,
+                name,
+                status="pending",
+                cursor=None,
+                processed=0,
+                batches=0,
+                total=None,
+                last_error=None,
+                started_at=None,
+                finished_at=None,
+            )
+        else:
+            raise ValueError(f"unknown action: {action}")
+
+
+def backfill_progress(engine: Engine) -> List[dict]:
+    """管理画面用の進捗一覧"""
+    ensure_backfill_jobs(engine)
+    table = _job_table()
+    with engine.connect() as connection:
+        rows = {row.name: row for row in connection.execute(table.select())}
+    progress = []
+    for name, backfill in BACKFILLS.items():
+        row = rows.get(name)
+        total = row.total if row is not None else None
+        processed = row.processed if row is not None else 0
+        if row is not None and row.status == "done":
+            percent = 100.0
+        elif total:
+            percent = round(min(processed / total, 1.0) * 100, 1)
+        else:
+            percent = 0.0
+        progress.append(
+            {
+                "name": name,
+                "description": backfill.description,
+                "status": row.status if row is not None else "pending",
+                "processed": processed,
+                "total": total,
+                "percent": percent,
+                "batches": row.batches if row is not None else 0,
+                "last_error": row.last_error if row is not None else None,
+                "started_at": row.started_at.isoformat() if row is not None and row.started_at else None,
+                "finished_at": row.finished_at.isoformat() if row is not None and row.finished_at else None,
+                "updated_at": row.updated_at.isoformat() if row is not None and row.updated_at else None,
+            }
+        )
+    return progress
+
+
+__all__ = [
+    "Backfill",
+    "BACKFILLS",
+    "ensure_backfill_jobs",
+    "run_backfill",
+    "run_pending_backfills",
+    "set_backfill_state",
+    "backfill_progress",
+]
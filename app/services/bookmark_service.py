@@ -1,9 +1,48 @@
-from typing import Tuple, List, Optional
+import threading
+import time
+from typing import Dict, Iterable, Set, Tuple, List, Optional
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import OperationalError
-from app.core.database import Bookmark, Document
+from app.core.config import settings
+from app.core.database import Bookmark, Document, defer_document_bodies
+from app.core.pagination import fetch_page
 from app.core.user_utils import normalize_user_id
 
+# (DB URL, user_id) -> (件数, 取得時刻)。ブックマークの追加・削除で invalidate_bookmark_count される
+_count_cache: Dict[Tuple[str, str], Tuple[int, float]] = {}
+_count_cache_lock = threading.Lock()
+
+
+def _bookmarks_query(db: Session, user_id: str):
+    document_load = joinedload(Bookmark.document)
+    return db.query(Bookmark).options(
+        document_load.joinedload(Document.classifications),
+        document_load.options(*defer_document_bodies()),
+    ).filter(Bookmark.user_id == user_id)
+
+
+def _attach_bookmark_metadata(items: Iterable[Bookmark]) -> List[Document]:
+    documents: List[Document] = []
+    for bookmark in items:
+        document = bookmark.document
+        if not document:
+            # Skip bookmarks without a document (possible if doc was deleted).
+            continue
+
+        # Attach transient bookmark metadata for template usage.
+        try:
+            document.bookmarked = True
+            document.bookmark_id = bookmark.id
+            document.bookmark_note = bookmark.note
+            document.bookmark_created_at = bookmark.created_at
+        except Exception:
+            # Transient attributes are best-effort.
+            pass
+
+        documents.append(document)
+    return documents
+
 
 def get_user_bookmarked_documents(
     db: Session,
@@ -34,14 +73,8 @@ def get_user_bookmarked_documents(
 
     offset = (safe_page - 1) * safe_per_page
 
-    q = db.query(Bookmark).options(
-        joinedload(Bookmark.document).joinedload(Document.classifications)
-    )
-
     # Always filter by normalized user_id (including "guest")
-    q = q.filter(Bookmark.user_id == normalized_user_id)
-
-    q = q.order_by(Bookmark.created_at.desc())
+    q = _bookmarks_query(db, normalized_user_id).order_by(Bookmark.created_at.desc(), Bookmark.id.desc())
 
     try:
         total = q.count()
@@ -53,23 +86,85 @@ def get_user_bookmarked_documents(
         # when schema migrations have not been applied.
         return [], 0
 
-    documents: List[Document] = []
-    for bookmark in items:
-        document = bookmark.document
-        if not document:
-            # Skip bookmarks without a document (possible if doc was deleted).
-            continue
+    return _attach_bookmark_metadata(items), total
 
-        # Attach transient bookmark metadata for template usage.
-        try:
-            document.bookmarked = True
-            document.bookmark_id = bookmark.id
-            document.bookmark_note = bookmark.note
-            document.bookmark_created_at = bookmark.created_at
-        except Exception:
-            # Transient attributes are best-effort.
-            pass
 
-        documents.append(document)
+def get_user_bookmarked_page(
+    db: Session,
+    user_id: Optional[str],
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> Tuple[List[Document], Optional[str]]:
+    """Return (documents, next_cursor) using keyset pagination on (created_at, id).
+
+    Unlike :func:`get_user_bookmarked_documents` this never runs ``OFFSET`` or
+    ``COUNT``; ``next_cursor`` is None on the last page. Raises
+    ``InvalidCursor`` for a malformed cursor.
+    """
+    normalized_user_id = normalize_user_id(user_id)
+    limit = max(min(int(limit), 200), 1)
+    try:
+        items, next_cursor = fetch_page(
+            _bookmarks_query(db, normalized_user_id), Bookmark.created_at, Bookmark.id, cursor, limit
+        )
+    except OperationalError:
+        return [], None
+    return _attach_bookmark_metadata(items), next_cursor
+
+
+def count_user_bookmarks(db: Session, user_id: Optional[str]) -> int:
+    """The user's bookmark count, cached for ``bookmark_count_cache_seconds``.
+
+    The count is only used for display, so a slightly stale value is fine;
+    bookmark writes through the API invalidate it immediately.
+    """
+    normalized_user_id = normalize_user_id(user_id)
+    key = (str(db.get_bind().url), normalized_user_id)
+    ttl = settings.bookmark_count_cache_seconds
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached is not None and ttl > 0 and now - cached[1] < ttl:
+        return cached[0]
+    try:
+        total = db.query(func.count(Bookmark.id)).filter(Bookmark.user_id == normalized_user_id).scalar() or 0
+    except OperationalError:
+        return 0
+    with _count_cache_lock:
+        _count_cache[key] = (total, now)
+    return total
+
+
+def invalidate_bookmark_count(user_id: Optional[str] = None) -> None:
+    """Drop cached counts for ``user_id`` (all users when None)."""
+    with _count_cache_lock:
+        if user_id is None:
+            _count_cache.clear()
+            return
+        normalized_user_id = normalize_user_id(user_id)
+        for key in [k for k in _count_cache if k[1] == normalized_user_id]:
+            _count_cache.pop(key, None)
+
+
+def bookmarked_document_ids(db: Session, document_ids: Iterable[str]) -> Set[str]:
+    """Return the subset of ``document_ids`` that have at least one bookmark.
+
+    One ``IN`` query for the whole page instead of lazily loading
+    ``Document.bookmarks`` for every card.
+    """
+    ids = {doc_id for doc_id in document_ids if doc_id}
+    if not ids:
+        return set()
+    try:
+        rows = db.query(Bookmark.document_id).filter(Bookmark.document_id.in_(ids)).distinct().all()
+    except OperationalError:
+        return set()
+    return {row[0] for row in rows}
+
 
-    return documents, total
+def mark_bookmarked(db: Session, documents: Iterable[Document]) -> None:
+    """Attach the transient ``bookmarked`` flag used by the templates to each document."""
+    documents = list(documents)
+    bookmarked = bookmarked_document_ids(db, (doc.id for doc in documents))
+    for doc in documents:
+        doc.bookmarked = doc.id in bookmarked
@@ -0,0 +1,47 @@
+"""Category / tag lookups backed by the denormalized classification data.
+
+``documents.primary_category`` and ``document_tags`` mirror the latest
+classification of each document (kept in sync by ORM events on
+``Classification`` in ``app.core.database``), so category/tag filters, facet
+counts and the tag cloud are index lookups instead of JOINs on
+``classifications`` and ``LIKE`` scans over the JSON ``tags`` text.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select
+
+from app.core.database import Document, DocumentTag
+
+
+def tagged_document_ids(tag: str):
+    """タグを持つドキュメント ID のサブクエリ（Document.id.in_(...) で使う）"""
+    return select(DocumentTag.document_id).where(DocumentTag.tag == tag.strip())
+
+
+def category_counts(db) -> List[Dict[str, Any]]:
+    """カテゴリごとの件数（件数の多い順）"""
+    rows = (
+        db.query(Document.primary_category, func.count(Document.id))
+        .filter(Document.primary_category.isnot(None))
+        .group_by(Document.primary_category)
+        .order_by(func.count(Document.id).desc(), Document.primary_category)
+        .all()
+    )
+    return [{"category": category, "count": count} for category, count in rows]
+
+
+def tag_counts(db, limit: int = 50, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """タグクラウド用のタグ件数（件数の多い順、category 指定時はそのカテゴリ内）"""
+    query = db.query(DocumentTag.tag, func.count(DocumentTag.document_id))
+    if category:
+        query = query.join(Document, Document.id == DocumentTag.document_id).filter(Document.primary_category == category)
+    rows = (
+        query.group_by(DocumentTag.tag)
+        .order_by(func.count(DocumentTag.document_id).desc(), DocumentTag.tag)
+        .limit(limit)
+        .all()
+    )
+    return [{"tag": tag, "count": count} for tag, count in rows]
+
+
+__all__ = ["tagged_document_ids", "category_counts", "tag_counts"]
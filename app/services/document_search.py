@@ -0,0 +1,29 @@
+"""Keyword search over document bodies, per database dialect.
+
+On SQLite the search is a substring ``LIKE`` on ``content_text`` (ASCII
+case-insensitive there). On PostgreSQL it combines a ``tsvector`` match,
+served by the GIN expression index that ``create_tables`` builds for
+``POSTGRES_FTS_CONFIG``, with a case-insensitive substring match served by the
+``pg_trgm`` index from ``migrations/postgresql``. Text search configurations
+split on spaces and punctuation, so Japanese text without spaces is only
+found through the substring half; the word match adds websearch syntax
+(``"phrase"``, ``OR``, ``-word``) for spaced languages.
+"""
+from sqlalchemy import or_
+
+from app.core.database import Document, document_tsquery, document_tsvector, postgres_fts_config
+
+
+def document_text_match(db, q: str):
+    """本文検索の条件（query.filter(...) で使う）"""
+    q = q.strip()
+    if db.get_bind().dialect.name != "postgresql":
+        return Document.content_text.contains(q)
+    substring = Document.content_text.icontains(q)
+    config = postgres_fts_config()
+    if not config:
+        return substring
+    return or_(document_tsvector(config).op("@@")(document_tsquery(config, q)), substring)
+
+
+__all__ = ["document_text_match"]
@@ -1,5 +1,4 @@
 import trafilatura
-import httpx
 from typing import Optional, Dict, Any
 from urllib.parse import urlparse
 import hashlib
@@ -8,6 +7,10 @@ from datetime import datetime
 import asyncio
 import tempfile
 import os
+import threading
+
+from app.core.config import settings
+from app.core.async_runner import get_loop_http_client
 
 # PDF処理
 try:
@@ -24,6 +27,90 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Docling の変換器はレイアウト/OCRモデルを読み込むため生成コストが高い。
+# プロセス内で1つだけ生成して使い回す。
+_docling_converter = None
+_docling_init_lock = threading.Lock()
+_docling_convert_lock = threading.Lock()
+
+
+def _build_docling_converter():
+    """設定に従って Docling の DocumentConverter を生成する"""
+    try:
+        from docling.datamodel.base_models import InputFormat
+        from docling.datamodel.pipeline_options import PdfPipelineOptions
+        from docling.document_converter import PdfFormatOption
+
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.do_ocr = settings.pdf_ocr_enabled
+        pipeline_options.do_table_structure = settings.pdf_table_structure
+        return DocumentConverter(
+            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+        )
+    except ImportError:
+        # 古い Docling ではパイプラインオプションを指定できないため既定値で生成する
+        logger.warning("Docling pipeline options unavailable; using default converter")
+        return DocumentConverter()
+
+
+def get_docling_converter():
+    """プロセス内で共有する Docling 変換器を遅延生成して返す。
+
+    Docling が利用できない場合は None を返す。
+    """
+    global _docling_converter
+    if not DOCLING_AVAILABLE:
+        return None
+    if _docling_converter is None:
+        with _docling_init_lock:
+            if _docling_converter is None:
+                _docling_converter = _build_docling_converter()
+                logger.info(
+                    "Docling converter created (ocr=%s table_structure=%s)",
+                    settings.pdf_ocr_enabled,
+                    settings.pdf_table_structure,
+                )
+    return _docling_converter
+
+
+def reset_docling_converter() -> None:
+    """共有変換器を破棄する（設定変更時やベンチマーク用）"""
+    global _docling_converter
+    with _docling_init_lock:
+        _docling_converter = None
+
+
+def warm_up_pdf_converter() -> bool:
+    """変換器を生成し、PDFパイプラインのモデルを事前に読み込む。
+
+    ワーカー起動時に呼び出すことで、最初のPDF取り込みでのモデル読み込み待ちを避ける。
+    変換器を用意できた場合は True を返す。
+    """
+    converter = get_docling_converter()
+    if converter is None:
+        return False
+    try:
+        from docling.datamodel.base_models import InputFormat
+
+        initialize = getattr(converter, "initialize_pipeline", None)
+        if callable(initialize):
+            with _docling_convert_lock:
+                initialize(InputFormat.PDF)
+        logger.info("Docling PDF pipeline warmed up")
+    except Exception as e:
+        logger.warning(f"Docling warm-up failed; models will load on first conversion: {e}")
+    return True
+
+
+def _convert_with_docling(file_path: str, **kwargs):
+    """共有変換器で PDF を変換する（モデルはスレッドセーフではないため直列化する）
+
+    `kwargs` は `DocumentConverter.convert` にそのまま渡す（例: `page_range=(1, 8)`）。
+    """
+    converter = get_docling_converter()
+    with _docling_convert_lock:
+        return converter.convert(file_path, **kwargs)
+
 
 class ContentExtractor:
     """コンテンツ抽出サービス"""
@@ -34,53 +121,54 @@ class ContentExtractor:
     async def extract_from_url(self, url: str) -> Optional[Dict[str, Any]]:
         """URLからコンテンツを抽出"""
         try:
-            async with httpx.AsyncClient(
+            client = get_loop_http_client(
+                "extractor",
                 headers={"User-Agent": self.user_agent},
                 timeout=30.0,
                 follow_redirects=True
-            ) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                # HTMLコンテンツ抽出
-                extracted = trafilatura.extract(
-                    response.text,
-                    output_format='markdown',
-                    include_comments=False,
-                    include_links=False,
-                    include_images=True,
-                    include_tables=True,
-                    favor_precision=True
-                )
-                
-                if not extracted:
-                    logger.warning(f"Failed to extract content from {url}")
-                    return None
-                
-                # メタデータ抽出
-                metadata = trafilatura.extract_metadata(response.text)
-                
-                # ドメイン抽出
-                domain = urlparse(url).netloc
-                
-                # ハッシュ生成
-                content_hash = hashlib.sha256(extracted.encode()).hexdigest()
-                
-                # 言語検出
-                lang = self._detect_language(extracted)
-                
-                return {
-                    "url": url,
-                    "domain": domain,
-                    "title": metadata.title if metadata and metadata.title else "無題",
-                    "author": metadata.author if metadata and metadata.author else None,
-                    "published_at": self._parse_date(metadata.date) if metadata and metadata.date else None,
-                    "content_md": extracted,
-                    "content_text": trafilatura.extract(response.text, output_format='txt') or "",
-                    "hash": content_hash,
-                    "lang": lang
-                }
-                
+            )
+            response = await client.get(url)
+            response.raise_for_status()
+            
+            # HTMLコンテンツ抽出
+            extracted = trafilatura.extract(
+                response.text,
+                output_format='markdown',
+                include_comments=False,
+                include_links=False,
+                include_images=True,
+                include_tables=True,
+                favor_precision=True
+            )
+            
+            if not extracted:
+                logger.warning(f"Failed to extract content from {url}")
+                return None
+            
+            # メタデータ抽出
+            metadata = trafilatura.extract_metadata(response.text)
+            
+            # ドメイン抽出
+            domain = urlparse(url).netloc
+            
+            # ハッシュ生成
+            content_hash = hashlib.sha256(extracted.encode()).hexdigest()
+            
+            # 言語検出
+            lang = self._detect_language(extracted)
+            
+            return {
+                "url": url,
+                "domain": domain,
+                "title": metadata.title if metadata and metadata.title else "無題",
+                "author": metadata.author if metadata and metadata.author else None,
+                "published_at": self._parse_date(metadata.date) if metadata and metadata.date else None,
+                "content_md": extracted,
+                "content_text": trafilatura.extract(response.text, output_format='txt') or "",
+                "hash": content_hash,
+                "lang": lang
+            }
+            
         except Exception as e:
             logger.error(f"URL extraction error for {url}: {e}")
             return None
@@ -91,8 +179,8 @@ class ContentExtractor:
         # Doclingを最初に試行
         if DOCLING_AVAILABLE:
             try:
-                converter = DocumentConverter()
-                result = converter.convert(file_path)
+                # 変換はCPUバウンドなのでイベントループを塞がないようスレッドで実行する
+                result = await asyncio.to_thread(_convert_with_docling, file_path)
                 
                 if result and result.document:
                     content_md = result.document.export_to_markdown()
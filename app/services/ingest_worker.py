@@ -3,73 +3,42 @@ import json
 from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
 import uuid
-import asyncio
-from threading import Thread
 
 import httpx
 from sqlalchemy import text
-from urllib.parse import urljoin, urlparse
-import os
-from pathlib import Path
-
-try:
-    from PIL import Image
-    from io import BytesIO
-    PIL_AVAILABLE = True
-except Exception:
-    PIL_AVAILABLE = False
-
-from app.core.database import SessionLocal
+
+from app.core.config import settings
+from app.core.database import STATS_DOCUMENTS, SessionLocal, build_content_preview, bump_stats_counters, stats_day_key
+from app.core.content_codec import encode_content_md
 from app.services.extractor import content_extractor
 from app.services.postprocess import kick_postprocess_async
 from app.services.postprocess_queue import enqueue_job_for_document
-from app.services.personalization_queue import schedule_profile_update
+from app.services.personalization_queue import schedule_document_scoring
+from app.core.async_runner import run_sync
+from app.services.thumbnail_cache import get_thumbnail_for_url
 import sys
 
 logger = logging.getLogger(__name__)
 
 
 def _run_coro_in_new_loop(coro):
-    """Run an async coroutine safely in a worker thread without an event loop.
-    
-    This helper creates a new event loop, runs the coroutine, and properly
-    shuts down the loop. It's designed for use in ThreadPoolExecutor or
-    other worker threads that don't have a current event loop.
-    
+    """Run an async coroutine from synchronous worker code and return its result.
+
+    The coroutine is executed on the shared background event loop
+    (`app.core.async_runner`), so callers in ThreadPoolExecutor threads or in
+    threads that already run a loop can use it alike, and HTTP connection
+    pools bound to that loop are reused between calls.
+
     Args:
         coro: A coroutine object to execute
-        
+
     Returns:
         The result of the coroutine execution
-        
+
     Raises:
         Any exception raised by the coroutine
     """
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
-    
-    # If there's already a running loop in this thread, execute in a separate
-    # thread to avoid conflicts
-    if loop and loop.is_running():
-        result_container = {}
-        
-        def _runner():
-            try:
-                result_container["res"] = asyncio.run(coro)
-            except Exception as e:
-                result_container["exc"] = e
-        
-        t = Thread(target=_runner, daemon=True)
-        t.start()
-        t.join()
-        if "exc" in result_container:
-            raise result_container["exc"]
-        return result_container.get("res")
-    
-    # No running loop here; safe to use asyncio.run
-    return asyncio.run(coro)
+    return run_sync(coro)
 
 
 def _insert_document_if_new(db, doc: Dict[str, Any], source_name: str):
@@ -103,11 +72,13 @@ def _insert_document_if_new(db, doc: Dict[str, Any], source_name: str):
 
     insert_sql = text(
         """
-        INSERT INTO documents (id, url, domain, title, author, published_at, content_md, content_text, hash, lang, created_at, updated_at, source, original_url, thumbnail_url, fetched_at)
-        VALUES (:id, :url, :domain, :title, :author, :published_at, :content_md, :content_text, :hash, :lang, :created_at, :updated_at, :source, :original_url, :thumbnail_url, :fetched_at)
+        INSERT INTO documents (id, url, domain, title, author, published_at, content_md, content_md_z, content_text, content_preview, hash, lang, created_at, updated_at, source, original_url, thumbnail_url, fetched_at)
+        VALUES (:id, :url, :domain, :title, :author, :published_at, :content_md, :content_md_z, :content_text, :content_preview, :hash, :lang, :created_at, :updated_at, :source, :original_url, :thumbnail_url, :fetched_at)
         """
     )
 
+    # content_md は圧縮できれば content_md_z に入れる（Document.content_md と同じ規則）
+    content_md, content_md_z = encode_content_md(doc.get("content_md"))
     params = {
         "id": doc_id,
         "url": url,
@@ -120,8 +91,10 @@ def _insert_document_if_new(db, doc: Dict[str, Any], source_name: str):
             doc.get("published_at") if isinstance(doc.get("published_at"), datetime)
             else (content_extractor._parse_date(doc.get("published_at")) if doc.get("published_at") else None)
         ),
-        "content_md": doc.get("content_md"),
+        "content_md": content_md,
+        "content_md_z": content_md_z,
         "content_text": doc.get("content_text"),
+        "content_preview": build_content_preview(doc.get("content_text")),
         "hash": doc_hash,
         "lang": doc.get("lang"),
         "created_at": now,
@@ -134,6 +107,8 @@ def _insert_document_if_new(db, doc: Dict[str, Any], source_name: str):
 
     try:
         db.execute(insert_sql, params)
+        # ORM を通らない挿入なので stats_counters も同じトランザクションで増やす
+        bump_stats_counters(db.connection(), {STATS_DOCUMENTS: 1, stats_day_key(now): 1})
         db.commit()
         logger.info("Inserted document %s %s", doc_id, url)
         try:
@@ -147,15 +122,15 @@ def _insert_document_if_new(db, doc: Dict[str, Any], source_name: str):
         except Exception:
             db.rollback()
             logger.exception("Failed to create postprocess job for %s", doc_id)
-        delay = timedelta(seconds=30)
-        job_id = schedule_profile_update(
+        delay = timedelta(seconds=settings.preference_job_debounce_seconds)
+        job_id = schedule_document_scoring(
             db,
             document_id=doc_id,
             available_at=now + delay,
             payload={"document_ids": [doc_id]},
         )
         if job_id:
-            logger.debug("Ingest: scheduled preference job %s for document %s (available_at=%s)", job_id, doc_id, (now + delay).isoformat())
+            logger.debug("Ingest: scheduled scoring job %s for document %s (available_at=%s)", job_id, doc_id, (now + delay).isoformat())
         return doc_id
     except Exception:
         db.rollback()
@@ -198,70 +173,14 @@ def _fetch_qiita_items(config: Dict[str, Any]):
 
 
 def _ensure_thumbnail_for_url(db, url: str) -> Optional[str]:
-    """Try to download favicon or og:image for `url`, resize to 64x64 and store under `data/assets/thumbnails/`.
+    """Return a 64x64 favicon/og:image thumbnail for `url` stored under `data/assets/thumbnails/`.
+
+    Lookups go through the per-domain / per-URL cache in
+    `app.services.thumbnail_cache`, so a domain's favicon is fetched once.
 
     Returns relative thumbnail path (e.g. 'assets/thumbnails/<fname>') or None.
     """
-    if not url or not PIL_AVAILABLE:
-        if not PIL_AVAILABLE:
-            logger.warning("Pillow not available; thumbnail generation skipped")
-        return None
-
-    parsed = urlparse(url)
-    base = f"{parsed.scheme}://{parsed.netloc}"
-    thumb_dir = Path("data/assets/thumbnails")
-    thumb_dir.mkdir(parents=True, exist_ok=True)
-
-    candidates = []
-    # 1) favicon.ico
-    candidates.append(urljoin(base, "/favicon.ico"))
-
-    # 2) attempt to fetch page and look for <meta property="og:image"> or <link rel="icon">
-    try:
-        with httpx.Client(timeout=15.0) as client:
-            r = client.get(url)
-            if r.status_code == 200:
-                html = r.text
-                # naive parse for og:image
-                import re
-
-                m = re.search(r"<meta[^>]+property=[\"']og:image[\"'][^>]+content=[\"']([^\"']+)[\"']", html, re.I)
-                if m:
-                    img = m.group(1)
-                    if img.startswith("//"):
-                        img = f"{parsed.scheme}:{img}"
-                    elif img.startswith("/"):
-                        img = urljoin(base, img)
-                    candidates.append(img)
-                # link rel icons
-                m2 = re.search(r"<link[^>]+rel=[\"'](?:icon|shortcut icon)[\"'][^>]+href=[\"']([^\"']+)[\"']", html, re.I)
-                if m2:
-                    icon = m2.group(1)
-                    if icon.startswith("/"):
-                        icon = urljoin(base, icon)
-                    candidates.append(icon)
-    except Exception:
-        logger.debug("Could not fetch page to discover images for %s", url)
-
-    # Try candidates in order
-    for c in candidates:
-        try:
-            with httpx.Client(timeout=15.0) as client:
-                rr = client.get(c)
-                if rr.status_code != 200 or 'image' not in rr.headers.get('content-type',''):
-                    continue
-                # resize via Pillow
-                img = Image.open(BytesIO(rr.content)).convert('RGBA')
-                img = img.resize((64,64), Image.LANCZOS)
-                fname = f"thumb_{abs(hash(c))}.png"
-                path = thumb_dir / fname
-                img.save(path, format='PNG')
-                rel = os.path.join('assets','thumbnails', fname)
-                return rel
-        except Exception:
-            logger.debug("Failed to fetch/resize candidate %s", c)
-
-    return None
+    return get_thumbnail_for_url(db, url)
 
 
 def _fetch_hatena_items(config: Dict[str, Any]):
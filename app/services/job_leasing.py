@@ -0,0 +1,357 @@
+"""Atomic job leasing shared by the DB-backed queues.
+
+Both ``postprocess_jobs`` and ``preference_jobs`` are drained by polling
+workers. To let several workers drain the same queue in parallel, a job is
+claimed with a single conditional UPDATE::
+
+    UPDATE <jobs> SET status='in_progress', lease_owner=:owner, lease_expires_at=:exp
+    WHERE id = (SELECT id FROM <jobs> WHERE status='pending' AND ... ORDER BY ... LIMIT 1)
+      AND status = 'pending'
+    RETURNING id
+
+On SQLite the UPDATE takes the database write lock before the subquery is
+evaluated, so two workers can never pick the same row. On PostgreSQL the
+subquery uses ``FOR UPDATE SKIP LOCKED`` so concurrent workers skip rows that
+are being claimed instead of blocking on them. Databases without
+``UPDATE ... RETURNING`` fall back to select-then-conditional-update and
+check the affected row count.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Sequence, Type
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.services import queue_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """ワーカー識別子（ホスト名:PID:スレッドID）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def lease_next_job(
+    db: Session,
+    model: Type[Any],
+    *,
+    order_by: Sequence[Any],
+    owner: Optional[str] = None,
+    lease_seconds: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> Optional[Any]:
+    """実行可能な pending ジョブを1件アトミックに取得し、in_progress としてリースする。
+
+    `model` は status / next_attempt_at / lease_owner / lease_expires_at / updated_at
+    カラムを持つジョブモデル。取得できなかった場合は None を返す。
+    """
+    now = now or datetime.utcnow()
+    owner = owner or default_worker_id()
+    lease_seconds = settings.job_lease_seconds if lease_seconds is None else lease_seconds
+    expires_at = now + timedelta(seconds=lease_seconds)
+
+    candidate = (
+        select(model.id)
+        .where(
+            model.status == "pending",
+            or_(model.next_attempt_at.is_(None), model.next_attempt_at <= now),
+        )
+        .order_by(*order_by)
+        .limit(1)
+    )
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql":
+        candidate = candidate.with_for_update(skip_locked=True)
+
+    values = {
+        "status": "in_progress",
+        "lease_owner": owner,
+        "lease_expires_at": expires_at,
+        "updated_at": now,
+    }
+
+    try:
+        if getattr(dialect, "update_returning", False):
+            stmt = (
+                update(model)
+                .where(model.id == candidate.scalar_subquery(), model.status == "pending")
+                .values(**values)
+                .returning(model.id)
+                .execution_options(synchronize_session=False)
+            )
+            job_id = db.execute(stmt).scalar_one_or_none()
+        else:
+            job_id = db.execute(candidate).scalar_one_or_none()
+            if job_id is not None:
+                result = db.execute(
+                    update(model)
+                    .where(model.id == job_id, model.status == "pending")
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    job_id = None
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("job_leasing: failed to lease job from %s", model.__tablename__)
+        return None
+
+    if job_id is None:
+        return None
+    queue_metrics.incr(model.__tablename__, "leased")
+    job = db.get(model, job_id, populate_existing=True)
+    logger.debug("job_leasing: %s leased %s job %s until %s", owner, model.__tablename__, job_id, expires_at)
+    return job
+
+
+def seconds_until_next_job(db: Session, model: Type[Any], now: Optional[datetime] = None) -> Optional[float]:
+    """次に実行可能になる pending ジョブまでの秒数（pending が無ければ None）"""
+    now = now or datetime.utcnow()
+    try:
+        has_ready = db.execute(
+            select(model.id)
+            .where(
+                model.status == "pending",
+                or_(model.next_attempt_at.is_(None), model.next_attempt_at <= now),
+            )
+            .limit(1)
+        ).first()
+        if has_ready:
+            return 0.0
+        next_at = db.execute(
+            select(func.min(model.next_attempt_at)).where(model.status == "pending")
+        ).scalar()
+    except Exception:
+        db.rollback()
+        return None
+    if next_at is None:
+        return None
+    return max((next_at - now).total_seconds(), 0.0)
+
+
+def release_lease(job: Any) -> None:
+    """ジョブのリース情報をクリアする（完了・失敗・再スケジュール時）"""
+    job.lease_owner = None
+    job.lease_expires_at = None
+
+
+def finish_leased_job(
+    db: Session,
+    model: Type[Any],
+    job: Any,
+    owner: Optional[str] = None,
+    **values: Any,
+) -> bool:
+    """リースを保持している in_progress ジョブの結果（done / failed / 再試行）を書き込む。
+
+    `WHERE id = :id AND lease_owner = :owner AND status = 'in_progress'` の条件付き UPDATE で、
+    リース期限切れで回収され他のワーカーに渡ったジョブは上書きせずに False を返す。
+    owner 省略時はリース時に読み込んだ job.lease_owner を使う。リースは同時に解放する。
+    """
+    owner = job.lease_owner if owner is None else owner
+    values.setdefault("updated_at", datetime.utcnow())
+    values.update(lease_owner=None, lease_expires_at=None)
+    # リース導入前の行（lease_owner が NULL）はそのまま NULL を条件にする
+    held = model.lease_owner == owner if owner is not None else model.lease_owner.is_(None)
+    try:
+        result = db.execute(
+            update(model)
+            .where(model.id == job.id, model.status == "in_progress", held)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # コミットで job は期限切れになり、次のアクセスで DB の値を読み直す
+    if result.rowcount != 1:
+        queue_metrics.incr(model.__tablename__, "lease_lost")
+        logger.warning(
+            "job_leasing: %s job %s is no longer leased by %s; result discarded",
+            model.__tablename__,
+            job.id,
+            owner,
+        )
+        return False
+    return True
+
+
+def renew_lease(
+    db: Session,
+    model: Type[Any],
+    job_id: str,
+    owner: str,
+    lease_seconds: Optional[int] = None,
+) -> bool:
+    """自分が保持している in_progress ジョブのリース期限を延長する。
+
+    既に回収されて他のワーカーに渡っている場合などは False を返す。
+    """
+    lease_seconds = settings.job_lease_seconds if lease_seconds is None else lease_seconds
+    now = datetime.utcnow()
+    try:
+        result = db.execute(
+            update(model)
+            .where(model.id == job_id, model.status == "in_progress", model.lease_owner == owner)
+            .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("job_leasing: failed to renew lease for %s job %s", model.__tablename__, job_id)
+        return False
+    renewed = result.rowcount == 1
+    queue_metrics.incr(model.__tablename__, "lease_renewed" if renewed else "lease_lost")
+    return renewed
+
+
+def reclaim_expired_leases(
+    db: Session,
+    model: Type[Any],
+    *,
+    now: Optional[datetime] = None,
+    lease_seconds: Optional[int] = None,
+) -> Dict[str, int]:
+    """リース期限切れの in_progress ジョブをキューに戻す。
+
+    ワーカーのクラッシュ等で放置されたジョブは試行回数を1つ消費し、
+    上限に達していれば failed、そうでなければ即時再実行可能な pending に戻す。
+    リース導入前の行（lease_expires_at が NULL）は updated_at がリース期間より古いものを対象とする。
+    戻り値は {"requeued": n, "failed": m}。
+    """
+    now = now or datetime.utcnow()
+    lease_seconds = settings.job_lease_seconds if lease_seconds is None else lease_seconds
+    stale_before = now - timedelta(seconds=lease_seconds)
+    table = model.__tablename__
+    counts = {"requeued": 0, "failed": 0}
+
+    try:
+        expired = (
+            db.query(model)
+            .filter(
+                model.status == "in_progress",
+                or_(
+                    model.lease_expires_at < now,
+                    and_(model.lease_expires_at.is_(None), model.updated_at < stale_before),
+                ),
+            )
+            .all()
+        )
+        for job in expired:
+            attempts = int(job.attempts or 0) + 1
+            exhausted = attempts >= int(job.max_attempts or 1)
+            # 期限を確認した時点から延長・完了されていないことを条件に更新する
+            guard = (
+                model.lease_expires_at == job.lease_expires_at
+                if job.lease_expires_at is not None
+                else and_(model.lease_expires_at.is_(None), model.updated_at == job.updated_at)
+            )
+            result = db.execute(
+                update(model)
+                .where(model.id == job.id, model.status == "in_progress", guard)
+                .values(
+                    status="failed" if exhausted else "pending",
+                    attempts=attempts,
+                    last_error=f"lease expired (owner={job.lease_owner or 'unknown'})",
+                    next_attempt_at=None if exhausted else now,
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    updated_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                counts["failed" if exhausted else "requeued"] += 1
+                logger.warning(
+                    "job_leasing: reclaimed %s job %s from %s (attempt %d%s)",
+                    table,
+                    job.id,
+                    job.lease_owner,
+                    attempts,
+                    ", giving up" if exhausted else "",
+                )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("job_leasing: failed to reclaim expired %s leases", table)
+        return counts
+
+    queue_metrics.incr(table, "reclaimed", counts["requeued"])
+    queue_metrics.incr(table, "reclaimed_failed", counts["failed"])
+    return counts
+
+
+class LeaseHeartbeat:
+    """ジョブ処理中にバックグラウンドでリースを延長し続けるコンテキストマネージャ。
+
+    延長間隔はリース期間の1/3。専用のセッションを使うため、処理側のセッションとは独立している。
+    イベントループ上では ``async with`` で使うこと（終了時のスレッド join をループ外で待つ）。
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        model: Type[Any],
+        job_id: str,
+        owner: str,
+        lease_seconds: Optional[int] = None,
+    ):
+        self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+        self.model = model
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_seconds = settings.job_lease_seconds if lease_seconds is None else lease_seconds
+        self.interval = max(self.lease_seconds / 3.0, 0.05)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            session = self._session_factory()
+            try:
+                if not renew_lease(session, self.model, self.job_id, self.owner, self.lease_seconds):
+                    self.lost = True
+                    logger.warning("job_leasing: lost lease on %s job %s", self.model.__tablename__, self.job_id)
+                    return
+            finally:
+                session.close()
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread = threading.Thread(target=self._run, name=f"lease-heartbeat-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    async def __aenter__(self) -> "LeaseHeartbeat":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info) -> None:
+        # 延長処理の途中だと join が最大数秒かかるため、イベントループを塞がないよう別スレッドで待つ
+        await asyncio.to_thread(self.__exit__, *exc_info)
+
+
+__all__ = [
+    "default_worker_id",
+    "lease_next_job",
+    "release_lease",
+    "finish_leased_job",
+    "seconds_until_next_job",
+    "renew_lease",
+    "reclaim_expired_leases",
+    "LeaseHeartbeat",
+]
@@ -1,7 +1,9 @@
+import asyncio
 import httpx
 import json
 from typing import List, Dict, Any, Optional
 from app.core.config import settings
+from app.core.async_runner import get_loop_http_client, get_loop_semaphore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,11 +19,19 @@ class LLMClient:
         self.embed_model = settings.embed_model
         self.timeout = settings.timeout_sec
         
+    def _http_client(self) -> httpx.AsyncClient:
+        """実行中のループで共有する HTTP クライアント（接続プールを呼び出し間で再利用）"""
+        return get_loop_http_client("llm")
+
+    def _request_slot(self) -> asyncio.Semaphore:
+        """同時 LLM リクエスト数を `llm_max_concurrency` に制限するセマフォ"""
+        return get_loop_semaphore("llm", settings.llm_max_concurrency)
+
     async def chat_completion(self, messages: List[Dict[str, str]], temperature: float = 0.1) -> Optional[str]:
         """チャット補完を実行"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            async with self._request_slot():
+                response = await self._http_client().post(
                     f"{self.chat_api_base}/chat/completions",
                     json={
                         "model": self.chat_model,
@@ -31,13 +41,13 @@ class LLMClient:
                     },
                     timeout=self.timeout
                 )
-                response.raise_for_status()
-                data = response.json()
-                try:
-                    return data["choices"][0]["message"]["content"]
-                except Exception as e:
-                    logger.error(f"Chat completion parse error: {e} response={data}")
-                    return None
+            response.raise_for_status()
+            data = response.json()
+            try:
+                return data["choices"][0]["message"]["content"]
+            except Exception as e:
+                logger.error(f"Chat completion parse error: {e} response={data}")
+                return None
         except Exception as e:
             # log original exception with repr to help debugging connection errors
             logger.error(f"Chat completion error: {e!r}")
@@ -46,8 +56,8 @@ class LLMClient:
     async def create_embedding(self, text: str) -> Optional[List[float]]:
         """テキスト埋め込みを作成"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            async with self._request_slot():
+                response = await self._http_client().post(
                     f"{self.embed_api_base}/embeddings",
                     json={
                         "model": self.embed_model,
@@ -55,9 +65,9 @@ class LLMClient:
                     },
                     timeout=self.timeout
                 )
-                response.raise_for_status()
-                data = response.json()
-                return data["data"][0]["embedding"]
+            response.raise_for_status()
+            data = response.json()
+            return data["data"][0]["embedding"]
         except Exception as e:
             logger.error(f"Embedding creation error: {e}")
             return None
@@ -0,0 +1,177 @@
+"""Page-parallel PDF extraction pipeline.
+
+Large slide decks and papers are split into page ranges that are extracted in
+parallel across a process pool (Docling first, pdfminer.six as fallback per
+range) and merged back in page order.
+
+`extract_pdf_preview` is the fast path: it samples the first pages with
+pdfminer only so a document can be shown immediately, while the full
+structured extraction runs later as a postprocess step (see
+`app.services.postprocess`).
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services import extractor
+from app.services.extractor import content_extractor
+
+logger = logging.getLogger(__name__)
+
+PageRange = Tuple[int, int]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """PDFのページ数を返す（取得できない場合は0）"""
+    try:
+        from pdfminer.pdfpage import PDFPage
+
+        with open(file_path, "rb") as fp:
+            return sum(1 for _ in PDFPage.get_pages(fp))
+    except Exception as e:
+        logger.warning(f"Failed to count PDF pages for {file_path}: {e}")
+        return 0
+
+
+def split_page_ranges(page_count: int, pages_per_chunk: int) -> List[PageRange]:
+    """1始まり・両端を含むページ範囲に分割する"""
+    if page_count <= 0:
+        return []
+    size = max(int(pages_per_chunk or 1), 1)
+    return [(start, min(start + size - 1, page_count)) for start in range(1, page_count + 1, size)]
+
+
+def _init_pool_worker() -> None:
+    """プロセスプール初期化: 必要なら各ワーカーで Docling モデルを事前ロードする"""
+    if settings.pdf_warmup_on_start:
+        extractor.warm_up_pdf_converter()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """PDF抽出用のプロセスプールを遅延生成して返す。
+
+    uvicorn やワーカーはスレッドを持つため、fork ではなく spawn で起動する。
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(int(settings.pdf_extract_workers or 1), 1),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_pool_worker,
+                )
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    """プロセスプールを停止する（アプリ終了時）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> Dict[str, Any]:
+    """指定ページ範囲を抽出する（プロセスプール内で実行される）"""
+    if extractor.DOCLING_AVAILABLE:
+        try:
+            result = extractor._convert_with_docling(file_path, page_range=(start, end))
+            if result and result.document:
+                content_md = result.document.export_to_markdown()
+                content_text = result.document.export_to_text()
+                if content_md and content_text:
+                    return {"start": start, "content_md": content_md, "content_text": content_text}
+        except Exception as e:
+            logger.warning(f"Docling extraction failed for pages {start}-{end}, trying pdfminer: {e}")
+
+    if extractor.PDFMINER_AVAILABLE:
+        try:
+            content_text = extractor.extract_text(file_path, page_numbers=range(start - 1, end))
+            return {
+                "start": start,
+                "content_md": content_extractor._text_to_markdown(content_text),
+                "content_text": content_text,
+            }
+        except Exception as e:
+            logger.error(f"PDFminer extraction failed for pages {start}-{end}: {e}")
+
+    return {"start": start, "content_md": "", "content_text": ""}
+
+
+async def extract_pdf(
+    file_path: str,
+    original_filename: str,
+    executor: Optional[Executor] = None,
+) -> Optional[Dict[str, Any]]:
+    """PDFをページ範囲ごとに並列抽出し、ページ順に結合した結果を返す。
+
+    ページ数が1チャンクに収まる場合は従来どおり直列に抽出する。
+    `executor` を省略した場合は共有プロセスプールを使用する。
+    """
+    pages_per_chunk = max(int(settings.pdf_pages_per_chunk or 1), 1)
+    page_count = await asyncio.to_thread(count_pdf_pages, file_path)
+    if page_count <= pages_per_chunk:
+        return await content_extractor.extract_from_pdf(file_path, original_filename)
+
+    ranges = split_page_ranges(page_count, pages_per_chunk)
+    loop = asyncio.get_running_loop()
+    pool = executor or get_pdf_pool()
+    logger.info(f"Extracting {original_filename}: {page_count} pages in {len(ranges)} ranges")
+
+    parts = await asyncio.gather(
+        *(loop.run_in_executor(pool, _extract_page_range, file_path, start, end) for start, end in ranges)
+    )
+    parts = sorted(parts, key=lambda part: part["start"])
+
+    content_md = "\n\n".join(part["content_md"].strip() for part in parts if part["content_md"].strip())
+    content_text = "\n".join(part["content_text"].strip() for part in parts if part["content_text"].strip())
+    if not content_text:
+        logger.error(f"PDF extraction produced no text for {original_filename}")
+        return None
+    return content_extractor._create_pdf_result(content_md, content_text, original_filename)
+
+
+def _sample_text(file_path: str, max_pages: int) -> str:
+    return extractor.extract_text(file_path, maxpages=max(int(max_pages or 1), 1))
+
+
+async def extract_pdf_preview(
+    file_path: str,
+    original_filename: str,
+    max_pages: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """先頭ページだけを pdfminer で抽出したプレビュー結果を返す。
+
+    構造化抽出（Docling）は後段のポストプロセスで行う想定。
+    """
+    if not extractor.PDFMINER_AVAILABLE:
+        return None
+    pages = max_pages or settings.pdf_preview_pages
+    try:
+        content_text = await asyncio.to_thread(_sample_text, file_path, pages)
+    except Exception as e:
+        logger.error(f"PDF preview extraction failed for {original_filename}: {e}")
+        return None
+    if not content_text.strip():
+        return None
+    content_md = content_extractor._text_to_markdown(content_text)
+    return content_extractor._create_pdf_result(content_md, content_text, original_filename)
+
+
+__all__ = [
+    "count_pdf_pages",
+    "split_page_ranges",
+    "get_pdf_pool",
+    "shutdown_pdf_pool",
+    "extract_pdf",
+    "extract_pdf_preview",
+]
@@ -4,26 +4,52 @@ This module mirrors the structure of ``postprocess_queue`` but targets the
 ``preference_jobs`` table. Jobs are lightweight records processed by the
 background personalization worker to keep preference profiles and cached
 personalized scores up to date.
+
+Profile rebuilds are coalesced: while a job for the same (user_id, job_type)
+is still pending, further requests merge their ``document_ids`` into it and
+push it back by ``preference_job_debounce_seconds`` (never beyond
+``preference_job_max_delay_seconds`` after it was first queued), so a burst
+of ingests or feedback triggers a single rebuild per user. The first job of a
+burst is itself only due after the debounce.
+
+Job types:
+
+- ``profile_rebuild``: the user's profile may have changed (bookmark, feedback).
+  The worker rescores every recent document only if the profile drifted
+  beyond ``personalization_rescore_threshold``.
+- ``score_documents``: new documents arrived (ingest / postprocess). Only the
+  target documents are scored against the cached profile and merged into the
+  existing ranking.
+- ``score_refresh``: unconditional full rescore.
 """
 from __future__ import annotations
 
 import json
 import logging
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional, Sequence, Union
+from typing import Any, Callable, Dict, Optional, Sequence, Union
 
+from sqlalchemy import update
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.database import PreferenceJob, create_tables
+from app.services import queue_metrics, queue_signal
+from app.services.job_leasing import finish_leased_job, lease_next_job, reclaim_expired_leases
 
 logger = logging.getLogger(__name__)
 
+QUEUE_NAME = PreferenceJob.__tablename__
 DEFAULT_POLL_INTERVAL_SECONDS = 2.0
 BACKOFF_BASE_SECONDS = 5
 MAX_BACKOFF_SECONDS = 60
 DEFAULT_MAX_ATTEMPTS = 3
 
+JOB_PROFILE_REBUILD = "profile_rebuild"
+JOB_SCORE_DOCUMENTS = "score_documents"
+JOB_SCORE_REFRESH = "score_refresh"
+
 PayloadType = Optional[Union[str, Dict[str, Any], Sequence[Any]]]
 
 
@@ -44,7 +70,7 @@ def enqueue_job(
 	*,
 	user_id: Optional[str] = None,
 	document_id: Optional[str] = None,
-	job_type: str = "profile_rebuild",
+	job_type: str = JOB_PROFILE_REBUILD,
 	payload: PayloadType = None,
 	max_attempts: int = DEFAULT_MAX_ATTEMPTS,
 	available_at: Optional[datetime] = None,
@@ -70,6 +96,7 @@ def enqueue_job(
 	db.add(job)
 	db.commit()
 	db.refresh(job)
+	queue_signal.notify(QUEUE_NAME)
 	logger.debug(
 		"personalization_queue: enqueued job %s (type=%s user=%s document=%s)",
 		job.id,
@@ -80,6 +107,168 @@ def enqueue_job(
 	return job.id
 
 
+def _merge_payload(existing: Optional[str], job_document_id: Optional[str], document_id: Optional[str], payload: PayloadType) -> Optional[Dict[str, Any]]:
+	"""Merge a new request into a pending job's payload (None if it cannot be merged)."""
+
+	if existing:
+		try:
+			merged = json.loads(existing)
+		except (TypeError, ValueError):
+			return None
+		if not isinstance(merged, dict):
+			return None
+	else:
+		merged = {}
+
+	if payload is None:
+		incoming: Dict[str, Any] = {}
+	elif isinstance(payload, dict):
+		incoming = payload
+	else:
+		return None
+
+	document_ids = [str(value) for value in merged.get("document_ids") or [] if value is not None]
+	for value in [document_id, *(incoming.get("document_ids") or [])]:
+		if value is None:
+			continue
+		value = str(value)
+		if value != job_document_id and value not in document_ids:
+			document_ids.append(value)
+	if document_ids:
+		merged["document_ids"] = document_ids
+
+	for key, value in incoming.items():
+		if key == "document_ids":
+			continue
+		if key == "full_rebuild":
+			merged[key] = bool(merged.get(key)) or bool(value)
+			continue
+		if key == "limit" and merged.get("limit") is not None:
+			try:
+				merged["limit"] = max(int(merged["limit"]), int(value))
+			except (TypeError, ValueError):
+				pass
+			continue
+		merged.setdefault(key, value)
+	merged["coalesced"] = int(merged.get("coalesced") or 0) + 1
+	return merged
+
+
+def _max_delay_seconds() -> int:
+	return max(int(settings.preference_job_max_delay_seconds or 0), 0)
+
+
+def _debounced(now: datetime) -> datetime:
+	"""Due time of a coalescable request: ``now`` + debounce, capped by the max delay."""
+
+	debounce = max(int(settings.preference_job_debounce_seconds or 0), 0)
+	return now + timedelta(seconds=min(debounce, _max_delay_seconds()))
+
+
+def _coalesce_into_pending(
+	db: Session,
+	*,
+	user_id: Optional[str],
+	document_id: Optional[str],
+	job_type: str,
+	payload: PayloadType,
+	available_at: Optional[datetime],
+) -> Optional[str]:
+	"""Merge the request into a pending job for the same (user_id, job_type) if one exists."""
+
+	user_filter = PreferenceJob.user_id.is_(None) if user_id is None else PreferenceJob.user_id == user_id
+	job = (
+		db.query(PreferenceJob)
+		.filter(
+			PreferenceJob.status == "pending",
+			PreferenceJob.job_type == job_type,
+			PreferenceJob.attempts == 0,
+			user_filter,
+		)
+		.order_by(PreferenceJob.created_at.asc())
+		.first()
+	)
+	if job is None:
+		return None
+
+	merged = _merge_payload(job.payload, job.document_id, document_id, payload)
+	if merged is None:
+		return None
+
+	now = datetime.utcnow()
+	requested = available_at or _debounced(now)
+	deadline = (job.created_at or now) + timedelta(seconds=_max_delay_seconds())
+	current = job.next_attempt_at or now
+	next_attempt_at = max(current, min(requested, deadline))
+
+	# 他プロセスが同時に同じジョブへマージ・リースした場合は取りこぼさないよう新規ジョブにする
+	result = db.execute(
+		update(PreferenceJob)
+		.where(
+			PreferenceJob.id == job.id,
+			PreferenceJob.status == "pending",
+			PreferenceJob.updated_at == job.updated_at,
+		)
+		.values(
+			payload=_serialize_payload(merged),
+			next_attempt_at=next_attempt_at,
+			scheduled_at=next_attempt_at,
+			updated_at=now,
+		)
+		.execution_options(synchronize_session=False)
+	)
+	if result.rowcount != 1:
+		db.rollback()
+		return None
+	db.commit()
+	queue_metrics.incr(QUEUE_NAME, "coalesced")
+	logger.debug(
+		"personalization_queue: coalesced request into job %s (user=%s document=%s next_attempt_at=%s)",
+		job.id,
+		user_id,
+		document_id,
+		next_attempt_at.isoformat(),
+	)
+	return job.id
+
+
+def _enqueue_coalesced(
+	db: Session,
+	*,
+	job_type: str,
+	user_id: Optional[str],
+	document_id: Optional[str],
+	payload: PayloadType,
+	max_attempts: int,
+	available_at: Optional[datetime],
+	coalesce: bool,
+) -> str:
+	if coalesce:
+		job_id = _coalesce_into_pending(
+			db,
+			user_id=user_id,
+			document_id=document_id,
+			job_type=job_type,
+			payload=payload,
+			available_at=available_at,
+		)
+		if job_id:
+			return job_id
+		# バーストの最初のジョブもデバウンスし、続くリクエストがまとまる前に実行されないようにする
+		if available_at is None:
+			available_at = _debounced(datetime.utcnow())
+
+	return enqueue_job(
+		db,
+		user_id=user_id,
+		document_id=document_id,
+		job_type=job_type,
+		payload=payload,
+		max_attempts=max_attempts,
+		available_at=available_at,
+	)
+
+
 def enqueue_profile_update(
 	db: Session,
 	*,
@@ -88,90 +277,139 @@ def enqueue_profile_update(
 	payload: PayloadType = None,
 	max_attempts: int = DEFAULT_MAX_ATTEMPTS,
 	available_at: Optional[datetime] = None,
+	coalesce: bool = True,
 ) -> str:
-	"""Convenience wrapper for profile rebuild jobs."""
+	"""Convenience wrapper for profile rebuild jobs.
 
-	return enqueue_job(
+	With ``coalesce`` (default) the request is merged into an existing pending
+	rebuild for the same user instead of creating a new job.
+	"""
+
+	return _enqueue_coalesced(
 		db,
+		job_type=JOB_PROFILE_REBUILD,
 		user_id=user_id,
 		document_id=document_id,
-		job_type="profile_rebuild",
 		payload=payload,
 		max_attempts=max_attempts,
 		available_at=available_at,
+		coalesce=coalesce,
 	)
 
 
-def _acquire_job(db: Session) -> Optional[PreferenceJob]:
-	now = datetime.utcnow()
-	query = (
-		db.query(PreferenceJob)
-		.filter(
-			PreferenceJob.status == "pending",
-			(PreferenceJob.next_attempt_at == None) | (PreferenceJob.next_attempt_at <= now),
-		)
-		.order_by(PreferenceJob.next_attempt_at.asc(), PreferenceJob.scheduled_at.asc(), PreferenceJob.created_at.asc())
+def enqueue_document_scoring(
+	db: Session,
+	*,
+	document_id: Optional[str] = None,
+	user_id: Optional[str] = None,
+	payload: PayloadType = None,
+	max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+	available_at: Optional[datetime] = None,
+	coalesce: bool = True,
+) -> str:
+	"""Enqueue a job that scores new documents against the cached profile.
+
+	Pending jobs for the same user are coalesced like profile rebuilds, so a
+	burst of ingests is scored in one pass.
+	"""
+
+	return _enqueue_coalesced(
+		db,
+		job_type=JOB_SCORE_DOCUMENTS,
+		user_id=user_id,
+		document_id=document_id,
+		payload=payload,
+		max_attempts=max_attempts,
+		available_at=available_at,
+		coalesce=coalesce,
 	)
-	job = query.first()
-	if not job:
-		return None
-	try:
-		job.status = "in_progress"
-		job.updated_at = datetime.utcnow()
-		db.add(job)
-		db.commit()
-		db.refresh(job)
+
+
+def _acquire_job(db: Session, worker_id: Optional[str] = None) -> Optional[PreferenceJob]:
+	job = lease_next_job(
+		db,
+		PreferenceJob,
+		order_by=(
+			PreferenceJob.next_attempt_at.asc(),
+			PreferenceJob.scheduled_at.asc(),
+			PreferenceJob.created_at.asc(),
+		),
+		owner=worker_id,
+	)
+	if job:
 		logger.debug("personalization_queue: leased job %s", job.id)
-		return job
-	except Exception:
-		db.rollback()
-		logger.debug("personalization_queue: failed to lease job %s due to concurrency", job.id)
-		return None
+	return job
 
 
-def lease_job(db: Session) -> Optional[PreferenceJob]:
-	"""Public helper to claim the next pending job."""
+def lease_job(db: Session, worker_id: Optional[str] = None) -> Optional[PreferenceJob]:
+	"""Public helper to atomically claim the next pending job."""
 
-	return _acquire_job(db)
+	return _acquire_job(db, worker_id)
 
 
-def mark_job_done(db: Session, job: PreferenceJob) -> None:
-	job.status = "done"
-	job.updated_at = datetime.utcnow()
-	db.add(job)
-	db.commit()
+def reclaim_expired_jobs(db: Session) -> Dict[str, int]:
+	"""Return jobs whose worker lease expired to the queue (with attempt accounting)."""
+
+	return reclaim_expired_leases(db, PreferenceJob)
+
+
+def mark_job_done(db: Session, job: PreferenceJob, worker_id: Optional[str] = None) -> bool:
+	"""ジョブを done にする（リースを失っていた場合は何も書かずに False）"""
+	if not finish_leased_job(db, PreferenceJob, job, worker_id, status="done"):
+		return False
+	queue_metrics.incr(QUEUE_NAME, "completed")
 	logger.info("personalization_queue: job %s marked done", job.id)
+	return True
 
 
-def mark_job_failed(db: Session, job: PreferenceJob, error: str) -> None:
-	job.attempts = int(job.attempts or 0) + 1
-	job.last_error = (error or "")[:2000]
-	job.updated_at = datetime.utcnow()
+def mark_job_failed(db: Session, job: PreferenceJob, error: str, worker_id: Optional[str] = None) -> bool:
+	"""失敗を記録して再試行を予約する（上限到達で failed、リースを失っていた場合は False）"""
+	attempts = int(job.attempts or 0) + 1
+	values = {"attempts": attempts, "last_error": (error or "")[:2000]}
 
-	if job.attempts >= (job.max_attempts or DEFAULT_MAX_ATTEMPTS):
-		job.status = "failed"
-		db.add(job)
-		db.commit()
+	if attempts >= (job.max_attempts or DEFAULT_MAX_ATTEMPTS):
+		if not finish_leased_job(db, PreferenceJob, job, worker_id, status="failed", **values):
+			return False
+		queue_metrics.incr(QUEUE_NAME, "failed")
 		logger.error(
 			"personalization_queue: job %s reached max attempts (%s). Error: %s",
 			job.id,
-			job.attempts,
+			attempts,
 			error,
 		)
-		return
+		return True
 
-	backoff = BACKOFF_BASE_SECONDS * (2 ** (job.attempts - 1))
+	backoff = BACKOFF_BASE_SECONDS * (2 ** (attempts - 1))
 	backoff = min(backoff, MAX_BACKOFF_SECONDS)
-	job.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
-	job.status = "pending"
-	db.add(job)
-	db.commit()
+	next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
+	if not finish_leased_job(db, PreferenceJob, job, worker_id, status="pending", next_attempt_at=next_attempt_at, **values):
+		return False
+	queue_metrics.incr(QUEUE_NAME, "retried")
 	logger.info(
 		"personalization_queue: job %s scheduled retry in %.1fs (attempt %s)",
 		job.id,
 		backoff,
-		job.attempts,
+		attempts,
 	)
+	return True
+
+
+def _schedule_with_fallback(enqueue: Callable[..., str], db: Session, **kwargs: Any) -> Optional[str]:
+	try:
+		return enqueue(db, **kwargs)
+	except OperationalError:
+		logger.debug("personalization_queue: tables missing when scheduling %s; attempting create_tables()", enqueue.__name__)
+		try:
+			create_tables()
+		except Exception:
+			logger.exception("personalization_queue: create_tables failed while scheduling %s", enqueue.__name__)
+		try:
+			return enqueue(db, **kwargs)
+		except Exception:
+			logger.exception("personalization_queue: failed to %s after ensuring tables", enqueue.__name__)
+	except Exception:
+		logger.exception("personalization_queue: failed to %s", enqueue.__name__)
+	return None
 
 
 def schedule_profile_update(
@@ -185,44 +423,52 @@ def schedule_profile_update(
 ) -> Optional[str]:
 	"""Best-effort helper that enqueues a profile update job with fallback handling."""
 
-	try:
-		return enqueue_profile_update(
-			db,
-			user_id=user_id,
-			document_id=document_id,
-			payload=payload,
-			max_attempts=max_attempts,
-			available_at=available_at,
-		)
-	except OperationalError:
-		logger.debug("personalization_queue: tables missing when scheduling profile update; attempting create_tables()")
-		try:
-			create_tables()
-		except Exception:
-			logger.exception("personalization_queue: create_tables failed while scheduling profile update")
-		try:
-			return enqueue_profile_update(
-				db,
-				user_id=user_id,
-				document_id=document_id,
-				payload=payload,
-				max_attempts=max_attempts,
-				available_at=available_at,
-			)
-		except Exception:
-			logger.exception("personalization_queue: failed to enqueue profile update after ensuring tables")
-	except Exception:
-		logger.exception("personalization_queue: failed to enqueue profile update")
-	return None
+	return _schedule_with_fallback(
+		enqueue_profile_update,
+		db,
+		user_id=user_id,
+		document_id=document_id,
+		payload=payload,
+		max_attempts=max_attempts,
+		available_at=available_at,
+	)
+
+
+def schedule_document_scoring(
+	db: Session,
+	*,
+	document_id: Optional[str] = None,
+	user_id: Optional[str] = None,
+	payload: PayloadType = None,
+	max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+	available_at: Optional[datetime] = None,
+) -> Optional[str]:
+	"""Best-effort helper that enqueues a new-document scoring job with fallback handling."""
+
+	return _schedule_with_fallback(
+		enqueue_document_scoring,
+		db,
+		user_id=user_id,
+		document_id=document_id,
+		payload=payload,
+		max_attempts=max_attempts,
+		available_at=available_at,
+	)
 
 
 __all__ = [
 	"DEFAULT_POLL_INTERVAL_SECONDS",
 	"BACKOFF_BASE_SECONDS",
+	"JOB_PROFILE_REBUILD",
+	"JOB_SCORE_DOCUMENTS",
+	"JOB_SCORE_REFRESH",
 	"enqueue_job",
 	"enqueue_profile_update",
+	"enqueue_document_scoring",
 	"schedule_profile_update",
+	"schedule_document_scoring",
 	"lease_job",
+	"reclaim_expired_jobs",
 	"mark_job_done",
 	"mark_job_failed",
 ]
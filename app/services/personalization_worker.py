@@ -1,4 +1,14 @@
-"""Background worker for processing preference jobs."""
+"""Background worker for processing preference jobs.
+
+``score_documents`` jobs (new documents) score only their target documents
+against the cached profile and merge them into the stored ranking.
+``profile_rebuild`` jobs rescore every recent document only when the profile
+moved more than ``personalization_rescore_threshold`` since the last full
+rescore (tracked in ``preference_profiles.scored_snapshot``); smaller changes
+are handled like ``score_documents``. ``score_refresh`` and ``full_rebuild``
+payloads always rescore everything. Ranks are renumbered after each job so
+the persisted ranking stays contiguous.
+"""
 from __future__ import annotations
 
 import json
@@ -9,18 +19,27 @@ from typing import Dict, List, Optional, Sequence, Set, Tuple
 
 from sqlalchemy.orm import joinedload
 
-from app.core.database import Document, PreferenceJob
+from app.core.database import Document, PreferenceJob, PreferenceProfile
 from app.core import database as app_db
 from app.services.personalization_queue import (
 	DEFAULT_POLL_INTERVAL_SECONDS,
+	JOB_PROFILE_REBUILD,
+	JOB_SCORE_DOCUMENTS,
+	JOB_SCORE_REFRESH,
+	QUEUE_NAME,
 	lease_job,
 	mark_job_done,
 	mark_job_failed,
+	reclaim_expired_jobs,
 )
+from app.core.config import settings
+from app.services.job_leasing import LeaseHeartbeat, default_worker_id, seconds_until_next_job
+from app.services.queue_signal import QueueWaiter
 from app.services.personalized_ranking import PersonalizedRankingService
 from app.services.personalized_repository import PersonalizedScoreRepository
 from app.services.personalization_models import PersonalizedScoreDTO, PreferenceProfileDTO
 from app.services.preference_profile import PreferenceProfileService
+from app.services.similarity import cosine_similarity
 from app.core.user_utils import normalize_user_id
 
 logger = logging.getLogger(__name__)
@@ -54,7 +73,7 @@ def _resolve_target_ids(job: PreferenceJob, payload: Dict[str, object]) -> Set[s
 	return candidates
 
 
-def _load_documents(session, *, target_ids: Set[str], limit: int) -> List[Document]:
+def _load_documents(session, *, target_ids: Set[str], limit: int, include_recent: bool = True) -> List[Document]:
 	query = session.query(Document).options(
 		joinedload(Document.classifications),
 		joinedload(Document.embeddings),
@@ -69,7 +88,7 @@ def _load_documents(session, *, target_ids: Set[str], limit: int) -> List[Docume
 		for row in target_rows:
 			documents[row.id] = row
 
-	if len(documents) < limit:
+	if include_recent and len(documents) < limit:
 		remaining = max(limit - len(documents), 0)
 		if remaining:
 			# おすすめ記事は直近2日間に登録された記事を対象とする
@@ -98,6 +117,94 @@ def _compute_scores(
 	return ranking_service.score_documents(documents, profile=profile)
 
 
+def _profile_snapshot(profile: PreferenceProfileDTO) -> Dict[str, object]:
+	return {
+		"embedding": list(profile.embedding),
+		"category_weights": dict(profile.category_weights),
+		"domain_weights": dict(profile.domain_weights),
+		"cold_start": bool(profile.is_cold_start),
+	}
+
+
+def _weights_distance(before: object, after: Dict[str, float]) -> float:
+	"""正規化済みの重み分布どうしの全変動距離（0〜1）"""
+	if not isinstance(before, dict):
+		return 1.0 if after else 0.0
+	keys = set(before) | set(after)
+	total = 0.0
+	for key in keys:
+		try:
+			total += abs(float(before.get(key, 0.0) or 0.0) - float(after.get(key, 0.0)))
+		except (TypeError, ValueError):
+			return 1.0
+	return min(total / 2.0, 1.0)
+
+
+def _profile_drift(snapshot: Dict[str, object], profile: PreferenceProfileDTO) -> float:
+	"""前回の全件スコアリング時のプロファイルからの変化量（0〜1）"""
+	if bool(snapshot.get("cold_start")) != bool(profile.is_cold_start):
+		return 1.0
+
+	drift = 0.0
+	before = snapshot.get("embedding") or []
+	after = list(profile.embedding)
+	if before or after:
+		if not before or not after or len(before) != len(after):
+			return 1.0
+		try:
+			drift = max(drift, 1.0 - cosine_similarity([float(x) for x in before], after))
+		except Exception:
+			return 1.0
+
+	drift = max(drift, _weights_distance(snapshot.get("category_weights"), profile.category_weights))
+	drift = max(drift, _weights_distance(snapshot.get("domain_weights"), profile.domain_weights))
+	return max(min(drift, 1.0), 0.0)
+
+
+def _load_scored_snapshot(session, profile: PreferenceProfileDTO) -> Optional[Dict[str, object]]:
+	row = session.get(PreferenceProfile, profile.id) if profile.id else None
+	if row is None or not row.scored_snapshot:
+		return None
+	try:
+		data = json.loads(row.scored_snapshot)
+	except (TypeError, ValueError):
+		return None
+	return data if isinstance(data, dict) else None
+
+
+def _store_scored_snapshot(session, profile: PreferenceProfileDTO) -> None:
+	row = session.get(PreferenceProfile, profile.id) if profile.id else None
+	if row is None:
+		return
+	row.scored_snapshot = json.dumps(_profile_snapshot(profile), ensure_ascii=False, separators=(",", ":"))
+	row.scored_at = datetime.utcnow()
+	session.commit()
+
+
+def _needs_full_rescore(
+	session,
+	job_type: str,
+	payload: Dict[str, object],
+	*,
+	profile: PreferenceProfileDTO,
+	repo: PersonalizedScoreRepository,
+) -> Tuple[bool, str]:
+	"""全件再スコアが必要かどうかと、その理由を返す"""
+	if job_type == JOB_SCORE_REFRESH or payload.get("full_rebuild"):
+		return True, "forced"
+	if repo.count_scores(user_id=profile.user_id) == 0:
+		return True, "no-ranking"
+	if job_type == JOB_SCORE_DOCUMENTS:
+		return False, "new-documents"
+
+	snapshot = _load_scored_snapshot(session, profile)
+	if snapshot is None:
+		return True, "no-snapshot"
+	drift = _profile_drift(snapshot, profile)
+	threshold = max(float(settings.personalization_rescore_threshold or 0.0), 0.0)
+	return drift >= threshold, f"drift={drift:.3f}"
+
+
 def _handle_profile_rebuild(
 	session,
 	job: PreferenceJob,
@@ -105,20 +212,40 @@ def _handle_profile_rebuild(
 	payload: Dict[str, object],
 	profile_service: PreferenceProfileService,
 	ranking_service: PersonalizedRankingService,
+	job_type: str = JOB_PROFILE_REBUILD,
 ) -> Tuple[bool, Optional[str]]:
-	profile = profile_service.update_profile(session, user_id=job.user_id)
+	if payload.get("full_rebuild"):
+		# オンデマンドの全体再計算（通常はブックマークイベントでインクリメンタルに更新済み）
+		profile = profile_service.update_profile(session, user_id=job.user_id, full=True)
+	else:
+		# 初期化済みなら保存済みプロファイルをそのまま返す（キャッシュ）
+		profile = profile_service.update_profile(session, user_id=job.user_id)
 	limit = int(payload.get("limit", DEFAULT_DOCUMENT_LIMIT) or DEFAULT_DOCUMENT_LIMIT)
 	limit = max(min(limit, 500), 1)
 	target_ids = _resolve_target_ids(job, payload)
+	repo = PersonalizedScoreRepository(session)
+	full, reason = _needs_full_rescore(
+		session,
+		job_type,
+		payload,
+		profile=profile,
+		repo=repo,
+	)
 	logger.info(
-		"personalization_worker: processing job %s (type=%s user=%s target_docs=%s limit=%s)",
+		"personalization_worker: processing job %s (type=%s user=%s target_docs=%s limit=%s mode=%s reason=%s)",
 		job.id,
 		job.job_type,
 		job.user_id,
 		target_ids or "ALL",
 		limit,
+		"full" if full else "targeted",
+		reason,
 	)
-	documents = _load_documents(session, target_ids=target_ids, limit=limit)
+	if not full and not target_ids:
+		# プロファイルの変化が小さく、対象文書も無いので既存のランキングのままでよい
+		return True, None
+
+	documents = _load_documents(session, target_ids=target_ids, limit=limit, include_recent=full)
 
 	if target_ids and not documents:
 		missing = ",".join(sorted(target_ids))
@@ -131,19 +258,35 @@ def _handle_profile_rebuild(
 		ranking_service=ranking_service,
 	)
 
-	repo = PersonalizedScoreRepository(session)
-	persisted = repo.bulk_upsert(scores, profile_id=profile.id, user_id=profile.user_id)
+	# 対象文書だけを更新する場合は、元の順位を控えておき新しい位置との間だけ順位をずらす
+	previous_ranks = {} if full else repo.rank_map(user_id=profile.user_id, document_ids=list(target_ids))
+
+	persisted = repo.bulk_upsert(scores, profile_id=profile.id, user_id=profile.user_id, commit=False)
+
+	if not scores and target_ids:
+		repo.delete_scores(user_id=profile.user_id, document_ids=list(target_ids), commit=False)
+
+	if full:
+		moved = repo.reassign_ranks(user_id=profile.user_id)
+	else:
+		moved = repo.merge_ranks(
+			user_id=profile.user_id,
+			document_ids=[score.document_id for score in scores],
+			previous_ranks=previous_ranks,
+		)
+	if full:
+		_store_scored_snapshot(session, profile)
+
 	resolved_user = normalize_user_id(profile.user_id)
 	logger.info(
-		"personalization_worker: job %s stored %d scores for user=%s",
+		"personalization_worker: job %s stored %d scores for user=%s (%s, %d ranks moved)",
 		job.id,
 		len(persisted),
 		resolved_user,
+		"full" if full else "targeted",
+		moved,
 	)
 
-	if not scores and target_ids:
-		repo.delete_scores(user_id=profile.user_id, document_ids=list(target_ids))
-
 	return True, None
 
 
@@ -156,14 +299,15 @@ def _process_job(
 ) -> Tuple[bool, Optional[str]]:
 	payload = _parse_payload(job)
 
-	job_type = (job.job_type or "profile_rebuild").strip().lower()
-	if job_type in {"profile_rebuild", "score_refresh"}:
+	job_type = (job.job_type or JOB_PROFILE_REBUILD).strip().lower()
+	if job_type in {JOB_PROFILE_REBUILD, JOB_SCORE_DOCUMENTS, JOB_SCORE_REFRESH}:
 		return _handle_profile_rebuild(
 			session,
 			job,
 			payload=payload,
 			profile_service=profile_service,
 			ranking_service=ranking_service,
+			job_type=job_type,
 		)
 
 	logger.warning("personalization_worker: unsupported job type '%s' for job %s", job_type, job.id)
@@ -171,30 +315,51 @@ def _process_job(
 
 
 def run_worker(poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS) -> None:
-	"""Run the preference worker loop indefinitely."""
+	"""Run the preference worker loop indefinitely.
 
-	logger.info("Starting preference worker with poll interval %.2fs", poll_interval)
+	Idle waits are event-driven (``queue_signal``); ``poll_interval`` is the
+	initial wait, backing off while the queue stays empty.
+	"""
+
+	worker_id = default_worker_id()
+	logger.info("Starting preference worker %s with poll interval %.2fs", worker_id, poll_interval)
 	profile_service = PreferenceProfileService()
 	ranking_service = PersonalizedRankingService()
+	last_reclaim = 0.0
+	waiter = None
 
 	while True:
 		session = app_db.SessionLocal()
 		try:
-			job = lease_job(session)
+			if waiter is None:
+				waiter = QueueWaiter(QUEUE_NAME, session.get_bind(), min_wait=poll_interval)
+			if time.monotonic() - last_reclaim >= settings.job_reclaim_interval_seconds:
+				reclaim_expired_jobs(session)
+				last_reclaim = time.monotonic()
+
+			waiter.arm()
+			job = lease_job(session, worker_id)
 			if not job:
-				time.sleep(poll_interval)
+				next_due = seconds_until_next_job(session, PreferenceJob)
+				session.close()
+				waiter.wait(next_due)
 				continue
-
-			success, error = _process_job(
-				session,
-				job,
-				profile_service=profile_service,
-				ranking_service=ranking_service,
-			)
-			if success:
-				mark_job_done(session, job)
+			waiter.reset()
+
+			with LeaseHeartbeat(session, PreferenceJob, job.id, worker_id) as heartbeat:
+				success, error = _process_job(
+					session,
+					job,
+					profile_service=profile_service,
+					ranking_service=ranking_service,
+				)
+			if heartbeat.lost:
+				# 回収されて他のワーカーに渡ったジョブの状態は上書きしない
+				logger.warning("personalization_worker: job %s lost its lease while running; result discarded", job.id)
+			elif success:
+				mark_job_done(session, job, worker_id)
 			else:
-				mark_job_failed(session, job, error or "unknown error")
+				mark_job_failed(session, job, error or "unknown error", worker_id)
 		except Exception:
 			logger.exception("personalization_worker: unexpected error while processing job")
 		finally:
@@ -214,6 +379,8 @@ def run_once() -> None:
 			logger.info("personalization_worker: no jobs available for run_once")
 			return
 
+		# 処理中のコミットで job は読み直されるため、リース時の所有者を控えておく
+		owner = job.lease_owner
 		profile_service = PreferenceProfileService()
 		ranking_service = PersonalizedRankingService()
 		success, error = _process_job(
@@ -223,9 +390,9 @@ def run_once() -> None:
 			ranking_service=ranking_service,
 		)
 		if success:
-			mark_job_done(session, job)
+			mark_job_done(session, job, owner)
 		else:
-			mark_job_failed(session, job, error or "unknown error")
+			mark_job_failed(session, job, error or "unknown error", owner)
 	finally:
 		try:
 			session.close()
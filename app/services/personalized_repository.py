@@ -3,12 +3,14 @@ from __future__ import annotations
 import json
 import logging
 import uuid
+from bisect import bisect_left
 from datetime import datetime
 from typing import Dict, List, Optional, Sequence
 
+from sqlalchemy import and_, case, func, or_, update
 from sqlalchemy.orm import Session, joinedload
 
-from app.core.database import PersonalizedScore
+from app.core.database import Document, PersonalizedScore
 from app.core.user_utils import normalize_user_id
 from app.services.personalization_models import ExplanationBreakdown, PersonalizedScoreDTO
 
@@ -52,6 +54,26 @@ def _resolved_user_ids(scores: Sequence[PersonalizedScoreDTO], fallback_user_id:
 	return grouped
 
 
+def _ranked_ahead_of(score: float, created_at: Optional[datetime], document_id: str):
+	"""Rows ordered before (score, created_at, document_id) in ranking order.
+
+	Same order as ``reassign_ranks``: score desc, newer document first (no
+	created_at sorts last), then document_id.
+	"""
+
+	if created_at is None:
+		newer = Document.created_at.isnot(None)
+		same_age = Document.created_at.is_(None)
+	else:
+		newer = Document.created_at > created_at
+		same_age = Document.created_at == created_at
+	return or_(
+		PersonalizedScore.score > score,
+		and_(PersonalizedScore.score == score, newer),
+		and_(PersonalizedScore.score == score, same_age, PersonalizedScore.document_id < document_id),
+	)
+
+
 class PersonalizedScoreRepository:
 	"""Repository utilities for personalized_scores table."""
 
@@ -206,6 +228,153 @@ class PersonalizedScoreRepository:
 			self.session.commit()
 		return int(count)
 
+	def reassign_ranks(self, *, user_id: Optional[str], commit: bool = True) -> int:
+		"""Renumber ranks 1..N for a user's scores in score order. Returns rows changed.
+
+		Ordering matches ``PersonalizedRankingService.score_documents`` (score desc,
+		newer document first, then document_id), so scores merged in by separate
+		jobs form one consistent ranking. Only rows whose rank moved are written.
+		user_id is normalized to 'guest' if None.
+		"""
+
+		normalized_user_id = normalize_user_id(user_id)
+		rows = (
+			self.session.query(PersonalizedScore.id, PersonalizedScore.rank)
+			.outerjoin(Document, Document.id == PersonalizedScore.document_id)
+			.filter(PersonalizedScore.user_id == normalized_user_id)
+			.order_by(PersonalizedScore.score.desc(), Document.created_at.desc(), PersonalizedScore.document_id.asc())
+			.all()
+		)
+		changes = [
+			{"id": row_id, "rank": index}
+			for index, (row_id, rank) in enumerate(rows, start=1)
+			if rank != index
+		]
+		if changes:
+			self.session.execute(update(PersonalizedScore), changes)
+		if commit:
+			self.session.commit()
+		return len(changes)
+
+	def rank_map(self, *, user_id: Optional[str], document_ids: Sequence[str]) -> Dict[str, int]:
+		"""Return document_id -> stored rank for the given documents. user_id is normalized to 'guest' if None."""
+
+		if not document_ids:
+			return {}
+
+		normalized_user_id = normalize_user_id(user_id)
+		rows = (
+			self.session.query(PersonalizedScore.document_id, PersonalizedScore.rank)
+			.filter(PersonalizedScore.user_id == normalized_user_id)
+			.filter(PersonalizedScore.document_id.in_(list(document_ids)))
+			.all()
+		)
+		return {document_id: int(rank) for document_id, rank in rows}
+
+	def merge_ranks(
+		self,
+		*,
+		user_id: Optional[str],
+		document_ids: Sequence[str],
+		previous_ranks: Dict[str, int],
+		commit: bool = True,
+	) -> int:
+		"""Place re-scored documents into the stored ranking without renumbering it.
+
+		``previous_ranks`` holds the ranks the re-scored documents had before their
+		scores changed (see ``rank_map``); documents missing from it were not ranked
+		and documents no longer stored were removed. Every other row keeps its
+		relative order, so only the ranks between a document's old and new position
+		move, in one UPDATE. Ordering matches ``reassign_ranks``. Returns rows changed.
+		user_id is normalized to 'guest' if None.
+		"""
+
+		normalized_user_id = normalize_user_id(user_id)
+		targets = sorted(set(document_ids) | set(previous_ranks))
+		if not targets:
+			return 0
+
+		rows = (
+			self.session.query(PersonalizedScore.id, PersonalizedScore.document_id, PersonalizedScore.score, Document.created_at)
+			.outerjoin(Document, Document.id == PersonalizedScore.document_id)
+			.filter(PersonalizedScore.user_id == normalized_user_id)
+			.filter(PersonalizedScore.document_id.in_(targets))
+			.all()
+		)
+		# Number of other rows ranked ahead of each re-scored row
+		ahead = {
+			row.id: int(
+				self.session.query(func.count(PersonalizedScore.id))
+				.outerjoin(Document, Document.id == PersonalizedScore.document_id)
+				.filter(PersonalizedScore.user_id == normalized_user_id)
+				.filter(~PersonalizedScore.document_id.in_(targets))
+				.filter(_ranked_ahead_of(row.score, row.created_at, row.document_id))
+				.scalar()
+				or 0
+			)
+			for row in rows
+		}
+
+		# Other rows shift by (re-scored rows now placed above them) - (vacated ranks below them)
+		gaps = sorted(previous_ranks.values())
+		placed = sorted(ahead.values())
+
+		def rank_among_others(rank: int) -> int:
+			return rank - bisect_left(gaps, rank)
+
+		def first_rank_at(position: int) -> int:
+			rank = position
+			for gap in gaps:
+				if gap > rank:
+					break
+				rank += 1
+			return rank
+
+		bounds = sorted({1} | {gap + 1 for gap in gaps} | {first_rank_at(count + 1) for count in placed})
+		shifts = []
+		for index, start in enumerate(bounds):
+			delta = bisect_left(placed, rank_among_others(start)) - bisect_left(gaps, start)
+			if delta == 0:
+				continue
+			condition = PersonalizedScore.rank >= start
+			if index + 1 < len(bounds):
+				condition = and_(condition, PersonalizedScore.rank < bounds[index + 1])
+			shifts.append((condition, delta))
+
+		changed = 0
+		if shifts:
+			# One statement, so every interval is evaluated against the ranks before the shift
+			result = self.session.execute(
+				update(PersonalizedScore)
+				.where(PersonalizedScore.user_id == normalized_user_id)
+				.where(~PersonalizedScore.document_id.in_(targets))
+				.where(or_(*(condition for condition, _ in shifts)))
+				.values(rank=PersonalizedScore.rank + case(*shifts, else_=0))
+				.execution_options(synchronize_session=False)
+			)
+			changed += int(result.rowcount or 0)
+
+		ordered = sorted(rows, key=lambda row: row.document_id)
+		ordered.sort(key=lambda row: (row.created_at is not None, row.created_at or datetime.min), reverse=True)
+		ordered.sort(key=lambda row: row.score, reverse=True)
+		placements = [{"id": row.id, "rank": ahead[row.id] + index} for index, row in enumerate(ordered, start=1)]
+		if placements:
+			self.session.execute(update(PersonalizedScore), placements)
+			changed += len(placements)
+		if commit:
+			self.session.commit()
+		return changed
+
+	def count_scores(self, *, user_id: Optional[str]) -> int:
+		"""Number of stored scores for a user. user_id is normalized to 'guest' if None."""
+
+		normalized_user_id = normalize_user_id(user_id)
+		return int(
+			self.session.query(PersonalizedScore.id)
+			.filter(PersonalizedScore.user_id == normalized_user_id)
+			.count()
+		)
+
 	@staticmethod
 	def _row_to_dto(row: PersonalizedScore) -> PersonalizedScoreDTO:
 		breakdown, cold_start = _decode_components(row.components)
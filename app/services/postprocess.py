@@ -1,167 +1,271 @@
+import asyncio
 import logging
 import json
-import asyncio
+import os
 from threading import Thread
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-from app.core.database import Document, Embedding, Classification, PostprocessJob
+from app.core.database import Document, Embedding, Classification, PostprocessJob, get_sessionmaker
 from app.services.llm_client import llm_client
 from app.services.extractor import content_extractor
+from app.services.pdf_pipeline import extract_pdf
 from app.core.config import settings
-from app.services.personalization_queue import schedule_profile_update
+from app.core.async_runner import run_sync
+from app.services.personalization_queue import schedule_document_scoring
+from app.services.preference_profile import PreferenceProfileService
 
 logger = logging.getLogger(__name__)
 
 
-def process_doc_once(doc_id: str):
-    """Process the document once and return (success: bool, error: Optional[str]).
+def _session_factory():
+    """Return the shared sessionmaker for the current DB_URL.
 
-    This function is intended to be called by a worker that implements retry/backoff.
+    Resolved per call so tests which switch `DB_URL` at runtime are
+    respected; the engine itself is cached per URL by `get_sessionmaker`.
     """
-    import os
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-
-    # Create a session that is explicitly bound to the current DB_URL so
-    # tests which rebind module-level engines (via create_tables) don't cause
-    # process_doc_once to use a stale SessionLocal with the wrong DB.
-    db_url = os.environ.get("DB_URL") or settings.db_url
-    create_engine_kwargs = {"connect_args": {"check_same_thread": False}} if "sqlite" in db_url else {}
-    engine = create_engine(db_url, **create_engine_kwargs)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = SessionLocal()
+    return get_sessionmaker()
+
+
+# Stage DAG: extract -> (summary, embedding, classification). Each stage is an
+# independent `postprocess_jobs` row so a failure only retries that stage.
+STAGE_EXTRACT = "extract"
+STAGE_SUMMARY = "summary"
+STAGE_EMBEDDING = "embedding"
+STAGE_CLASSIFICATION = "classification"
+ROOT_STAGE = STAGE_EXTRACT
+STAGE_SUCCESSORS: Dict[str, Tuple[str, ...]] = {
+    STAGE_EXTRACT: (STAGE_SUMMARY, STAGE_EMBEDDING, STAGE_CLASSIFICATION),
+}
+FINAL_STAGES: Tuple[str, ...] = (STAGE_SUMMARY, STAGE_EMBEDDING, STAGE_CLASSIFICATION)
+
+
+def _prepared_text(doc: Document) -> str:
+    return content_extractor.prepare_text_for_summary(doc.content_text or "", max_chars=settings.short_summary_max_chars)
+
+
+def _load_document(doc_id: str) -> Optional[Document]:
+    """Load a detached snapshot of the document (runs in a worker thread)."""
+    with _session_factory()() as db:
+        doc = db.query(Document).filter(Document.id == doc_id).one_or_none()
+        if doc is not None:
+            db.expunge(doc)
+        return doc
+
+
+# Stage handlers keep only the LLM/PDF awaits on the event loop; every DB read
+# and write runs in `asyncio.to_thread` with its own short-lived session.
+async def _stage_extract(doc: Document, force: bool = False) -> Optional[str]:
+    # プレビュー抽出のみのPDFは、先に全ページの構造化抽出を行う
+    if getattr(doc, "extraction_status", None) != "preview" or not doc.pdf_path:
+        return None
     try:
-        # Debugging: use module-level engine to inspect URL
-        from app.core import database as _db_mod
-        try:
-            engine_url = str(_db_mod.engine.url) if getattr(_db_mod, 'engine', None) and getattr(_db_mod.engine, 'url', None) else None
-        except Exception:
-            engine_url = None
-        logger.debug("Postprocess: module.engine_url=%s", engine_url)
-    except Exception:
-        pass
+        pdf_file = os.path.join("data", doc.pdf_path)
+        extracted = await extract_pdf(pdf_file, doc.title or os.path.basename(pdf_file))
+        if not extracted:
+            return "pdf extraction returned empty"
+        await asyncio.to_thread(_save_extraction, doc.id, extracted)
+        logger.info("Postprocess: completed full PDF extraction for %s", doc.id)
+    except Exception as e:
+        logger.exception("Postprocess: PDF extraction failed for %s", doc.id)
+        return f"pdf extraction error: {e}"
+    return None
+
+
+def _save_extraction(doc_id: str, extracted: Dict[str, str]) -> None:
+    with _session_factory()() as db:
+        doc = db.get(Document, doc_id)
+        if doc is None:
+            return
+        doc.content_md = extracted["content_md"]
+        doc.content_text = extracted["content_text"]
+        doc.extraction_status = "full"
+        db.commit()
+
+
+async def _stage_summary(doc: Document, force: bool = False) -> Optional[str]:
+    if doc.short_summary and not force:
+        # 既に要約済み（前回の試行や同期要約）なら LLM を呼び直さない。作り直しは force 付きのジョブで
+        return None
+    text = _prepared_text(doc)
+    if not text:
+        logger.info("Postprocess: empty text for %s", doc.id)
+        return None
     try:
-        doc = db.query(Document).filter(Document.id == doc_id).one_or_none()
+        summary = await llm_client.generate_summary(text, style="short", timeout_sec=settings.summary_timeout_sec)
+        # If no summary was produced (None or empty), treat as failure so the job is retried.
+        if summary is None or (isinstance(summary, str) and summary.strip() == ""):
+            logger.error("Postprocess: summary generation returned empty for %s", doc.id)
+            return "summary empty"
+        await asyncio.to_thread(_save_summary, doc.id, summary)
+        logger.info("Postprocess: saved short summary for %s", doc.id)
+    except Exception as e:
+        logger.exception("Postprocess: summary generation failed for %s", doc.id)
+        return f"summary error: {e}"
+    return None
+
+
+def _save_summary(doc_id: str, summary: str) -> None:
+    with _session_factory()() as db:
+        doc = db.get(Document, doc_id)
+        if doc is None:
+            return
+        doc.short_summary = summary[: settings.short_summary_max_chars]
+        doc.summary_generated_at = datetime.utcnow()
+        doc.summary_model = settings.summary_model or settings.chat_model
+        db.commit()
+
+
+async def _stage_embedding(doc: Document, force: bool = False) -> Optional[str]:
+    text = _prepared_text(doc)
+    if not text:
+        return None
+    # Embedding (single-chunk fallback). Upsert chunk 0 so retries never duplicate rows.
+    try:
+        emb = await llm_client.create_embedding(text)
+        if emb:
+            await asyncio.to_thread(_save_embedding, doc.id, emb, text[:1000])
+            logger.info("Postprocess: saved embedding for %s", doc.id)
+    except Exception as e:
+        logger.exception("Postprocess: embedding failed for %s", doc.id)
+        return f"embedding error: {e}"
+    return None
+
+
+def _save_embedding(doc_id: str, emb, chunk_text: str) -> None:
+    with _session_factory()() as db:
+        emb_row = (
+            db.query(Embedding)
+            .filter(Embedding.document_id == doc_id, Embedding.chunk_id == 0)
+            .first()
+        )
+        if emb_row is None:
+            emb_row = Embedding(document_id=doc_id, chunk_id=0)
+        emb_row.vec = json.dumps(emb)
+        emb_row.chunk_text = chunk_text
+        db.add(emb_row)
+        db.commit()
+        apply_bookmark_contributions(db, doc_id)
+
+
+async def _stage_classification(doc: Document, force: bool = False) -> Optional[str]:
+    if not _prepared_text(doc):
+        return None
+    # Classification (ensure JOB-inserted docs get a category). Upsert the LLM row.
+    try:
+        classification_result = await llm_client.classify_content(doc.title or "", (doc.content_text or "")[:2000])
+        if classification_result:
+            await asyncio.to_thread(_save_classification, doc.id, classification_result)
+            logger.info("Postprocess: saved classification for %s", doc.id)
+    except Exception as e:
+        logger.exception("Postprocess: classification failed for %s", doc.id)
+        return f"classification error: {e}"
+    return None
+
+
+def _save_classification(doc_id: str, classification_result: Dict) -> None:
+    with _session_factory()() as db:
+        cls = (
+            db.query(Classification)
+            .filter(Classification.document_id == doc_id, Classification.method == "llm")
+            .first()
+        )
+        if cls is None:
+            cls = Classification(document_id=doc_id, method="llm", topics=None)
+        cls.primary_category = classification_result.get("primary_category", "その他")
+        cls.tags = classification_result.get("tags", [])
+        cls.confidence = classification_result.get("confidence", 0.5)
+        db.add(cls)
+        db.commit()
+        apply_bookmark_contributions(db, doc_id)
+
+
+_STAGE_HANDLERS = {
+    STAGE_EXTRACT: _stage_extract,
+    STAGE_SUMMARY: _stage_summary,
+    STAGE_EMBEDDING: _stage_embedding,
+    STAGE_CLASSIFICATION: _stage_classification,
+}
+
+
+async def run_stage(doc_id: str, stage: str, force: bool = False) -> Tuple[bool, Optional[str]]:
+    """Run a single idempotent stage for a document (`force` redoes a stage whose result exists)."""
+    handler = _STAGE_HANDLERS.get(stage)
+    if handler is None:
+        return False, f"unknown stage {stage}"
+    try:
+        doc = await asyncio.to_thread(_load_document, doc_id)
         if not doc:
             msg = f"document not found {doc_id}"
             logger.warning("Postprocess: %s", msg)
             return False, msg
+        error = await handler(doc, force=force)
+        return error is None, error
+    except Exception:
+        logger.exception("Postprocess unexpected error for %s (stage %s)", doc_id, stage)
+        return False, "unexpected error"
 
-        text = content_extractor.prepare_text_for_summary(doc.content_text or "", max_chars=settings.short_summary_max_chars)
-        if not text:
-            msg = "empty text"
-            logger.info("Postprocess: %s for %s", msg, doc_id)
-            return True, None
-
-        # Short summary
-        def _run_async(coro_factory):
-            """Run an async coroutine produced by `coro_factory` safely.
-
-            `coro_factory` may be either a coroutine function call (callable that
-            returns a coroutine) or a coroutine object. When the current thread
-            already has a running event loop (pytest/asyncio plugin), create
-            the coroutine inside a new thread and execute it with
-            `asyncio.run()` there to avoid cross-loop coroutine issues.
-            """
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                loop = None
-
-            # Helper to obtain a fresh coroutine object inside the current
-            # context: if coro_factory is already a coroutine object, return
-            # it; if it's callable, call it to get the coroutine.
-            def _make_coro():
-                if asyncio.iscoroutine(coro_factory):
-                    return coro_factory
-                if callable(coro_factory):
-                    return coro_factory()
-                raise TypeError("coro_factory must be a coroutine or callable returning a coroutine")
-
-            # If there's a running loop in this thread, execute in a separate
-            # thread and create the coroutine inside that thread.
-            if loop and loop.is_running():
-                result_container = {}
-
-                def _runner():
-                    try:
-                        coro = _make_coro()
-                        result_container["res"] = asyncio.run(coro)
-                    except Exception as e:
-                        result_container["exc"] = e
-
-                t = Thread(target=_runner, daemon=True)
-                t.start()
-                t.join()
-                if "exc" in result_container:
-                    raise result_container["exc"]
-                return result_container.get("res")
-
-            # No running loop here; safe to create coroutine in this thread
-            coro = _make_coro()
-            return asyncio.run(coro)
-
-        try:
-            summary = _run_async(lambda: llm_client.generate_summary(text, style="short", timeout_sec=settings.summary_timeout_sec))
-            # If no summary was produced (None or empty), treat as failure so the job is retried.
-            if summary is None or (isinstance(summary, str) and summary.strip() == ""):
-                logger.error("Postprocess: summary generation returned empty for %s", doc_id)
-                return False, "summary empty"
-            # Save the generated summary
-            doc.short_summary = summary[: settings.short_summary_max_chars]
-            doc.summary_generated_at = datetime.utcnow()
-            doc.summary_model = settings.summary_model or settings.chat_model
-            db.add(doc)
-            db.commit()
-            logger.info("Postprocess: saved short summary for %s", doc_id)
-        except Exception as e:
-            logger.exception("Postprocess: summary generation failed for %s", doc_id)
-            return False, f"summary error: {e}"
-
-        # Embedding (single-chunk fallback)
-        try:
-            emb = _run_async(lambda: llm_client.create_embedding(text))
-            if emb:
-                emb_row = Embedding(document_id=doc.id, chunk_id=0, vec=json.dumps(emb), chunk_text=text[:1000])
-                db.add(emb_row)
-                db.commit()
-                logger.info("Postprocess: saved embedding for %s", doc_id)
-        except Exception as e:
-            logger.exception("Postprocess: embedding failed for %s", doc_id)
-            return False, f"embedding error: {e}"
-
-        # Classification (ensure JOB-inserted docs get a category)
-        try:
-            classification_result = _run_async(lambda: llm_client.classify_content(doc.title or "", (doc.content_text or "")[:2000]))
-            if classification_result:
-                cls = Classification(
-                    document_id=doc.id,
-                    primary_category=classification_result.get("primary_category", "その他"),
-                    topics=None,
-                    tags=classification_result.get("tags", []),
-                    confidence=classification_result.get("confidence", 0.5),
-                    method="llm"
-                )
-                db.add(cls)
-                db.commit()
-                logger.info("Postprocess: saved classification for %s", doc_id)
-        except Exception as e:
-            logger.exception("Postprocess: classification failed for %s", doc_id)
-            return False, f"classification error: {e}"
-
-        job_id = schedule_profile_update(db, document_id=doc.id)
-        if job_id:
-            logger.debug("Postprocess: scheduled preference job %s for document %s", job_id, doc.id)
 
-        return True, None
+def apply_bookmark_contributions(db, doc_id: str) -> None:
+    """Add a newly saved embedding/category to the profiles of users who bookmarked the document earlier."""
+    try:
+        updated = PreferenceProfileService().apply_document_contributions(db, doc_id)
+        if updated:
+            logger.debug("Postprocess: updated %d bookmark contributions for %s", updated, doc_id)
     except Exception:
-        logger.exception("Postprocess unexpected error for %s", doc_id)
-        return False, "unexpected error"
+        db.rollback()
+        logger.exception("Postprocess: failed to update preference profiles for %s", doc_id)
+
+
+def schedule_document_profile_update(doc_id: str) -> None:
+    """Queue personalized scoring of a freshly processed document (only it is scored)."""
+    db = _session_factory()()
+    try:
+        job_id = schedule_document_scoring(db, document_id=doc_id, payload={"document_ids": [doc_id]})
+        if job_id:
+            logger.debug("Postprocess: scheduled scoring job %s for document %s", job_id, doc_id)
     finally:
         db.close()
 
 
+def process_doc_once(doc_id: str):
+    """Process the document once and return (success: bool, error: Optional[str]).
+
+    This function is intended to be called by a worker that implements retry/backoff.
+    The async steps run on the shared background event loop (`run_sync`).
+    """
+    return run_sync(lambda: process_doc(doc_id))
+
+
+async def process_doc(doc_id: str) -> Tuple[bool, Optional[str]]:
+    """Run every stage for a document (async variant of `process_doc_once`).
+
+    Stages after extraction run concurrently; all stages are idempotent, so a
+    retry after a partial failure does not duplicate earlier results.
+    """
+    ok, error = await run_stage(doc_id, STAGE_EXTRACT)
+    if not ok:
+        return ok, error
+    results = await asyncio.gather(*(run_stage(doc_id, stage) for stage in FINAL_STAGES))
+    for ok, error in results:
+        if not ok:
+            return ok, error
+    await asyncio.to_thread(schedule_document_profile_update, doc_id)
+    return True, None
+
+
+async def process_stage(doc_id: str, stage: Optional[str], force: bool = False) -> Tuple[bool, Optional[str]]:
+    """Run the work of one `postprocess_jobs` row (`stage` NULL = legacy whole-pipeline job)."""
+    if stage is None:
+        return await process_doc(doc_id)
+    return await run_stage(doc_id, stage, force=force)
+
+
+def process_stage_once(doc_id: str, stage: Optional[str], force: bool = False):
+    """Synchronous wrapper around `process_stage` for the polling worker."""
+    return run_sync(lambda: process_stage(doc_id, stage, force=force))
+
+
 def kick_postprocess_async(doc_id: str):
     """Backward-compatible helper: keep the old behavior (daemon thread, best-effort).
 
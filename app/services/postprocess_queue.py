@@ -1,113 +1,259 @@
 """Simple DB-backed postprocess job worker.
 
 This module provides a polling worker that picks up pending jobs from the
-`postprocess_jobs` table and runs `process_doc_once`. It implements simple
+`postprocess_jobs` table and runs their stage. It implements simple
 retry/backoff logic and marks jobs as `done` or `failed`.
 
+Each document is processed as a small stage DAG, one job row per stage:
+`extract` fans out to `summary`, `embedding` and `classification` once it is
+done, and those three run (and are retried) independently. The preference
+profile update is scheduled when the last of them completes. Jobs with
+`stage` NULL (enqueued before stages existed) run the whole pipeline. A job's
+JSON `payload` carries stage options: `{"force": true}` on a summary job
+(`enqueue_summary_regeneration`) replaces an existing summary.
+
+Jobs are leased atomically (`lease_owner` / `lease_expires_at`), so several
+worker processes can drain the queue in parallel. A heartbeat extends the
+lease while a job runs; leases of crashed workers expire and the job is
+returned to the queue by `reclaim_expired_jobs`. Results are written with a
+conditional UPDATE on the lease owner, so a worker whose job was reclaimed
+meanwhile discards its result instead of overwriting the new owner's state.
+
+With `--concurrency K` (or `POSTPROCESS_WORKER_CONCURRENCY`) the worker runs
+an asyncio loop that keeps up to K leased jobs in flight at once; LLM calls are
+still capped by `LLM_MAX_CONCURRENCY`. Throughput is logged in docs/min.
+
 This is intentionally lightweight and intended as an interim solution before
 migrating to a broker-based queue.
 """
 from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
 import time
 import logging
-from typing import Optional
+from typing import Optional, Set
 
 from app.core.database import SessionLocal, PostprocessJob
-from app.services.postprocess import process_doc_once
+from app.services.postprocess import (
+    FINAL_STAGES,
+    ROOT_STAGE,
+    STAGE_SUCCESSORS,
+    STAGE_SUMMARY,
+    process_stage,
+    process_stage_once,
+    schedule_document_profile_update,
+)
+from app.core.config import settings
+from app.services import queue_metrics, queue_signal
+from app.services.queue_signal import QueueWaiter
+from app.services.job_leasing import (
+    LeaseHeartbeat,
+    default_worker_id,
+    finish_leased_job,
+    lease_next_job,
+    reclaim_expired_leases,
+    seconds_until_next_job,
+)
 
 logger = logging.getLogger(__name__)
 
+QUEUE_NAME = PostprocessJob.__tablename__
 DEFAULT_POLL_INTERVAL = 2.0  # seconds
 BACKOFF_BASE_SECONDS = 5
 
 
-def _acquire_job(db) -> Optional[PostprocessJob]:
-    """Select a pending job and mark it in_progress atomically.
+def _acquire_job(db, worker_id: Optional[str] = None) -> Optional[PostprocessJob]:
+    """Atomically lease the oldest runnable pending job for this worker.
 
-    Note: SQLite doesn't support SELECT ... FOR UPDATE, so we use a simple
-    optimistic approach: select pending jobs ordered by next_attempt_at, then
-    attempt to update the status to in_progress and commit. If commit fails due
-    to concurrency, another worker will have claimed it.
+    Uses a single conditional UPDATE (see `app.services.job_leasing`), so
+    several workers can poll the same table without claiming a job twice.
     """
-    now = datetime.utcnow()
-    q = db.query(PostprocessJob).filter(
-        PostprocessJob.status == "pending",
-        (PostprocessJob.next_attempt_at == None) | (PostprocessJob.next_attempt_at <= now),
-    ).order_by(PostprocessJob.created_at)
+    return lease_next_job(
+        db,
+        PostprocessJob,
+        order_by=(PostprocessJob.created_at, PostprocessJob.id),
+        owner=worker_id,
+    )
 
-    job = q.first()
-    if not job:
-        return None
 
-    try:
-        job.status = "in_progress"
-        job.updated_at = datetime.utcnow()
-        db.add(job)
-        db.commit()
-        # refresh
-        db.refresh(job)
-        return job
-    except Exception:
-        db.rollback()
-        return None
+def _mark_job_done(db, job: PostprocessJob, worker_id: Optional[str] = None) -> bool:
+    """Record success and advance the stage DAG.
 
+    Returns False (and advances nothing) when the lease was lost meanwhile,
+    i.e. the job was reclaimed and now belongs to another worker.
+    """
+    if not finish_leased_job(db, PostprocessJob, job, worker_id, status="done"):
+        return False
+    queue_metrics.incr(QUEUE_NAME, "completed")
+    _advance_stages(db, job)
+    return True
 
-def _mark_job_done(db, job: PostprocessJob):
-    job.status = "done"
-    job.updated_at = datetime.utcnow()
-    db.add(job)
-    db.commit()
 
+def _advance_stages(db, job: PostprocessJob):
+    """Enqueue the successors of a finished stage, or the profile update after the last one."""
+    successors = STAGE_SUCCESSORS.get(job.stage or "", ())
+    for stage in successors:
+        enqueue_job_for_document(db, job.document_id, max_attempts=job.max_attempts, stage=stage)
+    _schedule_profile_update_if_finished(db, job)
 
-def _mark_job_failed(db, job: PostprocessJob, error: str):
-    job.attempts = job.attempts + 1
-    job.last_error = error[:2000]
-    job.updated_at = datetime.utcnow()
-    if job.attempts >= job.max_attempts:
-        job.status = "failed"
-        db.add(job)
-        db.commit()
-        logger.error("Postprocess job %s failed permanently after %d attempts", job.id, job.attempts)
+
+def _schedule_profile_update_if_finished(db, job: PostprocessJob):
+    """Schedule the profile update once every final stage is done or failed for good.
+
+    A permanently failed final stage counts as finished, so it does not hold
+    back the profile update of the stages that succeeded.
+    """
+    if job.stage not in FINAL_STAGES:
+        return
+    remaining = (
+        db.query(PostprocessJob.id)
+        .filter(
+            PostprocessJob.document_id == job.document_id,
+            PostprocessJob.stage.in_(FINAL_STAGES),
+            PostprocessJob.status.notin_(("done", "failed")),
+        )
+        .first()
+    )
+    if remaining is None:
+        schedule_document_profile_update(job.document_id)
+
+
+def _mark_job_failed(db, job: PostprocessJob, error: str, worker_id: Optional[str] = None) -> bool:
+    """Record a failed attempt: retry with backoff, or fail permanently.
+
+    Like `_mark_job_done`, writes nothing when the lease was lost.
+    """
+    attempts = job.attempts + 1
+    values = {"attempts": attempts, "last_error": error[:2000]}
+    if attempts >= job.max_attempts:
+        if not finish_leased_job(db, PostprocessJob, job, worker_id, status="failed", **values):
+            return False
+        queue_metrics.incr(QUEUE_NAME, "failed")
+        logger.error("Postprocess job %s failed permanently after %d attempts", job.id, attempts)
+        _schedule_profile_update_if_finished(db, job)
     else:
         # schedule next attempt with exponential backoff
-        backoff = BACKOFF_BASE_SECONDS * (2 ** (job.attempts - 1))
-        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
-        job.status = "pending"
-        db.add(job)
-        db.commit()
-        logger.info("Postprocess job %s scheduled retry in %s seconds (attempt %d)", job.id, backoff, job.attempts)
+        backoff = BACKOFF_BASE_SECONDS * (2 ** (attempts - 1))
+        next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
+        if not finish_leased_job(
+            db, PostprocessJob, job, worker_id, status="pending", next_attempt_at=next_attempt_at, **values
+        ):
+            return False
+        queue_metrics.incr(QUEUE_NAME, "retried")
+        logger.info("Postprocess job %s scheduled retry in %s seconds (attempt %d)", job.id, backoff, attempts)
+    return True
+
+
+def reclaim_expired_jobs(db):
+    """Return jobs whose worker lease expired (crashed/killed worker) to the queue."""
+    return reclaim_expired_leases(db, PostprocessJob)
+
+
+def _job_options(job: PostprocessJob) -> dict:
+    """The job's JSON payload as a dict ({} when absent or malformed)."""
+    try:
+        options = json.loads(job.payload) if job.payload else {}
+    except (TypeError, ValueError):
+        return {}
+    return options if isinstance(options, dict) else {}
+
 
+def enqueue_job_for_document(
+    db, document_id: str, max_attempts: int = 5, stage: str = ROOT_STAGE, payload: Optional[dict] = None
+):
+    """Enqueue a stage job (the root `extract` stage by default) and return its id.
 
-def enqueue_job_for_document(db, document_id: str, max_attempts: int = 5):
-    job = PostprocessJob(document_id=document_id, status="pending", attempts=0, max_attempts=max_attempts)
+    If the same stage is already pending or running for the document, the
+    existing job id is returned instead of adding a duplicate row. A `payload`
+    (e.g. `{"force": True}`) is merged into a pending job; a running job has
+    already read its payload, so a new job is added after it.
+    """
+    existing = (
+        db.query(PostprocessJob)
+        .filter(
+            PostprocessJob.document_id == document_id,
+            PostprocessJob.stage == stage,
+            PostprocessJob.status.in_(("pending", "in_progress")),
+        )
+        .first()
+    )
+    if existing is not None and not payload:
+        return existing.id
+    if existing is not None and existing.status == "pending":
+        existing.payload = json.dumps({**_job_options(existing), **payload})
+        db.commit()
+        return existing.id
+    job = PostprocessJob(
+        document_id=document_id,
+        stage=stage,
+        status="pending",
+        attempts=0,
+        max_attempts=max_attempts,
+        payload=json.dumps(payload) if payload else None,
+    )
     db.add(job)
     db.commit()
     db.refresh(job)
+    queue_signal.notify(QUEUE_NAME)
     return job.id
 
 
-def run_worker(poll_interval: float = DEFAULT_POLL_INTERVAL):
+def enqueue_summary_regeneration(db, document_id: str) -> str:
+    """Re-run the summary stage even though the document already has a summary."""
+    return enqueue_job_for_document(db, document_id, stage=STAGE_SUMMARY, payload={"force": True})
+
+
+def run_worker(poll_interval: float = DEFAULT_POLL_INTERVAL, concurrency: Optional[int] = None):
     """Run worker loop forever. Intended for manual start in development.
 
+    When the queue is empty the worker waits for an enqueue signal (see
+    `app.services.queue_signal`) instead of sleeping a fixed interval;
+    `poll_interval` is the initial idle wait, which backs off up to
+    `settings.queue_idle_max_wait_seconds`.
+
+    `concurrency` > 1 switches to the asyncio worker (`run_async_worker`).
+
     In production, run this in a managed process and ensure proper logging/monitoring.
     """
-    logger.info("Starting DB-backed postprocess worker with poll interval %s", poll_interval)
+    concurrency = settings.postprocess_worker_concurrency if concurrency is None else concurrency
+    if concurrency > 1:
+        asyncio.run(run_async_worker(concurrency, poll_interval))
+        return
+
+    worker_id = default_worker_id()
+    logger.info("Starting DB-backed postprocess worker %s with poll interval %s", worker_id, poll_interval)
+    last_reclaim = 0.0
+    waiter = None
     while True:
         db = SessionLocal()
         try:
-            job = _acquire_job(db)
+            if waiter is None:
+                waiter = QueueWaiter(QUEUE_NAME, db.get_bind(), min_wait=poll_interval)
+            if time.monotonic() - last_reclaim >= settings.job_reclaim_interval_seconds:
+                reclaim_expired_jobs(db)
+                last_reclaim = time.monotonic()
+
+            waiter.arm()
+            job = _acquire_job(db, worker_id)
             if not job:
+                next_due = seconds_until_next_job(db, PostprocessJob)
                 db.close()
-                time.sleep(poll_interval)
+                waiter.wait(next_due)
                 continue
+            waiter.reset()
 
-            logger.info("Picked job %s for document %s", job.id, job.document_id)
-            success, error = process_doc_once(job.document_id)
-            if success:
-                _mark_job_done(db, job)
-                logger.info("Job %s completed", job.id)
+            logger.info("Picked job %s (%s) for document %s", job.id, job.stage or "all", job.document_id)
+            with LeaseHeartbeat(db, PostprocessJob, job.id, worker_id) as heartbeat:
+                success, error = process_stage_once(job.document_id, job.stage, force=bool(_job_options(job).get("force")))
+            if heartbeat.lost:
+                # 回収されて他のワーカーが実行し直しているので、結果は記録しない
+                logger.warning("Job %s lost its lease while running; result discarded", job.id)
+            elif success:
+                if _mark_job_done(db, job, worker_id):
+                    logger.info("Job %s completed", job.id)
             else:
-                _mark_job_failed(db, job, error or "unknown error")
+                _mark_job_failed(db, job, error or "unknown error", worker_id)
         except Exception:
             logger.exception("Worker encountered unexpected error")
         finally:
@@ -117,7 +263,153 @@ def run_worker(poll_interval: float = DEFAULT_POLL_INTERVAL):
                 pass
 
 
+class ThroughputMeter:
+    """完了した文書数を数え、一定間隔で docs/min をログ出力する"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = settings.worker_throughput_log_seconds if interval is None else interval
+        self.started = self.window_started = time.monotonic()
+        self.total = 0
+        self.window = 0
+
+    def record(self, n: int = 1) -> None:
+        self.total += n
+        self.window += n
+
+    def docs_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.total * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    def maybe_log(self, in_flight: int) -> None:
+        now = time.monotonic()
+        elapsed = now - self.window_started
+        if elapsed < self.interval:
+            return
+        logger.info(
+            "Postprocess throughput: %.1f docs/min (last %ds: %d docs, total %d, in flight %d)",
+            self.window * 60.0 / elapsed,
+            int(elapsed),
+            self.window,
+            self.total,
+            in_flight,
+        )
+        self.window = 0
+        self.window_started = now
+
+
+def _reclaim_in_session() -> None:
+    db = SessionLocal()
+    try:
+        reclaim_expired_jobs(db)
+    finally:
+        db.close()
+
+
+def _arm_and_acquire(waiter: QueueWaiter, db, worker_id: str) -> Optional[PostprocessJob]:
+    # arm() はデータバージョンを DB に問い合わせるため、リースと合わせてスレッド側で行う
+    waiter.arm()
+    return _acquire_job(db, worker_id)
+
+
+def _seconds_until_next_job() -> Optional[float]:
+    db = SessionLocal()
+    try:
+        return seconds_until_next_job(db, PostprocessJob)
+    finally:
+        db.close()
+
+
+async def _process_leased_job(db, job: PostprocessJob, worker_id: str) -> bool:
+    """リース済みジョブを1件処理し、結果を記録してセッションを閉じる"""
+    try:
+        logger.info("Picked job %s (%s) for document %s", job.id, job.stage or "all", job.document_id)
+        async with LeaseHeartbeat(db, PostprocessJob, job.id, worker_id) as heartbeat:
+            success, error = await process_stage(job.document_id, job.stage, force=bool(_job_options(job).get("force")))
+        if heartbeat.lost:
+            logger.warning("Job %s lost its lease while running; result discarded", job.id)
+            return False
+        # 完了記録は同期 DB 書き込みなのでイベントループの外で行う
+        if success:
+            if not await asyncio.to_thread(_mark_job_done, db, job, worker_id):
+                return False
+            logger.info("Job %s completed", job.id)
+        else:
+            await asyncio.to_thread(_mark_job_failed, db, job, error or "unknown error", worker_id)
+        return success
+    except Exception:
+        logger.exception("Worker encountered unexpected error on job %s", job.id)
+        return False
+    finally:
+        db.close()
+
+
+async def run_async_worker(concurrency: int, poll_interval: float = DEFAULT_POLL_INTERVAL, max_jobs: Optional[int] = None):
+    """最大 `concurrency` 件のジョブを同時にリースして並行処理する非同期ワーカー。
+
+    ジョブの取得・完了記録は共有の `SessionLocal` から作ったジョブごとのセッションで
+    `asyncio.to_thread` 経由で行い、文書処理（LLM 呼び出し）はこのイベントループ上で並行に実行する。
+    `max_jobs` を指定するとその件数を処理した時点で終了する（テスト・バッチ用）。
+    """
+    worker_id = default_worker_id()
+    logger.info("Starting async postprocess worker %s with concurrency %d", worker_id, concurrency)
+    meter = ThroughputMeter()
+    in_flight: Set[asyncio.Task] = set()
+    started = 0
+    last_reclaim = 0.0
+    waiter = None
+    try:
+        while max_jobs is None or started < max_jobs or in_flight:
+            if time.monotonic() - last_reclaim >= settings.job_reclaim_interval_seconds:
+                await asyncio.to_thread(_reclaim_in_session)
+                last_reclaim = time.monotonic()
+
+            # 空きスロットぶんジョブをリースする
+            idle = False
+            while len(in_flight) < concurrency and (max_jobs is None or started < max_jobs):
+                db = SessionLocal()
+                if waiter is None:
+                    waiter = QueueWaiter(QUEUE_NAME, db.get_bind(), min_wait=poll_interval)
+                job = await asyncio.to_thread(_arm_and_acquire, waiter, db, worker_id)
+                if job is None:
+                    db.close()
+                    idle = True
+                    break
+                waiter.reset()
+                started += 1
+                in_flight.add(asyncio.create_task(_process_leased_job(db, job, worker_id)))
+
+            if in_flight:
+                done, in_flight = await asyncio.wait(
+                    in_flight,
+                    timeout=poll_interval if idle else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                meter.record(len(done))
+                meter.maybe_log(len(in_flight))
+            elif idle:
+                if max_jobs is not None:
+                    break
+                next_due = await asyncio.to_thread(_seconds_until_next_job)
+                await asyncio.to_thread(waiter.wait, next_due)
+    finally:
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        if waiter is not None:
+            waiter.close()
+        logger.info("Async postprocess worker %s processed %d docs (%.1f docs/min)", worker_id, meter.total, meter.docs_per_minute())
+    return meter.total
+
+
 if __name__ == "__main__":
     # Simple CLI entry for testing
     logging.basicConfig(level=logging.INFO)
-    run_worker()
+    parser = argparse.ArgumentParser(description="Run the DB-backed postprocess worker")
+    parser.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Initial idle wait in seconds")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Documents processed in parallel (default: POSTPROCESS_WORKER_CONCURRENCY)",
+    )
+    args = parser.parse_args()
+    run_worker(poll_interval=args.interval, concurrency=args.concurrency)
@@ -1,18 +1,20 @@
 from __future__ import annotations
 
-import asyncio
 import json
 import logging
-import threading
+import math
 import time
 import uuid
-from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Optional, Sequence
+from typing import Dict, Iterable, List, Optional, Sequence
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 
-from app.core.database import Bookmark, Document, PreferenceProfile
+from app.core.async_runner import run_sync
+from app.core.config import settings
+from app.core.database import Bookmark, Document, Embedding, PreferenceProfile
 from app.core.user_utils import normalize_user_id
 from app.services.llm_client import LLMClient, llm_client
 from app.services.personalization_models import PreferenceProfileDTO, PreferenceProfileStatus
@@ -27,6 +29,8 @@ DEFAULT_MAX_BOOKMARKS = 50
 DEFAULT_EMBEDDING_CHAR_LIMIT = 4000
 DEFAULT_MAX_RETRIES = 2
 DEFAULT_RETRY_DELAY_SECONDS = 1.5
+# 前方減衰の重みがこの値を超えたら基準時刻を現在に移して桁あふれを防ぐ
+REBASE_WEIGHT_LIMIT = 1e6
 
 
 def _normalize_status(value: Optional[str]) -> PreferenceProfileStatus:
@@ -77,40 +81,127 @@ def _dumps(obj: Dict[str, float]) -> str:
 
 
 def _run_async(coro_or_factory):
-	"""Run an async coroutine safely even if an event loop is already running."""
-
-	def _get_coro():
-		if asyncio.iscoroutine(coro_or_factory):
-			return coro_or_factory
-		if callable(coro_or_factory):
-			result = coro_or_factory()
-			if asyncio.iscoroutine(result):
-				return result
-			raise TypeError("Callable must return a coroutine")
-		raise TypeError("Expected coroutine or callable returning coroutine")
+	"""Run an async coroutine on the shared background loop and return its result."""
+	return run_sync(coro_or_factory)
 
-	try:
-		loop = asyncio.get_running_loop()
-	except RuntimeError:
-		loop = None
 
-	if loop and loop.is_running():
-		container: Dict[str, object] = {}
+def _normalize_counts(counts: Dict[str, float]) -> Dict[str, float]:
+	total = sum(value for value in counts.values() if value > 0)
+	if total <= 0:
+		return {}
+	return {key: round(value / total, 4) for key, value in counts.items() if value > 0}
+
 
-		def _runner():
-			try:
-				container["value"] = asyncio.run(_get_coro())
-			except Exception as exc:  # pragma: no cover - passthrough
-				container["error"] = exc
+def _primary_category(doc: Document) -> Optional[str]:
+	for classification in getattr(doc, "classifications", []) or []:
+		primary = getattr(classification, "primary_category", None)
+		if primary:
+			return str(primary)
+	return None
 
-		thread = threading.Thread(target=_runner, daemon=True)
-		thread.start()
-		thread.join()
-		if "error" in container:
-			raise container["error"]  # type: ignore[misc]
-		return container.get("value")
 
-	return asyncio.run(_get_coro())
+def _dump_contribution(*, vector: Optional[Sequence[float]], category: Optional[str], domain: Optional[str]) -> str:
+	"""ブックマーク1件が実際にプロファイルへ加算した内容（削除時にこれだけを減算する）"""
+	payload = {"vector": bool(vector), "category": category or None, "domain": domain or None}
+	return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _load_contribution(payload: Optional[str]) -> Optional[Dict[str, object]]:
+	"""NULL（記録前のブックマーク）や壊れた値は None（寄与不明）。"{}" は寄与なし"""
+	if payload is None:
+		return None
+	try:
+		data = json.loads(payload)
+	except (TypeError, ValueError, json.JSONDecodeError):
+		return None
+	return data if isinstance(data, dict) else None
+
+
+@dataclass
+class _ProfileState:
+	"""ブックマーク集合の累積状態（前方減衰: 時刻 t のイベントの重みは exp(λ(t - reference_at))）。
+
+	指数減衰は全イベントの比率を保つため、正規化した値は時間経過で変化しない。
+	そのためイベントごとに重みを1回加減算するだけで、減衰込みの加重平均を維持できる。
+	"""
+
+	reference_at: datetime
+	decay_rate: float = 0.0
+	embedding_sum: Optional[List[float]] = None
+	embedding_weight: float = 0.0
+	category_counts: Dict[str, float] = field(default_factory=dict)
+	domain_counts: Dict[str, float] = field(default_factory=dict)
+
+	@classmethod
+	def for_profile(cls, profile: PreferenceProfile, decay_rate: float) -> "_ProfileState":
+		embedding_sum = _loads_float_list(profile.embedding_sum) if profile.embedding_sum is not None else None
+		return cls(
+			reference_at=profile.decay_reference_at or datetime.utcnow(),
+			decay_rate=decay_rate,
+			embedding_sum=embedding_sum,
+			embedding_weight=float(profile.embedding_weight or 0.0),
+			category_counts=_loads_float_map(profile.category_counts),
+			domain_counts=_loads_float_map(profile.domain_counts),
+		)
+
+	def weight_at(self, at: datetime) -> float:
+		if self.decay_rate <= 0:
+			return 1.0
+		return math.exp(self.decay_rate * (at - self.reference_at).total_seconds())
+
+	def rebase(self, now: datetime) -> None:
+		if self.decay_rate <= 0 or self.weight_at(now) <= REBASE_WEIGHT_LIMIT:
+			return
+		factor = 1.0 / self.weight_at(now)
+		if self.embedding_sum is not None:
+			self.embedding_sum = [value * factor for value in self.embedding_sum]
+		self.embedding_weight *= factor
+		self.category_counts = {key: value * factor for key, value in self.category_counts.items()}
+		self.domain_counts = {key: value * factor for key, value in self.domain_counts.items()}
+		self.reference_at = now
+
+	def add(
+		self,
+		*,
+		vector: Optional[Sequence[float]],
+		category: Optional[str],
+		domain: Optional[str],
+		at: datetime,
+		sign: int = 1,
+	) -> None:
+		"""1件のブックマークを加算（sign=-1 で取り消し）する。O(埋め込み次元)。"""
+		weight = sign * self.weight_at(at)
+		if vector:
+			if self.embedding_sum is None or not self.embedding_sum:
+				self.embedding_sum = [0.0] * len(vector)
+			if len(vector) == len(self.embedding_sum):
+				self.embedding_sum = [acc + weight * float(value) for acc, value in zip(self.embedding_sum, vector)]
+				self.embedding_weight += weight
+			else:
+				logger.warning("preference_profile: embedding dimension mismatch (%s != %s); skipped", len(vector), len(self.embedding_sum))
+		if category:
+			self.category_counts[category] = self.category_counts.get(category, 0.0) + weight
+		if domain:
+			self.domain_counts[domain] = self.domain_counts.get(domain, 0.0) + weight
+		# 取り消しで生じる誤差で負にならないよう掃除する
+		if sign < 0:
+			self.category_counts = {key: value for key, value in self.category_counts.items() if value > 1e-9}
+			self.domain_counts = {key: value for key, value in self.domain_counts.items() if value > 1e-9}
+			if self.embedding_weight <= 1e-9:
+				self.embedding_sum = []
+				self.embedding_weight = 0.0
+
+	def mean_embedding(self) -> Optional[List[float]]:
+		if not self.embedding_sum or self.embedding_weight <= 0:
+			return None
+		return [value / self.embedding_weight for value in self.embedding_sum]
+
+
+def _decay_rate() -> float:
+	half_life_days = float(settings.preference_profile_half_life_days or 0.0)
+	if half_life_days <= 0:
+		return 0.0
+	return math.log(2) / (half_life_days * 86400.0)
 
 
 class PreferenceProfileService:
@@ -134,40 +225,245 @@ class PreferenceProfileService:
 		self.max_retries = max_retries
 		self.retry_delay_seconds = retry_delay_seconds
 
-	def update_profile(self, db: Session, user_id: Optional[str] = None) -> PreferenceProfileDTO:
-		bookmarks = self._load_recent_bookmarks(db, user_id)
+	def update_profile(self, db: Session, user_id: Optional[str] = None, *, full: bool = False) -> PreferenceProfileDTO:
+		"""プロファイルを返す。インクリメンタル状態が無い場合か ``full`` 指定時のみ全体再計算する。
+
+		ブックマークの追加・削除は ``apply_bookmark_event`` で都度反映されるため、
+		通常のジョブでは LLM 呼び出しも全ブックマークの読み込みも発生しない。
+		"""
+		profile = self._get_profile(db, user_id)
+		if not full and profile is not None and self._has_incremental_state(profile):
+			return self._to_dto(profile)
+		return self.rebuild_profile(db, user_id=user_id)
+
+	def rebuild_profile(self, db: Session, user_id: Optional[str] = None) -> PreferenceProfileDTO:
+		"""全ブックマークからプロファイルを再計算する（オンデマンド用）。
+
+		埋め込みは各文書の既存ベクトル（postprocess で保存済み）の減衰付き加重平均。
+		どの文書にもベクトルが無い場合に限り、従来どおりタイトル・要約を連結して LLM で埋め込む。
+		"""
+		bookmarks = self._load_bookmarks(db, user_id)
 		attached = [b for b in bookmarks if b.document is not None]
-		bookmark_count = len(attached)
+		bookmark_count = self._count_bookmarks(db, user_id)
 		last_bookmark_id = attached[0].id if attached else None
+		profile = self._get_profile(db, user_id)
 
+		now = datetime.utcnow()
+		state = _ProfileState(reference_at=now, decay_rate=_decay_rate())
+		vectors = self._load_document_vectors(db, [b.document_id for b in attached])
+		total_weight = 0.0
+		for bookmark in attached:
+			at = bookmark.created_at or now
+			vector = vectors.get(bookmark.document_id)
+			category = _primary_category(bookmark.document)
+			domain = getattr(bookmark.document, "domain", None)
+			state.add(vector=vector, category=category, domain=domain, at=at)
+			bookmark.profile_contribution = _dump_contribution(vector=vector, category=category, domain=domain)
+			total_weight += state.weight_at(at)
+		# 上限（max_bookmarks）より古いブックマークは寄与なしとして記録し、削除時に何も減算しない
+		self._bookmarks_query(db, user_id).filter(Bookmark.id.notin_([b.id for b in attached])).update(
+			{Bookmark.profile_contribution: "{}"}, synchronize_session=False
+		)
+
+		embedding: Optional[List[float]] = None
+		if bookmark_count >= self.cold_start_threshold and state.mean_embedding() is None:
+			embedding_text = self._compose_embedding_corpus(attached[: self.max_bookmarks])
+			embedding = self._generate_embedding(embedding_text) if embedding_text else None
+			if embedding:
+				# LLM の埋め込みを全ブックマークの平均とみなして状態を初期化する
+				state.embedding_sum = [value * total_weight for value in embedding]
+				state.embedding_weight = total_weight
+			else:
+				# 失敗時は状態を未初期化のままにし、次のジョブで再計算を試みる
+				state.embedding_sum = None
+
+		profile = self._persist_state(
+			db=db,
+			profile=profile,
+			user_id=user_id,
+			bookmark_count=bookmark_count,
+			last_bookmark_id=last_bookmark_id,
+			state=state,
+			embedding=embedding,
+		)
+		return self._to_dto(profile)
+
+	def apply_bookmark_event(
+		self,
+		db: Session,
+		*,
+		user_id: Optional[str],
+		document_id: str,
+		bookmarked_at: Optional[datetime] = None,
+		bookmark_id: Optional[str] = None,
+		removed: bool = False,
+		contribution: Optional[str] = None,
+	) -> Optional[PreferenceProfileDTO]:
+		"""ブックマーク1件の追加・削除をプロファイルに反映する（LLM 呼び出しなし）。
+
+		追加時に加算した内容（埋め込みの有無・カテゴリ・ドメイン）は Bookmark.profile_contribution に
+		記録し、削除時はその記録だけを減算する（削除済みの行は ``contribution`` で渡す）。
+		埋め込みや分類がまだ無い文書は、揃った時点で ``apply_document_contributions`` が残りを加える。
+		プロファイルがまだ初期化されていない場合は何もせず None を返す
+		（次の再計算ジョブで全体再計算される）。
+		"""
 		profile = self._get_profile(db, user_id)
-		if bookmark_count < self.cold_start_threshold:
-			profile = self._persist_profile(
+		if profile is None or not self._has_incremental_state(profile):
+			return None
+		bookmark = db.get(Bookmark, bookmark_id) if bookmark_id else None
+
+		now = datetime.utcnow()
+		state = _ProfileState.for_profile(profile, _decay_rate())
+		state.rebase(now)
+		at = bookmarked_at or now
+		if removed:
+			if contribution is None and bookmark is not None:
+				contribution = bookmark.profile_contribution
+			recorded = _load_contribution(contribution)
+			vector = self._load_document_vectors(db, [document_id]).get(document_id) if recorded and recorded.get("vector") else None
+			if recorded is None or (recorded.get("vector") and vector is None):
+				# 何を加算したか分からない（記録前のブックマーク・埋め込みの消失）ので次のジョブで全体再計算させる
+				return self._mark_dirty(db, profile)
+			state.add(vector=vector, category=recorded.get("category"), domain=recorded.get("domain"), at=at, sign=-1)
+		else:
+			doc = (
+				db.query(Document)
+				.options(joinedload(Document.classifications))
+				.filter(Document.id == document_id)
+				.one_or_none()
+			)
+			if doc is None:
+				# 寄与を特定できないため、次のジョブで全体再計算させる
+				return self._mark_dirty(db, profile)
+			vector = self._load_document_vectors(db, [document_id]).get(document_id)
+			category = _primary_category(doc)
+			domain = getattr(doc, "domain", None)
+			state.add(vector=vector, category=category, domain=domain, at=at)
+			if bookmark is not None:
+				bookmark.profile_contribution = _dump_contribution(vector=vector, category=category, domain=domain)
+
+		sign = -1 if removed else 1
+		last_bookmark_id = profile.last_bookmark_id
+		if not removed and bookmark_id:
+			last_bookmark_id = bookmark_id
+		elif removed and bookmark_id and bookmark_id == last_bookmark_id:
+			last_bookmark_id = None
+
+		profile = self._persist_state(
+			db=db,
+			profile=profile,
+			user_id=user_id,
+			bookmark_count=max(int(profile.bookmark_count or 0) + sign, 0),
+			last_bookmark_id=last_bookmark_id,
+			state=state,
+		)
+		return self._to_dto(profile)
+
+	def apply_document_contributions(self, db: Session, document_id: str) -> int:
+		"""後から埋め込み・分類が揃った文書について、ブックマーク時に加算できなかった分を加える。
+
+		profile_contribution に記録済みのブックマークだけが対象で、加えた分を記録に足すため
+		削除時の減算と対称に保たれる。更新したブックマーク数を返す。
+		"""
+		bookmarks = (
+			db.query(Bookmark)
+			.filter(Bookmark.document_id == document_id, Bookmark.profile_contribution.isnot(None))
+			.all()
+		)
+		if not bookmarks:
+			return 0
+		doc = (
+			db.query(Document)
+			.options(joinedload(Document.classifications))
+			.filter(Document.id == document_id)
+			.one_or_none()
+		)
+		if doc is None:
+			return 0
+		vector = self._load_document_vectors(db, [document_id]).get(document_id)
+		category = _primary_category(doc)
+		now = datetime.utcnow()
+		updated = 0
+		for bookmark in bookmarks:
+			recorded = _load_contribution(bookmark.profile_contribution)
+			if not recorded:
+				# 寄与なし（再計算の上限外）・不明な記録には加えない
+				continue
+			add_vector = vector if vector and not recorded.get("vector") else None
+			add_category = category if category and not recorded.get("category") else None
+			if add_vector is None and add_category is None:
+				continue
+			profile = self._get_profile(db, bookmark.user_id)
+			if profile is None or not self._has_incremental_state(profile):
+				continue
+			state = _ProfileState.for_profile(profile, _decay_rate())
+			state.rebase(now)
+			state.add(vector=add_vector, category=add_category, domain=None, at=bookmark.created_at or now)
+			bookmark.profile_contribution = _dump_contribution(
+				vector=add_vector or recorded.get("vector"),
+				category=add_category or recorded.get("category"),
+				domain=recorded.get("domain"),
+			)
+			self._persist_state(
 				db=db,
 				profile=profile,
-				user_id=user_id,
-				bookmark_count=bookmark_count,
-				last_bookmark_id=last_bookmark_id,
-				status="cold_start",
-				embedding=None,
-				category_weights={},
-				domain_weights={},
+				user_id=bookmark.user_id,
+				bookmark_count=int(profile.bookmark_count or 0),
+				last_bookmark_id=profile.last_bookmark_id,
+				state=state,
 			)
-			return self._to_dto(profile)
+			updated += 1
+		return updated
 
-		category_weights = self._compute_category_weights(attached)
-		domain_weights = self._compute_domain_weights(attached)
-		embedding_text = self._compose_embedding_corpus(attached)
-		embedding: Optional[List[float]] = None
+	@staticmethod
+	def _mark_dirty(db: Session, profile: PreferenceProfile) -> None:
+		profile.embedding_sum = None
+		db.add(profile)
+		db.commit()
+		return None
 
-		if embedding_text:
-			embedding = self._generate_embedding(embedding_text)
+	@staticmethod
+	def _has_incremental_state(profile: PreferenceProfile) -> bool:
+		return profile.decay_reference_at is not None and profile.embedding_sum is not None
 
+	def _load_document_vectors(self, db: Session, document_ids: Iterable[str]) -> Dict[str, List[float]]:
+		ids = [doc_id for doc_id in set(document_ids) if doc_id]
+		if not ids:
+			return {}
+		rows = (
+			db.query(Embedding.document_id, Embedding.vec)
+			.filter(Embedding.document_id.in_(ids), Embedding.chunk_id == 0)
+			.all()
+		)
+		vectors: Dict[str, List[float]] = {}
+		for document_id, vec in rows:
+			values = _loads_float_list(vec)
+			if values:
+				vectors[document_id] = values
+		return vectors
+
+	def _persist_state(
+		self,
+		*,
+		db: Session,
+		profile: Optional[PreferenceProfile],
+		user_id: Optional[str],
+		bookmark_count: int,
+		last_bookmark_id: Optional[str],
+		state: _ProfileState,
+		embedding: Optional[Sequence[float]] = None,
+	) -> PreferenceProfile:
+		embedding = embedding or state.mean_embedding()
 		status: PreferenceProfileStatus
-		if embedding:
-			status = "active"  # type: ignore[assignment]
+		if bookmark_count < self.cold_start_threshold:
+			status = "cold_start"  # type: ignore[assignment]
+			embedding = None
+			category_weights: Dict[str, float] = {}
+			domain_weights: Dict[str, float] = {}
 		else:
-			status = "error"  # type: ignore[assignment]
+			status = "active" if embedding else "error"  # type: ignore[assignment]
+			category_weights = _normalize_counts(state.category_counts)
+			domain_weights = _normalize_counts(state.domain_counts)
 
 		profile = self._persist_profile(
 			db=db,
@@ -179,8 +475,9 @@ class PreferenceProfileService:
 			embedding=embedding,
 			category_weights=category_weights,
 			domain_weights=domain_weights,
+			state=state,
 		)
-		return self._to_dto(profile)
+		return profile
 
 	def _generate_embedding(self, text: str) -> Optional[List[float]]:
 		text = text.strip()
@@ -216,6 +513,7 @@ class PreferenceProfileService:
 		embedding: Optional[Sequence[float]],
 		category_weights: Dict[str, float],
 		domain_weights: Dict[str, float],
+		state: Optional[_ProfileState] = None,
 	) -> PreferenceProfile:
 		now = datetime.utcnow()
 		# Normalize user_id to ensure we never persist NULL/empty user_id values
@@ -246,27 +544,39 @@ class PreferenceProfileService:
 		profile.profile_embedding = payload_embedding
 		profile.category_weights = payload_categories
 		profile.domain_weights = payload_domains
+		if state is not None:
+			profile.embedding_sum = (
+				json.dumps(state.embedding_sum, separators=(",", ":")) if state.embedding_sum is not None else None
+			)
+			profile.embedding_weight = state.embedding_weight
+			profile.category_counts = _dumps(state.category_counts)
+			profile.domain_counts = _dumps(state.domain_counts)
+			profile.decay_reference_at = state.reference_at
 
 		db.add(profile)
 		db.commit()
 		db.refresh(profile)
 		return profile
 
-	def _load_recent_bookmarks(self, db: Session, user_id: Optional[str]) -> List[Bookmark]:
-		from app.core.user_utils import normalize_user_id, GUEST_USER_ID
-		# Normalize user_id so that None/empty and the string 'guest' are handled uniformly.
-		normalized = normalize_user_id(user_id)
+	def _bookmarks_query(self, db: Session, user_id: Optional[str]):
+		# Normalize user_id so that None/empty and the string 'guest' are handled uniformly:
+		# bookmarks of unidentified users are stored with the literal 'guest' user_id.
+		return db.query(Bookmark).filter(Bookmark.user_id == normalize_user_id(user_id))
+
+	def _count_bookmarks(self, db: Session, user_id: Optional[str]) -> int:
+		return (
+			self._bookmarks_query(db, user_id)
+			.join(Document, Document.id == Bookmark.document_id)
+			.with_entities(func.count(Bookmark.id))
+			.scalar()
+			or 0
+		)
 
-		query = db.query(Bookmark).options(
+	def _load_bookmarks(self, db: Session, user_id: Optional[str]) -> List[Bookmark]:
+		"""全体再計算に使う新しい順 max_bookmarks 件（件数は _count_bookmarks で全件を数える）"""
+		query = self._bookmarks_query(db, user_id).options(
 			joinedload(Bookmark.document).joinedload(Document.classifications),
 		)
-		# If normalized user is the guest sentinel, bookmarks are stored with the
-		# literal 'guest' user_id in the DB. Use equality comparison for the
-		# normalized value so both None (legacy) and 'guest' are covered.
-		if normalized == GUEST_USER_ID:
-			query = query.filter(Bookmark.user_id == GUEST_USER_ID)
-		else:
-			query = query.filter(Bookmark.user_id == normalized)
 		query = query.order_by(Bookmark.created_at.desc()).limit(self.max_bookmarks)
 		return list(query.all())
 
@@ -300,37 +610,6 @@ class PreferenceProfileService:
 				break
 		return "\n\n".join(parts).strip()
 
-	def _compute_category_weights(self, bookmarks: Sequence[Bookmark]) -> Dict[str, float]:
-		counter: Counter[str] = Counter()
-		for bookmark in bookmarks:
-			doc = bookmark.document
-			if not doc:
-				continue
-			categories = getattr(doc, "classifications", []) or []
-			for classification in categories:
-				primary = getattr(classification, "primary_category", None)
-				if primary:
-					counter[str(primary)] += 1
-					break
-		total = sum(counter.values())
-		if total == 0:
-			return {}
-		return {key: round(value / total, 4) for key, value in counter.items()}
-
-	def _compute_domain_weights(self, bookmarks: Sequence[Bookmark]) -> Dict[str, float]:
-		counter: Counter[str] = Counter()
-		for bookmark in bookmarks:
-			doc = bookmark.document
-			if not doc:
-				continue
-			domain = getattr(doc, "domain", None)
-			if domain:
-				counter[str(domain)] += 1
-		total = sum(counter.values())
-		if total == 0:
-			return {}
-		return {key: round(value / total, 4) for key, value in counter.items()}
-
 	def _get_profile(self, db: Session, user_id: Optional[str]) -> Optional[PreferenceProfile]:
 		from app.core.user_utils import normalize_user_id
 		# Normalize user_id so that we consistently query stored profiles using
@@ -0,0 +1,135 @@
+"""Housekeeping for the DB-backed job queues.
+
+Every ingest enqueues several ``postprocess_jobs`` rows (one per stage) and at
+least one ``preference_jobs`` row, and finished rows were kept forever. The
+retention job deletes ``done`` rows older than ``job_retention_days`` and
+``failed`` rows older than ``failed_job_retention_days`` in small batches, so
+each batch holds the write lock only briefly and the workers keep leasing in
+between.
+
+After the purge the database is compacted: on SQLite ``PRAGMA optimize``
+refreshes the planner statistics (the partial lease indexes are only chosen
+once the statistics show that most rows are ``done``) and ``VACUUM`` runs when
+at least ``db_vacuum_min_free_ratio`` of the pages are free. On other
+backends the job tables are ``ANALYZE``d; space reclamation is left to
+autovacuum.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Type
+
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.core.database import PostprocessJob, PreferenceJob
+from app.services import queue_metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_MODELS = (PostprocessJob, PreferenceJob)
+
+
+def purge_finished_jobs(
+    db,
+    model: Type[Any],
+    *,
+    now: Optional[datetime] = None,
+    done_days: Optional[float] = None,
+    failed_days: Optional[float] = None,
+    batch_size: Optional[int] = None,
+) -> Dict[str, int]:
+    """保持期間を過ぎた done / failed ジョブをバッチ単位で削除する。
+
+    保持日数が 0 以下の状態は削除しない。戻り値は {"done": n, "failed": m}。
+    """
+    now = now or datetime.utcnow()
+    done_days = settings.job_retention_days if done_days is None else done_days
+    failed_days = settings.failed_job_retention_days if failed_days is None else failed_days
+    batch_size = max(int(settings.job_retention_batch_size if batch_size is None else batch_size), 1)
+    table = model.__tablename__
+    counts = {"done": 0, "failed": 0}
+
+    for status, days in (("done", done_days), ("failed", failed_days)):
+        if not days or days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        while True:
+            batch = (
+                select(model.id)
+                .where(model.status == status, model.updated_at < cutoff)
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            try:
+                result = db.execute(
+                    delete(model)
+                    .where(model.id.in_(batch))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.exception("queue_maintenance: failed to purge %s %s jobs", status, table)
+                break
+            deleted = int(result.rowcount or 0)
+            counts[status] += deleted
+            if deleted < batch_size:
+                break
+
+    if counts["done"] or counts["failed"]:
+        queue_metrics.incr(table, "purged", counts["done"] + counts["failed"])
+        logger.info(
+            "queue_maintenance: purged %d done / %d failed jobs from %s",
+            counts["done"],
+            counts["failed"],
+            table,
+        )
+    return counts
+
+
+def compact_database(engine, tables: Iterable[str] = (), *, min_free_ratio: Optional[float] = None) -> Dict[str, Any]:
+    """プランナー統計を更新し、空きページが多ければ VACUUM する。
+
+    戻り値は {"analyzed": bool, "vacuumed": bool, "free_ratio": float | None}。
+    """
+    min_free_ratio = settings.db_vacuum_min_free_ratio if min_free_ratio is None else min_free_ratio
+    report: Dict[str, Any] = {"analyzed": False, "vacuumed": False, "free_ratio": None}
+    tables = list(tables) or [model.__tablename__ for model in JOB_MODELS]
+
+    if engine.dialect.name != "sqlite":
+        try:
+            with engine.connect() as conn:
+                for table in tables:
+                    conn.exec_driver_sql(f"ANALYZE {table}")
+                conn.commit()
+            report["analyzed"] = True
+        except Exception:
+            logger.exception("queue_maintenance: ANALYZE failed")
+        return report
+
+    # VACUUM はトランザクション外で実行する必要があるため autocommit で接続する
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("PRAGMA optimize")
+            report["analyzed"] = True
+            page_count = conn.exec_driver_sql("PRAGMA page_count").scalar() or 0
+            freelist = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+            ratio = (freelist / page_count) if page_count else 0.0
+            report["free_ratio"] = round(ratio, 4)
+            if min_free_ratio > 0 and ratio >= min_free_ratio:
+                logger.info("queue_maintenance: VACUUM (%.1f%% of %d pages free)", ratio * 100, page_count)
+                conn.exec_driver_sql("VACUUM")
+                report["vacuumed"] = True
+    except Exception:
+        logger.exception("queue_maintenance: SQLite compaction failed")
+    return report
+
+
+def run_housekeeping(db) -> Dict[str, Any]:
+    """全ジョブキューの保持期間処理とコンパクションをまとめて実行する（スケジューラから日次）"""
+    purged = {model.__tablename__: purge_finished_jobs(db, model) for model in JOB_MODELS}
+    compaction = compact_database(db.get_bind())
+    return {"purged": purged, "compaction": compaction}
+
+
+__all__ = ["purge_finished_jobs", "compact_database", "run_housekeeping"]
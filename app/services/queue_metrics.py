@@ -0,0 +1,39 @@
+"""In-process counters for the DB-backed job queues.
+
+Counters are keyed by queue (table name) and event, e.g.
+``postprocess_jobs.leased`` or ``preference_jobs.reclaimed``. They live in
+the memory of the process that emits them (API process or worker) and are
+reset on restart; durable queue state comes from the jobs tables themselves
+(see ``app.api.routes.admin``).
+"""
+import threading
+from collections import Counter
+from typing import Dict
+
+_counters: Counter = Counter()
+_lock = threading.Lock()
+
+
+def incr(queue: str, event: str, amount: int = 1) -> None:
+    if amount <= 0:
+        return
+    with _lock:
+        _counters[(queue, event)] += amount
+
+
+def snapshot() -> Dict[str, Dict[str, int]]:
+    """{queue: {event: count}} 形式で現在値を返す"""
+    with _lock:
+        items = list(_counters.items())
+    out: Dict[str, Dict[str, int]] = {}
+    for (queue, event), count in items:
+        out.setdefault(queue, {})[event] = count
+    return out
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+
+
+__all__ = ["incr", "snapshot", "reset"]
@@ -0,0 +1,157 @@
+"""Wake-up signalling for the DB-backed job queues.
+
+Workers used to sleep a fixed poll interval whenever their queue was empty.
+`QueueWaiter` replaces that sleep with an event-driven wait that returns as
+soon as new work may be available:
+
+- In-process: `notify(queue)` (called by the enqueue helpers right after
+  commit) bumps a per-queue generation and wakes waiters through a
+  `threading.Condition`.
+- Cross-process (SQLite): the waiter holds one connection and probes
+  ``PRAGMA data_version``, which changes whenever another connection commits.
+  The probe is a single in-memory pragma, so it can run every
+  ``queue_signal_probe_interval`` seconds at negligible cost.
+
+Other backends fall back to the in-process signal plus the timed wait. When
+nothing happens the wait time backs off exponentially up to
+``queue_idle_max_wait_seconds``; callers cap it at the time until the next
+delayed job becomes due.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _QueueSignal:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.generation = 0
+
+
+_signals: Dict[str, _QueueSignal] = {}
+_signals_lock = threading.Lock()
+
+
+def _signal_for(queue: str) -> _QueueSignal:
+    with _signals_lock:
+        signal = _signals.get(queue)
+        if signal is None:
+            signal = _signals[queue] = _QueueSignal()
+        return signal
+
+
+def notify(queue: str) -> None:
+    """同一プロセス内で待機しているワーカーを起こす（enqueue のコミット後に呼ぶ）"""
+    signal = _signal_for(queue)
+    with signal.cond:
+        signal.generation += 1
+        signal.cond.notify_all()
+
+
+class QueueWaiter:
+    """キューが空の間の待機を担当する（イベント駆動＋アダプティブ・バックオフ）"""
+
+    def __init__(
+        self,
+        queue: str,
+        engine: Optional[Any] = None,
+        *,
+        min_wait: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        probe_interval: Optional[float] = None,
+    ):
+        self.queue = queue
+        self.min_wait = max(float(settings.queue_idle_min_wait_seconds if min_wait is None else min_wait), 0.01)
+        self.max_wait = max(float(settings.queue_idle_max_wait_seconds if max_wait is None else max_wait), self.min_wait)
+        self.probe_interval = max(
+            float(settings.queue_signal_probe_interval if probe_interval is None else probe_interval), 0.01
+        )
+        self.current_wait = self.min_wait
+        self._signal = _signal_for(queue)
+        self._armed_generation: Optional[int] = None
+        self._armed_version: Optional[int] = None
+        self._probe_conn = None
+        if engine is not None and engine.dialect.name == "sqlite":
+            try:
+                self._probe_conn = engine.raw_connection()
+            except Exception:
+                logger.debug("queue_signal: could not open data_version probe connection", exc_info=True)
+
+    def _data_version(self) -> Optional[int]:
+        if self._probe_conn is None:
+            return None
+        try:
+            cur = self._probe_conn.cursor()
+            try:
+                cur.execute("PRAGMA data_version")
+                row = cur.fetchone()
+            finally:
+                cur.close()
+            return int(row[0]) if row else None
+        except Exception:
+            logger.debug("queue_signal: data_version probe failed; disabling", exc_info=True)
+            self.close()
+            return None
+
+    def arm(self) -> None:
+        """キューを確認する直前に呼び、以降の enqueue を取りこぼさないよう基準値を記録する"""
+        self._armed_generation = self._signal.generation
+        self._armed_version = self._data_version()
+
+    def reset(self) -> None:
+        """ジョブを取得できたら待機時間を最小値に戻す"""
+        self.current_wait = self.min_wait
+
+    def _woken(self) -> bool:
+        if self._signal.generation != self._armed_generation:
+            return True
+        if self._armed_version is not None:
+            version = self._data_version()
+            if version is not None and version != self._armed_version:
+                return True
+        return False
+
+    def wait(self, max_timeout: Optional[float] = None) -> bool:
+        """新しいジョブの兆候があるか、待機時間が過ぎるまで待つ。
+
+        起こされた場合は True（待機時間は最小値に戻る）、タイムアウトの場合は False
+        （次回の待機時間は倍になる）を返す。
+        """
+        if self._armed_generation is None:
+            self.arm()
+        timeout = self.current_wait
+        if max_timeout is not None:
+            timeout = max(min(timeout, max_timeout), 0.0)
+        deadline = time.monotonic() + timeout
+        slice_ = self.probe_interval if self._armed_version is not None else timeout
+        try:
+            while True:
+                if self._woken():
+                    self.reset()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.current_wait = min(self.current_wait * 2, self.max_wait)
+                    return False
+                with self._signal.cond:
+                    if self._signal.generation == self._armed_generation:
+                        self._signal.cond.wait(min(remaining, slice_))
+        finally:
+            self._armed_generation = None
+            self._armed_version = None
+
+    def close(self) -> None:
+        if self._probe_conn is not None:
+            try:
+                self._probe_conn.close()
+            except Exception:
+                pass
+            self._probe_conn = None
+
+
+__all__ = ["notify", "QueueWaiter"]
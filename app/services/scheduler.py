@@ -1,8 +1,10 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import logging
 from datetime import datetime
 from sqlalchemy import text
+from app.core.config import settings
 from app.core.database import SessionLocal
 
 logger = logging.getLogger(__name__)
@@ -46,9 +48,108 @@ def _run_fetch_for_source(source_id: int):
         logger.exception("Failed to run fetch for source")
 
 
+def _run_thumbnail_cleanup():
+    """参照されなくなったサムネイルファイルを削除する（日次）"""
+    db = SessionLocal()
+    try:
+        from app.services.thumbnail_cache import cleanup_orphaned_thumbnails
+
+        cleanup_orphaned_thumbnails(db)
+    except Exception:
+        logger.exception("Failed to clean up orphaned thumbnails")
+    finally:
+        db.close()
+
+
+def _run_reclaim_expired_jobs():
+    """ワーカー停止で放置された in_progress ジョブをキューに戻す"""
+    db = SessionLocal()
+    try:
+        from app.services.postprocess_queue import reclaim_expired_jobs as reclaim_postprocess
+        from app.services.personalization_queue import reclaim_expired_jobs as reclaim_preference
+
+        reclaim_postprocess(db)
+        reclaim_preference(db)
+    except Exception:
+        logger.exception("Failed to reclaim expired job leases")
+    finally:
+        db.close()
+
+
+def _run_queue_housekeeping():
+    """保持期間を過ぎた完了ジョブを削除し、DB の統計更新・コンパクションを行う（日次）"""
+    db = SessionLocal()
+    try:
+        from app.services.queue_maintenance import run_housekeeping
+
+        run_housekeeping(db)
+    except Exception:
+        logger.exception("Failed to run job queue housekeeping")
+    finally:
+        db.close()
+
+
+def _run_stats_reconcile():
+    """stats_counters を実テーブルから数え直し、ORM を通らない書き込みによるずれを直す"""
+    db = SessionLocal()
+    try:
+        from app.services.stats_counters import reconcile
+
+        reconcile(db)
+    except Exception:
+        logger.exception("Failed to reconcile stats counters")
+    finally:
+        db.close()
+
+
+def _run_backfills():
+    """未完了のバックフィルを時間予算の範囲で少しずつ進める"""
+    try:
+        from app.core.database import get_engine
+        from app.services.backfills import run_pending_backfills
+
+        run_pending_backfills(get_engine(), time_budget=settings.backfill_time_budget_seconds)
+    except Exception:
+        logger.exception("Failed to run backfills")
+
+
 def start_scheduler():
     if not scheduler.running:
         scheduler.start()
+    scheduler.add_job(
+        _run_thumbnail_cleanup,
+        trigger=CronTrigger(hour=4, minute=30),
+        id="thumbnail_cleanup",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        _run_reclaim_expired_jobs,
+        trigger=IntervalTrigger(seconds=settings.job_reclaim_interval_seconds),
+        id="reclaim_expired_jobs",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        _run_queue_housekeeping,
+        trigger=CronTrigger(hour=4, minute=45),
+        id="queue_housekeeping",
+        replace_existing=True,
+    )
+    if settings.stats_reconcile_interval_minutes > 0:
+        scheduler.add_job(
+            _run_stats_reconcile,
+            trigger=IntervalTrigger(minutes=settings.stats_reconcile_interval_minutes),
+            id="stats_reconcile",
+            replace_existing=True,
+        )
+    if settings.backfill_enabled:
+        scheduler.add_job(
+            _run_backfills,
+            trigger=IntervalTrigger(seconds=settings.backfill_interval_seconds),
+            id="backfills",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
     _load_sources_and_schedule()
 
 
@@ -4,8 +4,9 @@
 import json
 import numpy as np
 from typing import List, Tuple, Optional
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from app.core.database import Document, Embedding
+from app.core.database import Document, Embedding, defer_document_bodies, pgvector_active
 import logging
 
 logger = logging.getLogger(__name__)
@@ -97,4 +98,50 @@ def calculate_document_similarity(
     except Exception as e:
         logger.error(f"Error calculating document similarity: {e}")
         # エラー時は全て低い類似度で返す
-        return [(doc, 0.1) for doc in other_documents]
\ No newline at end of file
+        return [(doc, 0.1) for doc in other_documents]
+
+
+_PGVECTOR_BASE_SQL = text(
+    "SELECT vec_pg::text FROM embeddings WHERE document_id = :document_id AND chunk_id = 0 AND vec_pg IS NOT NULL LIMIT 1"
+)
+# ORDER BY の右辺を定数（バインド変数）にしておくと HNSW 索引で近傍を引ける
+_PGVECTOR_NEAREST_SQL = text(
+    """
+    SELECT document_id, vec_pg <=> CAST(:base AS vector) AS distance
+    FROM embeddings
+    WHERE chunk_id = 0 AND vec_pg IS NOT NULL AND document_id <> :document_id
+    ORDER BY vec_pg <=> CAST(:base AS vector)
+    LIMIT :limit
+    """
+)
+
+
+def nearest_documents(db: Session, document_id: str, limit: int) -> Optional[List[Tuple[Document, float]]]:
+    """
+    pgvector の近傍検索で類似ドキュメントを取得
+
+    PostgreSQL で PGVECTOR_ENABLED のときだけ使う。使えない場合
+    （SQLite・拡張なし・基準ドキュメントのベクトルなし）は None を返すので、
+    呼び出し側は calculate_document_similarity にフォールバックする。
+
+    Returns:
+        (ドキュメント, 類似度スコア)のタプルのリスト（スコアは cosine_similarity と同じ 0〜1）
+    """
+    if not pgvector_active(db.get_bind()):
+        return None
+    try:
+        base = db.execute(_PGVECTOR_BASE_SQL, {"document_id": document_id}).scalar()
+        if base is None:
+            return None
+        rows = db.execute(_PGVECTOR_NEAREST_SQL, {"document_id": document_id, "base": base, "limit": limit}).all()
+    except Exception as e:
+        logger.error(f"pgvector similarity query failed: {e}")
+        db.rollback()
+        return None
+
+    documents = {
+        doc.id: doc
+        for doc in db.query(Document).options(*defer_document_bodies()).filter(Document.id.in_([r[0] for r in rows]))
+    }
+    # コサイン距離（1 - cos）を cosine_similarity と同じ (cos + 1) / 2 の尺度に直す
+    return [(documents[doc_id], 1.0 - float(distance) / 2) for doc_id, distance in rows if doc_id in documents]
@@ -0,0 +1,89 @@
+"""Dashboard statistics served from the ``stats_counters`` table.
+
+The counters are kept up to date by ORM events on ``Document`` /
+``Collection`` / ``Classification`` (see ``app.core.database``), so the home
+page and ``/api/stats`` read a handful of primary-key rows instead of running
+``COUNT(*)`` / ``COUNT(DISTINCT ...)`` over ``documents`` on every view.
+``reconcile`` recounts from the real tables to repair drift from writes that
+bypass the ORM (raw SQL bulk deletes, manual fixes).
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable
+
+from sqlalchemy import and_, or_
+
+from app.core.database import (
+    STATS_CATEGORY_PREFIX,
+    STATS_COLLECTIONS,
+    STATS_DOCUMENTS,
+    StatsCounter,
+    reconcile_stats_counters,
+    stats_day_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# category: の直後の文字（':' の次は ';'）までを範囲検索して主キー索引で引く
+_CATEGORY_RANGE_END = STATS_CATEGORY_PREFIX[:-1] + chr(ord(STATS_CATEGORY_PREFIX[-1]) + 1)
+
+
+def _today_key() -> str:
+    return stats_day_key(datetime.now(timezone.utc).date())
+
+
+def read_counters(db, keys: Iterable[str]) -> Dict[str, int]:
+    """指定キーの値（行が無いキーは 0）"""
+    keys = list(keys)
+    rows = db.query(StatsCounter.key, StatsCounter.value).filter(StatsCounter.key.in_(keys)).all()
+    values = {key: 0 for key in keys}
+    values.update({key: value for key, value in rows})
+    return values
+
+
+def home_stats(db) -> Dict[str, int]:
+    """ホーム画面の総ドキュメント数と今日（UTC）の登録数"""
+    today = _today_key()
+    values = read_counters(db, [STATS_DOCUMENTS, today])
+    return {"total_documents": values[STATS_DOCUMENTS], "today_documents": values[today]}
+
+
+def dashboard_stats(db) -> Dict[str, int]:
+    """/api/stats 用の集計（1クエリ）"""
+    today = _today_key()
+    keys = [STATS_DOCUMENTS, STATS_COLLECTIONS, today]
+    rows = (
+        db.query(StatsCounter.key, StatsCounter.value)
+        .filter(
+            or_(
+                StatsCounter.key.in_(keys),
+                and_(StatsCounter.key >= STATS_CATEGORY_PREFIX, StatsCounter.key < _CATEGORY_RANGE_END),
+            )
+        )
+        .all()
+    )
+    values = {key: value for key, value in rows}
+    return {
+        "total_documents": values.get(STATS_DOCUMENTS, 0),
+        "today_documents": values.get(today, 0),
+        "total_categories": sum(
+            1 for key, value in values.items() if key.startswith(STATS_CATEGORY_PREFIX) and value > 0
+        ),
+        "total_collections": values.get(STATS_COLLECTIONS, 0),
+    }
+
+
+def reconcile(db) -> Dict[str, tuple]:
+    """カウンタを実テーブルから数え直す（スケジューラから定期実行）。ずれていたキーを返す"""
+    try:
+        drift = reconcile_stats_counters(db.connection())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if drift:
+        logger.warning("stats_counters: corrected %d drifted counters: %s", len(drift), drift)
+    return drift
+
+
+__all__ = ["read_counters", "home_stats", "dashboard_stats", "reconcile"]
@@ -0,0 +1,258 @@
+"""Document thumbnail (favicon / og:image) lookup with a persistent cache.
+
+Thumbnails are cached in the `thumbnail_cache` table under two kinds of keys:
+
+- ``domain:<netloc>`` for the site favicon, shared by every document of the
+  domain, so the article page is only fetched when the domain has no icon.
+- ``url:<article url>`` for page-specific images (og:image / <link rel=icon>).
+
+Image files are stored content-addressed as
+``data/assets/thumbnails/thumb_<sha256 of the PNG>.png`` so the same icon is
+written once no matter how many documents or restarts reference it. Lookups
+that find nothing are cached as negative entries (``thumbnail_path`` NULL)
+for ``settings.thumbnail_negative_ttl_hours``.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import urljoin, urlparse
+
+import httpx
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import ThumbnailCache
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = Path("data/assets/thumbnails")
+THUMBNAIL_SIZE = (64, 64)
+FETCH_TIMEOUT_SEC = 15.0
+
+
+def _thumbnail_rel_path(fname: str) -> str:
+    return os.path.join("assets", "thumbnails", fname)
+
+
+def _thumbnail_file(rel_path: Optional[str]) -> Optional[Path]:
+    if not rel_path:
+        return None
+    return THUMBNAIL_DIR / os.path.basename(rel_path)
+
+
+def store_thumbnail_image(content: bytes) -> Optional[str]:
+    """画像を64x64のPNGに変換し、内容のSHA-256をファイル名として保存する。
+
+    同じ画像は同じファイル名になるため、既に存在する場合は書き込まない。
+    戻り値は 'assets/thumbnails/thumb_<sha256>.png'（変換できない場合は None）。
+    """
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        img = Image.open(BytesIO(content)).convert("RGBA")
+        img = img.resize(THUMBNAIL_SIZE, Image.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+    except Exception:
+        logger.debug("Could not decode thumbnail image", exc_info=True)
+        return None
+
+    png = buf.getvalue()
+    fname = f"thumb_{hashlib.sha256(png).hexdigest()}.png"
+    THUMBNAIL_DIR.mkdir(parents=True, exist_ok=True)
+    path = THUMBNAIL_DIR / fname
+    if not path.exists():
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(png)
+        os.replace(tmp, path)
+    return _thumbnail_rel_path(fname)
+
+
+def _fetch_image(client: httpx.Client, image_url: str) -> Optional[str]:
+    try:
+        r = client.get(image_url)
+        if r.status_code != 200 or "image" not in r.headers.get("content-type", ""):
+            return None
+        return store_thumbnail_image(r.content)
+    except Exception:
+        logger.debug("Failed to fetch/resize candidate %s", image_url)
+        return None
+
+
+def _discover_page_images(client: httpx.Client, url: str) -> List[str]:
+    """記事ページから og:image と <link rel="icon"> を探す"""
+    parsed = urlparse(url)
+    base = f"{parsed.scheme}://{parsed.netloc}"
+    candidates: List[str] = []
+    try:
+        r = client.get(url)
+        if r.status_code != 200:
+            return candidates
+        html = r.text
+        m = re.search(r"<meta[^>]+property=[\"']og:image[\"'][^>]+content=[\"']([^\"']+)[\"']", html, re.I)
+        if m:
+            img = m.group(1)
+            if img.startswith("//"):
+                img = f"{parsed.scheme}:{img}"
+            elif img.startswith("/"):
+                img = urljoin(base, img)
+            candidates.append(img)
+        m2 = re.search(r"<link[^>]+rel=[\"'](?:icon|shortcut icon)[\"'][^>]+href=[\"']([^\"']+)[\"']", html, re.I)
+        if m2:
+            icon = m2.group(1)
+            if icon.startswith("/"):
+                icon = urljoin(base, icon)
+            candidates.append(icon)
+    except Exception:
+        logger.debug("Could not fetch page to discover images for %s", url)
+    return candidates
+
+
+def _lookup(db, cache_key: str) -> Optional[ThumbnailCache]:
+    try:
+        return db.get(ThumbnailCache, cache_key)
+    except Exception:
+        logger.debug("thumbnail_cache lookup failed for %s", cache_key, exc_info=True)
+        db.rollback()
+        return None
+
+
+def _remember(db, cache_key: str, source_url: str, thumbnail_path: Optional[str]) -> None:
+    now = datetime.utcnow()
+    expires_at = None if thumbnail_path else now + timedelta(hours=settings.thumbnail_negative_ttl_hours)
+    try:
+        entry = db.get(ThumbnailCache, cache_key) or ThumbnailCache(cache_key=cache_key)
+        entry.source_url = source_url
+        entry.thumbnail_path = thumbnail_path
+        entry.fetched_at = now
+        entry.expires_at = expires_at
+        db.add(entry)
+        db.commit()
+    except Exception:
+        logger.debug("Failed to store thumbnail_cache entry %s", cache_key, exc_info=True)
+        db.rollback()
+
+
+def _cached_hit(entry: Optional[ThumbnailCache]) -> Optional[str]:
+    """キャッシュ済みのファイルが存在すればそのパスを返す"""
+    if entry is None or not entry.thumbnail_path:
+        return None
+    path = _thumbnail_file(entry.thumbnail_path)
+    return entry.thumbnail_path if path is not None and path.exists() else None
+
+
+def _is_fresh_negative(entry: Optional[ThumbnailCache]) -> bool:
+    return (
+        entry is not None
+        and not entry.thumbnail_path
+        and entry.expires_at is not None
+        and entry.expires_at > datetime.utcnow()
+    )
+
+
+def get_thumbnail_for_url(db, url: str) -> Optional[str]:
+    """記事URLのサムネイル（相対パス）を返す。キャッシュを優先し、必要な時だけ取得する。"""
+    if not url or not PIL_AVAILABLE:
+        if not PIL_AVAILABLE:
+            logger.warning("Pillow not available; thumbnail generation skipped")
+        return None
+
+    parsed = urlparse(url)
+    if not parsed.netloc:
+        return None
+    base = f"{parsed.scheme}://{parsed.netloc}"
+    domain_key = f"domain:{parsed.netloc.lower()}"
+    url_key = f"url:{url}"
+
+    domain_entry = _lookup(db, domain_key)
+    hit = _cached_hit(domain_entry)
+    if hit:
+        return hit
+    url_entry = _lookup(db, url_key)
+    hit = _cached_hit(url_entry)
+    if hit:
+        return hit
+
+    domain_negative = _is_fresh_negative(domain_entry)
+    if domain_negative and _is_fresh_negative(url_entry):
+        return None
+
+    with httpx.Client(timeout=FETCH_TIMEOUT_SEC, follow_redirects=True) as client:
+        # 1) ドメインの favicon（取得できればドメイン単位で共有）
+        if not domain_negative:
+            favicon_url = urljoin(base, "/favicon.ico")
+            rel = _fetch_image(client, favicon_url)
+            _remember(db, domain_key, favicon_url, rel)
+            if rel:
+                return rel
+
+        # 2) 記事ページの og:image / link rel=icon
+        if _is_fresh_negative(url_entry):
+            return None
+        for candidate in _discover_page_images(client, url):
+            rel = _fetch_image(client, candidate)
+            if rel:
+                _remember(db, url_key, candidate, rel)
+                return rel
+        _remember(db, url_key, url, None)
+    return None
+
+
+def cleanup_orphaned_thumbnails(db, min_age_seconds: int = 3600, dry_run: bool = False) -> int:
+    """どのドキュメントにもキャッシュにも参照されていないサムネイルファイルを削除する。
+
+    取り込み中のファイルを消さないよう、`min_age_seconds` より新しいファイルは残す。
+    戻り値は削除した（dry_run の場合は削除対象の）ファイル数。
+    """
+    if not THUMBNAIL_DIR.exists():
+        return 0
+
+    referenced = set()
+    for sql in (
+        "SELECT thumbnail_url FROM documents WHERE thumbnail_url IS NOT NULL",
+        "SELECT thumbnail_path FROM thumbnail_cache WHERE thumbnail_path IS NOT NULL",
+    ):
+        try:
+            referenced.update(os.path.basename(r[0]) for r in db.execute(text(sql)).fetchall() if r[0])
+        except Exception:
+            logger.exception("Failed to collect referenced thumbnails; skipping cleanup")
+            db.rollback()
+            return 0
+
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    for path in THUMBNAIL_DIR.iterdir():
+        if not path.is_file() or path.name in referenced:
+            continue
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+            if not dry_run:
+                path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            continue
+        except Exception:
+            logger.debug("Failed to remove orphaned thumbnail %s", path, exc_info=True)
+    if removed:
+        logger.info("%s %d orphaned thumbnails", "Found" if dry_run else "Removed", removed)
+    return removed
+
+
+__all__ = [
+    "get_thumbnail_for_url",
+    "store_thumbnail_image",
+    "cleanup_orphaned_thumbnails",
+]
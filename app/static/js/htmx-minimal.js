@@ -221,6 +221,64 @@ function initHxBindings() {
         });
     });
 
+    // hx-trigger="revealed": load when the element scrolls into view (infinite scroll sentinels)
+    const hxRevealedElems = document.querySelectorAll('[hx-get][hx-trigger="revealed"]');
+    hxRevealedElems.forEach(elem => {
+        if (elem._hxRevealedBound || typeof IntersectionObserver === 'undefined') return;
+        elem._hxRevealedBound = true;
+        const observer = new IntersectionObserver(entries => {
+            if (!entries.some(entry => entry.isIntersecting)) return;
+            observer.disconnect();
+            const url = elem.getAttribute('hx-get');
+            const hxSwap = elem.getAttribute('hx-swap') || 'outerHTML';
+
+            fetch(url, {
+                headers: {
+                    'HX-Request': 'true'
+                }
+            })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                }
+                return response.text();
+            })
+            .then(html => {
+                const parent = elem.parentElement;
+                if (hxSwap === 'outerHTML') {
+                    elem.outerHTML = html;
+                } else {
+                    elem.innerHTML = html;
+                }
+
+                const afterSwapEvent = new CustomEvent('htmx:afterSwap', {
+                    detail: {
+                        target: parent,
+                        xhr: null
+                    }
+                });
+                document.body.dispatchEvent(afterSwapEvent);
+
+                if (window.lucide) {
+                    window.lucide.createIcons();
+                } else if (window.createIcons) {
+                    window.createIcons();
+                }
+
+                initHxBindings();
+            })
+            .catch(error => {
+                console.error('hx-get (revealed) error:', error);
+                // The observer was disconnected before the request; watch the element again
+                // so the next scroll retries (after a pause, since it may still be in view)
+                setTimeout(() => {
+                    if (elem.isConnected) observer.observe(elem);
+                }, 2000);
+            });
+        }, { rootMargin: '200px' });
+        observer.observe(elem);
+    });
+
     // Attach click handlers for hx-post on non-form elements (buttons/links)
     const hxPostElems = document.querySelectorAll('[hx-post]');
     hxPostElems.forEach(elem => {
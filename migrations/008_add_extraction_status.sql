@@ -0,0 +1,9 @@
+-- Add extraction_status to documents
+-- "preview" marks PDFs ingested with a quick pdfminer sample whose full
+-- Docling extraction is still pending as a postprocess step; "full" marks
+-- documents whose PDF body has been (re-)extracted page-parallel.
+-- NULL means the document was extracted in one pass at ingest time.
+
+ALTER TABLE documents ADD COLUMN extraction_status TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_documents_extraction_status ON documents(extraction_status) WHERE extraction_status IS NOT NULL;
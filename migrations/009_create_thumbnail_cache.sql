@@ -0,0 +1,15 @@
+-- Cache of favicon / og:image lookups used for document thumbnails.
+-- cache_key is "domain:<netloc>" for site icons and "url:<article url>" for
+-- page-specific images. thumbnail_path points at a content-addressed file
+-- (assets/thumbnails/thumb_<sha256>.png); NULL marks a negative entry that
+-- is retried after expires_at.
+
+CREATE TABLE IF NOT EXISTS thumbnail_cache (
+    cache_key TEXT PRIMARY KEY,
+    source_url TEXT,
+    thumbnail_path TEXT,
+    fetched_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS idx_thumbnail_cache_path ON thumbnail_cache(thumbnail_path) WHERE thumbnail_path IS NOT NULL;
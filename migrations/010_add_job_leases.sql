@@ -0,0 +1,11 @@
+-- Lease columns for multi-worker job queues.
+-- Workers claim a job with a single conditional UPDATE that sets
+-- status='in_progress', lease_owner (host:pid:thread) and lease_expires_at.
+
+ALTER TABLE postprocess_jobs ADD COLUMN lease_owner TEXT;
+ALTER TABLE postprocess_jobs ADD COLUMN lease_expires_at DATETIME;
+ALTER TABLE preference_jobs ADD COLUMN lease_owner TEXT;
+ALTER TABLE preference_jobs ADD COLUMN lease_expires_at DATETIME;
+
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_status_created ON postprocess_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_preference_jobs_status_next_attempt ON preference_jobs(status, next_attempt_at);
@@ -0,0 +1,8 @@
+-- Stage jobs for postprocessing.
+-- Each document gets one job row per stage (extract -> summary / embedding /
+-- classification) so that a failed stage is retried on its own.
+-- Rows with stage NULL are legacy jobs that run the whole pipeline.
+
+ALTER TABLE postprocess_jobs ADD COLUMN stage TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_document_stage ON postprocess_jobs(document_id, stage);
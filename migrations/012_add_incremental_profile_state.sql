@@ -0,0 +1,10 @@
+-- Incremental preference profile state.
+-- Bookmark events update these running (optionally time-decayed) sums in
+-- place; profile_embedding / category_weights / domain_weights are derived
+-- from them. A NULL embedding_sum means the profile needs a full recompute.
+
+ALTER TABLE preference_profiles ADD COLUMN embedding_sum TEXT;
+ALTER TABLE preference_profiles ADD COLUMN embedding_weight REAL;
+ALTER TABLE preference_profiles ADD COLUMN category_counts TEXT;
+ALTER TABLE preference_profiles ADD COLUMN domain_counts TEXT;
+ALTER TABLE preference_profiles ADD COLUMN decay_reference_at DATETIME;
@@ -0,0 +1,8 @@
+-- Snapshot of the preference profile used for the last full rescore.
+-- The personalization worker compares the current profile against it and
+-- rescores every recent document only when the profile drifted beyond
+-- PERSONALIZATION_RESCORE_THRESHOLD; otherwise it scores just the job's
+-- target documents and merges them into the existing ranking.
+
+ALTER TABLE preference_profiles ADD COLUMN scored_snapshot TEXT;
+ALTER TABLE preference_profiles ADD COLUMN scored_at DATETIME;
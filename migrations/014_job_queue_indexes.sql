@@ -0,0 +1,20 @@
+-- Partial indexes matching the job queue queries.
+-- Most queue rows are `done`, so the lease / reclaim / retention queries only
+-- index the rows they actually look at. The old status-only indexes remain
+-- for ad-hoc filtering on the admin pages.
+
+-- postprocess_jobs: lease ORDER BY created_at, id; next due job; expired leases; retention
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_created ON postprocess_jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_pending_created ON postprocess_jobs(created_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_pending_next_attempt ON postprocess_jobs(next_attempt_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_in_progress_lease ON postprocess_jobs(lease_expires_at) WHERE status = 'in_progress';
+CREATE INDEX IF NOT EXISTS idx_postprocess_jobs_done_updated ON postprocess_jobs(updated_at) WHERE status = 'done';
+
+-- preference_jobs: lease ORDER BY next_attempt_at, scheduled_at, created_at; coalescing; expired leases; retention
+CREATE INDEX IF NOT EXISTS idx_preference_jobs_pending_order ON preference_jobs(next_attempt_at, scheduled_at, created_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_preference_jobs_pending_user_type ON preference_jobs(user_id, job_type) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_preference_jobs_in_progress_lease ON preference_jobs(lease_expires_at) WHERE status = 'in_progress';
+CREATE INDEX IF NOT EXISTS idx_preference_jobs_done_updated ON preference_jobs(updated_at) WHERE status = 'done';
+
+ANALYZE postprocess_jobs;
+ANALYZE preference_jobs;
@@ -0,0 +1,8 @@
+-- List views read a short preview instead of the full document body.
+-- content_preview holds the first 301 characters of content_text (one extra
+-- character so templates can tell whether the text continues). The ORM keeps
+-- it in sync whenever content_text is set; raw INSERTs must fill it too.
+-- Existing rows are filled in batches by the `content_preview` backfill
+-- (app.services.backfills), not here.
+
+ALTER TABLE documents ADD COLUMN content_preview TEXT;
@@ -0,0 +1,11 @@
+-- Store the Markdown body compressed (zlib, or zstd when zstandard is installed).
+-- content_md_z holds the compressed body; content_md keeps plain text only for
+-- bodies that were not compressed (short bodies, CONTENT_COMPRESSION=none and
+-- rows written before this migration) and is '' when content_md_z is set.
+-- content_text stays plain because keyword search runs LIKE against it.
+--
+-- SQLite cannot compress in SQL, so existing rows are converted afterwards by
+-- the compress_content_md backfill (app.services.backfills); until then they
+-- are read from the plain column as before.
+
+ALTER TABLE documents ADD COLUMN content_md_z BLOB;
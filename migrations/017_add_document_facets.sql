@@ -0,0 +1,17 @@
+-- Denormalize the latest classification for index-backed filtering.
+-- documents.primary_category holds the category of the most recent
+-- classification and document_tags holds its tags, one row per tag. The ORM
+-- keeps both in sync whenever a classification row is written; existing
+-- documents are filled in batches by the `document_facets` backfill
+-- (app.services.backfills), not here.
+
+ALTER TABLE documents ADD COLUMN primary_category TEXT;
+CREATE INDEX IF NOT EXISTS ix_documents_primary_category ON documents (primary_category);
+CREATE INDEX IF NOT EXISTS ix_classifications_document_id ON classifications (document_id);
+
+CREATE TABLE IF NOT EXISTS document_tags (
+    document_id VARCHAR NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+    tag VARCHAR NOT NULL,
+    PRIMARY KEY (document_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_document_tags_tag ON document_tags (tag, document_id);
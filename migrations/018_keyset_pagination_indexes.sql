@@ -0,0 +1,10 @@
+-- Keyset (cursor) pagination for the document and bookmark lists.
+-- Pages are ordered by (created_at DESC, id DESC) and continue after the last
+-- row of the previous page, so each page is a range scan on these indexes
+-- instead of an OFFSET over every earlier row.
+
+CREATE INDEX IF NOT EXISTS idx_documents_created_id ON documents (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_bookmarks_user_created_id ON bookmarks (user_id, created_at, id);
+
+ANALYZE documents;
+ANALYZE bookmarks;
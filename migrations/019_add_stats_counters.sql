@@ -0,0 +1,28 @@
+-- Materialized counters for the dashboard and /api/stats.
+-- The ORM increments/decrements these rows whenever documents, collections or
+-- a document's latest category change; a periodic job recounts them from the
+-- real tables. Keys: documents, collections, documents:YYYY-MM-DD (UTC
+-- registration day) and category:<name>. This migration seeds them from the
+-- existing rows (the app also seeds an empty table on startup).
+
+CREATE TABLE IF NOT EXISTS stats_counters (
+    key VARCHAR NOT NULL PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME
+);
+
+DELETE FROM stats_counters;
+
+INSERT INTO stats_counters (key, value, updated_at)
+SELECT 'documents', COUNT(*), CURRENT_TIMESTAMP FROM documents;
+
+INSERT INTO stats_counters (key, value, updated_at)
+SELECT 'collections', COUNT(*), CURRENT_TIMESTAMP FROM collections;
+
+INSERT INTO stats_counters (key, value, updated_at)
+SELECT 'documents:' || date(created_at), COUNT(*), CURRENT_TIMESTAMP
+FROM documents WHERE created_at IS NOT NULL GROUP BY date(created_at);
+
+INSERT INTO stats_counters (key, value, updated_at)
+SELECT 'category:' || primary_category, COUNT(*), CURRENT_TIMESTAMP
+FROM documents WHERE primary_category IS NOT NULL GROUP BY primary_category;
@@ -0,0 +1,7 @@
+-- What each bookmark added to its user's incremental preference profile.
+-- JSON {"vector": bool, "category": str|null, "domain": str|null}; removing the
+-- bookmark subtracts exactly this. "{}" means the bookmark contributed nothing
+-- (outside the rebuild cap); NULL means unknown, so removal marks the profile
+-- for a full recompute instead of guessing.
+
+ALTER TABLE bookmarks ADD COLUMN profile_contribution TEXT;
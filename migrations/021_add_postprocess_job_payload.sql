@@ -0,0 +1,4 @@
+-- Per-job stage options as JSON, e.g. {"force": true} on a summary job to
+-- regenerate a summary that already exists. NULL means no options.
+
+ALTER TABLE postprocess_jobs ADD COLUMN payload TEXT;
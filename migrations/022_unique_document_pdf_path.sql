@@ -0,0 +1,7 @@
+-- Uploaded PDFs are stored under their SHA-256 (assets/pdfs/uploads/<hash>.pdf),
+-- so one path is one document. The unique index lets concurrent uploads of the
+-- same file race safely: the loser's INSERT fails and it returns the winner's
+-- document. NULL pdf_path (non-PDF documents) is not constrained. Databases
+-- that already hold duplicate paths must merge them before applying this.
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_documents_pdf_path ON documents (pdf_path);
@@ -0,0 +1,15 @@
+-- PostgreSQL: tables that exist only in the SQLite migrations.
+-- Everything else is created from the models (create_all / create_tables);
+-- `sources` has no model and is read and written with plain SQL, so it is
+-- created here with the same columns as migrations/003. `enabled` stays an
+-- integer so the existing `enabled=1` queries work unchanged.
+
+CREATE TABLE IF NOT EXISTS sources (
+  id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  name TEXT NOT NULL,
+  type TEXT NOT NULL,
+  config TEXT,
+  enabled INTEGER NOT NULL DEFAULT 1,
+  cron_schedule TEXT,
+  last_fetched_at TIMESTAMP
+);
@@ -0,0 +1,11 @@
+-- PostgreSQL: index the substring half of the document search.
+-- app.services.document_search matches `content_text ILIKE '%q%'` next to the
+-- tsvector query; text search configurations do not split Japanese text, so
+-- the substring match is what finds CJK terms. pg_trgm makes it an index scan
+-- for terms of three or more characters. pg_trgm is a trusted extension
+-- (PostgreSQL 13+), so the database owner can create it.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_documents_content_trgm
+    ON documents USING gin (content_text gin_trgm_ops);
@@ -0,0 +1,4 @@
+-- PostgreSQL: same column as migrations/020 for databases created before the
+-- model had it (create_all does not add columns to existing tables).
+
+ALTER TABLE bookmarks ADD COLUMN IF NOT EXISTS profile_contribution TEXT;
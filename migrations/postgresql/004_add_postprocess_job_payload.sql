@@ -0,0 +1,4 @@
+-- PostgreSQL: same column as migrations/021 for databases created before the
+-- model had it (create_all does not add columns to existing tables).
+
+ALTER TABLE postprocess_jobs ADD COLUMN IF NOT EXISTS payload TEXT;
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Report the compression ratio and decode latency of stored document bodies.
+
+Usage:
+  PYTHONPATH=. python scripts/benchmark_content_compression.py                          # synthetic corpus
+  PYTHONPATH=. python scripts/benchmark_content_compression.py --db ./data/scraps.db --limit 500
+
+With --db the bodies are sampled from `documents` (compressed rows are expanded
+first); otherwise a synthetic corpus built from the repository's Markdown docs
+is used. Every available codec (zlib, and zstd when zstandard is installed) is
+measured at its default level: total size, ratio, and the median / p95 time to
+expand one body, which is what the detail, reader and export paths pay.
+"""
+import argparse
+import glob
+import sqlite3
+import statistics
+import time
+import zlib
+
+from app.core import content_codec
+
+
+def load_bodies(db_path, limit):
+    if not db_path:
+        docs = [open(p, encoding="utf-8").read() for p in sorted(glob.glob("docs/*.md")) + ["README.md"]]
+        return [doc for doc in docs if doc.strip()] * max(1, limit // max(len(docs), 1))
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(documents)")]
+        select_z = "content_md_z" if "content_md_z" in columns else "NULL"
+        rows = conn.execute(
+            f"SELECT content_md, {select_z} FROM documents ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [content_codec.decompress_body(blob) if blob is not None else (md or "") for md, blob in rows]
+
+
+def compressor(codec):
+    if codec == "zstd":
+        return content_codec._zstd.ZstdCompressor(level=3).compress
+    return lambda raw: zlib.compress(raw, 6)
+
+
+def measure(codec, bodies):
+    compress = compressor(codec)
+    raw = [body.encode("utf-8") for body in bodies]
+    blobs = [compress(data) for data in raw]
+    timings = []
+    for blob in blobs:
+        start = time.perf_counter()
+        content_codec.decompress_body(blob)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    before, after = sum(map(len, raw)), sum(map(len, blobs))
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{codec:<5} {before / 1024:>10,.0f} KiB -> {after / 1024:>9,.0f} KiB  "
+        f"ratio {before / after:5.2f}x  decode median {statistics.median(timings):.3f} ms  p95 {p95:.3f} ms"
+    )
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", default=None, help="SQLite DB to sample bodies from (default: synthetic corpus)")
+    p.add_argument("--limit", type=int, default=500)
+    args = p.parse_args()
+
+    bodies = [body for body in load_bodies(args.db, args.limit) if len(body.encode("utf-8")) >= content_codec.MIN_COMPRESS_BYTES]
+    if not bodies:
+        print("No bodies to measure.")
+        return
+    print(f"{len(bodies)} bodies, median {statistics.median(len(b) for b in bodies):,.0f} chars")
+    for codec in ("zlib", "zstd"):
+        if codec == "zstd" and not content_codec.ZSTD_AVAILABLE:
+            print("zstd  skipped (pip install zstandard)")
+            continue
+        measure(codec, bodies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Measure requests/sec of a trivial DB-backed endpoint with each get_db variant.
+
+Usage:
+  PYTHONPATH=. python scripts/benchmark_get_db.py                  # temp SQLite DB, 2000 requests
+  PYTHONPATH=. python scripts/benchmark_get_db.py --requests 5000 --db-url sqlite:///./data/scraps.db
+
+"legacy" reproduces the previous `get_db` (registry lookup, a raw connection
+probing `sqlite_master`, then `Base.metadata.create_all()` on every request),
+"test-hook" is `get_db` with `enable_test_db_hook()` (what the test suite
+uses) and "cached" is the production `get_db`, which only opens a session.
+Each variant serves `GET /ping`, which runs `SELECT 1` through the session.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import database
+
+
+def legacy_get_db():
+    factory = database.get_sessionmaker(database.current_db_url())
+    bound_engine = factory.kw["bind"]
+    conn = bound_engine.connect()
+    try:
+        conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='documents'")).fetchall()
+    except Exception:
+        pass
+    finally:
+        conn.close()
+    database.Base.metadata.create_all(bind=bound_engine)
+    db = factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping(db: Session = Depends(database.get_db)):
+        return {"ok": db.execute(text("SELECT 1")).scalar()}
+
+    return app
+
+
+def run(label: str, client: TestClient, requests: int) -> float:
+    for _ in range(min(50, requests)):
+        client.get("/ping")
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get("/ping")
+    elapsed = time.perf_counter() - start
+    rps = requests / elapsed
+    print(f"{label:<10} {requests} requests in {elapsed:.2f}s -> {rps:,.0f} req/s ({elapsed / requests * 1000:.2f} ms/req)")
+    return rps
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--db-url", default=None, help="DB to benchmark against (default: a temporary SQLite file)")
+    args = p.parse_args()
+
+    db_url = args.db_url
+    if db_url is None:
+        db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ["DB_URL"] = db_url
+    database.create_tables()
+
+    app = build_app()
+    results = {}
+    with TestClient(app) as client:
+        app.dependency_overrides[database.get_db] = legacy_get_db
+        results["legacy"] = run("legacy", client, args.requests)
+        app.dependency_overrides.clear()
+
+        database.enable_test_db_hook()
+        results["test-hook"] = run("test-hook", client, args.requests)
+        database.enable_test_db_hook(False)
+
+        results["cached"] = run("cached", client, args.requests)
+
+    print(f"cached vs legacy: {results['cached'] / results['legacy']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare cold vs warm Docling conversion times on sample PDFs.
+
+Usage:
+  PYTHONPATH=. python scripts/benchmark_pdf_converter.py                 # data/assets/pdfs/**/*.pdf
+  PYTHONPATH=. python scripts/benchmark_pdf_converter.py a.pdf b.pdf --runs 3
+
+"cold" rebuilds the DocumentConverter for every file (the previous behaviour of
+`extract_from_pdf`), "warm" reuses the shared converter returned by
+`get_docling_converter()` after `warm_up_pdf_converter()` has run once.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+from app.core.config import settings
+from app.services import extractor
+
+
+def _time_conversion(file_path: str) -> float:
+    start = time.perf_counter()
+    extractor._convert_with_docling(file_path)
+    return time.perf_counter() - start
+
+
+def bench_cold(files, runs: int):
+    timings = []
+    for _ in range(runs):
+        for path in files:
+            extractor.reset_docling_converter()
+            timings.append(_time_conversion(path))
+    return timings
+
+
+def bench_warm(files, runs: int):
+    extractor.reset_docling_converter()
+    start = time.perf_counter()
+    extractor.warm_up_pdf_converter()
+    warmup = time.perf_counter() - start
+    timings = []
+    for _ in range(runs):
+        for path in files:
+            timings.append(_time_conversion(path))
+    return warmup, timings
+
+
+def _summary(label: str, timings):
+    print(
+        f"{label:<6} n={len(timings):<3} mean={statistics.mean(timings):.3f}s "
+        f"median={statistics.median(timings):.3f}s min={min(timings):.3f}s max={max(timings):.3f}s"
+    )
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("files", nargs="*", help="PDF files to convert (default: data/assets/pdfs/**/*.pdf)")
+    p.add_argument("--runs", type=int, default=1, help="Number of passes over the file list")
+    args = p.parse_args()
+
+    if not extractor.DOCLING_AVAILABLE:
+        print("Docling is not installed; nothing to benchmark.")
+        return 1
+
+    files = args.files or sorted(glob.glob(os.path.join("data", "assets", "pdfs", "**", "*.pdf"), recursive=True))
+    if not files:
+        print("No PDF files found. Pass file paths or place samples under data/assets/pdfs/.")
+        return 1
+
+    print(f"Files: {len(files)}  runs: {args.runs}  ocr={settings.pdf_ocr_enabled} table_structure={settings.pdf_table_structure}")
+
+    cold = bench_cold(files, args.runs)
+    warmup, warm = bench_warm(files, args.runs)
+
+    _summary("cold", cold)
+    _summary("warm", warm)
+    print(f"warm-up (one-off model load): {warmup:.3f}s")
+    if statistics.mean(warm) > 0:
+        print(f"speedup (cold mean / warm mean): {statistics.mean(cold) / statistics.mean(warm):.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,10 +3,14 @@
 This script queries all document IDs and enqueues jobs in batches using
 app.services.personalization_queue.enqueue_profile_update.
 
-Usage: PYTHONPATH=. python scripts/enqueue_guest_profile_rebuild.py
+Usage: PYTHONPATH=. python scripts/enqueue_guest_profile_rebuild.py [--full]
+
+--full marks the first job as a full profile recompute (profiles are
+otherwise updated incrementally from bookmark events).
 """
 from __future__ import annotations
 
+import argparse
 from math import ceil
 from typing import List
 
@@ -27,6 +31,10 @@ def chunk_list(lst, n):
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full", action="store_true", help="recompute the profile from all bookmarks")
+    args = parser.parse_args()
+
     session = SessionLocal()
     try:
         doc_ids = get_all_document_ids(session)
@@ -40,7 +48,9 @@ def main():
         created = 0
         for i, batch in enumerate(batches, start=1):
             payload = {"document_ids": batch}
-            job_id = personalization_queue.enqueue_profile_update(session, user_id=user, payload=payload)
+            if args.full and i == 1:
+                payload["full_rebuild"] = True
+            job_id = personalization_queue.enqueue_profile_update(session, user_id=user, payload=payload, coalesce=False)
             print(f"  enqueued job {job_id} ({i}/{len(batches)}) docs={len(batch)}")
             created += 1
         print(f"Done: enqueued {created} jobs for user={user}")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Re-extract the body of documents from their stored PDFs (page-parallel).
+
+Backfilled SpeakerDeck documents only carry the slide page text scraped from
+HTML; once `backfill_speakerdeck_pdfs.py` has downloaded their PDFs, this
+script replaces `content_md` / `content_text` with the full PDF extraction.
+
+Usage:
+  PYTHONPATH=. python scripts/extract_pdf_content.py                 # dry-run, list candidates
+  PYTHONPATH=. python scripts/extract_pdf_content.py --apply         # extract and update DB
+  PYTHONPATH=. python scripts/extract_pdf_content.py --apply --domain speakerdeck --limit 20
+
+Documents already marked `extraction_status = 'full'` are skipped.
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from sqlalchemy import text
+
+from app.core.content_codec import encode_content_md
+from app.core.database import SessionLocal, build_content_preview
+from app.services.pdf_pipeline import extract_pdf, shutdown_pdf_pool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("extract_pdf_content")
+
+
+def find_candidates(session, domain: str, limit: int):
+    sql = text("""
+    SELECT id, title, pdf_path FROM documents
+    WHERE pdf_path IS NOT NULL AND trim(pdf_path) != ''
+      AND (extraction_status IS NULL OR extraction_status != 'full')
+      AND (:domain = '' OR domain LIKE :domain_like)
+    ORDER BY created_at DESC
+    LIMIT :limit
+    """)
+    return session.execute(
+        sql, {"domain": domain, "domain_like": f"%{domain}%", "limit": limit}
+    ).fetchall()
+
+
+async def _extract_all(rows):
+    results = []
+    for doc_id, title, pdf_path in rows:
+        file_path = os.path.join("data", pdf_path)
+        if not os.path.exists(file_path):
+            logger.warning(f"  PDF file missing for {doc_id}: {file_path}")
+            continue
+        logger.info(f"Extracting {doc_id} - {title}")
+        extracted = await extract_pdf(file_path, title or os.path.basename(file_path))
+        if not extracted:
+            logger.warning(f"  extraction failed for {doc_id}")
+            continue
+        results.append((doc_id, extracted))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apply", action="store_true", help="Actually extract PDFs and update DB")
+    parser.add_argument("--domain", default="speakerdeck", help="Restrict to documents whose domain contains this (empty for all)")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum number of documents to process")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        rows = find_candidates(session, args.domain, args.limit)
+        if not rows:
+            logger.info("No documents with stored PDFs pending extraction.")
+            return
+
+        logger.info(f"Found {len(rows)} documents with stored PDFs.")
+        if not args.apply:
+            logger.info("Dry-run mode: pass --apply to extract PDFs and update the database.")
+            for doc_id, title, pdf_path in rows:
+                print(f"{doc_id}\t{title}\t{pdf_path}")
+            return
+
+        results = asyncio.run(_extract_all(rows))
+        for doc_id, extracted in results:
+            content_md, content_md_z = encode_content_md(extracted["content_md"])
+            session.execute(
+                text("""
+                UPDATE documents
+                SET content_md = :content_md, content_md_z = :content_md_z, content_text = :content_text,
+                    content_preview = :content_preview, extraction_status = 'full', updated_at = CURRENT_TIMESTAMP
+                WHERE id = :id
+                """),
+                {
+                    "id": doc_id,
+                    "content_md": content_md,
+                    "content_md_z": content_md_z,
+                    "content_text": extracted["content_text"],
+                    "content_preview": build_content_preview(extracted["content_text"]),
+                },
+            )
+            session.commit()
+            logger.info(f"  updated {doc_id}")
+        logger.info(f"Updated {len(results)} of {len(rows)} documents.")
+    finally:
+        session.close()
+        shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    main()
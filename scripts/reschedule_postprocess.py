@@ -3,16 +3,19 @@
 
 Usage:
   python scripts/reschedule_postprocess.py --dry-run --limit 10
+  python scripts/reschedule_postprocess.py --regenerate-summary DOC_ID [DOC_ID ...]
 
 By default the script lists affected document IDs. Without `--dry-run` it will
 create rows in the `postprocess_jobs` table using the project's enqueue helper.
+`--regenerate-summary` enqueues a forced summary job for the given documents,
+replacing summaries that already exist.
 """
 import argparse
 import logging
 from typing import List
 
 from app.core.database import SessionLocal, Document, Classification
-from app.services.postprocess_queue import enqueue_job_for_document
+from app.services.postprocess_queue import enqueue_job_for_document, enqueue_summary_regeneration
 
 
 logger = logging.getLogger("reschedule")
@@ -44,10 +47,20 @@ def main():
     p.add_argument("--dry-run", action="store_true", help="Only show what would be enqueued")
     p.add_argument("--only-summaries", action="store_true", help="Target only documents missing summaries")
     p.add_argument("--only-classifications", action="store_true", help="Target only documents missing classifications")
+    p.add_argument("--regenerate-summary", nargs="+", metavar="DOC_ID", help="Regenerate the summary of these documents")
     args = p.parse_args()
 
     db = SessionLocal()
     try:
+        if args.regenerate_summary:
+            for doc_id in args.regenerate_summary:
+                if args.dry_run:
+                    print(f"Would enqueue summary regeneration for {doc_id}")
+                    continue
+                job_id = enqueue_summary_regeneration(db, doc_id)
+                print(f"Enqueued summary regeneration {job_id} for document {doc_id}")
+            return
+
         ids = find_missing(db, only_summaries=args.only_summaries, only_classifications=args.only_classifications)
         total = len(ids)
         if args.limit and args.limit > 0:
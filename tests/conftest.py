@@ -0,0 +1,50 @@
+"""Shared pytest setup.
+
+Many tests switch ``DB_URL`` at runtime and then hit the app without
+overriding ``get_db``. Production ``get_db`` only hands out sessions from the
+startup-bound ``SessionLocal``, so the test hook re-resolves the engine for
+the current URL on each request and creates the schema once per URL.
+
+``count_queries`` records the SQL statements an engine executes so tests can
+assert that a request runs a bounded number of queries (no N+1 lazy loads).
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.core.database import enable_test_db_hook
+
+enable_test_db_hook()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def selects(self):
+        return [s for s in self.statements if s.lstrip().upper().startswith("SELECT")]
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture()
+def count_queries():
+    """``with count_queries(engine) as counter:`` collects the statements run inside the block."""
+
+    @contextmanager
+    def _count(engine):
+        counter = QueryCounter()
+        event.listen(engine, "before_cursor_execute", counter)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, "before_cursor_execute", counter)
+
+    return _count
@@ -0,0 +1,56 @@
+"""Tests for the shared background event loop runner."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import async_runner
+
+
+def test_submit_runs_on_one_persistent_loop():
+    async def current_loop():
+        return asyncio.get_running_loop(), threading.current_thread().name
+
+    first_loop, thread_name = async_runner.submit(current_loop()).result(timeout=5)
+    second_loop, _ = async_runner.submit(current_loop()).result(timeout=5)
+
+    assert first_loop is second_loop
+    assert thread_name == async_runner.get_runner().name
+
+
+def test_run_sync_from_worker_threads_and_exception_propagation():
+    async def double(x):
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda x: async_runner.run_sync(lambda: double(x)), range(8)))
+    assert results == [x * 2 for x in range(8)]
+
+    async def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        async_runner.run_sync(boom())
+
+
+def test_run_sync_rejects_calls_from_the_runner_thread():
+    async def nested():
+        return async_runner.run_sync(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        async_runner.submit(nested()).result(timeout=5)
+
+
+def test_loop_http_client_is_reused_between_calls():
+    async def get_client():
+        return async_runner.get_loop_http_client("test")
+
+    first = async_runner.run_sync(get_client)
+    second = async_runner.run_sync(get_client)
+    assert first is second
+    assert not first.is_closed
+
+    async_runner.run_sync(async_runner.close_loop_http_clients)
+    assert first.is_closed
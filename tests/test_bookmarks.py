@@ -59,8 +59,10 @@ def test_bookmark_flow(test_database_override):
 
     with TestingSessionLocal() as verify2:
         jobs_after_delete = verify2.query(PreferenceJob).order_by(PreferenceJob.created_at.asc()).all()
-        assert len(jobs_after_delete) == 2
+        # 未処理の再計算ジョブがあれば新規ジョブは作らずにまとめられる
+        assert len(jobs_after_delete) == 1
         assert jobs_after_delete[-1].document_id == doc_id
+        assert json.loads(jobs_after_delete[-1].payload)["coalesced"] == 1
 
     # Ensure deleted
     resp4 = client.get("/api/bookmarks")
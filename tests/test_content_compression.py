@@ -0,0 +1,131 @@
+"""content_md is stored compressed and expanded only when the body is read."""
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core import content_codec
+from app.core.config import settings
+from app.core.database import Base, Document, defer_document_bodies
+from app.services.ingest_worker import _insert_document_if_new
+
+BODY = "# 見出し\n\n" + "同じ段落が何度も続く長い記事の本文です。" * 400
+
+
+@pytest.fixture()
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bodies.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _document(body):
+    return Document(
+        id=str(uuid.uuid4()),
+        url=f"https://example.com/{uuid.uuid4()}",
+        title="t",
+        content_md=body,
+        content_text=body,
+        hash=str(uuid.uuid4()),
+    )
+
+
+def test_long_bodies_are_compressed_and_round_trip(factory):
+    with factory() as db:
+        doc = _document(BODY)
+        db.add(doc)
+        db.commit()
+        doc_id = doc.id
+
+    with factory() as db:
+        raw_md, blob = db.execute(text("SELECT content_md, content_md_z FROM documents WHERE id = :id"), {"id": doc_id}).one()
+        assert raw_md == ""
+        assert blob is not None and len(blob) * 10 < len(BODY.encode("utf-8"))
+        assert db.get(Document, doc_id).content_md == BODY
+
+
+def test_short_and_legacy_bodies_stay_plain(factory):
+    with factory() as db:
+        doc = _document("短い本文")
+        db.add(doc)
+        db.commit()
+        assert doc.content_md_z is None
+        # マイグレーション前の行（平文の content_md のみ）もそのまま読める
+        db.execute(
+            text(
+                "INSERT INTO documents (id, title, content_md, content_text, hash) "
+                "VALUES ('legacy', 't', :body, :body, 'legacy')"
+            ),
+            {"body": BODY},
+        )
+        db.commit()
+        assert db.get(Document, "legacy").content_md == BODY
+
+
+def test_compression_can_be_disabled(factory, monkeypatch):
+    monkeypatch.setattr(settings, "content_compression", "none")
+    with factory() as db:
+        doc = _document(BODY)
+        db.add(doc)
+        db.commit()
+        assert doc.content_md_z is None
+        assert doc.content_md == BODY
+
+
+def test_zstd_falls_back_to_zlib_when_unavailable(monkeypatch):
+    monkeypatch.setattr(settings, "content_compression", "zstd")
+    monkeypatch.setattr(content_codec, "ZSTD_AVAILABLE", False)
+    assert content_codec.active_codec() == "zlib"
+    blob = content_codec.compress_body(BODY)
+    assert content_codec.decompress_body(blob) == BODY
+
+
+def test_raw_ingest_insert_compresses_body(factory, monkeypatch):
+    monkeypatch.setattr("app.services.ingest_worker.enqueue_job_for_document", lambda db, doc_id: None)
+    monkeypatch.setattr("app.services.ingest_worker.schedule_document_scoring", lambda db, **kw: None)
+    with factory() as db:
+        doc_id = _insert_document_if_new(
+            db,
+            {"url": "https://example.com/feed-item", "title": "t", "content_md": BODY, "content_text": BODY, "hash": "h"},
+            "test-source",
+        )
+        assert doc_id
+        doc = db.get(Document, doc_id)
+        assert doc.content_md_z is not None
+        assert doc.content_md == BODY
+
+
+def test_deferred_load_expands_on_first_access(factory):
+    with factory() as db:
+        db.add(_document(BODY))
+        db.commit()
+    with factory() as db:
+        doc = db.query(Document).options(*defer_document_bodies()).one()
+        assert "content_md_z" not in doc.__dict__
+        assert doc.content_md == BODY
+
+
+def test_backfill_compresses_existing_rows(factory):
+    from app.services import backfills
+
+    with factory() as db:
+        db.execute(
+            text(
+                "INSERT INTO documents (id, title, content_md, content_text, hash) "
+                "VALUES ('old', 't', :body, :body, 'old'), ('tiny', 't', 'x', 'x', 'tiny')"
+            ),
+            {"body": BODY},
+        )
+        db.commit()
+        engine = db.get_bind()
+
+    assert backfills.run_backfill(engine, "compress_content_md", batch_size=1, throttle_seconds=0) == "done"
+
+    with engine.connect() as connection:
+        rows = dict(connection.execute(text("SELECT id, content_md_z IS NOT NULL FROM documents")).all())
+    # 短すぎる本文は縮まないので平文のまま残す
+    assert rows == {"old": 1, "tiny": 0}
+    with factory() as db:
+        assert db.get(Document, "old").content_md == BODY
+        assert db.get(Document, "tiny").content_md == "x"
@@ -0,0 +1,87 @@
+"""List views read content_preview instead of the full document body."""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, Bookmark, Document, CONTENT_PREVIEW_CHARS, get_db
+
+
+@pytest.fixture()
+def setup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'preview.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    from app.main import app as _app
+
+    _app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(_app) as client:
+            event.listen(engine, "before_cursor_execute", _record)
+            yield client, factory, statements
+            event.remove(engine, "before_cursor_execute", _record)
+    finally:
+        _app.dependency_overrides.pop(get_db, None)
+
+
+def _add_document(db, body):
+    doc = Document(
+        id=str(uuid.uuid4()),
+        url=f"https://example.com/{uuid.uuid4()}",
+        domain="example.com",
+        title="長い記事",
+        content_md=body,
+        content_text=body,
+        hash=str(uuid.uuid4()),
+    )
+    db.add(doc)
+    db.commit()
+    return doc
+
+
+def test_preview_follows_content_text():
+    doc = Document(title="t", content_md="x", content_text="a" * 1000, hash="h")
+    assert len(doc.content_preview) == CONTENT_PREVIEW_CHARS + 1
+    assert doc.preview_text(200) == "a" * 200 + "..."
+
+    doc.content_text = "short"
+    assert doc.content_preview == "short"
+    assert doc.preview_text(200) == "short"
+
+
+def test_list_paths_do_not_select_document_bodies(setup):
+    client, factory, statements = setup
+    body = "本文" * 50_000
+    with factory() as db:
+        for _ in range(3):
+            doc = _add_document(db, body)
+        db.add(Bookmark(user_id="guest", document_id=doc.id))
+        db.commit()
+    statements.clear()
+
+    listing = client.get("/api/documents?limit=50")
+    assert listing.status_code == 200
+    assert listing.json()["documents"][0]["content_preview"] == body[:200] + "..."
+    assert len(listing.content) < 10_000
+
+    for path in ("/", "/documents", "/bookmarks"):
+        assert client.get(path).status_code == 200
+
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert selects
+    assert not [s for s in selects if any(f"{col} AS" in s for col in ("content_text", "content_md", "content_md_z"))]
@@ -0,0 +1,163 @@
+"""documents.primary_category / document_tags mirror the latest classification."""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import (
+    CLASSIFICATION_BACKFILL_SQL,
+    Base,
+    Classification,
+    Document,
+    DocumentTag,
+    get_db,
+)
+
+
+@pytest.fixture()
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'facets.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture()
+def client(factory):
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    from app.main import app as _app
+
+    _app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(_app) as test_client:
+            yield test_client
+    finally:
+        _app.dependency_overrides.pop(get_db, None)
+
+
+def _document(db, title="記事"):
+    doc = Document(
+        id=str(uuid.uuid4()),
+        url=f"https://example.com/{uuid.uuid4()}",
+        domain="example.com",
+        title=title,
+        content_md="本文",
+        content_text="本文",
+        hash=str(uuid.uuid4()),
+    )
+    db.add(doc)
+    db.flush()
+    return doc
+
+
+def _classify(db, doc, category, tags, *, method="llm", created_at=None):
+    cls = Classification(
+        document_id=doc.id,
+        primary_category=category,
+        tags=tags,
+        confidence=0.8,
+        method=method,
+        created_at=created_at or datetime.utcnow(),
+    )
+    db.add(cls)
+    db.commit()
+    return cls
+
+
+def _tags(db, doc_id):
+    return sorted(t for (t,) in db.query(DocumentTag.tag).filter(DocumentTag.document_id == doc_id))
+
+
+def test_classification_writes_are_mirrored(factory):
+    with factory() as db:
+        doc = _document(db)
+        cls = _classify(db, doc, "テック/AI", ["自動化", " python ", "自動化", ""])
+        db.refresh(doc)
+        assert doc.primary_category == "テック/AI"
+        assert _tags(db, doc.id) == ["python", "自動化"]
+
+        # postprocess と同じ LLM 行の上書き
+        cls.primary_category = "ソフトウェア開発"
+        cls.tags = ["rust"]
+        db.commit()
+        db.refresh(doc)
+        assert doc.primary_category == "ソフトウェア開発"
+        assert _tags(db, doc.id) == ["rust"]
+
+
+def test_deleting_latest_classification_falls_back_to_previous(factory):
+    with factory() as db:
+        doc = _document(db)
+        _classify(db, doc, "研究", ["論文"], method="rules", created_at=datetime.utcnow() - timedelta(days=1))
+        latest = _classify(db, doc, "ビジネス", ["経営"])
+        db.refresh(doc)
+        assert [c.primary_category for c in doc.classifications] == ["ビジネス", "研究"]
+
+        db.delete(latest)
+        db.commit()
+        db.refresh(doc)
+        assert doc.primary_category == "研究"
+        assert _tags(db, doc.id) == ["論文"]
+
+        db.delete(doc)
+        db.commit()
+        assert db.query(DocumentTag).count() == 0
+
+
+def test_filters_and_facets_use_denormalized_columns(client, factory):
+    with factory() as db:
+        ai = _document(db, "AI 記事")
+        _classify(db, ai, "テック/AI", ["自動化", "python"])
+        biz = _document(db, "経営 記事")
+        _classify(db, biz, "ビジネス", ["経営", "python"])
+        _document(db, "未分類")
+        db.commit()
+
+    listing = client.get("/api/documents", params={"category": "テック/AI"}).json()["documents"]
+    assert [d["title"] for d in listing] == ["AI 記事"]
+
+    page = client.get("/documents", params={"tag": "自動化"}).text
+    assert "AI 記事" in page and "経営 記事" not in page
+    page = client.get("/documents", params={"category": "ビジネス"}).text
+    assert "経営 記事" in page and "AI 記事" not in page
+
+    facets = client.get("/api/facets").json()
+    assert facets["categories"] == [{"category": "テック/AI", "count": 1}, {"category": "ビジネス", "count": 1}]
+    assert facets["tags"][0] == {"tag": "python", "count": 2}
+    assert client.get("/api/facets", params={"category": "ビジネス"}).json()["tags"] == [
+        {"tag": "python", "count": 1},
+        {"tag": "経営", "count": 1},
+    ]
+    assert client.get("/api/stats").json()["total_categories"] == 2
+
+
+def test_backfill_sql_uses_latest_classification(factory):
+    with factory() as db:
+        doc = _document(db)
+        db.commit()
+        # イベントを通らない旧データ（Unicode エスケープされた JSON も含む）
+        db.execute(
+            text(
+                "INSERT INTO classifications (id, document_id, primary_category, tags, confidence, method, created_at) VALUES "
+                "('old', :doc, '研究', '[\"論文\"]', 0.5, 'rules', '2024-01-01 00:00:00'), "
+                "('new', :doc, 'テック/AI', '[\"\\u81ea\\u52d5\\u5316\", \"ai\", 3]', 0.9, 'llm', '2024-02-01 00:00:00'), "
+                "('bad', 'missing', 'その他', 'not json', 0.1, 'rules', '2024-02-01 00:00:00')"
+            ),
+            {"doc": doc.id},
+        )
+        db.commit()
+        for statement in CLASSIFICATION_BACKFILL_SQL:
+            db.execute(text(statement))
+        db.commit()
+
+        db.refresh(doc)
+        assert doc.primary_category == "テック/AI"
+        assert _tags(db, doc.id) == ["ai", "自動化"]
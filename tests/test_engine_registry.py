@@ -0,0 +1,72 @@
+"""Tests for the URL-keyed engine registry."""
+from sqlalchemy import text
+
+from app.core import database
+
+
+def test_engine_is_shared_per_url(tmp_path, monkeypatch):
+    url_a = f"sqlite:///{tmp_path / 'a.db'}"
+    url_b = f"sqlite:///{tmp_path / 'b.db'}"
+
+    assert database.get_engine(url_a) is database.get_engine(url_a)
+    assert database.get_sessionmaker(url_a) is database.get_sessionmaker(url_a)
+    assert database.get_engine(url_a) is not database.get_engine(url_b)
+
+    # DB_URL を実行時に切り替えると、その URL のエンジンが使われる
+    monkeypatch.setenv("DB_URL", url_b)
+    assert database.get_engine() is database.get_engine(url_b)
+
+    database.invalidate_engine_cache(url_a)
+    database.invalidate_engine_cache(url_b)
+
+
+def test_invalidate_rebuilds_engine(tmp_path):
+    url = f"sqlite:///{tmp_path / 'c.db'}"
+    first = database.get_engine(url)
+    database.invalidate_engine_cache(url)
+    second = database.get_engine(url)
+    assert first is not second
+    assert database.get_sessionmaker(url).kw["bind"] is second
+    database.invalidate_engine_cache(url)
+
+
+def test_deleted_sqlite_file_needs_explicit_invalidation(tmp_path):
+    db_file = tmp_path / "d.db"
+    url = f"sqlite:///{db_file}"
+    first = database.get_engine(url)
+    with first.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER)"))
+    assert database.get_engine(url) is first
+
+    # get_engine はファイルの有無を見ない。作り直した DB を使うには明示的に破棄する
+    db_file.unlink()
+    assert database.get_engine(url) is first
+    database.invalidate_engine_cache(url)
+    second = database.get_engine(url)
+    assert second is not first
+    with second.connect() as conn:
+        assert conn.execute(text("SELECT name FROM sqlite_master WHERE name='t'")).fetchall() == []
+    database.invalidate_engine_cache(url)
+
+
+def test_get_db_follows_db_url_only_with_test_hook(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'hook.db'}"
+    monkeypatch.setenv("DB_URL", url)
+    monkeypatch.setattr(database, "SessionLocal", database.SessionLocal)
+    monkeypatch.setattr(database, "engine", database.engine)
+    startup_factory = database.SessionLocal
+
+    # 本番の get_db は起動時に束縛された SessionLocal をそのまま使い、スキーマも確認しない
+    monkeypatch.setattr(database, "_test_db_hook_enabled", False)
+    gen = database.get_db()
+    session = next(gen)
+    assert session.get_bind() is startup_factory.kw["bind"]
+    gen.close()
+
+    monkeypatch.setattr(database, "_test_db_hook_enabled", True)
+    gen = database.get_db()
+    session = next(gen)
+    assert session.get_bind() is database.get_engine(url)
+    assert session.execute(text("SELECT count(*) FROM documents")).scalar() == 0
+    gen.close()
+    database.invalidate_engine_cache(url)
@@ -0,0 +1,203 @@
+"""Tests for streaming PDF uploads: size limit, content-addressed storage and dedupe."""
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.database import Base, Document, get_db
+from app.api.routes import ingest
+from app.main import app
+
+PDF_BYTES = b"%PDF-1.4\n" + b"0" * 4096
+
+
+def _content_data(filename):
+    return {
+        "url": None,
+        "domain": "pdf",
+        "title": filename,
+        "author": None,
+        "published_at": None,
+        "lang": "en",
+        "content_md": "# body",
+        "content_text": "body",
+        "hash": hashlib.sha256(b"body").hexdigest(),
+    }
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, session_factory):
+    # PDFは data/assets/pdfs/uploads 配下に保存されるため作業ディレクトリを隔離する
+    monkeypatch.chdir(tmp_path)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+def test_upload_is_stored_by_hash_and_deduplicated(client, tmp_path):
+    extract = AsyncMock(side_effect=lambda path, name: _content_data(name))
+    with patch("app.api.routes.ingest.extract_pdf", extract), \
+         patch("app.api.routes.ingest._process_document_async", AsyncMock()):
+        first = client.post("/api/ingest/pdf", files={"file": ("deck.pdf", PDF_BYTES, "application/pdf")})
+        second = client.post("/api/ingest/pdf", files={"file": ("copy.pdf", PDF_BYTES, "application/pdf")})
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json()["message"] == "PDF already exists"
+    assert second.json()["document_id"] == first.json()["document_id"]
+    assert extract.await_count == 1
+
+    stored = tmp_path / "data" / "assets" / "pdfs" / "uploads" / f"{hashlib.sha256(PDF_BYTES).hexdigest()}.pdf"
+    assert stored.read_bytes() == PDF_BYTES
+    assert [p.name for p in stored.parent.iterdir()] == [stored.name]
+
+
+def test_upload_over_limit_is_rejected(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "max_file_size", 1024)
+    extract = AsyncMock()
+    with patch("app.api.routes.ingest.extract_pdf", extract):
+        response = client.post("/api/ingest/pdf", files={"file": ("big.pdf", PDF_BYTES, "application/pdf")})
+
+    assert response.status_code == 413
+    extract.assert_not_awaited()
+    upload_dir = tmp_path / "data" / "assets" / "pdfs" / "uploads"
+    assert not upload_dir.exists() or list(upload_dir.iterdir()) == []
+
+
+def _stored_path(tmp_path, pdf_bytes):
+    return tmp_path / "data" / "assets" / "pdfs" / "uploads" / f"{hashlib.sha256(pdf_bytes).hexdigest()}.pdf"
+
+
+def test_concurrent_upload_of_the_same_pdf_returns_the_winner(client, session_factory, tmp_path):
+    pdf_bytes = b"%PDF-1.4\n" + uuid.uuid4().bytes
+    rel_path = f"assets/pdfs/uploads/{hashlib.sha256(pdf_bytes).hexdigest()}.pdf"
+    winner_id = str(uuid.uuid4())
+
+    async def extract_while_another_request_commits(path, name):
+        # 抽出中に同じ内容を取り込んだ別のリクエストが先に登録する
+        with session_factory() as other:
+            other.add(Document(id=winner_id, url=None, domain="pdf", title="winner", content_md="# w", content_text="w", hash=str(uuid.uuid4()), pdf_path=rel_path))
+            other.commit()
+        return _content_data(name)
+
+    with patch("app.api.routes.ingest.extract_pdf", AsyncMock(side_effect=extract_while_another_request_commits)), \
+         patch("app.api.routes.ingest._process_document_async", AsyncMock()):
+        response = client.post("/api/ingest/pdf", files={"file": ("race.pdf", pdf_bytes, "application/pdf")})
+
+    assert response.status_code == 200
+    assert response.json()["message"] == "PDF already exists"
+    assert response.json()["document_id"] == winner_id
+    # 勝者の文書が参照するファイルは残る
+    assert _stored_path(tmp_path, pdf_bytes).read_bytes() == pdf_bytes
+
+
+def test_failed_upload_keeps_a_file_it_did_not_create(client, tmp_path):
+    pdf_bytes = b"%PDF-1.4\n" + uuid.uuid4().bytes
+    stored = _stored_path(tmp_path, pdf_bytes)
+    os.makedirs(stored.parent, exist_ok=True)
+    # 同じ内容を取り込み中の別リクエストが先に置いたファイル
+    stored.write_bytes(pdf_bytes)
+
+    with patch("app.api.routes.ingest.extract_pdf", AsyncMock(return_value=None)):
+        response = client.post("/api/ingest/pdf", files={"file": ("dup.pdf", pdf_bytes, "application/pdf")})
+
+    assert response.status_code == 400
+    assert stored.read_bytes() == pdf_bytes
+    assert [p.name for p in stored.parent.iterdir()] == [stored.name]
+
+    # 自分で作ったファイルは失敗時に消す
+    stored.unlink()
+    with patch("app.api.routes.ingest.extract_pdf", AsyncMock(return_value=None)):
+        response = client.post("/api/ingest/pdf", files={"file": ("dup.pdf", pdf_bytes, "application/pdf")})
+    assert response.status_code == 400
+    assert list(stored.parent.iterdir()) == []
+
+
+async def _upload_concurrently(session_factory, pdf_bytes, extract, release):
+    """同じ内容の2つのアップロードを、2つ目がロック待ちになってから1つ目の抽出を終わらせる順で走らせる"""
+    file_hash = hashlib.sha256(pdf_bytes).hexdigest()
+
+    async def upload(name):
+        with session_factory() as db:
+            return await ingest.ingest_pdf(UploadFile(io.BytesIO(pdf_bytes), filename=name), db)
+
+    with patch("app.api.routes.ingest.extract_pdf", extract), \
+         patch("app.api.routes.ingest._process_document_async", AsyncMock()):
+        first = asyncio.create_task(upload("first.pdf"))
+        while extract.await_count == 0:
+            await asyncio.sleep(0.01)
+        second = asyncio.create_task(upload("second.pdf"))
+        while ingest._pdf_hash_waiters.get(file_hash, 0) < 2:
+            await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+
+async def test_waiting_upload_returns_the_first_uploads_document(session_factory, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pdf_bytes = b"%PDF-1.4\n" + uuid.uuid4().bytes
+    release = asyncio.Event()
+
+    async def slow_extract(path, name):
+        await release.wait()
+        return _content_data(name)
+
+    extract = AsyncMock(side_effect=slow_extract)
+    first, second = await _upload_concurrently(session_factory, pdf_bytes, extract, release)
+
+    assert first["message"] == "PDF ingested successfully"
+    assert second["message"] == "PDF already exists"
+    assert second["document_id"] == first["document_id"]
+    assert extract.await_count == 1
+    assert list(_stored_path(tmp_path, pdf_bytes).parent.iterdir()) == [_stored_path(tmp_path, pdf_bytes)]
+    assert ingest._pdf_hash_locks == {}
+
+
+async def test_waiting_upload_extracts_after_the_first_upload_fails(session_factory, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pdf_bytes = b"%PDF-1.4\n" + uuid.uuid4().bytes
+    stored = _stored_path(tmp_path, pdf_bytes)
+    release = asyncio.Event()
+    seen = []
+
+    async def extract(path, name):
+        # どちらの抽出中も最終パスにファイルがある（2つ目は1つ目の後始末が終わってから自分で置き直す）
+        seen.append(os.path.exists(path))
+        if name == "first.pdf":
+            await release.wait()
+            return None
+        return _content_data(name)
+
+    mock = AsyncMock(side_effect=extract)
+    first, second = await _upload_concurrently(session_factory, pdf_bytes, mock, release)
+
+    assert isinstance(first, HTTPException) and first.status_code == 400
+    assert second["message"] == "PDF ingested successfully"
+    assert seen == [True, True]
+    assert stored.read_bytes() == pdf_bytes
@@ -0,0 +1,203 @@
+"""Tests for atomic multi-worker job leasing."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, PostprocessJob, PreferenceJob
+from app.services import personalization_queue, postprocess_queue, queue_metrics
+from app.services.job_leasing import LeaseHeartbeat
+
+
+def _session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'leasing.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_concurrent_workers_never_lease_the_same_job(tmp_path):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    job_ids = {postprocess_queue.enqueue_job_for_document(db, f"doc-{i}") for i in range(40)}
+    db.close()
+
+    leased = []
+    lock = threading.Lock()
+
+    def worker(n):
+        session = Session()
+        try:
+            while True:
+                job = postprocess_queue._acquire_job(session, f"worker-{n}")
+                if job is None:
+                    return
+                with lock:
+                    leased.append((job.id, job.lease_owner))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ids = [job_id for job_id, _ in leased]
+    assert sorted(ids) == sorted(job_ids)
+    assert len(set(ids)) == len(ids)
+    assert all(owner.startswith("worker-") for _, owner in leased)
+
+
+def test_lease_sets_owner_and_expiry_and_is_cleared_on_completion(tmp_path):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    future = datetime.utcnow() + timedelta(hours=1)
+    personalization_queue.enqueue_job(db, user_id="u1", available_at=future)
+    ready_id = personalization_queue.enqueue_job(db, user_id="u2")
+
+    job = personalization_queue.lease_job(db, "w1")
+    assert job.id == ready_id
+    assert job.status == "in_progress"
+    assert job.lease_owner == "w1"
+    assert job.lease_expires_at > datetime.utcnow()
+    # 実行予定時刻が未来のジョブはリースされない
+    assert personalization_queue.lease_job(db, "w2") is None
+
+    personalization_queue.mark_job_done(db, job)
+    done = db.get(PreferenceJob, ready_id)
+    assert done.status == "done"
+    assert done.lease_owner is None and done.lease_expires_at is None
+    db.close()
+
+
+def test_expired_leases_are_reclaimed_with_attempt_accounting(tmp_path):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    retry_id = postprocess_queue.enqueue_job_for_document(db, "doc-retry")
+    last_id = postprocess_queue.enqueue_job_for_document(db, "doc-last", max_attempts=1)
+    live_id = postprocess_queue.enqueue_job_for_document(db, "doc-live")
+    for _ in range(3):
+        postprocess_queue._acquire_job(db, "crashed-worker")
+
+    past = datetime.utcnow() - timedelta(minutes=1)
+    for job_id in (retry_id, last_id):
+        db.get(PostprocessJob, job_id).lease_expires_at = past
+    db.commit()
+
+    queue_metrics.reset()
+    counts = postprocess_queue.reclaim_expired_jobs(db)
+    assert counts == {"requeued": 1, "failed": 1}
+    assert queue_metrics.snapshot()["postprocess_jobs"]["reclaimed"] == 1
+
+    db.expire_all()
+    retry = db.get(PostprocessJob, retry_id)
+    assert (retry.status, retry.attempts, retry.lease_owner) == ("pending", 1, None)
+    assert "lease expired" in retry.last_error
+    assert db.get(PostprocessJob, last_id).status == "failed"
+    assert db.get(PostprocessJob, live_id).status == "in_progress"
+
+    # 回収されたジョブは再び取得できる
+    assert postprocess_queue._acquire_job(db, "new-worker").id == retry_id
+    db.close()
+
+
+def test_heartbeat_extends_lease_until_done(tmp_path):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    postprocess_queue.enqueue_job_for_document(db, "doc-slow")
+    job = postprocess_queue._acquire_job(db, "w1")
+    first_expiry = job.lease_expires_at
+
+    with LeaseHeartbeat(db, PostprocessJob, job.id, "w1", lease_seconds=1) as hb:
+        time.sleep(0.8)
+    assert not hb.lost
+
+    db.expire_all()
+    renewed = db.get(PostprocessJob, job.id)
+    assert renewed.lease_expires_at != first_expiry
+    assert renewed.lease_owner == "w1"
+    db.close()
+
+
+def _steal(Session, model, job_id, new_owner):
+    """リースを期限切れにして回収し、別ワーカーに取らせる"""
+    session = Session()
+    try:
+        session.get(model, job_id).lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+        reclaim = postprocess_queue.reclaim_expired_jobs if model is PostprocessJob else personalization_queue.reclaim_expired_jobs
+        assert reclaim(session)["requeued"] == 1
+        if model is PostprocessJob:
+            stolen = postprocess_queue._acquire_job(session, new_owner)
+        else:
+            stolen = personalization_queue.lease_job(session, new_owner)
+        assert stolen.id == job_id
+    finally:
+        session.close()
+
+
+async def test_result_of_a_reclaimed_job_is_discarded(tmp_path, monkeypatch):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    postprocess_queue.enqueue_job_for_document(db, "doc-slow")
+    job = postprocess_queue._acquire_job(db, "w1")
+
+    async def slow_stage(document_id, stage, force=False):
+        # 処理中にリースが切れて w2 に渡る
+        _steal(Session, PostprocessJob, job.id, "w2")
+        return True, None
+
+    monkeypatch.setattr(postprocess_queue, "process_stage", slow_stage)
+    assert await postprocess_queue._process_leased_job(db, job, "w1") is False
+
+    check = Session()
+    current = check.get(PostprocessJob, job.id)
+    assert (current.status, current.lease_owner, current.attempts) == ("in_progress", "w2", 1)
+    # 完了扱いにならないので後続ステージも積まれない
+    assert check.query(PostprocessJob).count() == 1
+    assert postprocess_queue._mark_job_failed(check, current, "late", "w1") is False
+    check.expire_all()
+    assert check.get(PostprocessJob, job.id).attempts == 1
+
+    # 新しい所有者の結果は記録される
+    assert postprocess_queue._mark_job_done(check, current, "w2") is True
+    assert {j.stage for j in check.query(PostprocessJob)} == {"extract", "summary", "embedding", "classification"}
+    check.close()
+
+
+def test_preference_job_result_after_lost_lease_is_not_written(tmp_path):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    job_id = personalization_queue.enqueue_job(db, user_id="u1")
+    job = personalization_queue.lease_job(db, "w1")
+    _steal(Session, PreferenceJob, job_id, "w2")
+
+    assert personalization_queue.mark_job_failed(db, job, "boom", "w1") is False
+    assert personalization_queue.mark_job_done(db, job, "w1") is False
+    db.expire_all()
+    current = db.get(PreferenceJob, job_id)
+    assert (current.status, current.lease_owner, current.attempts, current.last_error.startswith("lease expired")) == (
+        "in_progress",
+        "w2",
+        1,
+        True,
+    )
+    db.close()
+
+
+def test_heartbeat_reports_a_lost_lease(tmp_path):
+    Session = _session_factory(tmp_path)
+    db = Session()
+    postprocess_queue.enqueue_job_for_document(db, "doc-slow")
+    job = postprocess_queue._acquire_job(db, "w1")
+    _steal(Session, PostprocessJob, job.id, "w2")
+
+    with LeaseHeartbeat(db, PostprocessJob, job.id, "w1", lease_seconds=0.3) as hb:
+        time.sleep(0.5)
+    assert hb.lost
+    db.close()
@@ -0,0 +1,137 @@
+"""Cursor (keyset) pagination for the document and bookmark lists."""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, Bookmark, Document, get_db
+from app.core.pagination import InvalidCursor, decode_cursor, encode_cursor, fetch_page
+from app.services.bookmark_service import count_user_bookmarks, invalidate_bookmark_count
+
+DOCUMENTS = 7
+
+
+@pytest.fixture()
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keyset.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    with factory() as db:
+        for i in range(DOCUMENTS):
+            doc = Document(
+                id=f"doc-{i}",
+                url=f"https://example.com/{i}",
+                domain="example.com",
+                title=f"記事 {i}",
+                content_md="本文",
+                content_text="本文",
+                hash=str(uuid.uuid4()),
+                # 2件ずつ同じ時刻にして id でのタイブレークも通す
+                created_at=base + timedelta(minutes=i // 2),
+            )
+            db.add(doc)
+            db.add(Bookmark(user_id="guest", document_id=doc.id, created_at=base + timedelta(minutes=i // 2)))
+        db.commit()
+        # func.now() 形式（マイクロ秒なし）の行も混ぜる
+        db.execute(text("UPDATE documents SET created_at = '2025-01-01 12:00:00' WHERE id = 'doc-0'"))
+        db.commit()
+    invalidate_bookmark_count()
+    return factory
+
+
+@pytest.fixture()
+def client(factory):
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    from app.main import app as _app
+
+    _app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(_app) as test_client:
+            yield test_client
+    finally:
+        _app.dependency_overrides.pop(get_db, None)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2025-01-01 12:00:00", "a")) == ("2025-01-01 12:00:00", "a")
+    moment = datetime(2025, 1, 1, 12, 0, 0, 5)
+    assert decode_cursor(encode_cursor(moment, 3)) == (moment, 3)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor")
+
+
+def test_fetch_page_walks_every_row_once(factory):
+    with factory() as db:
+        seen, cursor = [], None
+        while True:
+            items, cursor = fetch_page(db.query(Document), Document.created_at, Document.id, cursor, 3)
+            seen.extend(doc.id for doc in items)
+            if cursor is None:
+                break
+    expected = sorted((f"doc-{i}" for i in range(DOCUMENTS)), key=lambda d: (int(d[4:]) // 2, d), reverse=True)
+    assert seen == expected
+
+
+def test_documents_api_follows_next_cursor(client):
+    first = client.get("/api/documents", params={"limit": 4}).json()
+    assert first["next_cursor"]
+    second = client.get("/api/documents", params={"limit": 4, "cursor": first["next_cursor"]}).json()
+    assert second["next_cursor"] is None
+    ids = [d["id"] for d in first["documents"] + second["documents"]]
+    assert len(ids) == len(set(ids)) == DOCUMENTS
+
+    # 旧クライアントの offset も引き続き使える
+    legacy = client.get("/api/documents", params={"limit": 4, "offset": 4}).json()
+    assert [d["id"] for d in legacy["documents"]] == [d["id"] for d in second["documents"]]
+
+    assert client.get("/api/documents", params={"cursor": "broken"}).status_code == 400
+
+
+def test_bookmarks_api_follows_next_cursor(client):
+    first = client.get("/api/bookmarks", params={"limit": 5}).json()
+    second = client.get("/api/bookmarks", params={"limit": 5, "cursor": first["next_cursor"]}).json()
+    ids = [b["document_id"] for b in first["bookmarks"] + second["bookmarks"]]
+    assert len(ids) == len(set(ids)) == DOCUMENTS
+    assert second["next_cursor"] is None
+
+
+def test_pages_render_infinite_scroll_fragments(client):
+    page = client.get("/bookmarks", params={"per_page": 5}).text
+    assert "表示範囲: 1 - 5 / 7" in page
+    assert 'hx-trigger="revealed"' in page
+    sentinel = page.split("data-infinite-scroll", 1)[1]
+    next_url = sentinel.split('hx-get="', 1)[1].split('"', 1)[0].replace("&amp;", "&")
+    assert next_url.startswith("/bookmarks?")
+
+    fragment = client.get(next_url, headers={"HX-Request": "true"}).text
+    assert "<html" not in fragment
+    assert fragment.count("<article") == 2
+    assert 'hx-trigger="revealed"' not in fragment
+
+    documents_page = client.get("/documents", params={"domain": "example.com"}).text
+    # 50件未満なのでセンチネルは出ない
+    assert 'hx-trigger="revealed"' not in documents_page
+    assert client.get("/documents", params={"cursor": "broken"}).status_code == 400
+
+
+def test_bookmark_count_is_cached_until_a_bookmark_changes(client, factory):
+    with factory() as db:
+        assert count_user_bookmarks(db, "guest") == DOCUMENTS
+        db.query(Bookmark).filter(Bookmark.document_id == "doc-0").delete()
+        db.commit()
+        # 直接の DELETE ではキャッシュは古いまま
+        assert count_user_bookmarks(db, "guest") == DOCUMENTS
+
+    assert client.post("/api/bookmarks", json={"document_id": "doc-0"}).status_code == 200
+    with factory() as db:
+        assert count_user_bookmarks(db, "guest") == DOCUMENTS
@@ -0,0 +1,181 @@
+"""Versioned schema migrations and resumable backfill jobs."""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core import migrations
+from app.core.database import Base, BackfillJob, Classification, Document
+from app.services import backfills
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _write(tmp_path, name, sql):
+    (tmp_path / name).write_text(sql, encoding="utf-8")
+
+
+def test_split_statements_keeps_trigger_bodies():
+    sql = """
+    -- comment
+    CREATE TABLE t (x INTEGER);
+    CREATE TRIGGER tr AFTER INSERT ON t BEGIN
+        UPDATE t SET x = x + 1;
+    END;
+    INSERT INTO t VALUES (1);
+    """
+    statements = list(migrations.split_statements(sql))
+    assert len(statements) == 3
+    assert statements[1].startswith("CREATE TRIGGER") and statements[1].endswith("END;")
+
+
+def test_versions_are_recorded_and_applied_once(engine, tmp_path):
+    _write(tmp_path, "002_add_column.sql", "ALTER TABLE items ADD COLUMN note TEXT;\nINSERT INTO items (id) VALUES (2);")
+    _write(tmp_path, "001_create.sql", "CREATE TABLE items (id INTEGER PRIMARY KEY);\nINSERT INTO items (id) VALUES (1);")
+    _write(tmp_path, "README.txt", "ignored")
+
+    assert [m.version for m in migrations.pending(engine, tmp_path)] == ["001", "002"]
+    assert migrations.apply_pending(engine, tmp_path, target="001") == ["001"]
+    assert migrations.apply_pending(engine, tmp_path) == ["002"]
+    assert migrations.apply_pending(engine, tmp_path) == []
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM items")).scalar() == 2
+
+    # 既存の列を追加するだけの文は許容し、想定外のエラーはファイルごとロールバック
+    _write(tmp_path, "003_repeat.sql", "ALTER TABLE items ADD COLUMN note TEXT;")
+    _write(tmp_path, "004_broken.sql", "INSERT INTO items (id) VALUES (3);\nINSERT INTO missing VALUES (1);")
+    with pytest.raises(migrations.MigrationError):
+        migrations.apply_pending(engine, tmp_path)
+    state = migrations.status(engine, tmp_path)
+    assert [m["version"] for m in state["applied"]] == ["001", "002", "003"]
+    assert state["pending"] == [{"version": "004", "name": "broken"}]
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM items")).scalar() == 2
+
+
+def test_failed_migration_rolls_back_its_ddl(engine, tmp_path):
+    _write(
+        tmp_path,
+        "001_partial.sql",
+        "CREATE TABLE foo (id INTEGER PRIMARY KEY);\nINSERT INTO foo (id) VALUES (1);\nINSERT INTO missing VALUES (1);",
+    )
+    with pytest.raises(migrations.MigrationError):
+        migrations.apply_pending(engine, tmp_path)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT name FROM sqlite_master WHERE name = 'foo'")).first() is None
+    assert migrations.applied_versions(engine) == []
+    assert [m.version for m in migrations.pending(engine, tmp_path)] == ["001"]
+
+
+def test_repository_migrations_apply_to_a_model_built_database(engine):
+    assert len(migrations.apply_pending(engine)) == len(migrations.discover())
+    assert migrations.pending(engine) == []
+
+
+def test_create_tables_migrates_an_existing_database(monkeypatch, tmp_path):
+    from app.core import database
+
+    # create_tables は module の engine / SessionLocal を差し替えるので、テスト後に戻す
+    monkeypatch.setattr(database, "engine", database.engine)
+    monkeypatch.setattr(database, "SessionLocal", database.SessionLocal)
+    db_url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    monkeypatch.setenv("DB_URL", db_url)
+    legacy = database.get_engine(db_url)
+    assert migrations.apply_pending(legacy, target="001") == ["001"]
+
+    database.create_tables()
+
+    with legacy.connect() as connection:
+        columns = {row[1] for row in connection.execute(text("PRAGMA table_info(documents)"))}
+    assert {"short_summary", "extraction_status", "content_md_z", "primary_category"} <= columns
+    assert migrations.pending(legacy) == []
+
+
+def _seed_documents(engine, count):
+    with engine.begin() as connection:
+        for i in range(count):
+            doc_id = f"doc-{i:03d}"
+            connection.execute(
+                Document.__table__.insert().values(
+                    id=doc_id,
+                    url=f"https://example.com/{i}",
+                    domain="example.com",
+                    title=f"記事 {i}",
+                    content_md="本文 " * 200,
+                    content_text=f"本文 {i}",
+                    hash=str(uuid.uuid4()),
+                )
+            )
+            connection.execute(
+                Classification.__table__.insert().values(
+                    id=str(uuid.uuid4()),
+                    document_id=doc_id,
+                    primary_category="研究",
+                    tags=["論文"],
+                    confidence=0.5,
+                    method="rules",
+                )
+            )
+
+
+def test_backfills_resume_after_time_budget_and_finish(engine):
+    _seed_documents(engine, 25)
+
+    status = backfills.run_backfill(engine, "content_preview", batch_size=10, throttle_seconds=0, time_budget=0)
+    assert status == "pending"
+    with engine.connect() as connection:
+        job = connection.execute(BackfillJob.__table__.select().where(BackfillJob.name == "content_preview")).first()
+        assert (job.processed, job.total, job.cursor) == (10, 25, "doc-009")
+        assert connection.execute(text("SELECT COUNT(*) FROM documents WHERE content_preview IS NULL")).scalar() == 15
+
+    results = backfills.run_pending_backfills(engine)
+    # embedding_vectors は PostgreSQL + pgvector 以外では何もせず done になる
+    assert results == {
+        "content_preview": "done",
+        "compress_content_md": "done",
+        "document_facets": "done",
+        "embedding_vectors": "done",
+    }
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM documents WHERE content_preview IS NULL")).scalar() == 0
+        assert connection.execute(text("SELECT COUNT(*) FROM documents WHERE content_md_z IS NULL")).scalar() == 0
+        assert connection.execute(text("SELECT COUNT(DISTINCT document_id) FROM document_tags")).scalar() == 25
+        assert connection.execute(text("SELECT value FROM stats_counters WHERE key = 'category:研究'")).scalar() == 25
+
+    progress = {b["name"]: b for b in backfills.backfill_progress(engine)}
+    assert progress["content_preview"]["processed"] == 25 and progress["content_preview"]["percent"] == 100.0
+
+
+def test_paused_backfill_is_skipped_until_resumed(engine):
+    _seed_documents(engine, 3)
+    backfills.set_backfill_state(engine, "document_facets", "pause")
+    assert "document_facets" not in backfills.run_pending_backfills(engine)
+    backfills.set_backfill_state(engine, "document_facets", "resume")
+    assert backfills.run_pending_backfills(engine)["document_facets"] == "done"
+
+
+def test_admin_migrations_page_and_actions(monkeypatch, engine):
+    import app.api.routes.admin as admin_routes
+
+    monkeypatch.setattr(admin_routes, "get_engine", lambda: engine)
+    from app.main import app as _app
+
+    client = TestClient(_app)
+    page = client.get("/admin/migrations")
+    assert page.status_code == 200
+    assert "document_facets" in page.text
+
+    data = client.get("/api/admin/migrations").json()
+    assert {b["name"] for b in data["backfills"]} == set(backfills.BACKFILLS)
+    assert data["schema"]["pending"]
+
+    paused = client.post("/api/admin/backfills/content_preview/pause").json()
+    assert {b["name"]: b["status"] for b in paused["backfills"]}["content_preview"] == "paused"
+    assert client.post("/api/admin/backfills/content_preview/explode").status_code == 400
+    assert client.post("/api/admin/backfills/unknown/pause").status_code == 404
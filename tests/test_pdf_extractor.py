@@ -0,0 +1,66 @@
+"""Tests for the shared (warm) Docling converter used by PDF extraction."""
+import pytest
+
+from app.services import extractor
+
+
+class _FakeDocument:
+    def export_to_markdown(self):
+        return "# スライド\n\n本文"
+
+    def export_to_text(self):
+        return "スライド 本文"
+
+
+class _FakeResult:
+    document = _FakeDocument()
+
+
+class _FakeConverter:
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        type(self).instances += 1
+        self.converted = []
+
+    def convert(self, file_path):
+        self.converted.append(file_path)
+        return _FakeResult()
+
+
+@pytest.fixture
+def fake_docling(monkeypatch):
+    _FakeConverter.instances = 0
+    monkeypatch.setattr(extractor, "DOCLING_AVAILABLE", True)
+    monkeypatch.setattr(extractor, "DocumentConverter", _FakeConverter, raising=False)
+    extractor.reset_docling_converter()
+    yield _FakeConverter
+    extractor.reset_docling_converter()
+
+
+async def test_converter_is_created_once_and_reused(fake_docling, tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+
+    first = await extractor.content_extractor.extract_from_pdf(str(pdf), "a.pdf")
+    second = await extractor.content_extractor.extract_from_pdf(str(pdf), "a.pdf")
+
+    assert first["content_md"].startswith("# スライド")
+    assert second["content_text"] == "スライド 本文"
+    assert fake_docling.instances == 1
+    assert extractor.get_docling_converter().converted == [str(pdf), str(pdf)]
+
+
+def test_warm_up_creates_shared_converter(fake_docling):
+    assert extractor.warm_up_pdf_converter() is True
+    assert fake_docling.instances == 1
+    # 以降の取得では再生成されない
+    extractor.get_docling_converter()
+    assert fake_docling.instances == 1
+
+
+def test_warm_up_without_docling(monkeypatch):
+    monkeypatch.setattr(extractor, "DOCLING_AVAILABLE", False)
+    extractor.reset_docling_converter()
+    assert extractor.warm_up_pdf_converter() is False
+    assert extractor.get_docling_converter() is None
@@ -0,0 +1,75 @@
+"""Tests for page-parallel PDF extraction and the pdfminer preview mode."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.config import settings
+from app.services import extractor, pdf_pipeline
+
+pytestmark = pytest.mark.skipif(not extractor.PDFMINER_AVAILABLE, reason="pdfminer.six not installed")
+
+
+def _make_pdf(path, page_texts):
+    """ページごとに1行のテキストを持つ最小構成のPDFを書き出す"""
+    n = len(page_texts)
+    font_id = 3 + 2 * n
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(n)), n)).encode(),
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(
+            (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+             f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>").encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+    return str(path)
+
+
+@pytest.fixture
+def no_docling(monkeypatch):
+    monkeypatch.setattr(extractor, "DOCLING_AVAILABLE", False)
+
+
+def test_split_page_ranges():
+    assert pdf_pipeline.split_page_ranges(0, 8) == []
+    assert pdf_pipeline.split_page_ranges(5, 8) == [(1, 5)]
+    assert pdf_pipeline.split_page_ranges(10, 4) == [(1, 4), (5, 8), (9, 10)]
+
+
+async def test_extract_pdf_merges_ranges_in_page_order(no_docling, monkeypatch, tmp_path):
+    pdf = _make_pdf(tmp_path / "deck.pdf", [f"Slide{i}" for i in range(1, 6)])
+    monkeypatch.setattr(settings, "pdf_pages_per_chunk", 2)
+
+    assert pdf_pipeline.count_pdf_pages(pdf) == 5
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        result = await pdf_pipeline.extract_pdf(pdf, "deck.pdf", executor=pool)
+
+    text = result["content_text"]
+    positions = [text.index(f"Slide{i}") for i in range(1, 6)]
+    assert positions == sorted(positions)
+    assert result["title"] == "deck.pdf"
+
+
+async def test_extract_pdf_preview_samples_first_pages(no_docling, tmp_path):
+    pdf = _make_pdf(tmp_path / "paper.pdf", ["Intro", "Method", "Results", "Appendix"])
+
+    result = await pdf_pipeline.extract_pdf_preview(pdf, "paper.pdf", max_pages=2)
+
+    assert "Intro" in result["content_text"]
+    assert "Method" in result["content_text"]
+    assert "Results" not in result["content_text"]
@@ -0,0 +1,169 @@
+"""Tests for targeted vs. full rescoring in the personalization worker."""
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.database import Base, Document, Embedding, PersonalizedScore, PreferenceJob, PreferenceProfile
+from app.services import personalization_queue
+from app.services import personalization_worker as worker
+from app.services.personalization_models import PreferenceProfileDTO
+from app.services.personalized_ranking import PersonalizedRankingService
+from app.services.personalized_repository import PersonalizedScoreRepository
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scoring.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def _add_document(db, vec, *, age_minutes=0):
+    doc = Document(
+        id=str(uuid.uuid4()),
+        url=f"https://example.com/{uuid.uuid4()}",
+        domain="example.com",
+        title="doc",
+        content_md="body",
+        content_text="body",
+        hash=str(uuid.uuid4()),
+        created_at=datetime.utcnow() - timedelta(minutes=age_minutes),
+    )
+    db.add(doc)
+    db.add(Embedding(document_id=doc.id, chunk_id=0, vec=json.dumps(vec), chunk_text="body"))
+    db.commit()
+    return doc.id
+
+
+class FakeProfileService:
+    def __init__(self, profile):
+        self.profile = profile
+
+    def update_profile(self, session, user_id=None, full=False):
+        return self.profile
+
+
+class RecordingRankingService(PersonalizedRankingService):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def score_documents(self, documents, *, profile=None):
+        self.calls.append(sorted(doc.id for doc in documents))
+        return super().score_documents(documents, profile=profile)
+
+
+def _profile(db, embedding):
+    row = db.query(PreferenceProfile).filter_by(user_id="alice").one_or_none()
+    if row is None:
+        row = PreferenceProfile(user_id="alice", bookmark_count=5, status="active")
+        db.add(row)
+        db.commit()
+    return PreferenceProfileDTO(id=row.id, user_id="alice", bookmark_count=5, embedding=tuple(embedding))
+
+
+def _run(db, job_id, profile, ranking):
+    job = db.get(PreferenceJob, job_id)
+    return worker._process_job(db, job, profile_service=FakeProfileService(profile), ranking_service=ranking)
+
+
+def _ranking(db):
+    rows = db.query(PersonalizedScore).filter_by(user_id="alice").order_by(PersonalizedScore.rank).all()
+    return [(row.document_id, row.rank, row.score) for row in rows]
+
+
+def test_new_document_is_scored_alone_and_merged_into_ranking(tmp_path):
+    db = _session(tmp_path)
+    profile = _profile(db, [1.0, 0.0])
+    ranking = RecordingRankingService()
+    existing = [_add_document(db, vec, age_minutes=10) for vec in ([1.0, 0.0], [0.6, 0.8], [0.0, 1.0])]
+
+    job_id = personalization_queue.enqueue_job(db, user_id="alice", job_type="score_refresh")
+    assert _run(db, job_id, profile, ranking) == (True, None)
+    assert ranking.calls == [sorted(existing)]
+
+    new_doc = _add_document(db, [0.9, 0.1])
+    job_id = personalization_queue.enqueue_document_scoring(db, user_id="alice", document_id=new_doc, coalesce=False)
+    assert _run(db, job_id, profile, ranking) == (True, None)
+
+    # 新しい文書だけがスコアリングされ、既存ランキングに差し込まれる
+    assert ranking.calls[-1] == [new_doc]
+    result = _ranking(db)
+    assert [rank for _, rank, _ in result] == [1, 2, 3, 4]
+    assert [doc_id for doc_id, _, _ in result] == [existing[0], new_doc, existing[1], existing[2]]
+    scores = [score for _, _, score in result]
+    assert scores == sorted(scores, reverse=True)
+    db.close()
+
+
+def test_profile_rebuild_rescores_everything_only_after_large_drift(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "personalization_rescore_threshold", 0.05)
+    db = _session(tmp_path)
+    ranking = RecordingRankingService()
+    docs = [_add_document(db, vec, age_minutes=5) for vec in ([1.0, 0.0], [0.0, 1.0])]
+
+    job_id = personalization_queue.enqueue_profile_update(db, user_id="alice", coalesce=False)
+    _run(db, job_id, _profile(db, [1.0, 0.0]), ranking)
+    assert ranking.calls == [sorted(docs)]
+    assert db.query(PreferenceProfile).filter_by(user_id="alice").one().scored_snapshot
+
+    # わずかな変化では対象文書のみ
+    bookmarked = _add_document(db, [0.7, 0.7])
+    job_id = personalization_queue.enqueue_profile_update(db, user_id="alice", document_id=bookmarked, coalesce=False)
+    _run(db, job_id, _profile(db, [1.0, 0.01]), ranking)
+    assert ranking.calls[-1] == [bookmarked]
+
+    # 大きく変わったら直近の文書をすべて再スコア
+    job_id = personalization_queue.enqueue_profile_update(db, user_id="alice", document_id=bookmarked, coalesce=False)
+    _run(db, job_id, _profile(db, [0.0, 1.0]), ranking)
+    assert ranking.calls[-1] == sorted(docs + [bookmarked])
+    result = _ranking(db)
+    assert result[0][0] == docs[1]
+    assert [rank for _, rank, _ in result] == [1, 2, 3]
+    db.close()
+
+
+def test_merge_ranks_only_shifts_ranks_between_old_and_new_positions(tmp_path):
+    db = _session(tmp_path)
+    repo = PersonalizedScoreRepository(db)
+    docs = [_add_document(db, [1.0, 0.0], age_minutes=i) for i in range(10)]
+    for index, doc_id in enumerate(docs):
+        db.add(PersonalizedScore(user_id="alice", document_id=doc_id, score=0.9 - index * 0.05, rank=index + 1))
+    db.commit()
+
+    def row(doc_id):
+        return db.query(PersonalizedScore).filter_by(user_id="alice", document_id=doc_id).one()
+
+    # docs[2] が 3位から docs[5] と docs[6] の間へ下がり、docs[8] が削除され、新しい文書が 2位に入る
+    moved, removed = docs[2], docs[8]
+    new_doc = _add_document(db, [1.0, 0.0])
+    previous = repo.rank_map(user_id="alice", document_ids=[moved, removed, new_doc])
+    row(moved).score = 0.62
+    db.delete(row(removed))
+    db.add(PersonalizedScore(user_id="alice", document_id=new_doc, score=0.87, rank=1))
+    db.flush()
+
+    changed = repo.merge_ranks(user_id="alice", document_ids=[moved, new_doc], previous_ranks=previous)
+
+    expected = [docs[0], new_doc, docs[1], docs[3], docs[4], docs[5], moved, docs[6], docs[7], docs[9]]
+    assert [doc_id for doc_id, _, _ in _ranking(db)] == expected
+    assert [rank for _, rank, _ in _ranking(db)] == list(range(1, 11))
+    # 挿入と削除が打ち消し合う docs[3]〜docs[5] や、範囲外の docs[0]・docs[9] は書き換えない
+    assert changed == 5
+    assert repo.reassign_ranks(user_id="alice") == 0
+    db.close()
+
+
+def test_profile_drift_measures_embedding_and_weights():
+    base = PreferenceProfileDTO(id="p", user_id="u", bookmark_count=5, embedding=(1.0, 0.0), category_weights={"AI": 1.0})
+    snapshot = worker._profile_snapshot(base)
+    assert worker._profile_drift(snapshot, base) == 0.0
+
+    moved = PreferenceProfileDTO(id="p", user_id="u", bookmark_count=5, embedding=(1.0, 0.0), category_weights={"AI": 0.5, "Web": 0.5})
+    assert abs(worker._profile_drift(snapshot, moved) - 0.5) < 1e-9
+
+    cold = PreferenceProfileDTO(id="p", user_id="u", bookmark_count=1, embedding=(1.0, 0.0), category_weights={"AI": 1.0})
+    assert worker._profile_drift(snapshot, cold) == 1.0
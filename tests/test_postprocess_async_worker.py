@@ -0,0 +1,124 @@
+"""Tests for the concurrent asyncio postprocess worker."""
+import asyncio
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.async_runner import get_loop_semaphore
+from app.core.database import Base, Document, PostprocessJob
+from app.services import postprocess_queue
+
+
+class _SlowSummary:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, text, style="short", timeout_sec=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            self.active -= 1
+        return "並行処理テストの要約"
+
+
+async def _fake_create_embedding(text):
+    return [0.1, 0.2, 0.3]
+
+
+async def _fake_classify_content(title, content):
+    return {"primary_category": "テック/AI", "tags": ["AI"], "confidence": 0.9}
+
+
+async def test_async_worker_processes_jobs_concurrently(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path / 'async_worker.db'}"
+    monkeypatch.setenv("DB_URL", db_url)
+    engine = create_engine(db_url, connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(postprocess_queue, "SessionLocal", Session)
+
+    import app.services.llm_client as llm_mod
+
+    summary = _SlowSummary()
+    monkeypatch.setattr(llm_mod.llm_client, "generate_summary", summary)
+    monkeypatch.setattr(llm_mod.llm_client, "create_embedding", _fake_create_embedding)
+    monkeypatch.setattr(llm_mod.llm_client, "classify_content", _fake_classify_content)
+
+    db = Session()
+    for i in range(8):
+        doc = Document(url=f"http://example.test/{i}", domain="example.test", title=f"doc {i}", content_md="本文です", content_text="本文です", hash=f"h{i}")
+        db.add(doc)
+        db.commit()
+        postprocess_queue.enqueue_job_for_document(db, doc.id)
+    db.close()
+
+    # 8 文書 × (extract + summary / embedding / classification)
+    processed = await postprocess_queue.run_async_worker(concurrency=4, poll_interval=0.05, max_jobs=32)
+
+    assert processed == 32
+    assert 1 < summary.peak <= 4
+    db = Session()
+    assert {job.status for job in db.query(PostprocessJob).all()} == {"done"}
+    assert db.query(Document).filter(Document.short_summary.is_(None)).count() == 0
+    db.close()
+
+
+async def test_loop_semaphore_is_shared_per_loop_and_limits_concurrency():
+    assert get_loop_semaphore("test-llm", 2) is get_loop_semaphore("test-llm", 5)
+
+    active = 0
+    peak = 0
+
+    async def call():
+        nonlocal active, peak
+        async with get_loop_semaphore("test-llm", 2):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+
+
+async def test_async_worker_runs_queue_db_calls_off_the_event_loop(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path / 'async_worker_threads.db'}"
+    monkeypatch.setenv("DB_URL", db_url)
+    engine = create_engine(db_url, connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(postprocess_queue, "SessionLocal", Session)
+
+    loop_thread = threading.get_ident()
+    calls = []
+
+    def recording(name, fn):
+        def wrapper(*args, **kwargs):
+            calls.append((name, threading.get_ident()))
+            return fn(*args, **kwargs)
+        return wrapper
+
+    for name in ("reclaim_expired_jobs", "_acquire_job", "_mark_job_done", "_mark_job_failed"):
+        monkeypatch.setattr(postprocess_queue, name, recording(name, getattr(postprocess_queue, name)))
+
+    async def fake_stage(document_id, stage, force=False):
+        return stage != "summary", "boom"
+
+    monkeypatch.setattr(postprocess_queue, "process_stage", fake_stage)
+
+    db = Session()
+    doc = Document(url="http://example.test/t", domain="example.test", title="t", content_md="本文", content_text="本文", hash="ht")
+    db.add(doc)
+    db.commit()
+    postprocess_queue.enqueue_job_for_document(db, doc.id, stage="summary")
+    postprocess_queue.enqueue_job_for_document(db, doc.id, stage="embedding")
+    db.close()
+
+    await postprocess_queue.run_async_worker(concurrency=2, poll_interval=0.05, max_jobs=2)
+
+    assert {name for name, _ in calls} == {"reclaim_expired_jobs", "_acquire_job", "_mark_job_done", "_mark_job_failed"}
+    assert all(ident != loop_thread for _, ident in calls)
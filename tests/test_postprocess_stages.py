@@ -0,0 +1,174 @@
+"""Tests for stage-based postprocess jobs."""
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, Classification, Document, Embedding, PostprocessJob, PreferenceJob
+from app.services import postprocess, postprocess_queue
+from app.services.postprocess import process_stage_once
+
+
+class _Counter:
+    def __init__(self, result, fail_times=0):
+        self.result = result
+        self.fail_times = fail_times
+        self.calls = 0
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise RuntimeError("simulated transient failure")
+        return self.result
+
+
+def _setup(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path / 'stages.db'}"
+    monkeypatch.setenv("DB_URL", db_url)
+    engine = create_engine(db_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    import app.services.llm_client as llm_mod
+
+    fakes = {
+        "generate_summary": _Counter("段階処理テストの要約"),
+        "create_embedding": _Counter([0.1, 0.2, 0.3]),
+        "classify_content": _Counter({"primary_category": "テック/AI", "tags": ["AI"], "confidence": 0.9}, fail_times=1),
+    }
+    for name, fake in fakes.items():
+        monkeypatch.setattr(llm_mod.llm_client, name, fake)
+    return Session, fakes
+
+
+def _drain(db):
+    """キューが空になるまでジョブを順に処理する（リトライ待ちは即時実行に早送りする）"""
+    stages = []
+    while True:
+        db.query(PostprocessJob).filter(PostprocessJob.status == "pending").update({"next_attempt_at": None})
+        db.commit()
+        job = postprocess_queue._acquire_job(db, "test-worker")
+        if job is None:
+            return stages
+        success, error = process_stage_once(job.document_id, job.stage, force=bool(postprocess_queue._job_options(job).get("force")))
+        stages.append((job.stage, success))
+        if success:
+            postprocess_queue._mark_job_done(db, job)
+        else:
+            postprocess_queue._mark_job_failed(db, job, error or "err")
+
+
+def test_failed_stage_is_retried_alone_without_duplicates(tmp_path, monkeypatch):
+    Session, fakes = _setup(tmp_path, monkeypatch)
+    db = Session()
+    doc = Document(url="http://example.test/a", domain="example.test", title="記事", content_md="本文", content_text="本文です", hash="h")
+    db.add(doc)
+    db.commit()
+    postprocess_queue.enqueue_job_for_document(db, doc.id)
+
+    stages = _drain(db)
+
+    assert stages[0] == ("extract", True)
+    assert ("classification", False) in stages
+    assert sorted(stage for stage, ok in stages if ok) == ["classification", "embedding", "extract", "summary"]
+    # 分類の再試行で要約・埋め込みは再実行されない
+    assert fakes["generate_summary"].calls == 1
+    assert fakes["create_embedding"].calls == 1
+    assert fakes["classify_content"].calls == 2
+    assert db.query(Embedding).filter(Embedding.document_id == doc.id).count() == 1
+    assert db.query(Classification).filter(Classification.document_id == doc.id).count() == 1
+    assert db.query(PreferenceJob).filter(PreferenceJob.document_id == doc.id).count() == 1
+    db.close()
+
+
+def test_stages_are_idempotent_when_rerun(tmp_path, monkeypatch):
+    Session, fakes = _setup(tmp_path, monkeypatch)
+    fakes["classify_content"].fail_times = 0
+    db = Session()
+    doc = Document(url="http://example.test/b", domain="example.test", title="記事", content_md="本文", content_text="本文です", hash="h")
+    db.add(doc)
+    db.commit()
+
+    for _ in range(2):
+        for stage in ("summary", "embedding", "classification"):
+            assert process_stage_once(doc.id, stage) == (True, None)
+
+    assert fakes["generate_summary"].calls == 1
+    assert db.query(Embedding).filter(Embedding.document_id == doc.id).count() == 1
+    assert db.query(Classification).filter(Classification.document_id == doc.id).count() == 1
+    db.close()
+
+
+def test_enqueue_does_not_duplicate_active_stage(tmp_path, monkeypatch):
+    Session, _ = _setup(tmp_path, monkeypatch)
+    db = Session()
+    first = postprocess_queue.enqueue_job_for_document(db, "doc-1")
+    assert postprocess_queue.enqueue_job_for_document(db, "doc-1") == first
+    assert db.query(PostprocessJob).count() == 1
+    db.close()
+
+
+async def test_stage_database_work_runs_off_the_event_loop(tmp_path, monkeypatch):
+    Session, fakes = _setup(tmp_path, monkeypatch)
+    fakes["classify_content"].fail_times = 0
+    db = Session()
+    doc = Document(url="http://example.test/c", domain="example.test", title="記事", content_md="本文", content_text="本文です", hash="h")
+    db.add(doc)
+    db.commit()
+
+    loop_thread = threading.get_ident()
+    session_threads = []
+    factory = postprocess._session_factory
+
+    def recording_factory():
+        session_threads.append(threading.get_ident())
+        return factory()
+
+    monkeypatch.setattr(postprocess, "_session_factory", recording_factory)
+    assert await postprocess.process_doc(doc.id) == (True, None)
+
+    assert session_threads and loop_thread not in session_threads
+    db.expire_all()
+    assert db.get(Document, doc.id).short_summary == "段階処理テストの要約"
+    assert db.query(Embedding).filter(Embedding.document_id == doc.id).count() == 1
+    db.close()
+
+
+def test_permanently_failed_stage_does_not_block_the_profile_update(tmp_path, monkeypatch):
+    Session, fakes = _setup(tmp_path, monkeypatch)
+    fakes["classify_content"].fail_times = 100
+    db = Session()
+    doc = Document(url="http://example.test/d", domain="example.test", title="記事", content_md="本文", content_text="本文です", hash="h")
+    db.add(doc)
+    db.commit()
+    postprocess_queue.enqueue_job_for_document(db, doc.id, max_attempts=1)
+
+    _drain(db)
+
+    statuses = {job.stage: job.status for job in db.query(PostprocessJob)}
+    assert statuses["classification"] == "failed"
+    assert db.query(PreferenceJob).filter(PreferenceJob.document_id == doc.id).count() == 1
+    db.close()
+
+
+def test_summary_regeneration_replaces_an_existing_summary(tmp_path, monkeypatch):
+    Session, fakes = _setup(tmp_path, monkeypatch)
+    db = Session()
+    doc = Document(
+        url="http://example.test/e", domain="example.test", title="記事", content_md="本文", content_text="本文です",
+        hash="h", short_summary="古い要約",
+    )
+    db.add(doc)
+    db.commit()
+
+    # 通常の要約ステージは既存の要約を残す
+    assert process_stage_once(doc.id, "summary") == (True, None)
+    assert fakes["generate_summary"].calls == 0
+
+    job_id = postprocess_queue.enqueue_summary_regeneration(db, doc.id)
+    assert postprocess_queue.enqueue_summary_regeneration(db, doc.id) == job_id
+    assert _drain(db) == [("summary", True)]
+    assert fakes["generate_summary"].calls == 1
+    db.expire_all()
+    assert db.get(Document, doc.id).short_summary == "段階処理テストの要約"
+    db.close()
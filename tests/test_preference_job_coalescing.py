@@ -0,0 +1,81 @@
+"""Tests for coalescing/debouncing of preference profile rebuild jobs."""
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.database import Base, PreferenceJob
+from app.services import personalization_queue
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'coalesce.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def test_burst_of_requests_becomes_one_job_per_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "preference_job_debounce_seconds", 30)
+    monkeypatch.setattr(settings, "preference_job_max_delay_seconds", 300)
+    db = _session(tmp_path)
+
+    ids = set()
+    for i in range(50):
+        ids.add(personalization_queue.enqueue_profile_update(db, document_id=f"doc-{i}", payload={"document_ids": [f"doc-{i}"]}))
+    ids.add(personalization_queue.enqueue_profile_update(db, user_id="alice", document_id="doc-a"))
+
+    assert len(ids) == 2
+    guest_job = db.query(PreferenceJob).filter(PreferenceJob.user_id.is_(None)).one()
+    payload = json.loads(guest_job.payload)
+    assert guest_job.document_id == "doc-0"
+    assert set(payload["document_ids"]) == {f"doc-{i}" for i in range(50)}
+    assert payload["coalesced"] == 49
+    # デバウンスで後ろ倒しされるが、最初の登録から上限を超えては遅らせない
+    assert guest_job.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+    assert guest_job.next_attempt_at <= guest_job.created_at + timedelta(seconds=300)
+    db.close()
+
+
+def test_debounce_is_capped_by_max_delay(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "preference_job_debounce_seconds", 600)
+    monkeypatch.setattr(settings, "preference_job_max_delay_seconds", 60)
+    db = _session(tmp_path)
+
+    job_id = personalization_queue.enqueue_profile_update(db, user_id="bob")
+    personalization_queue.enqueue_profile_update(db, user_id="bob", document_id="doc-1")
+
+    job = db.get(PreferenceJob, job_id)
+    assert job.next_attempt_at <= job.created_at + timedelta(seconds=60)
+    db.close()
+
+
+def test_first_job_of_a_burst_is_not_due_immediately(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "preference_job_debounce_seconds", 30)
+    monkeypatch.setattr(settings, "preference_job_max_delay_seconds", 300)
+    db = _session(tmp_path)
+
+    job_id = personalization_queue.enqueue_profile_update(db, user_id="dave", document_id="doc-1")
+    job = db.get(PreferenceJob, job_id)
+    assert job.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+    assert personalization_queue.lease_job(db, "w1") is None
+
+    # デバウンスより上限が短ければ上限で打ち切る
+    monkeypatch.setattr(settings, "preference_job_max_delay_seconds", 5)
+    job = db.get(PreferenceJob, personalization_queue.enqueue_profile_update(db, user_id="erin"))
+    assert job.next_attempt_at <= job.created_at + timedelta(seconds=5)
+    db.close()
+
+
+def test_leased_job_is_not_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "preference_job_debounce_seconds", 0)
+    db = _session(tmp_path)
+    first = personalization_queue.enqueue_profile_update(db, user_id="carol", document_id="doc-1")
+    leased = personalization_queue.lease_job(db, "w1")
+    assert leased.id == first
+
+    second = personalization_queue.enqueue_profile_update(db, user_id="carol", document_id="doc-2")
+    assert second != first
+    assert personalization_queue.enqueue_profile_update(db, user_id="carol", coalesce=False) not in {first, second}
+    db.close()
@@ -10,6 +10,7 @@ from app.core.database import (
     Bookmark,
     Classification,
     Document,
+    Embedding,
     PreferenceProfile,
     SessionLocal,
     create_tables,
@@ -60,6 +61,7 @@ def _reset_db() -> None:
             "preference_feedbacks",
             "bookmarks",
             "classifications",
+            "embeddings",
             "documents",
             "preference_profiles",
         ]:
@@ -75,9 +77,10 @@ def _seed_bookmark(
     user_id: Optional[str],
     title: str,
     domain: str,
-    category: str,
+    category: Optional[str],
     note: Optional[str] = None,
     minutes_ago: int = 0,
+    vector: Optional[List[float]] = None,
 ) -> str:
     with SessionLocal() as db:
         now = datetime.utcnow() - timedelta(minutes=minutes_ago)
@@ -96,16 +99,20 @@ def _seed_bookmark(
         db.add(doc)
         db.flush()
 
-        classification = Classification(
-            document_id=doc.id,
-            primary_category=category,
-            topics=[],
-            tags=[],
-            confidence=0.9,
-            method="test",
-            created_at=now,
-        )
-        db.add(classification)
+        if category is not None:
+            classification = Classification(
+                document_id=doc.id,
+                primary_category=category,
+                topics=[],
+                tags=[],
+                confidence=0.9,
+                method="test",
+                created_at=now,
+            )
+            db.add(classification)
+
+        if vector is not None:
+            db.add(Embedding(document_id=doc.id, chunk_id=0, vec=json.dumps(vector), chunk_text=title))
 
         bookmark = Bookmark(
             user_id=user_id,
@@ -177,9 +184,204 @@ def test_update_profile_preserves_embedding_when_generation_fails():
 
     failing_service = PreferenceProfileService(llm=FailingLLM(), max_retries=1, retry_delay_seconds=0.01)
     with SessionLocal() as db:
-        profile = failing_service.update_profile(db, user_id=user_id)
+        # 初期化済みプロファイルは通常更新では再計算されないため、全体再計算を明示する
+        profile = failing_service.update_profile(db, user_id=user_id, full=True)
         assert profile.status == "error"
         assert profile.embedding == (0.5, 0.6, 0.7)
         stored = db.query(PreferenceProfile).filter(PreferenceProfile.user_id == user_id).one()
         assert stored.status == "error"
-        assert json.loads(stored.profile_embedding) == [0.5, 0.6, 0.7]
\ No newline at end of file
+        assert json.loads(stored.profile_embedding) == [0.5, 0.6, 0.7]
+
+def test_profile_uses_document_embeddings_without_llm():
+    _reset_db()
+    user_id = "user-vectors"
+    _seed_bookmark(user_id=user_id, title="A", domain="tech.example", category="テック/AI", minutes_ago=3, vector=[1.0, 0.0])
+    _seed_bookmark(user_id=user_id, title="B", domain="tech.example", category="テック/AI", minutes_ago=2, vector=[0.0, 1.0])
+    _seed_bookmark(user_id=user_id, title="C", domain="biz.example", category="ビジネス", minutes_ago=1, vector=[1.0, 1.0])
+
+    llm = StaticEmbeddingLLM([[9.0, 9.0]])
+    service = PreferenceProfileService(llm=llm)
+    with SessionLocal() as db:
+        profile = service.update_profile(db, user_id=user_id)
+        assert llm.calls == 0
+        assert profile.status == "active"
+        assert profile.embedding == pytest.approx((2 / 3, 2 / 3))
+
+
+def test_bookmark_events_update_profile_incrementally():
+    _reset_db()
+    user_id = "user-incremental"
+    for i, minutes in enumerate((5, 4, 3)):
+        _seed_bookmark(user_id=user_id, title=f"AI{i}", domain="tech.example", category="テック/AI", minutes_ago=minutes, vector=[1.0, 0.0])
+
+    llm = StaticEmbeddingLLM([[9.0, 9.0]])
+    service = PreferenceProfileService(llm=llm)
+    with SessionLocal() as db:
+        service.update_profile(db, user_id=user_id)
+
+    new_id = _seed_bookmark(user_id=user_id, title="Biz", domain="biz.example", category="ビジネス", vector=[0.0, 1.0])
+    with SessionLocal() as db:
+        bookmark = db.get(Bookmark, new_id)
+        incremental = service.apply_bookmark_event(
+            db,
+            user_id=user_id,
+            document_id=bookmark.document_id,
+            bookmarked_at=bookmark.created_at,
+            bookmark_id=bookmark.id,
+        )
+        assert incremental.bookmark_count == 4
+        assert incremental.last_bookmark_id == new_id
+        assert incremental.embedding == pytest.approx((0.75, 0.25))
+        assert incremental.category_weights["ビジネス"] == pytest.approx(0.25)
+
+        # 通常の更新は保存済みの状態をそのまま返し、全体再計算と一致する
+        assert service.update_profile(db, user_id=user_id).embedding == incremental.embedding
+        full = service.update_profile(db, user_id=user_id, full=True)
+        assert full.embedding == pytest.approx(incremental.embedding)
+        assert full.domain_weights == pytest.approx(incremental.domain_weights)
+
+        removed = service.apply_bookmark_event(
+            db,
+            user_id=user_id,
+            document_id=bookmark.document_id,
+            bookmarked_at=bookmark.created_at,
+            bookmark_id=bookmark.id,
+            removed=True,
+        )
+        assert removed.bookmark_count == 3
+        assert removed.embedding == pytest.approx((1.0, 0.0))
+        assert removed.category_weights == {"テック/AI": 1.0}
+    assert llm.calls == 0
+
+
+def _apply_event(service, db, bookmark_id: str, *, removed: bool = False):
+    bookmark = db.get(Bookmark, bookmark_id)
+    return service.apply_bookmark_event(
+        db,
+        user_id=bookmark.user_id,
+        document_id=bookmark.document_id,
+        bookmarked_at=bookmark.created_at,
+        bookmark_id=bookmark.id,
+        removed=removed,
+    )
+
+
+def _seed_active_profile(service, user_id: str) -> None:
+    for i, minutes in enumerate((5, 4, 3)):
+        _seed_bookmark(user_id=user_id, title=f"AI{i}", domain="tech.example", category="テック/AI", minutes_ago=minutes, vector=[1.0, 0.0])
+    with SessionLocal() as db:
+        service.update_profile(db, user_id=user_id)
+
+
+def test_document_completed_after_bookmarking_is_added_and_removed_symmetrically():
+    from app.services.postprocess import apply_bookmark_contributions
+
+    _reset_db()
+    user_id = "user-late-embedding"
+    service = PreferenceProfileService(llm=StaticEmbeddingLLM([[9.0, 9.0]]))
+    _seed_active_profile(service, user_id)
+
+    # 埋め込み・分類がまだ無い文書をブックマークすると、加算されるのはドメインだけ
+    pending_id = _seed_bookmark(user_id=user_id, title="Biz", domain="biz.example", category=None)
+    with SessionLocal() as db:
+        added = _apply_event(service, db, pending_id)
+        assert added.embedding == pytest.approx((1.0, 0.0))
+        assert "ビジネス" not in added.category_weights
+        document_id = db.get(Bookmark, pending_id).document_id
+
+        # 後処理が埋め込みと分類を保存すると、足りなかった分が加わって全体再計算と同じ値になる
+        db.add(Embedding(document_id=document_id, chunk_id=0, vec=json.dumps([0.0, 1.0]), chunk_text="Biz"))
+        db.add(Classification(document_id=document_id, primary_category="ビジネス", topics=[], tags=[], confidence=0.9, method="llm"))
+        db.commit()
+        apply_bookmark_contributions(db, document_id)
+        completed = service.update_profile(db, user_id=user_id)
+        assert completed.embedding == pytest.approx((0.75, 0.25))
+        assert completed.category_weights["ビジネス"] == pytest.approx(0.25)
+        assert json.loads(db.get(Bookmark, pending_id).profile_contribution) == {
+            "vector": True,
+            "category": "ビジネス",
+            "domain": "biz.example",
+        }
+        # 2回目は何もしない
+        assert service.apply_document_contributions(db, document_id) == 0
+
+        removed = _apply_event(service, db, pending_id, removed=True)
+        assert removed.bookmark_count == 3
+        assert removed.embedding == pytest.approx((1.0, 0.0))
+        assert removed.category_weights == {"テック/AI": 1.0}
+        assert removed.domain_weights == pytest.approx({"tech.example": 1.0})
+
+
+def test_removing_a_bookmark_only_subtracts_what_it_added():
+    _reset_db()
+    user_id = "user-pending-removal"
+    service = PreferenceProfileService(llm=StaticEmbeddingLLM([[9.0, 9.0]]))
+    _seed_active_profile(service, user_id)
+
+    pending_id = _seed_bookmark(user_id=user_id, title="Biz", domain="biz.example", category=None)
+    with SessionLocal() as db:
+        _apply_event(service, db, pending_id)
+        document_id = db.get(Bookmark, pending_id).document_id
+        # 加算後に埋め込みが保存されても、記録していない分は減算しない
+        db.add(Embedding(document_id=document_id, chunk_id=0, vec=json.dumps([0.0, 1.0]), chunk_text="Biz"))
+        db.commit()
+        removed = _apply_event(service, db, pending_id, removed=True)
+        assert removed.embedding == pytest.approx((1.0, 0.0))
+        assert removed.category_weights == {"テック/AI": 1.0}
+        assert removed.domain_weights == pytest.approx({"tech.example": 1.0})
+
+
+def test_removing_a_bookmark_with_unknown_contribution_marks_profile_dirty():
+    _reset_db()
+    user_id = "user-legacy-removal"
+    service = PreferenceProfileService(llm=StaticEmbeddingLLM([[9.0, 9.0]]))
+    _seed_active_profile(service, user_id)
+
+    # イベントを経ずに作られた（記録の無い）ブックマーク
+    legacy_id = _seed_bookmark(user_id=user_id, title="Old", domain="old.example", category="ビジネス", vector=[0.0, 1.0])
+    with SessionLocal() as db:
+        assert _apply_event(service, db, legacy_id, removed=True) is None
+        stored = db.query(PreferenceProfile).filter(PreferenceProfile.user_id == user_id).one()
+        assert stored.embedding_sum is None
+        rebuilt = service.update_profile(db, user_id=user_id)
+        assert rebuilt.embedding == pytest.approx((0.75, 0.25))
+
+
+def test_rebuild_is_capped_and_excluded_bookmarks_contribute_nothing():
+    _reset_db()
+    user_id = "user-capped"
+    oldest_id = _seed_bookmark(user_id=user_id, title="old", domain="old.example", category="古い", minutes_ago=3, vector=[0.0, 1.0])
+    _seed_bookmark(user_id=user_id, title="A", domain="tech.example", category="テック/AI", minutes_ago=2, vector=[1.0, 0.0])
+    _seed_bookmark(user_id=user_id, title="B", domain="tech.example", category="テック/AI", minutes_ago=1, vector=[1.0, 0.0])
+
+    service = PreferenceProfileService(llm=StaticEmbeddingLLM([[9.0, 9.0]]), max_bookmarks=2, cold_start_threshold=2)
+    with SessionLocal() as db:
+        profile = service.update_profile(db, user_id=user_id)
+        # 件数は全件、プロファイルは新しい2件から
+        assert profile.bookmark_count == 3
+        assert profile.embedding == pytest.approx((1.0, 0.0))
+        assert "old.example" not in profile.domain_weights
+        assert db.get(Bookmark, oldest_id).profile_contribution == "{}"
+
+        removed = _apply_event(service, db, oldest_id, removed=True)
+        assert removed.bookmark_count == 2
+        assert removed.embedding == pytest.approx((1.0, 0.0))
+        assert removed.domain_weights == pytest.approx({"tech.example": 1.0})
+
+
+def test_time_decay_favours_recent_bookmarks(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "preference_profile_half_life_days", 1.0)
+    _reset_db()
+    user_id = "user-decay"
+    _seed_bookmark(user_id=user_id, title="old", domain="old.example", category="古い", minutes_ago=2 * 24 * 60, vector=[1.0, 0.0])
+    _seed_bookmark(user_id=user_id, title="new1", domain="new.example", category="新しい", minutes_ago=0, vector=[0.0, 1.0])
+    _seed_bookmark(user_id=user_id, title="new2", domain="new.example", category="新しい", minutes_ago=0, vector=[0.0, 1.0])
+
+    service = PreferenceProfileService(llm=StaticEmbeddingLLM([[9.0, 9.0]]))
+    with SessionLocal() as db:
+        profile = service.update_profile(db, user_id=user_id)
+        # 2日前（半減期2回分）のブックマークの重みは 1/4
+        assert profile.domain_weights["old.example"] == pytest.approx(0.25 / 2.25, abs=1e-3)
+        assert profile.embedding[0] == pytest.approx(0.25 / 2.25, abs=1e-3)
@@ -0,0 +1,106 @@
+"""Listing routes run a fixed number of queries regardless of the page size."""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, Bookmark, Classification, Collection, CollectionItem, Document, get_db
+
+DOCUMENTS = 30
+
+
+@pytest.fixture()
+def app_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queries.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with factory() as db:
+        doc_ids = []
+        for i in range(DOCUMENTS):
+            doc = Document(
+                id=str(uuid.uuid4()),
+                url=f"https://example.com/{i}",
+                domain="example.com",
+                title=f"記事 {i}",
+                content_md="本文",
+                content_text="本文",
+                hash=str(uuid.uuid4()),
+            )
+            doc.classifications.append(
+                Classification(primary_category="テック/AI", tags=["python"], confidence=0.9, method="prompt")
+            )
+            db.add(doc)
+            doc_ids.append(doc.id)
+            if i % 3 == 0:
+                db.add(Bookmark(user_id="guest", document_id=doc.id))
+        for c in range(3):
+            collection = Collection(name=f"collection {c}")
+            db.add(collection)
+            db.flush()
+            for doc_id in doc_ids[c * 5:(c + 1) * 5]:
+                db.add(CollectionItem(collection_id=collection.id, document_id=doc_id))
+        db.commit()
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    from app.main import app as _app
+
+    _app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(_app) as client:
+            yield client, engine, doc_ids
+    finally:
+        _app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.mark.parametrize(
+    "path, max_queries",
+    [
+        ("/api/documents?limit=50", 2),
+        ("/api/documents?limit=50&sort=personalized", 2),
+        ("/documents", 3),
+        ("/documents?sort=personalized", 3),
+        ("/api/collections", 1),
+    ],
+)
+def test_listing_query_count_is_bounded(app_db, count_queries, path, max_queries):
+    client, engine, _ = app_db
+    with count_queries(engine) as counter:
+        response = client.get(path)
+    assert response.status_code == 200
+    assert counter.count <= max_queries, counter.statements
+
+
+def test_listing_results_are_unchanged(app_db):
+    client, _, doc_ids = app_db
+    documents = client.get("/api/documents?limit=50").json()["documents"]
+    assert len(documents) == DOCUMENTS
+    assert all(doc["category"] == "テック/AI" and doc["tags"] == ["python"] for doc in documents)
+
+    collections = client.get("/api/collections").json()["collections"]
+    assert sorted(c["item_count"] for c in collections) == [5, 5, 5]
+
+    page = client.get("/documents").text
+    assert page.count('hx-delete="/api/bookmarks?document_id=') == len(range(0, DOCUMENTS, 3))
+
+
+def test_modal_and_collection_detail_do_not_lazy_load(app_db, count_queries):
+    client, engine, doc_ids = app_db
+    with count_queries(engine) as counter:
+        assert client.get(f"/api/documents/{doc_ids[0]}/modal").status_code == 200
+    assert counter.count <= 3, counter.statements
+
+    collection_id = client.get("/api/collections").json()["collections"][0]["id"]
+    with count_queries(engine) as counter:
+        detail = client.get(f"/api/collections/{collection_id}")
+    assert detail.status_code == 200
+    assert len(detail.json()["items"]) == 5
+    assert counter.count == 1, counter.statements
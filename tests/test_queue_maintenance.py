@@ -0,0 +1,81 @@
+"""Tests for job retention, compaction and the queue indexes."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, PostprocessJob, PreferenceJob
+from app.services import queue_maintenance
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'housekeeping.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def _add_jobs(db, status, count, *, age_days):
+    updated = datetime.utcnow() - timedelta(days=age_days)
+    for i in range(count):
+        db.add(
+            PostprocessJob(
+                document_id=f"doc-{status}-{age_days}-{i}",
+                status=status,
+                attempts=0,
+                max_attempts=5,
+                created_at=updated,
+                updated_at=updated,
+            )
+        )
+    db.commit()
+
+
+def test_purge_removes_only_expired_finished_jobs_in_batches(tmp_path):
+    db = _session(tmp_path)
+    _add_jobs(db, "done", 25, age_days=10)
+    _add_jobs(db, "done", 3, age_days=1)
+    _add_jobs(db, "failed", 4, age_days=10)
+    _add_jobs(db, "failed", 2, age_days=40)
+    _add_jobs(db, "pending", 5, age_days=10)
+
+    counts = queue_maintenance.purge_finished_jobs(db, PostprocessJob, done_days=7, failed_days=30, batch_size=10)
+
+    assert counts == {"done": 25, "failed": 2}
+    remaining = dict(
+        (status, db.query(PostprocessJob).filter_by(status=status).count()) for status in ("done", "failed", "pending")
+    )
+    assert remaining == {"done": 3, "failed": 4, "pending": 5}
+    db.close()
+
+
+def test_zero_retention_keeps_jobs(tmp_path):
+    db = _session(tmp_path)
+    _add_jobs(db, "done", 3, age_days=100)
+    assert queue_maintenance.purge_finished_jobs(db, PostprocessJob, done_days=0, failed_days=0) == {"done": 0, "failed": 0}
+    assert db.query(PostprocessJob).count() == 3
+    db.close()
+
+
+def test_housekeeping_compacts_sqlite_and_lease_uses_partial_index(tmp_path):
+    db = _session(tmp_path)
+    _add_jobs(db, "done", 300, age_days=10)
+    # recent done rows survive retention, so the refreshed statistics favour the partial index
+    _add_jobs(db, "done", 200, age_days=1)
+    _add_jobs(db, "pending", 2, age_days=0)
+    db.add(PreferenceJob(job_type="profile_rebuild", status="done", updated_at=datetime.utcnow() - timedelta(days=10)))
+    db.commit()
+
+    report = queue_maintenance.run_housekeeping(db)
+
+    assert report["purged"]["postprocess_jobs"]["done"] == 300
+    assert report["purged"]["preference_jobs"]["done"] == 1
+    assert report["compaction"]["analyzed"] is True
+
+    engine = db.get_bind()
+    db.close()
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM postprocess_jobs WHERE status = 'pending' "
+            "AND (next_attempt_at IS NULL OR next_attempt_at <= '2100-01-01') ORDER BY created_at, id LIMIT 1"
+        ).fetchall()
+    assert any("idx_postprocess_jobs_pending_created" in row[-1] for row in plan)
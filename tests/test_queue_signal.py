@@ -0,0 +1,77 @@
+"""Tests for event-driven queue wake-up."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, PostprocessJob
+from app.services import postprocess_queue, queue_signal
+from app.services.job_leasing import seconds_until_next_job
+from app.services.queue_signal import QueueWaiter
+
+
+def _session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'signal.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_notify_wakes_waiter_in_same_process():
+    waiter = QueueWaiter("test-queue", min_wait=10, max_wait=10)
+    waiter.arm()
+    threading.Timer(0.1, queue_signal.notify, args=("test-queue",)).start()
+
+    started = time.monotonic()
+    assert waiter.wait() is True
+    assert time.monotonic() - started < 2
+
+
+def test_commit_from_other_connection_wakes_sqlite_waiter(tmp_path):
+    engine, Session = _session_factory(tmp_path)
+    waiter = QueueWaiter("other-process-queue", engine, min_wait=10, max_wait=10, probe_interval=0.05)
+    waiter.arm()
+
+    def enqueue_elsewhere():
+        db = Session()
+        db.add(PostprocessJob(document_id="doc-x", status="pending", attempts=0, max_attempts=5))
+        db.commit()
+        db.close()
+
+    threading.Timer(0.1, enqueue_elsewhere).start()
+    started = time.monotonic()
+    try:
+        assert waiter.wait() is True
+        assert time.monotonic() - started < 2
+    finally:
+        waiter.close()
+
+
+def test_idle_wait_backs_off_and_resets():
+    waiter = QueueWaiter("idle-queue", min_wait=0.02, max_wait=0.05)
+    waiter.arm()
+    assert waiter.wait() is False
+    assert waiter.current_wait == 0.04
+    waiter.arm()
+    assert waiter.wait() is False
+    assert waiter.current_wait == 0.05
+    waiter.reset()
+    assert waiter.current_wait == 0.02
+
+
+def test_seconds_until_next_job(tmp_path):
+    _, Session = _session_factory(tmp_path)
+    db = Session()
+    assert seconds_until_next_job(db, PostprocessJob) is None
+
+    job_id = postprocess_queue.enqueue_job_for_document(db, "doc-later")
+    assert seconds_until_next_job(db, PostprocessJob) == 0.0
+
+    db.get(PostprocessJob, job_id).next_attempt_at = datetime.utcnow() + timedelta(seconds=30)
+    db.commit()
+    assert 25 < seconds_until_next_job(db, PostprocessJob) <= 30
+    db.close()
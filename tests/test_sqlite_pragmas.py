@@ -0,0 +1,41 @@
+"""Tests for the per-connection SQLite pragma profile."""
+from app.core import database
+from app.core.config import settings
+
+
+def test_every_pooled_connection_gets_the_profile(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pragmas.db'}"
+    engine = database.get_engine(url)
+    try:
+        with engine.connect() as first, engine.connect() as second:
+            for conn in (first, second):
+                assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+                assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+                assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == settings.sqlite_busy_timeout_ms
+                assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -settings.sqlite_cache_size_kib
+                assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+
+        report = database.sqlite_health_report(engine)
+        assert report["journal_mode"] == "wal"
+        assert report["synchronous"] == "NORMAL"
+        assert report["temp_store"] == "MEMORY"
+        assert report["mismatches"] == {}
+    finally:
+        database.invalidate_engine_cache(url)
+
+
+def test_invalid_values_are_skipped_and_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "sqlite_journal_mode", "bogus")
+    monkeypatch.setattr(settings, "sqlite_busy_timeout_ms", 1234)
+    profile = database.sqlite_pragma_profile()
+    assert "journal_mode" not in profile
+    assert profile["busy_timeout"] == 1234
+
+    url = f"sqlite:///{tmp_path / 'invalid.db'}"
+    try:
+        report = database.sqlite_health_report(database.get_engine(url))
+        assert report["journal_mode"] == "delete"
+        assert report["busy_timeout"] == 1234
+        assert report["mismatches"] == {}
+    finally:
+        database.invalidate_engine_cache(url)
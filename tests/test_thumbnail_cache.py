@@ -0,0 +1,107 @@
+"""Tests for the per-domain thumbnail cache and content-addressed thumbnail files."""
+import hashlib
+import os
+import time
+from io import BytesIO
+
+import httpx
+import pytest
+
+from app.core import database
+from app.core.database import ThumbnailCache, create_tables
+from app.services import thumbnail_cache
+
+pytestmark = pytest.mark.skipif(not thumbnail_cache.PIL_AVAILABLE, reason="Pillow not installed")
+
+
+def _png_bytes(color):
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new("RGB", (16, 16), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def db_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnail_cache, "THUMBNAIL_DIR", tmp_path / "thumbnails")
+    create_tables()
+    session = database.SessionLocal()
+    session.query(ThumbnailCache).delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.query(ThumbnailCache).delete()
+        session.commit()
+        session.close()
+
+
+@pytest.fixture
+def fake_http(monkeypatch):
+    """httpx.Client をモックトランスポートに差し替え、リクエストURLを記録する"""
+    routes = {}
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        status, content_type, body = routes.get(str(request.url), (404, "text/plain", b""))
+        return httpx.Response(status, headers={"content-type": content_type}, content=body)
+
+    real_client = httpx.Client
+    monkeypatch.setattr(
+        thumbnail_cache.httpx,
+        "Client",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    return routes, requested
+
+
+def test_domain_favicon_is_fetched_once_and_named_by_content(db_session, fake_http):
+    routes, requested = fake_http
+    routes["https://example.com/favicon.ico"] = (200, "image/x-icon", _png_bytes("red"))
+
+    first = thumbnail_cache.get_thumbnail_for_url(db_session, "https://example.com/a")
+    second = thumbnail_cache.get_thumbnail_for_url(db_session, "https://example.com/b")
+
+    assert first == second
+    assert requested == ["https://example.com/favicon.ico"]
+    fname = os.path.basename(first)
+    stored = thumbnail_cache.THUMBNAIL_DIR / fname
+    assert fname == f"thumb_{hashlib.sha256(stored.read_bytes()).hexdigest()}.png"
+
+
+def test_domain_without_favicon_is_negatively_cached(db_session, fake_http):
+    routes, requested = fake_http
+    routes["https://noicon.example/post"] = (
+        200,
+        "text/html",
+        b'<meta property="og:image" content="/og.png">',
+    )
+    routes["https://noicon.example/og.png"] = (200, "image/png", _png_bytes("blue"))
+
+    rel = thumbnail_cache.get_thumbnail_for_url(db_session, "https://noicon.example/post")
+    assert rel is not None
+    thumbnail_cache.get_thumbnail_for_url(db_session, "https://noicon.example/other")
+
+    # favicon は1回だけ試行され、以降はネガティブキャッシュで省略される
+    assert requested.count("https://noicon.example/favicon.ico") == 1
+    entry = db_session.get(ThumbnailCache, "domain:noicon.example")
+    assert entry.thumbnail_path is None and entry.expires_at is not None
+
+
+def test_cleanup_removes_only_unreferenced_files(db_session, fake_http):
+    routes, _ = fake_http
+    routes["https://example.com/favicon.ico"] = (200, "image/png", _png_bytes("green"))
+    kept = thumbnail_cache.get_thumbnail_for_url(db_session, "https://example.com/a")
+    orphan = thumbnail_cache.THUMBNAIL_DIR / "thumb_123456.png"
+    orphan.write_bytes(b"old")
+    old = time.time() - 7200
+    os.utime(orphan, (old, old))
+    os.utime(thumbnail_cache.THUMBNAIL_DIR / os.path.basename(kept), (old, old))
+
+    removed = thumbnail_cache.cleanup_orphaned_thumbnails(db_session)
+
+    assert removed == 1
+    assert not orphan.exists()
+    assert (thumbnail_cache.THUMBNAIL_DIR / os.path.basename(kept)).exists()